@@ -0,0 +1,449 @@
+import argparse
+import json
+import string
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from segway_pipeline.recolor_bed import LABELS_TO_COLORS
+
+# GRCh38 primary assembly, chrM and the EBV, alt, random and unplaced contigs are left
+# out since Segway is not run on them.
+GRCH38_CHROM_SIZES = {
+    "chr1": 248956422,
+    "chr2": 242193529,
+    "chr3": 198295559,
+    "chr4": 190214555,
+    "chr5": 181538259,
+    "chr6": 170805979,
+    "chr7": 159345973,
+    "chr8": 145138636,
+    "chr9": 138394717,
+    "chr10": 133797422,
+    "chr11": 135086622,
+    "chr12": 133275309,
+    "chr13": 114364328,
+    "chr14": 107043718,
+    "chr15": 101991189,
+    "chr16": 90338345,
+    "chr17": 83257441,
+    "chr18": 80373285,
+    "chr19": 58617616,
+    "chr20": 64444167,
+    "chr21": 46709983,
+    "chr22": 50818468,
+    "chrX": 156040895,
+    "chrY": 57227415,
+}
+
+# Segway cycles through these colors by label
+SEGWAY_COLORS = [
+    "27,158,119",
+    "217,95,2",
+    "117,112,179",
+    "231,41,138",
+    "102,166,30",
+    "230,171,2",
+    "166,118,29",
+    "102,102,102",
+]
+TRACK_LINE = (
+    'track autoScale=off description="segway {num_labels}-label segmentation of '
+    'synthetic" itemRgb=on name=segway.{seed} viewLimits=0:1 visibility=dense'
+)
+
+# Mean segment length and resolution of tests/data/segway.bed.gz, which has about 48k
+# segments over chr19, so about 2.5 million segments for the whole genome.
+RESOLUTION = 100
+MEAN_SEGMENT_LENGTH = 1200
+ROWS_PER_CHUNK = 1 << 16
+
+HISTONE_TARGETS = [
+    "H3K4me1",
+    "H3K4me2",
+    "H3K4me3",
+    "H3K9ac",
+    "H3K9me3",
+    "H3K27ac",
+    "H3K27me3",
+    "H3K36me3",
+    "H3K79me2",
+    "H4K20me1",
+    "H2AFZ",
+]
+TF_TARGETS = ["CTCF", "POLR2A", "EP300", "RAD21"]
+# Relative frequencies of the assays in a large reference epigenome, the WGBS and
+# control datasets are skipped by get_portal_files.
+ASSAY_WEIGHTS = {
+    "Histone ChIP-seq": 10,
+    "TF ChIP-seq": 3,
+    "DNase-seq": 2,
+    "ATAC-seq": 1,
+    "WGBS": 1,
+    "Control ChIP-seq": 2,
+}
+OUTPUT_TYPES = {
+    "Histone ChIP-seq": ["fold change over control", "signal p-value"],
+    "TF ChIP-seq": ["fold change over control", "signal p-value"],
+    "ATAC-seq": ["fold change over control", "signal p-value"],
+    "DNase-seq": ["read-depth normalized signal", "raw signal"],
+}
+ASSEMBLIES = ["GRCh38", "hg19"]
+
+DATA_FILENAMES = {
+    "bed": "segway.bed",
+    "relabeled_bed": "segway.relabeled.bed",
+    "mnemonics": "mnemonics.txt",
+    "reference_epigenome": "reference_epigenome.json",
+    "quality_metrics": "quality_metrics.json",
+    "tracknames": "tracknames.json",
+}
+
+
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    chrom_sizes = (
+        read_chrom_sizes(args.chrom_sizes)
+        if args.chrom_sizes is not None
+        else GRCH38_CHROM_SIZES
+    )
+    generate_data(
+        args.output_dir,
+        chrom_sizes,
+        scale=args.scale,
+        num_labels=args.num_labels,
+        num_datasets=args.num_datasets,
+        seed=args.seed,
+    )
+
+
+def generate_data(
+    output_dir: Path,
+    chrom_sizes: Dict[str, int] = GRCH38_CHROM_SIZES,
+    scale: float = 1.0,
+    num_labels: int = 10,
+    num_datasets: int = 60,
+    seed: int = 0,
+) -> Dict[str, Path]:
+    """
+    Writes a Segway bed, the same bed relabeled, a mnemonics file, a reference
+    epigenome with its quality metrics, and a trackname assay input to `output_dir`.
+    Returns the paths written by name. The same arguments always produce the same
+    files.
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    paths = get_data_paths(output_dir)
+    mnemonics = make_mnemonics(num_labels)
+    with open(paths["mnemonics"], "w") as f:
+        write_mnemonics(f, mnemonics)
+    with open(paths["bed"], "w") as bed, open(paths["relabeled_bed"], "w") as relabeled:
+        write_bed(
+            bed, chrom_sizes, scale, num_labels, seed, relabeled, mnemonics=mnemonics
+        )
+    reference_epigenome, quality_metrics = make_reference_epigenome(num_datasets, seed)
+    with open(paths["reference_epigenome"], "w") as f:
+        json.dump(reference_epigenome, f)
+    with open(paths["quality_metrics"], "w") as f:
+        json.dump(quality_metrics, f)
+    tracknames, assays = make_tracknames(reference_epigenome)
+    with open(paths["tracknames"], "w") as f:
+        json.dump({"tracknames": tracknames, "assays": assays}, f)
+    return paths
+
+
+def get_data_paths(output_dir: Path) -> Dict[str, Path]:
+    return {
+        name: Path(output_dir) / filename for name, filename in DATA_FILENAMES.items()
+    }
+
+
+def make_mnemonics(num_labels: int) -> Dict[str, str]:
+    """
+    Cycles through the labels that `recolor_bed` knows the colors of, so the relabeled
+    bed can be recolored.
+    """
+    names = sorted(LABELS_TO_COLORS)
+    return {str(label): names[label % len(names)] for label in range(num_labels)}
+
+
+def write_mnemonics(file_handle: IO[str], mnemonics: Dict[str, str]) -> None:
+    file_handle.write("old\tnew\n")
+    file_handle.writelines(f"{old}\t{new}\n" for old, new in mnemonics.items())
+
+
+def write_bed(
+    file_handle: IO[str],
+    chrom_sizes: Dict[str, int],
+    scale: float = 1.0,
+    num_labels: int = 10,
+    seed: int = 0,
+    relabeled_file_handle: Optional[IO[str]] = None,
+    mnemonics: Optional[Dict[str, str]] = None,
+) -> int:
+    """
+    Writes a bed laid out like Segway output, tiling each chromosome, truncated to
+    `scale` of its length, with segments at the Segway resolution with geometrically
+    distributed lengths. Adjacent segments always have different labels. If
+    `relabeled_file_handle` is given, the same bed with the labels replaced by their
+    `mnemonics` is written to it. Returns the number of segments.
+    """
+    rng = np.random.default_rng(seed)
+    track_line = TRACK_LINE.format(num_labels=num_labels, seed=seed) + "\n"
+    file_handle.write(track_line)
+    if relabeled_file_handle is not None:
+        relabeled_file_handle.write(track_line)
+    names = [str(label) for label in range(num_labels)]
+    relabeled_names = (
+        [mnemonics[name] for name in names] if mnemonics is not None else names
+    )
+    num_segments = 0
+    for chrom, starts, ends, labels in iter_segments(
+        rng, chrom_sizes, scale, num_labels
+    ):
+        num_segments += len(starts)
+        for start in range(0, len(starts), ROWS_PER_CHUNK):
+            rows = slice(start, start + ROWS_PER_CHUNK)
+            chunk = list(
+                zip(starts[rows].tolist(), ends[rows].tolist(), labels[rows].tolist())
+            )
+            file_handle.write(_format_rows(chrom, chunk, names))
+            if relabeled_file_handle is not None:
+                relabeled_file_handle.write(_format_rows(chrom, chunk, relabeled_names))
+    return num_segments
+
+
+def iter_segments(
+    rng: np.random.Generator,
+    chrom_sizes: Dict[str, int],
+    scale: float = 1.0,
+    num_labels: int = 10,
+) -> Iterator[Tuple[str, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Yields the chromosome, starts, ends and labels of the segments of each chromosome.
+    """
+    for chrom, size in chrom_sizes.items():
+        length = int(size * scale)
+        if length == 0:
+            continue
+        # Draw comfortably more segments than needed, then cut at the chromosome end
+        num_draws = int(length / MEAN_SEGMENT_LENGTH * 1.2) + 16
+        lengths = (
+            rng.geometric(RESOLUTION / MEAN_SEGMENT_LENGTH, num_draws) * RESOLUTION
+        )
+        ends = np.cumsum(lengths)
+        num_segments = int(np.searchsorted(ends, length)) + 1
+        ends = ends[:num_segments]
+        ends[-1] = length
+        starts = np.concatenate(([0], ends[:-1]))
+        steps = (
+            rng.integers(1, num_labels, num_segments)
+            if num_labels > 1
+            else np.zeros(num_segments, dtype=int)
+        )
+        labels = (rng.integers(num_labels) + np.cumsum(steps)) % num_labels
+        yield chrom, starts, ends, labels
+
+
+def make_reference_epigenome(
+    num_datasets: int, seed: int = 0
+) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """
+    Makes a reference epigenome shaped like the portal's, with the original files
+    embedded the way `Client.get_reference_epigenome` does, and the samtools flagstats
+    quality metrics of its alignments by `@id`. Every dataset has bigWigs of several
+    output types on both assemblies for each replicate and the pooled replicates, as
+    well as alignments and files with excluded statuses, but only one file per
+    dataset is picked by `get_portal_files`.
+    """
+    rng = np.random.default_rng(seed)
+    accessions = _iter_accessions(rng)
+    assays = list(ASSAY_WEIGHTS)
+    weights = np.array(list(ASSAY_WEIGHTS.values()), dtype=float)
+    datasets = []
+    quality_metrics: Dict[str, Dict[str, Any]] = {}
+    for _ in range(num_datasets):
+        assay_title = assays[rng.choice(len(assays), p=weights / weights.sum())]
+        dataset: Dict[str, Any] = {
+            "@id": f"/experiments/{next(accessions).replace('FF', 'SR')}/",
+            "assay_title": assay_title,
+            "status": "released",
+        }
+        if assay_title in ("Histone ChIP-seq", "TF ChIP-seq"):
+            targets = (
+                HISTONE_TARGETS if assay_title == "Histone ChIP-seq" else TF_TARGETS
+            )
+            dataset["target"] = {"label": targets[rng.integers(len(targets))]}
+        num_bioreps = int(rng.integers(1, 4))
+        dataset["replicates"] = [
+            {"biological_replicate_number": number, "status": "released"}
+            for number in range(1, num_bioreps + 1)
+        ]
+        # A replicate that was dropped and its files, which must be ignored
+        dataset["replicates"].append(
+            {"biological_replicate_number": num_bioreps + 1, "status": "deleted"}
+        )
+        replicate_sets = [[number] for number in range(1, num_bioreps + 1)]
+        if num_bioreps > 1:
+            replicate_sets.append(list(range(1, num_bioreps + 1)))
+        files = []
+        for replicates in replicate_sets:
+            if len(replicates) == 1:
+                accession = next(accessions)
+                metric = f"/samtools-flagstats-quality-metrics/{accession}/"
+                quality_metrics[metric] = {
+                    "@id": metric,
+                    "mapped": int(rng.integers(10_000_000, 100_000_000)),
+                }
+                files.append(
+                    _make_file(
+                        accession,
+                        "bam",
+                        "alignments",
+                        "GRCh38",
+                        replicates,
+                        quality_metrics=[
+                            f"/star-quality-metrics/{accession}/",
+                            metric,
+                        ],
+                    )
+                )
+            for output_type in OUTPUT_TYPES.get(assay_title, ["methylation state"]):
+                for assembly in ASSEMBLIES:
+                    files.append(
+                        _make_file(
+                            next(accessions),
+                            "bigWig",
+                            output_type,
+                            assembly,
+                            replicates,
+                        )
+                    )
+        files.append(
+            _make_file(
+                next(accessions),
+                "bigWig",
+                files[-1]["output_type"],
+                "GRCh38",
+                replicate_sets[-1],
+                status="revoked",
+            )
+        )
+        dataset["original_files"] = files
+        datasets.append(dataset)
+    reference_epigenome = {
+        "@id": f"/reference-epigenomes/{next(accessions).replace('FF', 'SR')}/",
+        "@type": ["ReferenceEpigenome", "Series", "Dataset", "Item"],
+        "status": "released",
+        "related_datasets": datasets,
+    }
+    return reference_epigenome, quality_metrics
+
+
+def make_tracknames(reference_epigenome: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    """
+    Makes the bigWig paths and assays that the pipeline would pass to
+    `make_trackname_assay`, one per dataset.
+    """
+    tracknames = []
+    assays = []
+    for dataset in reference_epigenome["related_datasets"]:
+        accession = next(
+            file["accession"]
+            for file in dataset["original_files"]
+            if file["file_format"] == "bigWig"
+        )
+        tracknames.append(
+            f"/cromwell_root/encode-public/2020/01/01/{accession}/{accession}.bigWig"
+        )
+        assays.append(dataset.get("target", {}).get("label", dataset["assay_title"]))
+    return tracknames, assays
+
+
+def read_chrom_sizes(path: Path) -> Dict[str, int]:
+    chrom_sizes = {}
+    with open(path) as f:
+        for line in f:
+            chrom, size = line.split()[:2]
+            chrom_sizes[chrom] = int(size)
+    return chrom_sizes
+
+
+def _make_file(
+    accession: str,
+    file_format: str,
+    output_type: str,
+    assembly: str,
+    biological_replicates: List[int],
+    status: str = "released",
+    quality_metrics: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    return {
+        "@id": f"/files/{accession}/",
+        "accession": accession,
+        "assembly": assembly,
+        "biological_replicates": biological_replicates,
+        "cloud_metadata": {
+            "url": (
+                f"https://encode-public.s3.amazonaws.com/2020/01/01/{accession}/"
+                f"{accession}.{file_format}"
+            )
+        },
+        "file_format": file_format,
+        "output_type": output_type,
+        "quality_metrics": quality_metrics if quality_metrics is not None else [],
+        "status": status,
+    }
+
+
+def _iter_accessions(rng: np.random.Generator) -> Iterator[str]:
+    """
+    Yields unique random ENCODE style file accessions.
+    """
+    seen = set()
+    letters = np.array(list(string.ascii_uppercase))
+    while True:
+        accession = (
+            f"ENCFF{rng.integers(1000):03d}{''.join(rng.choice(letters, 3).tolist())}"
+        )
+        if accession not in seen:
+            seen.add(accession)
+            yield accession
+
+
+def _format_rows(chrom: str, rows: List[Tuple[int, int, int]], names: List[str]) -> str:
+    return "".join(
+        f"{chrom}\t{start}\t{end}\t{names[label]}\t1000\t.\t{start}\t{end}\t"
+        f"{SEGWAY_COLORS[label % len(SEGWAY_COLORS)]}\n"
+        for start, end, label in rows
+    )
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output-dir", type=Path, required=True)
+    parser.add_argument(
+        "--chrom-sizes",
+        type=Path,
+        help="chrom sizes to generate the bed for, by default GRCh38",
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="fraction of each chromosome to generate segments for",
+    )
+    parser.add_argument("--num-labels", type=int, default=10)
+    parser.add_argument(
+        "--num-datasets",
+        type=int,
+        default=60,
+        help="number of datasets in the reference epigenome",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+if __name__ == "__main__":
+    main()
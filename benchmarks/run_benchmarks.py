@@ -0,0 +1,451 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from io import StringIO
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from benchmarks.generate_data import GRCH38_CHROM_SIZES, generate_data, get_data_paths
+from scripts.make_input_jsons_from_portal import Client, get_portal_files
+from segway_pipeline.compressed_io import open_output
+from segway_pipeline.instrument import get_peak_rss_mb
+from segway_pipeline.make_trackname_assay import (
+    make_trackname_assay,
+    write_trackname_assay,
+)
+from segway_pipeline.recolor_bed import (
+    LABELS_TO_COLORS,
+    make_color_strings,
+    recolor_bed,
+    recolor_bed_mmap,
+)
+from segway_pipeline.relabel import parse_mnemonics, relabel
+from segway_pipeline.segmentation import load_input
+from segway_pipeline.signal_distribution import (
+    GENOMEDATA_CHUNK_BASES,
+    get_read_intervals,
+    sample_blocks,
+)
+from segway_pipeline.vectorized_remap import remap_bed
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+DEFAULT_THRESHOLD = 0.25
+# The metrics that are compared to the baseline, lower is better for both
+METRICS = ("seconds", "peak_rss_mb")
+# The portal and trackname benchmarks each take well under a millisecond, so they are
+# timed over many calls.
+PORTAL_ITERATIONS = 1000
+TRACKNAME_ITERATIONS = 1000
+SIGNAL_DISTRIBUTION_SAMPLE_FRACTION = 0.1
+
+Paths = Dict[str, Path]
+
+
+class LocalClient(Client):
+    """
+    Serves the quality metrics that `get_portal_files` fetches for replicated DNase
+    from a dict instead of the portal.
+    """
+
+    def __init__(self, quality_metrics: Dict[str, Dict[str, Any]]) -> None:
+        super().__init__()
+        self.quality_metrics = quality_metrics
+
+    def get_json(self, url_or_path: str) -> Dict[str, Any]:
+        return self.quality_metrics[url_or_path]
+
+
+def bench_relabel(paths: Paths, output_path: Path) -> None:
+    with open(paths["bed"], newline="") as bed, open(
+        paths["mnemonics"], newline=""
+    ) as mnemonics, open(output_path, "w", newline="") as output:
+        relabel(bed, mnemonics, output)
+
+
+def bench_relabel_numpy(paths: Paths, output_path: Path) -> None:
+    with open(paths["mnemonics"], newline="") as f:
+        mnemonics = parse_mnemonics(f)
+    with open(paths["bed"], "rb") as bed, open(output_path, "wb") as output:
+        remap_bed(bed, output, mnemonics=mnemonics)
+
+
+def bench_recolor_bed(paths: Paths, output_path: Path) -> None:
+    with open(paths["relabeled_bed"], newline="") as bed, open(
+        output_path, "w", newline=""
+    ) as output:
+        recolor_bed(bed, output)
+
+
+def bench_recolor_bed_mmap(paths: Paths, output_path: Path) -> None:
+    with open(output_path, "wb") as output:
+        recolor_bed_mmap(paths["relabeled_bed"], output)
+
+
+def bench_recolor_bed_numpy(paths: Paths, output_path: Path) -> None:
+    with open(paths["relabeled_bed"], "rb") as bed, open(output_path, "wb") as output:
+        remap_bed(bed, output, colors=make_color_strings(LABELS_TO_COLORS))
+
+
+def bench_recolor_bed_gzip(paths: Paths, output_path: Path) -> None:
+    with open(paths["relabeled_bed"], newline="") as bed, open_output(
+        output_path.with_suffix(".gz"), compression="gzip"
+    ) as output:
+        recolor_bed(bed, output)
+    output_path.with_suffix(".gz").unlink()
+
+
+def bench_make_trackname_assay(paths: Paths, output_path: Path) -> Optional[int]:
+    with open(paths["tracknames"]) as f:
+        tracks = json.load(f)
+    for _ in range(TRACKNAME_ITERATIONS):
+        trackname_assay = make_trackname_assay(tracks["tracknames"], tracks["assays"])
+        write_trackname_assay(StringIO(), trackname_assay)
+    return TRACKNAME_ITERATIONS * len(tracks["tracknames"])
+
+
+def bench_get_portal_files(paths: Paths, output_path: Path) -> Optional[int]:
+    with open(paths["reference_epigenome"]) as f:
+        reference_epigenome = json.load(f)
+    with open(paths["quality_metrics"]) as f:
+        client = LocalClient(json.load(f))
+    for _ in range(PORTAL_ITERATIONS):
+        get_portal_files(reference_epigenome, "GRCh38", client)
+    return PORTAL_ITERATIONS * len(reference_epigenome["related_datasets"])
+
+
+def bench_signal_distribution_sample(paths: Paths, output_path: Path) -> Dict[str, int]:
+    """
+    There is no genomedata to read the signal from, so this times sampling the blocks
+    and counts what the signal distribution would read per track at the sample
+    fraction, and reading every segment. A chunk is an HDF5 chunk of genomedata, the
+    unit it decompresses. Each chromosome is a single supercontig, as in a genomedata
+    loaded with just the chrom sizes.
+    """
+    segmentation = load_input(paths["bed"])
+    label_codes = segmentation.codes["name"].astype(np.int64)
+    chroms = []
+    supercontigs = []
+    for chrom, indexes in segmentation.iter_chroms():
+        starts = segmentation.starts[indexes].astype(np.int64)
+        ends = segmentation.ends[indexes].astype(np.int64)
+        chroms.append((chrom, starts, ends, label_codes[indexes]))
+        supercontigs.append((np.array([0]), ends[-1:]))
+    sample = sample_blocks(
+        chroms,
+        supercontigs,
+        len(segmentation.values["name"]),
+        SIGNAL_DISTRIBUTION_SAMPLE_FRACTION,
+    )
+    bases_read, chunks_read = _count_reads(
+        [(starts, ends) for _, starts, ends, _ in sample.cluster_pieces]
+    )
+    bases, chunks = _count_reads([(starts, ends) for _, starts, ends, _ in chroms])
+    return {
+        "records": len(segmentation.starts),
+        "bases": bases,
+        "bases_read": bases_read,
+        "chunks": chunks,
+        "chunks_read": chunks_read,
+    }
+
+
+# The benchmarks that don't read a bed return the number of tracks or datasets they
+# processed, or a dict of that as "records" and other counts to report. Reading the
+# inputs is included in the timings.
+BENCHMARKS: Dict[str, Callable[[Paths, Path], Union[None, int, Dict[str, int]]]] = {
+    "relabel": bench_relabel,
+    "relabel_numpy": bench_relabel_numpy,
+    "recolor_bed": bench_recolor_bed,
+    "recolor_bed_mmap": bench_recolor_bed_mmap,
+    "recolor_bed_numpy": bench_recolor_bed_numpy,
+    "recolor_bed_gzip": bench_recolor_bed_gzip,
+    "make_trackname_assay": bench_make_trackname_assay,
+    "get_portal_files": bench_get_portal_files,
+    "signal_distribution_sample": bench_signal_distribution_sample,
+}
+# The bed each bed benchmark reads, throughput is also reported in MB/s for these
+BED_INPUTS = {
+    "relabel": "bed",
+    "relabel_numpy": "bed",
+    "recolor_bed": "relabeled_bed",
+    "recolor_bed_mmap": "relabeled_bed",
+    "recolor_bed_numpy": "relabeled_bed",
+    "recolor_bed_gzip": "relabeled_bed",
+}
+
+
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    params = {
+        "scale": args.scale,
+        "num_labels": args.num_labels,
+        "num_datasets": args.num_datasets,
+        "seed": args.seed,
+    }
+    if args.run_one is not None:
+        paths = get_data(args.data_dir, params)
+        result = run_one(args.run_one, paths, args.repeat)
+        print(json.dumps(result))
+        return
+    baseline = None
+    if not args.update_baseline and args.baseline.exists():
+        baseline = load_baseline(args.baseline)
+        if baseline["params"] != params:
+            parser.error(
+                f"Baseline {args.baseline} was run with {baseline['params']}, rerun "
+                "with the same data parameters or with --update-baseline"
+            )
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_dir = args.data_dir if args.data_dir is not None else Path(temp_dir)
+        start = time.perf_counter()
+        get_data(data_dir, params)
+        print(f"Generated data in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+        results = {}
+        for name in args.benchmarks:
+            results[name] = run_in_subprocess(name, data_dir, args)
+            print(format_result(name, results[name], baseline), file=sys.stderr)
+    if args.output is not None:
+        write_results(args.output, params, results)
+    if args.update_baseline:
+        write_results(args.baseline, params, results)
+        return
+    if baseline is None:
+        return
+    regressions = find_regressions(results, baseline["results"], args.threshold)
+    for regression in regressions:
+        print(f"Regression: {regression}", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
+
+
+def get_data(data_dir: Path, params: Dict[str, Any]) -> Paths:
+    """
+    Generates the data into `data_dir`, unless it already holds data generated with the
+    same parameters.
+    """
+    params_path = Path(data_dir) / "params.json"
+    if params_path.exists():
+        with open(params_path) as f:
+            if json.load(f) == params:
+                return get_data_paths(data_dir)
+    paths = generate_data(data_dir, GRCH38_CHROM_SIZES, **params)
+    with open(params_path, "w") as f:
+        json.dump(params, f)
+    return paths
+
+
+def run_in_subprocess(
+    name: str, data_dir: Path, args: argparse.Namespace
+) -> Dict[str, Any]:
+    """
+    Runs each benchmark in a fresh interpreter so that its peak memory isn't inflated
+    by the ones before it.
+    """
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.run_benchmarks",
+        "--run-one",
+        name,
+        "--data-dir",
+        str(data_dir),
+        "--repeat",
+        str(args.repeat),
+        "--scale",
+        str(args.scale),
+        "--num-labels",
+        str(args.num_labels),
+        "--num-datasets",
+        str(args.num_datasets),
+        "--seed",
+        str(args.seed),
+    ]
+    process = subprocess.run(command, cwd=REPO_ROOT, stdout=subprocess.PIPE, check=True)
+    result: Dict[str, Any] = json.loads(process.stdout.decode().splitlines()[-1])
+    return result
+
+
+def run_one(name: str, paths: Paths, repeat: int = 1) -> Dict[str, Any]:
+    """
+    Reports the fastest of `repeat` runs and the peak resident memory of the process,
+    which includes the interpreter and imported modules.
+    """
+    output_path = paths["bed"].parent / f"{name}.out"
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = BENCHMARKS[name](paths, output_path)
+        timings.append(time.perf_counter() - start)
+        if output_path.exists():
+            output_path.unlink()
+    result: Dict[str, Any] = {
+        "seconds": round(min(timings), 4),
+        "peak_rss_mb": round(get_peak_rss_mb(), 1),
+    }
+    if name in BED_INPUTS:
+        result["records"] = _count_rows(paths[BED_INPUTS[name]])
+        result["bytes"] = os.path.getsize(paths[BED_INPUTS[name]])
+    elif isinstance(records, dict):
+        result.update(records)
+    else:
+        result["records"] = records
+    return result
+
+
+def find_regressions(
+    results: Dict[str, Dict[str, Any]],
+    baseline_results: Dict[str, Dict[str, Any]],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> List[str]:
+    """
+    Returns a description of each metric that is more than `threshold`, a fraction,
+    worse than its baseline. Benchmarks without a baseline are skipped.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline_results:
+            continue
+        for metric in METRICS:
+            value = result[metric]
+            baseline_value = baseline_results[name][metric]
+            if value > baseline_value * (1 + threshold):
+                regressions.append(
+                    f"{name} {metric} is {value}, baseline is {baseline_value} "
+                    f"({_get_change(value, baseline_value):+.0%})"
+                )
+    return regressions
+
+
+def format_result(
+    name: str, result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None
+) -> str:
+    seconds = result["seconds"]
+    parts = [
+        f"{name:<22}",
+        f"{seconds:9.3f} s",
+        f"{result['records'] / seconds:12,.0f} records/s",
+    ]
+    if "bytes" in result:
+        parts.append(f"{result['bytes'] / seconds / 1e6:7.1f} MB/s")
+    for unit in ("bases", "chunks"):
+        if f"{unit}_read" in result:
+            parts.append(f"reads {result[f'{unit}_read'] / result[unit]:.1%} of {unit}")
+    parts.append(f"{result['peak_rss_mb']:8.1f} MB peak RSS")
+    if baseline is not None and name in baseline["results"]:
+        baseline_result = baseline["results"][name]
+        parts.append(
+            "vs baseline "
+            + ", ".join(
+                f"{metric} {_get_change(result[metric], baseline_result[metric]):+.0%}"
+                for metric in METRICS
+            )
+        )
+    return "  ".join(parts)
+
+
+def load_baseline(path: Path) -> Dict[str, Any]:
+    with open(path) as f:
+        baseline: Dict[str, Any] = json.load(f)
+    return baseline
+
+
+def write_results(
+    path: Path, params: Dict[str, Any], results: Dict[str, Dict[str, Any]]
+) -> None:
+    """
+    Written the way the pretty-format-json hook formats it.
+    """
+    with open(path, "w") as f:
+        json.dump({"params": params, "results": results}, f, indent=4, sort_keys=True)
+        f.write("\n")
+
+
+def _get_change(value: float, baseline_value: float) -> float:
+    return value / baseline_value - 1 if baseline_value else 0.0
+
+
+def _count_reads(intervals: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[int, int]:
+    """
+    The number of bases and of genomedata chunks that reading the sorted, disjoint
+    intervals of each chromosome, from a supercontig starting at 0, reads.
+    """
+    num_bases = num_chunks = 0
+    for starts, ends in intervals:
+        if not len(starts):
+            continue
+        starts, ends = get_read_intervals(starts, ends)
+        num_bases += int(np.sum(ends - starts))
+        first_chunks = starts // GENOMEDATA_CHUNK_BASES
+        last_chunks = (ends - 1) // GENOMEDATA_CHUNK_BASES
+        # Consecutive intervals can share a chunk
+        num_chunks += int(np.sum(last_chunks - first_chunks + 1))
+        num_chunks -= int(np.sum(first_chunks[1:] == last_chunks[:-1]))
+    return num_bases, num_chunks
+
+
+def _count_rows(bed_path: Path) -> int:
+    """
+    Number of rows in the bed, not counting the track line.
+    """
+    num_lines = 0
+    with open(bed_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            num_lines += block.count(b"\n")
+    return num_lines - 1
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--benchmarks",
+        nargs="+",
+        choices=list(BENCHMARKS),
+        default=list(BENCHMARKS),
+        help="benchmarks to run, by default all of them",
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="fraction of each GRCh38 chromosome to generate segments for",
+    )
+    parser.add_argument("--num-labels", type=int, default=10)
+    parser.add_argument("--num-datasets", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="report the fastest of this many runs"
+    )
+    parser.add_argument(
+        "--data-dir",
+        type=Path,
+        help="where to keep the generated data so it can be reused between runs",
+    )
+    parser.add_argument(
+        "--baseline", type=Path, default=DEFAULT_BASELINE, help="baseline results"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="fraction by which a metric may exceed the baseline before failing",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="write the results to the baseline instead of comparing to it",
+    )
+    parser.add_argument("-o", "--output", type=Path, help="write the results here")
+    parser.add_argument("--run-one", choices=list(BENCHMARKS), help=argparse.SUPPRESS)
+    return parser
+
+
+if __name__ == "__main__":
+    main()
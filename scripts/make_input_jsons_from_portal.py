@@ -5,6 +5,20 @@ from urllib.parse import urljoin
 
 import httpx
 
+try:
+    from segway_pipeline.instrument import add_records, instrumented
+except ImportError:  # pragma: no cover
+    # Run as `python scripts/make_input_jsons_from_portal.py` the package isn't
+    # importable, run it with `python -m scripts.make_input_jsons_from_portal` from the
+    # root of the repo to record metrics.
+
+    def instrumented(name: str) -> Any:  # type: ignore
+        return lambda main: main
+
+    def add_records(num_records: int) -> None:  # type: ignore
+        pass
+
+
 InputJson = Dict[str, Union[float, int, str, List[str]]]
 
 PORTAL_URL = "https://www.encodeproject.org/"
@@ -279,6 +293,7 @@ class ArgHelper:
         return parser
 
 
+@instrumented("make_input_jsons_from_portal")
 def main() -> None:
     arg_helper = ArgHelper()
     args = arg_helper.args
@@ -288,6 +303,7 @@ def main() -> None:
     portal_files = get_portal_files(
         reference_epigenome, assembly, client, args.skip_assays, args.chip_targets
     )
+    add_records(len(portal_files))
     chrom_sizes_s3_url = client.get_url_for_file(args.chrom_sizes)
     annotation_s3_url = client.get_url_for_file(args.annotation_gtf)
     extra_props = arg_helper.get_extra_props(chrom_sizes_s3_url, annotation_s3_url)
@@ -0,0 +1,281 @@
+import argparse
+import os
+import re
+import stat
+from pathlib import Path
+from typing import IO, Dict, Iterator, List, Optional, Tuple, Union
+
+from segway_pipeline.compressed_io import add_compression_args, open_output
+from segway_pipeline.instrument import add_records, instrumented
+
+PathLike = Union[str, Path]
+
+# 2019-01-01 00:00Z, the mtime the WDL tasks have always given the members
+DEFAULT_MTIME = 1546300800
+BLOCK_SIZE = 512
+# GNU tar's default blocking factor of 20
+RECORD_SIZE = 20 * BLOCK_SIZE
+CHUNK_SIZE = 1 << 20
+NAME_SIZE = 100
+MAX_SIZE = 0o77777777777
+
+REGULAR = b"0"
+HARD_LINK = b"1"
+SYMLINK = b"2"
+DIRECTORY = b"5"
+PAX_HEADER = b"x"
+
+
+@instrumented("archive")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    with open_output(
+        args.output_filename,
+        "wb",
+        compression=args.compression,
+        threads=args.threads,
+    ) as output_file_handle:
+        members = write_archive(
+            output_file_handle, args.paths, args.member_regex, mtime=args.mtime
+        )
+    add_records(len(members))
+
+
+def write_archive(
+    output_file_handle: IO[bytes],
+    paths: List[PathLike],
+    member_regex: Optional[str] = None,
+    mtime: int = DEFAULT_MTIME,
+) -> List[str]:
+    """
+    Writes the same bytes as the reproducible tar the WDL tasks used to make with
+
+        find paths -print0 | LC_ALL=C sort -z |
+            tar --owner=0 --group=0 --numeric-owner --mtime=@mtime \
+            --pax-option=exthdr.name=%d/PaxHeaders/%f,delete=atime,delete=ctime \
+            --no-recursion --null -T - -c
+
+    or with `find paths -regextype egrep -regex member_regex` if `member_regex` is
+    given, for GNU tar 1.34. That is, a POSIX tar with the members sorted bytewise by
+    path, owned by root, all with the same mtime, and extended headers only for long or
+    non-ASCII names, long link targets and huge files. Members are streamed straight to
+    `output_file_handle`. Returns the member paths in the order they were written.
+    """
+    members = list_members(paths, member_regex)
+    hard_links: Dict[Tuple[int, int], bytes] = {}
+    size = 0
+    for member in members:
+        size += _write_member(output_file_handle, member, mtime, hard_links)
+    size += 2 * BLOCK_SIZE
+    # The end of archive blocks, then padding to a whole record
+    output_file_handle.write(b"\0" * (2 * BLOCK_SIZE + -size % RECORD_SIZE))
+    return members
+
+
+def list_members(
+    paths: List[PathLike], member_regex: Optional[str] = None
+) -> List[str]:
+    """
+    Lists the paths and everything under them without following symlinks, like `find`,
+    sorted by their bytes like `LC_ALL=C sort`. If `member_regex` is given only the
+    paths it matches in full are kept, like `find -regex`.
+    """
+    members: List[str] = []
+    for path in paths:
+        members.extend(_walk(str(path)))
+    if member_regex is not None:
+        pattern = re.compile(member_regex)
+        members = [member for member in members if pattern.fullmatch(member)]
+    return sorted(members, key=os.fsencode)
+
+
+def make_header(
+    name: bytes,
+    mode: int,
+    size: int,
+    mtime: int,
+    typeflag: bytes,
+    linkname: bytes = b"",
+    device_fields: bool = True,
+) -> bytes:
+    """
+    Makes a ustar header block the way GNU tar fills it in for the POSIX format, with
+    zero padded octal numbers, no user or group names, and names that don't fit simply
+    truncated, their full value being in the preceding extended header.
+    """
+    device = _octal(0, 8) if device_fields else b"\0" * 8
+    header = b"".join(
+        (
+            name[:NAME_SIZE].ljust(NAME_SIZE, b"\0"),
+            _octal(mode, 8),
+            _octal(0, 8),
+            _octal(0, 8),
+            _octal(size if size <= MAX_SIZE else 0, 12),
+            _octal(mtime, 12),
+            b" " * 8,
+            typeflag,
+            linkname[:NAME_SIZE].ljust(NAME_SIZE, b"\0"),
+            b"ustar\x0000",
+            b"\0" * 64,
+            device,
+            device,
+            b"\0" * 167,
+        )
+    )
+    checksum = b"%06o\0 " % sum(header)
+    return header[:148] + checksum + header[156:]
+
+
+def make_pax_records(records: List[Tuple[str, bytes]]) -> bytes:
+    """
+    Each record is `length key=value\n`, where the length counts its own digits.
+    """
+    data = []
+    for key, value in records:
+        body = b" %s=%s\n" % (key.encode(), value)
+        length = len(body) + 1
+        while len(str(length)) + len(body) != length:
+            length += 1
+        data.append(str(length).encode() + body)
+    return b"".join(data)
+
+
+def _walk(path: str) -> Iterator[str]:
+    yield path
+    if os.path.isdir(path) and not os.path.islink(path):
+        with os.scandir(path) as entries:
+            names = [entry.name for entry in entries]
+        for name in names:
+            yield from _walk(os.path.join(path, name))
+
+
+def _write_member(
+    output_file_handle: IO[bytes],
+    path: str,
+    mtime: int,
+    hard_links: Dict[Tuple[int, int], bytes],
+) -> int:
+    """
+    Returns the number of bytes written. Hard links are detected the same way as GNU
+    tar, the first path to an inode in the archive is stored as a file, the later ones
+    as links to it.
+    """
+    st = os.lstat(path)
+    name = os.fsencode(path)
+    linkname = b""
+    size = 0
+    if stat.S_ISDIR(st.st_mode):
+        typeflag = DIRECTORY
+        name = name.rstrip(b"/") + b"/"
+    elif stat.S_ISLNK(st.st_mode):
+        typeflag = SYMLINK
+        linkname = os.fsencode(os.readlink(path))
+    elif stat.S_ISREG(st.st_mode):
+        typeflag = REGULAR
+        size = st.st_size
+        if st.st_nlink > 1:
+            key = (st.st_dev, st.st_ino)
+            if key in hard_links:
+                typeflag = HARD_LINK
+                linkname = hard_links[key]
+                size = 0
+            else:
+                hard_links[key] = name
+    else:
+        raise ValueError(f"Can't archive {path}, only files, dirs and links are")
+    mode = stat.S_IMODE(st.st_mode)
+    records = _get_pax_records(name, linkname, size)
+    header = make_header(name, mode, size, mtime, typeflag, linkname)
+    if records:
+        pax_data = make_pax_records(records)
+        pax_header = make_header(
+            _get_pax_header_name(name),
+            0o644,
+            len(pax_data),
+            mtime,
+            PAX_HEADER,
+            device_fields=False,
+        )
+        pax_data += b"\0" * (-len(pax_data) % BLOCK_SIZE)
+        header = pax_header + pax_data + header
+    output_file_handle.write(header)
+    if typeflag == REGULAR:
+        return len(header) + _copy_file(output_file_handle, path, size)
+    return len(header)
+
+
+def _get_pax_records(
+    name: bytes, linkname: bytes, size: int
+) -> List[Tuple[str, bytes]]:
+    """
+    In the order GNU tar stores them.
+    """
+    records = []
+    if len(linkname) > NAME_SIZE:
+        records.append(("linkpath", linkname))
+    if len(name) > NAME_SIZE or not name.isascii():
+        records.append(("path", name))
+    if size > MAX_SIZE:
+        records.append(("size", str(size).encode()))
+    return records
+
+
+def _get_pax_header_name(name: bytes) -> bytes:
+    """
+    Expands `%d/PaxHeaders/%f`, the directory and base name of the member.
+    """
+    directory, _, base = name.rstrip(b"/").rpartition(b"/")
+    return (directory or b".") + b"/PaxHeaders/" + base
+
+
+def _copy_file(output_file_handle: IO[bytes], path: str, size: int) -> int:
+    """
+    Like GNU tar, the size in the header is the size the file had when it was listed.
+    Returns the number of bytes written, including the padding to a whole block.
+    """
+    remaining = size
+    with open(path, "rb") as f:
+        while remaining:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise ValueError(f"File {path} shrank while being archived")
+            output_file_handle.write(chunk)
+            remaining -= len(chunk)
+    padding = -size % BLOCK_SIZE
+    output_file_handle.write(b"\0" * padding)
+    return size + padding
+
+
+def _octal(value: int, size: int) -> bytes:
+    return b"%0*o\0" % (size - 1, value)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+", help="files and dirs to archive")
+    parser.add_argument(
+        "-o",
+        "--output-filename",
+        required=True,
+        help="may be compressed, see --compression",
+    )
+    parser.add_argument(
+        "--member-regex",
+        help=(
+            "only archive the paths that this regex fully matches, like find -regex, "
+            "e.g. 'traindir/(params|triangulation)($|/.*)'"
+        ),
+    )
+    parser.add_argument(
+        "--mtime",
+        type=int,
+        default=DEFAULT_MTIME,
+        help="modification time of all the members, in seconds since the epoch",
+    )
+    add_compression_args(parser)
+    return parser
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from segway_pipeline.compressed_io import (
+    BGZF,
+    NONE,
+    BgzfReader,
+    is_bgzf,
+    sniff_compression,
+)
+from segway_pipeline.instrument import instrumented
+
+PathLike = Union[str, Path]
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".index.json"
+# Same as the tabix linear index
+DEFAULT_BIN_SIZE = 1 << 14
+HEADER_PREFIXES = (b"track", b"browser", b"#")
+
+REGION_REGEX = re.compile(r"^(?P<chrom>[^:]+)(:(?P<start>[\d,]+)-(?P<end>[\d,]+))?$")
+
+
+@instrumented("bed_index")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    index_path = args.index or get_index_path(args.bed)
+    if args.command == "build":
+        index = build_index(args.bed, args.bin_size)
+        with open(index_path, "w") as f:
+            json.dump(index, f)
+        return
+    try:
+        chrom, start, end = parse_region(args.region)
+    except ValueError as e:
+        parser.error(str(e))
+    index = load_index(index_path, args.bed)
+    output = sys.stdout.buffer
+    with open_indexed(args.bed, index) as bed_file_handle:
+        if args.print_header:
+            output.write(bed_file_handle.readline())
+        for line in query(bed_file_handle, index, chrom, start, end):
+            output.write(line)
+
+
+def get_index_path(bed_path: PathLike) -> str:
+    return f"{bed_path}{INDEX_SUFFIX}"
+
+
+def open_indexed(bed_path: PathLike, index: Optional[Dict[str, Any]] = None) -> Any:
+    """
+    Opens the bed so that `tell` and `seek` work with the offsets in its index, plain
+    byte offsets for uncompressed beds, and BGZF virtual offsets for BGZF beds.
+    """
+    compression = _get_compression(bed_path)
+    if index is not None and index["compression"] != compression:
+        raise ValueError(
+            f"Index is for a {index['compression']} bed but {bed_path} is {compression}"
+        )
+    if compression == BGZF:
+        return BgzfReader(open(bed_path, "rb"))
+    return open(bed_path, "rb")
+
+
+def build_index(bed_path: PathLike, bin_size: int = DEFAULT_BIN_SIZE) -> Dict[str, Any]:
+    """
+    Records the offset of the first record of each chromosome, and the offset of the
+    first record overlapping each `bin_size` base bin of it, or of the first record
+    after the bin if none overlap it. Records must be grouped by chromosome and sorted
+    by start within each one, which Segway output always is. Leading track, browser and
+    comment lines are skipped. The size of the bed is stored to detect stale indexes.
+    """
+    chroms: Dict[str, Dict[str, Any]] = {}
+    with open_indexed(bed_path) as bed_file_handle:
+        chrom = ""
+        bins: List[int] = []
+        previous_start = 0
+        in_header = True
+        while True:
+            offset = bed_file_handle.tell()
+            line = bed_file_handle.readline()
+            if not line:
+                break
+            if in_header and line.startswith(HEADER_PREFIXES):
+                continue
+            in_header = False
+            fields = line.split(b"\t", 3)
+            if len(fields) < 3:
+                raise ValueError(f"Found bed line with fewer than 3 columns: {line!r}")
+            start = int(fields[1])
+            end = int(fields[2])
+            if fields[0].decode() != chrom:
+                chrom = fields[0].decode()
+                if chrom in chroms:
+                    raise ValueError(
+                        f"Bed is not sorted, found chromosome {chrom} more than once"
+                    )
+                bins = []
+                chroms[chrom] = {"offset": offset, "num_records": 0, "bins": bins}
+                previous_start = 0
+            if start < previous_start:
+                raise ValueError(f"Bed is not sorted, {line!r} is out of order")
+            previous_start = start
+            chroms[chrom]["num_records"] += 1
+            # Records are sorted by start, so the first to reach a bin has the lowest
+            # offset of those overlapping it. Empty bins before it get its offset too.
+            last_bin = (max(end, start + 1) - 1) // bin_size
+            bins.extend(offset for _ in range(len(bins), last_bin + 1))
+    return {
+        "version": INDEX_VERSION,
+        "compression": _get_compression(bed_path),
+        "bin_size": bin_size,
+        "size": os.path.getsize(bed_path),
+        "chroms": chroms,
+    }
+
+
+def load_index(
+    index_path: PathLike, bed_path: Optional[PathLike] = None
+) -> Dict[str, Any]:
+    """
+    If `bed_path` is given the index is checked against it.
+    """
+    with open(index_path) as f:
+        index = json.load(f)
+    if index["version"] != INDEX_VERSION:
+        raise ValueError(
+            f"Unsupported index version {index['version']}, expected {INDEX_VERSION}"
+        )
+    if bed_path is not None and os.path.getsize(bed_path) != index["size"]:
+        raise ValueError(f"Index {index_path} is out of date for {bed_path}")
+    return index
+
+
+def query(
+    bed_file_handle: Any,
+    index: Dict[str, Any],
+    chrom: str,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+) -> Iterator[bytes]:
+    """
+    Yields the lines of the records on `chrom` overlapping the 0-based, half open
+    interval from `start` to `end`, or all of them if no interval is given.
+    `bed_file_handle` must be opened with `open_indexed`.
+    """
+    entry = index["chroms"].get(chrom)
+    if entry is None:
+        return
+    start = 0 if start is None else start
+    bin_index = start // index["bin_size"]
+    if bin_index >= len(entry["bins"]):
+        return
+    bed_file_handle.seek(entry["bins"][bin_index])
+    chrom_bytes = chrom.encode()
+    for line in iter(bed_file_handle.readline, b""):
+        fields = line.split(b"\t", 3)
+        if fields[0] != chrom_bytes:
+            break
+        record_start = int(fields[1])
+        if end is not None and record_start >= end:
+            break
+        if int(fields[2]) > start:
+            yield line
+
+
+def parse_region(region: str) -> Tuple[str, Optional[int], Optional[int]]:
+    """
+    Parses a `chr`, or `chr:start-end` region, where like samtools and tabix the start
+    and end are 1-based and inclusive. Returns the region as a 0-based half open
+    interval.
+    """
+    match = REGION_REGEX.match(region)
+    if match is None:
+        raise ValueError(f"Invalid region {region}, must be chr or chr:start-end")
+    if match.group("start") is None:
+        return match.group("chrom"), None, None
+    start = int(match.group("start").replace(",", ""))
+    end = int(match.group("end").replace(",", ""))
+    if start < 1 or end < start:
+        raise ValueError(f"Invalid region {region}, must have 1 <= start <= end")
+    return match.group("chrom"), start - 1, end
+
+
+def _get_compression(bed_path: PathLike) -> str:
+    if is_bgzf(bed_path):
+        return BGZF
+    if sniff_compression(bed_path) != NONE:
+        raise ValueError(
+            f"Can't index {bed_path}, only uncompressed and BGZF compressed beds can be "
+            "sought into, write it with --compression bgzf instead"
+        )
+    return NONE
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser(
+        "build", help="index an uncompressed or BGZF compressed bed"
+    )
+    build_parser.add_argument("bed")
+    build_parser.add_argument(
+        "--bin-size",
+        type=int,
+        default=DEFAULT_BIN_SIZE,
+        help="size in bases of the bins within each chromosome",
+    )
+    query_parser = subparsers.add_parser(
+        "query", help="print the records overlapping a region"
+    )
+    query_parser.add_argument("bed")
+    query_parser.add_argument(
+        "region", help="chr or chr:start-end, with a 1-based inclusive start and end"
+    )
+    query_parser.add_argument(
+        "--print-header", action="store_true", help="also print the track line"
+    )
+    for subparser in (build_parser, query_parser):
+        subparser.add_argument(
+            "--index",
+            help=f"path to the index, by default the bed path + {INDEX_SUFFIX}",
+        )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
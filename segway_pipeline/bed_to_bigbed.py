@@ -0,0 +1,677 @@
+import argparse
+import itertools
+import struct
+import zlib
+from array import array
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import (
+    IO,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+import numpy as np
+
+from segway_pipeline.compressed_io import open_input
+from segway_pipeline.instrument import add_records, instrumented
+
+BIGBED_MAGIC = 0x8789F2EB
+BPT_MAGIC = 0x78CA8C91
+CIR_TREE_MAGIC = 0x2468ACE0
+BIGBED_VERSION = 4
+
+# Same defaults as bedToBigBed
+DEFAULT_BLOCK_SIZE = 256
+DEFAULT_ITEMS_PER_SLOT = 512
+MAX_ZOOM_LEVELS = 10
+MIN_ZOOM_REDUCTION = 10
+ZOOM_INCREMENT = 4
+
+HEADER = struct.Struct("<IHHQQQHHQQIQ")
+ZOOM_HEADER = struct.Struct("<IIQQ")
+TOTAL_SUMMARY = struct.Struct("<Qdddd")
+EXTENSION_HEADER = struct.Struct("<HHQ52x")
+BPT_HEADER = struct.Struct("<IIIIQ8x")
+CIR_TREE_HEADER = struct.Struct("<IIQIIIIQI4x")
+NODE_HEADER = struct.Struct("<BxH")
+LEAF_ITEM = struct.Struct("<IIIIQQ")
+BRANCH_ITEM = struct.Struct("<IIIIQ")
+RECORD_HEADER = struct.Struct("<III")
+ZOOM_RECORD = struct.Struct("<IIIIffff")
+
+AUTOSQL_HEADER = 'table bed\n"Browser Extensible Data"\n    (\n'
+AUTOSQL_FIELDS = (
+    'string chrom;       "Reference sequence chromosome or scaffold"',
+    'uint   chromStart;  "Start position in chromosome"',
+    'uint   chromEnd;    "End position in chromosome"',
+    'string name;        "Name of item."',
+    'uint score;          "Score (0-1000)"',
+    'char[1] strand;     "+ or - for strand"',
+    'uint thickStart;   "Start of where display should be thick (start codon)"',
+    'uint thickEnd;     "End of where display should be thick (stop codon)"',
+    'uint reserved;     "Used as itemRgb as of 2004-11-22"',
+    'int blockCount;    "Number of blocks"',
+    'int[blockCount] blockSizes; "Comma separated list of block sizes"',
+    'int[blockCount] chromStarts; "Start positions relative to chromStart"',
+)
+
+# (start chrom id, start base, end chrom id, end base)
+Bounds = Tuple[int, int, int, int]
+
+
+class IndexItem(NamedTuple):
+    bounds: Bounds
+    offset: int
+    size: int
+
+
+@instrumented("bed_to_bigbed")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    with open(args.chrom_sizes) as chrom_sizes_file_handle:
+        chrom_sizes = parse_chrom_sizes(chrom_sizes_file_handle)
+    with open_input(args.bed) as bed_file_handle, open(
+        args.output_filename, "wb"
+    ) as output_file_handle:
+        num_records = bed_to_bigbed(
+            bed_file_handle, chrom_sizes, output_file_handle, threads=args.threads
+        )
+    add_records(num_records)
+
+
+def parse_chrom_sizes(chrom_sizes_file_handle: IO[str]) -> Dict[str, int]:
+    chrom_sizes = {}
+    for line in chrom_sizes_file_handle:
+        if not line.strip():
+            continue
+        chrom, size = line.split()[:2]
+        chrom_sizes[chrom] = int(size)
+    return chrom_sizes
+
+
+def bed_to_bigbed(
+    bed_file_handle: IO[str],
+    chrom_sizes: Dict[str, int],
+    output_file_handle: IO[bytes],
+    threads: int = 1,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    items_per_slot: int = DEFAULT_ITEMS_PER_SLOT,
+) -> int:
+    """
+    Writes the bed as a bigBed in a single streaming pass, the equivalent of stripping
+    the track line and running `bedToBigBed`. Records must be grouped by chromosome and
+    sorted by start within each one, in any chromosome order. Every chromosome in
+    `chrom_sizes` goes in the chromosome tree, numbered in name order like UCSC.
+
+    Records are packed into blocks of `items_per_slot` as they are read and the blocks
+    are zlib compressed on a pool of `threads` threads. Only the record coordinates are
+    kept in memory, the zoom levels are computed from them with NumPy once the data is
+    written, and the offsets in the header are filled in at the end, so the output must
+    be seekable. Track, browser and comment lines are skipped. Returns the number of
+    records written.
+    """
+    if not chrom_sizes:
+        raise ValueError("No chromosomes in chrom sizes")
+    chrom_names = sorted(chrom_sizes)
+    chrom_ids = {chrom: i for i, chrom in enumerate(chrom_names)}
+    executor = ThreadPoolExecutor(threads) if threads > 1 else None
+    try:
+        writer = _BlockWriter(output_file_handle, executor, 2 * threads)
+        # Leave room for the header and the maximum number of zoom headers, like
+        # bedToBigBed, they are filled in at the end.
+        output_file_handle.write(
+            bytes(HEADER.size + MAX_ZOOM_LEVELS * ZOOM_HEADER.size)
+        )
+        rows = _iter_rows(bed_file_handle)
+        first_row = next(rows, None)
+        field_count = 3 if first_row is None else len(first_row)
+        if not 3 <= field_count <= len(AUTOSQL_FIELDS):
+            raise ValueError(
+                f"Bed has {field_count} columns, must have between 3 and "
+                f"{len(AUTOSQL_FIELDS)}"
+            )
+        autosql_offset = output_file_handle.tell()
+        output_file_handle.write(make_autosql(field_count).encode() + b"\0")
+        total_summary_offset = output_file_handle.tell()
+        output_file_handle.write(bytes(TOTAL_SUMMARY.size))
+        extension_offset = output_file_handle.tell()
+        output_file_handle.write(EXTENSION_HEADER.pack(EXTENSION_HEADER.size, 0, 0))
+        chrom_tree_offset = output_file_handle.tell()
+        write_chrom_tree(output_file_handle, chrom_names, chrom_sizes, block_size)
+        data_offset = output_file_handle.tell()
+        output_file_handle.write(bytes(8))
+
+        coordinates = _Coordinates()
+        if first_row is not None:
+            _write_records(
+                writer,
+                itertools.chain([first_row], rows),
+                field_count,
+                chrom_ids,
+                chrom_sizes,
+                items_per_slot,
+                coordinates,
+            )
+        data_index = writer.finish()
+        index_offset = output_file_handle.tell()
+        write_cir_tree(
+            output_file_handle, data_index, block_size, items_per_slot, index_offset
+        )
+
+        coverage = compute_coverage(*coordinates.to_arrays())
+        zoom_headers = []
+        for reduction, summaries in choose_zoom_levels(
+            coverage, coordinates.average_size(), index_offset - data_offset
+        ):
+            zoom_data_offset = output_file_handle.tell()
+            output_file_handle.write(struct.pack("<I", len(summaries[0])))
+            _write_zoom_records(writer, summaries, items_per_slot)
+            zoom_index = writer.finish()
+            zoom_index_offset = output_file_handle.tell()
+            write_cir_tree(
+                output_file_handle,
+                zoom_index,
+                block_size,
+                items_per_slot,
+                zoom_index_offset,
+            )
+            zoom_headers.append(
+                ZOOM_HEADER.pack(reduction, 0, zoom_data_offset, zoom_index_offset)
+            )
+        output_file_handle.write(struct.pack("<I", BIGBED_MAGIC))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    output_file_handle.seek(0)
+    output_file_handle.write(
+        HEADER.pack(
+            BIGBED_MAGIC,
+            BIGBED_VERSION,
+            len(zoom_headers),
+            chrom_tree_offset,
+            data_offset,
+            index_offset,
+            field_count,
+            field_count,
+            autosql_offset,
+            total_summary_offset,
+            writer.max_uncompressed_size,
+            extension_offset,
+        )
+    )
+    output_file_handle.write(b"".join(zoom_headers))
+    output_file_handle.seek(total_summary_offset)
+    output_file_handle.write(make_total_summary(coverage))
+    output_file_handle.seek(data_offset)
+    output_file_handle.write(struct.pack("<Q", len(coordinates)))
+    output_file_handle.seek(0, 2)
+    return len(coordinates)
+
+
+def make_autosql(field_count: int) -> str:
+    fields = "".join(f"    {field}\n" for field in AUTOSQL_FIELDS[:field_count])
+    return f"{AUTOSQL_HEADER}{fields}    )\n"
+
+
+def write_chrom_tree(
+    file_handle: IO[bytes],
+    chrom_names: List[str],
+    chrom_sizes: Dict[str, int],
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> None:
+    """
+    Writes the B+ tree mapping chromosome names to their ids and sizes, laid out the
+    same way as UCSC's `bptFileBulkIndexToOpenFile`: the levels are written from the
+    root down, and every node is padded out to `block_size` items. `chrom_names` must
+    be sorted, a chromosome's id is its index.
+    """
+    item_count = len(chrom_names)
+    block_size = min(block_size, item_count)
+    key_size = max(len(chrom.encode()) for chrom in chrom_names)
+    keys = [chrom.encode().ljust(key_size, b"\0") for chrom in chrom_names]
+    value_size = 8
+    file_handle.write(
+        BPT_HEADER.pack(BPT_MAGIC, block_size, key_size, value_size, item_count)
+    )
+    levels = 1
+    count = item_count
+    while count > block_size:
+        count = (count + block_size - 1) // block_size
+        levels += 1
+    branch_node_size = NODE_HEADER.size + block_size * (key_size + 8)
+    leaf_node_size = NODE_HEADER.size + block_size * (key_size + value_size)
+    offset = file_handle.tell()
+    for level in range(levels - 1, 0, -1):
+        slot_size = block_size**level
+        node_count = (item_count + slot_size * block_size - 1) // (
+            slot_size * block_size
+        )
+        child_offset = offset + node_count * branch_node_size
+        child_node_size = leaf_node_size if level == 1 else branch_node_size
+        for start in range(0, item_count, slot_size * block_size):
+            children = range(
+                start, min(start + slot_size * block_size, item_count), slot_size
+            )
+            node = [NODE_HEADER.pack(0, len(children))]
+            for child in children:
+                node.append(keys[child] + struct.pack("<Q", child_offset))
+                child_offset += child_node_size
+            file_handle.write(b"".join(node).ljust(branch_node_size, b"\0"))
+        offset += node_count * branch_node_size
+    for start in range(0, item_count, block_size):
+        chroms = range(start, min(start + block_size, item_count))
+        node = [NODE_HEADER.pack(1, len(chroms))]
+        for chrom_id in chroms:
+            chrom_size = chrom_sizes[chrom_names[chrom_id]]
+            node.append(keys[chrom_id] + struct.pack("<II", chrom_id, chrom_size))
+        file_handle.write(b"".join(node).ljust(leaf_node_size, b"\0"))
+
+
+def write_cir_tree(
+    file_handle: IO[bytes],
+    items: List[IndexItem],
+    block_size: int,
+    items_per_slot: int,
+    end_file_offset: int,
+) -> None:
+    """
+    Writes the R-tree indexing the blocks in `items` by their genomic bounds, laid out
+    like UCSC's `cirTreeFileBulkIndexToOpenFile`. The blocks may be in any order in the
+    file, the index is built over them sorted by their bounds.
+    """
+    items = sorted(items)
+    if items:
+        bounds: Bounds = (
+            items[0].bounds[0],
+            items[0].bounds[1],
+            *max(item.bounds[2:] for item in items),
+        )
+    else:
+        bounds = (0, 0, 0, 0)
+    file_handle.write(
+        CIR_TREE_HEADER.pack(
+            CIR_TREE_MAGIC,
+            block_size,
+            len(items),
+            *bounds,
+            end_file_offset,
+            items_per_slot,
+        )
+    )
+    # Build the levels bottom up, each node is the list of its children's bounds
+    levels: List[List[List[Bounds]]] = [
+        [
+            [item.bounds for item in items[start : start + block_size]]
+            for start in range(0, max(len(items), 1), block_size)
+        ]
+    ]
+    while len(levels[-1]) > 1:
+        children = [_node_bounds(node) for node in levels[-1]]
+        levels.append(
+            [
+                children[start : start + block_size]
+                for start in range(0, len(children), block_size)
+            ]
+        )
+    levels.reverse()
+    branch_node_size = NODE_HEADER.size + block_size * BRANCH_ITEM.size
+    leaf_node_size = NODE_HEADER.size + block_size * LEAF_ITEM.size
+    offset = file_handle.tell()
+    for level, nodes in enumerate(levels[:-1]):
+        child_offset = offset + len(nodes) * branch_node_size
+        child_node_size = (
+            leaf_node_size if level == len(levels) - 2 else branch_node_size
+        )
+        for node in nodes:
+            packed = [NODE_HEADER.pack(0, len(node))]
+            for child_bounds in node:
+                packed.append(BRANCH_ITEM.pack(*child_bounds, child_offset))
+                child_offset += child_node_size
+            file_handle.write(b"".join(packed).ljust(branch_node_size, b"\0"))
+        offset += len(nodes) * branch_node_size
+    for start in range(0, max(len(items), 1), block_size):
+        leaf_items = items[start : start + block_size]
+        packed = [NODE_HEADER.pack(1, len(leaf_items))]
+        for item in leaf_items:
+            packed.append(LEAF_ITEM.pack(*item.bounds, item.offset, item.size))
+        file_handle.write(b"".join(packed).ljust(leaf_node_size, b"\0"))
+
+
+def _node_bounds(children: List[Bounds]) -> Bounds:
+    return (
+        *min(child[:2] for child in children),
+        *max(child[2:] for child in children),
+    )
+
+
+def compute_coverage(
+    chrom_ids: np.ndarray, starts: np.ndarray, ends: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns the chromosome ids, starts, ends and depths of the runs of bases covered by
+    at least one record, sorted by chromosome id and start. The depth is the number of
+    records covering the run, which bigBed zoom levels summarize.
+    """
+    if len(starts) == 0:
+        return chrom_ids, starts, ends, starts
+    chroms = chrom_ids.astype(np.int64) << 32
+    positions = np.concatenate((chroms | starts, chroms | ends))
+    deltas = np.concatenate(
+        (np.ones(len(starts), dtype=np.int64), np.full(len(ends), -1, dtype=np.int64))
+    )
+    order = np.argsort(positions, kind="stable")
+    positions = positions[order]
+    depths = np.cumsum(deltas[order])
+    # Keep the depth after the last event at each position, it holds until the next
+    last_at_position = np.append(positions[1:] != positions[:-1], True)
+    positions = positions[last_at_position]
+    depths = depths[last_at_position]
+    covered = depths[:-1] > 0
+    run_starts = positions[:-1][covered]
+    run_ends = positions[1:][covered]
+    return (
+        run_starts >> 32,
+        run_starts & 0xFFFFFFFF,
+        run_ends & 0xFFFFFFFF,
+        depths[:-1][covered],
+    )
+
+
+def summarize(
+    coverage: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray], reduction: int
+) -> Tuple[np.ndarray, ...]:
+    """
+    Summarize the coverage in bins of `reduction` bases for a zoom level. Returns the
+    chromosome id, start, end, number of covered bases, minimum and maximum depth, and
+    the sums of the depth and squared depth over the covered bases of each bin with any
+    coverage. The start and end are those of the covered bases in the bin.
+    """
+    chroms, starts, ends, depths = coverage
+    first_bins = starts // reduction
+    counts = (ends - 1) // reduction - first_bins + 1
+    run_indices = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.cumsum(counts) - counts
+    bins = (
+        np.arange(int(counts.sum()))
+        - np.repeat(offsets, counts)
+        + first_bins[run_indices]
+    )
+    bin_starts = np.maximum(starts[run_indices], bins * reduction)
+    bin_ends = np.minimum(ends[run_indices], (bins + 1) * reduction)
+    lengths = bin_ends - bin_starts
+    bin_depths = depths[run_indices]
+    keys = (chroms[run_indices] << 32) | bins
+    groups = np.flatnonzero(np.append(True, keys[1:] != keys[:-1]))
+    return (
+        chroms[run_indices][groups],
+        bin_starts[groups],
+        np.maximum.reduceat(bin_ends, groups),
+        np.add.reduceat(lengths, groups),
+        np.minimum.reduceat(bin_depths, groups),
+        np.maximum.reduceat(bin_depths, groups),
+        np.add.reduceat(bin_depths * lengths, groups),
+        np.add.reduceat(bin_depths * bin_depths * lengths, groups),
+    )
+
+
+def choose_zoom_levels(
+    coverage: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+    average_size: float,
+    data_size: int,
+) -> List[Tuple[int, Tuple[np.ndarray, ...]]]:
+    """
+    Picks the zoom levels the way bedToBigBed does: the first is the smallest
+    reduction, starting from the average record size and growing by `ZOOM_INCREMENT`,
+    whose summaries take at most half the space of the data, and each following level
+    is `ZOOM_INCREMENT` times coarser, for as long as that still shrinks the summaries.
+    """
+    if len(coverage[0]) == 0:
+        return []
+    reduction = max(int(average_size), MIN_ZOOM_REDUCTION)
+    for _ in range(MAX_ZOOM_LEVELS):
+        summaries = summarize(coverage, reduction)
+        # Zoom records are assumed to compress about two fold
+        if len(summaries[0]) * ZOOM_RECORD.size // 2 <= data_size // 2:
+            break
+        reduction *= ZOOM_INCREMENT
+    else:
+        return []
+    levels = [(reduction, summaries)]
+    while len(levels) < MAX_ZOOM_LEVELS:
+        reduction *= ZOOM_INCREMENT
+        if reduction > 0xFFFFFFFF:
+            break
+        summaries = summarize(coverage, reduction)
+        if len(summaries[0]) >= len(levels[-1][1][0]):
+            break
+        levels.append((reduction, summaries))
+    return levels
+
+
+def make_total_summary(
+    coverage: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+) -> bytes:
+    _, starts, ends, depths = coverage
+    if len(depths) == 0:
+        return TOTAL_SUMMARY.pack(0, 0, 0, 0, 0)
+    lengths = (ends - starts).astype(np.float64)
+    return TOTAL_SUMMARY.pack(
+        int((ends - starts).sum()),
+        float(depths.min()),
+        float(depths.max()),
+        float((depths * lengths).sum()),
+        float((depths * depths * lengths).sum()),
+    )
+
+
+class _Coordinates:
+    """
+    Compact record coordinates for computing the zoom levels after streaming the data.
+    """
+
+    def __init__(self) -> None:
+        self.chrom_ids = array("I")
+        self.starts = array("I")
+        self.ends = array("I")
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def append(self, chrom_id: int, start: int, end: int) -> None:
+        self.chrom_ids.append(chrom_id)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def average_size(self) -> float:
+        if not self.starts:
+            return 0
+        return (sum(self.ends) - sum(self.starts)) / len(self.starts)
+
+    def to_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return (
+            np.frombuffer(self.chrom_ids, dtype=np.uint32).astype(np.int64),
+            np.frombuffer(self.starts, dtype=np.uint32).astype(np.int64),
+            np.frombuffer(self.ends, dtype=np.uint32).astype(np.int64),
+        )
+
+
+class _BlockWriter:
+    """
+    Compresses blocks on the executor, if any, and writes them out in the order they
+    were submitted, keeping track of where each one went for the index. At most
+    `max_pending` blocks are in flight at once.
+    """
+
+    def __init__(
+        self,
+        file_handle: IO[bytes],
+        executor: Optional[ThreadPoolExecutor],
+        max_pending: int,
+    ) -> None:
+        self._file_handle = file_handle
+        self._executor = executor
+        self._max_pending = max_pending
+        self._pending: Deque[Tuple[Bounds, "Future[bytes]"]] = deque()
+        self._index: List[IndexItem] = []
+        self.max_uncompressed_size = 0
+
+    def submit(self, bounds: Bounds, block: bytes) -> None:
+        self.max_uncompressed_size = max(self.max_uncompressed_size, len(block))
+        if self._executor is None:
+            self._write(bounds, zlib.compress(block))
+            return
+        self._pending.append((bounds, self._executor.submit(zlib.compress, block)))
+        while len(self._pending) > self._max_pending:
+            self._write_next()
+
+    def finish(self) -> List[IndexItem]:
+        """
+        Writes out the remaining blocks and returns the index of all the blocks written
+        since the last call.
+        """
+        while self._pending:
+            self._write_next()
+        index, self._index = self._index, []
+        return index
+
+    def _write_next(self) -> None:
+        bounds, future = self._pending.popleft()
+        self._write(bounds, future.result())
+
+    def _write(self, bounds: Bounds, compressed: bytes) -> None:
+        self._index.append(IndexItem(bounds, self._file_handle.tell(), len(compressed)))
+        self._file_handle.write(compressed)
+
+
+def _iter_rows(bed_file_handle: IO[str]) -> Iterator[List[str]]:
+    for line in bed_file_handle:
+        line = line.rstrip("\r\n")
+        if not line or line.startswith(("track", "browser", "#")):
+            continue
+        yield line.split("\t")
+
+
+def _write_records(
+    writer: _BlockWriter,
+    rows: Iterable[List[str]],
+    field_count: int,
+    chrom_ids: Dict[str, int],
+    chrom_sizes: Dict[str, int],
+    items_per_slot: int,
+    coordinates: _Coordinates,
+) -> None:
+    """
+    Packs the records into blocks of up to `items_per_slot` records on the same
+    chromosome, validating that they are sorted and fit on their chromosome.
+    """
+    block: List[bytes] = []
+    block_chrom = ""
+    block_start = 0
+    block_end = 0
+    previous_start = 0
+    seen_chroms = set()
+    for row in rows:
+        if len(row) != field_count:
+            raise ValueError(
+                f"Expected {field_count} columns but found {len(row)} in row {row}"
+            )
+        chrom = row[0]
+        start = int(row[1])
+        end = int(row[2])
+        if chrom != block_chrom or len(block) == items_per_slot:
+            if block:
+                chrom_id = chrom_ids[block_chrom]
+                writer.submit(
+                    (chrom_id, block_start, chrom_id, block_end), b"".join(block)
+                )
+                block = []
+            if chrom != block_chrom:
+                if chrom not in chrom_ids:
+                    raise ValueError(f"Chromosome {chrom} is not in the chrom sizes")
+                if chrom in seen_chroms:
+                    raise ValueError(
+                        f"Bed is not sorted, found chromosome {chrom} more than once"
+                    )
+                seen_chroms.add(chrom)
+                block_chrom = chrom
+                previous_start = 0
+            block_start = start
+            block_end = end
+        if start < previous_start:
+            raise ValueError(f"Bed is not sorted, {row} is out of order")
+        if not 0 <= start <= end <= chrom_sizes[chrom]:
+            raise ValueError(
+                f"Invalid coordinates for {row} on chromosome of size "
+                f"{chrom_sizes[chrom]}"
+            )
+        previous_start = start
+        block_end = max(block_end, end)
+        chrom_id = chrom_ids[chrom]
+        block.append(
+            RECORD_HEADER.pack(chrom_id, start, end)
+            + "\t".join(row[3:]).encode()
+            + b"\0"
+        )
+        coordinates.append(chrom_id, start, end)
+    if block:
+        chrom_id = chrom_ids[block_chrom]
+        writer.submit((chrom_id, block_start, chrom_id, block_end), b"".join(block))
+
+
+def _write_zoom_records(
+    writer: _BlockWriter, summaries: Tuple[np.ndarray, ...], items_per_slot: int
+) -> None:
+    chroms, starts, ends = summaries[:3]
+    # Same layout as ZOOM_RECORD, the fields are named f0 to f7
+    packed = np.empty(len(chroms), dtype=np.dtype("<u4,<u4,<u4,<u4,<f4,<f4,<f4,<f4"))
+    for i, values in enumerate(summaries):
+        packed[f"f{i}"] = values
+    # Start a new block at every chromosome as well as every `items_per_slot` records
+    chrom_starts = np.flatnonzero(np.append(True, chroms[1:] != chroms[:-1]))
+    boundaries = sorted(
+        {
+            int(block_start)
+            for chrom_start, chrom_end in zip(
+                chrom_starts, np.append(chrom_starts[1:], len(chroms))
+            )
+            for block_start in range(chrom_start, chrom_end, items_per_slot)
+        }
+    )
+    for block_start, block_end in zip(boundaries, boundaries[1:] + [len(chroms)]):
+        chrom_id = int(chroms[block_start])
+        bounds = (
+            chrom_id,
+            int(starts[block_start]),
+            chrom_id,
+            int(ends[block_start:block_end].max()),
+        )
+        writer.submit(bounds, packed[block_start:block_end].tobytes())
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "bed", help="path to bed, may be gzip, BGZF, or zstd compressed, or - for stdin"
+    )
+    parser.add_argument("chrom_sizes")
+    parser.add_argument("-o", "--output-filename", required=True)
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="number of threads to use for compressing the data blocks",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Union
+
+from segway_pipeline.digest import digest_file, digest_files
+from segway_pipeline.instrument import instrumented
+
+PathLike = Union[str, Path]
+
+KEY_ALGORITHM = "sha256"
+OBJECTS_DIR = "objects"
+STAGING_DIR = "tmp"
+DATA_DIR = "data"
+ENTRY_FILENAME = "entry.json"
+SIZE_SUFFIXES = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+class CacheEntry(NamedTuple):
+    """
+    `name` is the basename of the cached file or directory, `last_used` the time it was
+    last published or retrieved, in seconds since the epoch.
+    """
+
+    key: str
+    name: str
+    size: int
+    last_used: float
+    params: Dict[str, Any]
+
+
+class Cache:
+    """
+    A content addressed cache of task outputs in a local directory, for reruns that
+    Cromwell call caching misses. Outputs are stored under a key derived from the
+    contents of the inputs and the parameters that affect the output, see `make_key`,
+    so moving or renaming the inputs doesn't invalidate them. Entries are published
+    atomically with a rename, so concurrent runs can share a cache. If `max_size` is
+    given, the least recently used entries are evicted after each publish to keep the
+    cache under that many bytes.
+    """
+
+    def __init__(self, directory: PathLike, max_size: Optional[int] = None):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        (self.directory / OBJECTS_DIR).mkdir(parents=True, exist_ok=True)
+        (self.directory / STAGING_DIR).mkdir(exist_ok=True)
+
+    def get(self, key: str, destination: PathLike) -> bool:
+        """
+        Copies the output cached under `key` to `destination`, returning whether there
+        was one. Also marks the entry as used for the LRU eviction.
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            entry = self._read_entry(entry_dir)
+        except FileNotFoundError:
+            return False
+        source = entry_dir / DATA_DIR / entry.name
+        if source.is_dir():
+            if Path(destination).exists():
+                shutil.rmtree(destination)
+            shutil.copytree(source, destination, symlinks=True)
+        else:
+            shutil.copyfile(source, destination)
+        os.utime(entry_dir / ENTRY_FILENAME)
+        return True
+
+    def put(
+        self, key: str, path: PathLike, params: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        Publishes a copy of the file or directory at `path` under `key`, with `params`
+        recorded for `list`. An existing entry for the key is kept as is.
+        """
+        path = Path(path)
+        entry_dir = self._entry_dir(key)
+        if entry_dir.exists():
+            return
+        staging_dir = Path(tempfile.mkdtemp(dir=self.directory / STAGING_DIR))
+        try:
+            (staging_dir / DATA_DIR).mkdir()
+            target = staging_dir / DATA_DIR / path.name
+            if path.is_dir():
+                shutil.copytree(path, target, symlinks=True)
+            else:
+                shutil.copyfile(path, target)
+            entry = {"name": path.name, "params": params or {}, "size": _size(target)}
+            with open(staging_dir / ENTRY_FILENAME, "w") as f:
+                json.dump(entry, f, indent=4, sort_keys=True)
+            try:
+                staging_dir.rename(entry_dir)
+            except OSError:
+                # Another run published the same key first
+                if not entry_dir.exists():
+                    raise
+        finally:
+            if staging_dir.exists():
+                shutil.rmtree(staging_dir)
+        if self.max_size is not None:
+            self.prune(max_size=self.max_size)
+
+    def entries(self) -> List[CacheEntry]:
+        """
+        Returns the entries from least to most recently used.
+        """
+        entries = []
+        for entry_dir in (self.directory / OBJECTS_DIR).iterdir():
+            try:
+                entries.append(self._read_entry(entry_dir))
+            except FileNotFoundError:
+                continue
+        return sorted(entries, key=lambda entry: (entry.last_used, entry.key))
+
+    def remove(self, key: str) -> bool:
+        """
+        The entry is renamed out of the objects dir before being deleted, so that it
+        disappears for readers all at once.
+        """
+        entry_dir = self._entry_dir(key)
+        removed_dir = self.directory / STAGING_DIR / f"removed-{key}-{os.getpid()}"
+        try:
+            entry_dir.rename(removed_dir)
+        except FileNotFoundError:
+            return False
+        shutil.rmtree(removed_dir)
+        return True
+
+    def prune(
+        self, max_size: Optional[int] = None, max_age: Optional[float] = None
+    ) -> List[CacheEntry]:
+        """
+        Removes the entries that haven't been used in `max_age` seconds, then the least
+        recently used ones until the total size is at most `max_size` bytes. Returns the
+        removed entries.
+        """
+        entries = self.entries()
+        total_size = sum(entry.size for entry in entries)
+        now = time.time()
+        removed = []
+        for entry in entries:
+            too_old = max_age is not None and now - entry.last_used > max_age
+            too_big = max_size is not None and total_size > max_size
+            if not (too_old or too_big):
+                continue
+            if self.remove(entry.key):
+                removed.append(entry)
+                total_size -= entry.size
+        return removed
+
+    def _entry_dir(self, key: str) -> Path:
+        if not re.fullmatch("[0-9a-f]+", key):
+            raise ValueError(f"Invalid cache key {key}")
+        return self.directory / OBJECTS_DIR / key
+
+    def _read_entry(self, entry_dir: Path) -> CacheEntry:
+        entry_path = entry_dir / ENTRY_FILENAME
+        with open(entry_path) as f:
+            entry = json.load(f)
+        return CacheEntry(
+            key=entry_dir.name,
+            name=entry["name"],
+            size=entry["size"],
+            last_used=entry_path.stat().st_mtime,
+            params=entry["params"],
+        )
+
+
+@instrumented("cache")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    cache = Cache(args.cache_dir)
+    if args.command == "list":
+        entries = cache.entries()
+        for entry in entries:
+            last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.last_used))
+            params = json.dumps(entry.params, sort_keys=True)
+            print(
+                f"{entry.key[:12]}\t{format_size(entry.size)}\t{last_used}\t"
+                f"{entry.name}\t{params}"
+            )
+        total_size = sum(entry.size for entry in entries)
+        print(f"{len(entries)} entries, {format_size(total_size)} total")
+    elif args.command == "prune":
+        if args.max_size is None and args.max_age is None:
+            parser.error("Must specify --max-size and/or --max-age")
+        max_age = None if args.max_age is None else args.max_age * 24 * 60 * 60
+        removed = cache.prune(max_size=args.max_size, max_age=max_age)
+        for entry in removed:
+            print(f"Removed {entry.key[:12]} {entry.name}")
+    else:
+        for prefix in args.keys:
+            matches = [
+                entry for entry in cache.entries() if entry.key.startswith(prefix)
+            ]
+            if len(matches) != 1:
+                parser.error(f"Key prefix {prefix} matches {len(matches)} entries")
+            cache.remove(matches[0].key)
+            print(f"Removed {matches[0].key[:12]} {matches[0].name}")
+
+
+def make_key(paths: Sequence[PathLike], params: Dict[str, Any], jobs: int = 1) -> str:
+    """
+    Hashes the contents of the input files, in order, along with the parameters, which
+    must be JSON serializable. Directories are hashed by the relative paths and contents
+    of the files in them. The file names themselves aren't part of the key, so anything
+    derived from them that affects the output, e.g. track names, must be in `params`.
+    """
+    hasher = hashlib.new(KEY_ALGORITHM)
+    hasher.update(json.dumps(params, sort_keys=True).encode())
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            files = sorted(_iter_files(path))
+            digests = digest_files(
+                files, algorithm=KEY_ALGORITHM, decompress=False, jobs=jobs
+            )
+            for file, digest in zip(files, digests):
+                hasher.update(f"{file.relative_to(path).as_posix()}\0".encode())
+                hasher.update(digest.encode())
+        else:
+            digest = digest_file(path, algorithm=KEY_ALGORITHM, decompress=False)
+            hasher.update(digest.encode())
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def parse_size(size: str) -> int:
+    """
+    Parses a size in bytes with an optional binary suffix, e.g. 500M or 1.5T.
+    """
+    match = re.fullmatch(r"([0-9.]+)\s*([KMGT]?)i?B?", size.strip(), re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Invalid size {size}")
+    return int(float(match.group(1)) * SIZE_SUFFIXES[match.group(2).upper()])
+
+
+def add_cache_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--cache-dir",
+        help=(
+            "local directory to cache outputs in, keyed on the contents of the inputs "
+            "and the parameters. If an output is already cached it is copied from the "
+            "cache instead of being made again."
+        ),
+    )
+    parser.add_argument(
+        "--cache-max-size",
+        type=parse_size,
+        help="evict least recently used outputs to keep the cache under this, e.g. 500G",
+    )
+
+
+def format_size(size: int) -> str:
+    if size < 1024:
+        return str(size)
+    scaled = float(size)
+    for suffix in ("K", "M", "G", "T"):
+        scaled /= 1024
+        if scaled < 1024 or suffix == "T":
+            break
+    return f"{scaled:.1f}{suffix}"
+
+
+def _iter_files(directory: Path) -> Iterator[Path]:
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            yield Path(root, filename)
+
+
+def _size(path: Path) -> int:
+    if not path.is_dir():
+        return path.stat().st_size
+    return sum(file.stat().st_size for file in _iter_files(path))
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("cache_dir", help="cache directory, as passed to --cache-dir")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="list entries, least recently used first")
+    prune_parser = subparsers.add_parser(
+        "prune", help="evict least recently used and old entries"
+    )
+    prune_parser.add_argument(
+        "--max-size", type=parse_size, help="evict until the cache is under this size"
+    )
+    prune_parser.add_argument(
+        "--max-age", type=float, help="evict entries not used in this many days"
+    )
+    remove_parser = subparsers.add_parser("remove", help="remove entries by key")
+    remove_parser.add_argument(
+        "keys", nargs="+", help="keys or unique key prefixes, as shown by list"
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 import argparse
 from math import sqrt
 
+from segway_pipeline.instrument import instrumented
 
+
+@instrumented("calculate_num_labels")
 def main():
     parser = get_parser()
     args = parser.parse_args()
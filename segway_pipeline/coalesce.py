@@ -0,0 +1,71 @@
+import sys
+from typing import Any, List, Optional
+
+CHROM = 0
+START = 1
+END = 2
+THICK_START = 6
+THICK_END = 7
+
+# Everything but the coordinates must match for two segments to be merged: name, score,
+# strand and itemRgb.
+MERGE_KEY_COLUMNS = (3, 4, 5, 8)
+
+
+class CoalescingWriter:
+    """
+    Wraps a `csv.writer` to merge runs of abutting rows on the same chromosome with the
+    same name, score, strand and color into a single row before writing them, which
+    happens a lot after relabeling since several Segway labels often map onto the same
+    mnemonic. The merged row spans from the start of the first row to the end of the
+    last, as does its thick region. Only the current run is held in memory.
+
+    Call `flush` after the last row to write out the final run.
+    """
+
+    def __init__(self, writer: Any) -> None:
+        self._writer = writer
+        self._pending: Optional[List[str]] = None
+        self.num_merged = 0
+
+    def writerow(self, row: List[str]) -> None:
+        pending = self._pending
+        if pending is not None and can_merge(pending, row):
+            pending[END] = row[END]
+            pending[THICK_END] = row[THICK_END]
+            self.num_merged += 1
+            return
+        if pending is not None:
+            self._writer.writerow(pending)
+        # Callers may reuse or mutate the row after writing it, so keep a copy
+        self._pending = list(row)
+
+    def flush(self) -> None:
+        if self._pending is not None:
+            self._writer.writerow(self._pending)
+            self._pending = None
+
+
+def can_merge(previous: List[str], row: List[str]) -> bool:
+    return (
+        previous[CHROM] == row[CHROM]
+        and previous[END] == row[START]
+        and all(previous[i] == row[i] for i in MERGE_KEY_COLUMNS)
+    )
+
+
+def flush_writer(writer: Any) -> int:
+    """
+    Flushes the writer if it is coalescing, and returns the number of rows it merged.
+    """
+    if isinstance(writer, CoalescingWriter):
+        writer.flush()
+        return writer.num_merged
+    return 0
+
+
+def report_merged(num_merged: int, output_filename: str) -> None:
+    print(
+        f"Coalesced {num_merged} rows into their neighbors in {output_filename}",
+        file=sys.stderr,
+    )
@@ -0,0 +1,530 @@
+import argparse
+import gzip
+import io
+import shutil
+import struct
+import subprocess
+import sys
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Any, Deque, Iterator, List, Optional, Tuple, Union
+
+from segway_pipeline.instrument import instrumented
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+PathLike = Union[str, Path]
+
+NONE = "none"
+GZIP = "gzip"
+BGZF = "bgzf"
+ZSTD = "zstd"
+# gzip compressed by GNU gzip itself, see GnuGzipWriter
+GNU_GZIP = "gnu-gzip"
+COMPRESSIONS = (NONE, GZIP, BGZF, ZSTD, GNU_GZIP)
+
+SUFFIXES_TO_COMPRESSIONS = {".gz": GZIP, ".bgz": BGZF, ".zst": ZSTD}
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+DEFAULT_LEVELS = {GZIP: 6, BGZF: 6, ZSTD: 3, GNU_GZIP: 6}
+GNU_GZIP_PROGRAM = "gzip"
+
+# Same as the BGZF_BLOCK_SIZE used by htslib's bgzip, leaves headroom in the 64 KiB
+# block for incompressible data.
+BGZF_BLOCK_SIZE = 0xFF00
+BGZF_HEADER = struct.Struct("<2sBBIBBHBBHH")
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+GZIP_OS_UNIX = 3
+DEFLATE_WINDOW_SIZE = 1 << 15
+COPY_CHUNK_SIZE = 1 << 20
+
+
+@instrumented("compressed_io")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    recompress(
+        args.input_filename,
+        args.output_filename,
+        compression=args.compression,
+        threads=args.threads,
+    )
+
+
+def recompress(
+    input_path: PathLike,
+    output_path: PathLike,
+    compression: Optional[str] = None,
+    threads: int = 1,
+) -> None:
+    """
+    Streams the decompressed contents of a possibly compressed file to the output with
+    its compression, e.g. to gzip a file on multiple threads.
+    """
+    with open_input(input_path, "rb") as input_file, open_output(
+        output_path, "wb", compression=compression, threads=threads
+    ) as output_file:
+        shutil.copyfileobj(input_file, output_file, COPY_CHUNK_SIZE)
+
+
+def add_compression_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSIONS,
+        help=(
+            "compression for the output, by default inferred from the output filename "
+            "suffix (.gz, .bgz, .zst). gnu-gzip pipes the output through `gzip -n`, "
+            "which is single threaded, for outputs that must be byte identical to gzip's"
+        ),
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="number of threads to use for compressing the output",
+    )
+
+
+def infer_compression(path: PathLike) -> str:
+    return SUFFIXES_TO_COMPRESSIONS.get(Path(path).suffix, NONE)
+
+
+def detect_compression(magic: bytes) -> str:
+    """
+    BGZF files are reported as gzip, since any gzip reader can decompress them.
+    """
+    if magic.startswith(GZIP_MAGIC):
+        return GZIP
+    if magic.startswith(ZSTD_MAGIC):
+        return ZSTD
+    return NONE
+
+
+def sniff_compression(path: PathLike) -> str:
+    with open(path, "rb") as f:
+        return detect_compression(f.read(len(ZSTD_MAGIC)))
+
+
+def is_bgzf(path: PathLike) -> bool:
+    """
+    Checks whether the first block has the BGZF extra subfield, which tells BGZF apart
+    from other gzip files.
+    """
+    with open(path, "rb") as f:
+        return _parse_bgzf_header(f.read(BGZF_HEADER.size)) is not None
+
+
+def open_input(path: PathLike, mode: str = "rt") -> IO[Any]:
+    """
+    Opens a possibly compressed file for reading, detecting the compression from the
+    file contents rather than the name, so plain, gzip, BGZF and zstd files can all be
+    read directly. A path of `-` reads from stdin.
+    """
+    if mode not in ("rt", "rb"):
+        raise ValueError(f"Invalid mode {mode}, must be one of rt or rb")
+    if str(path) == "-":
+        raw: IO[bytes] = open(sys.stdin.fileno(), "rb", closefd=False)
+    else:
+        raw = open(path, "rb")
+    compression = detect_compression(raw.peek(len(ZSTD_MAGIC)))  # type: ignore
+    binary: Any
+    if compression == GZIP:
+        binary = _ClosingGzipFile(raw)
+    elif compression == ZSTD:
+        binary = _require_zstandard().ZstdDecompressor().stream_reader(raw)
+    else:
+        binary = raw
+    if mode == "rb":
+        return binary
+    return io.TextIOWrapper(binary)
+
+
+def open_output(
+    path: PathLike,
+    mode: str = "wt",
+    compression: Optional[str] = None,
+    threads: int = 1,
+    level: Optional[int] = None,
+) -> IO[Any]:
+    """
+    Opens a file for writing with the given compression, or the compression inferred
+    from the filename if none is given. A path of `-` writes to stdout. Text mode uses
+    `newline=""` so that `csv.writer` line terminators are written untranslated.
+    """
+    if mode not in ("wt", "wb"):
+        raise ValueError(f"Invalid mode {mode}, must be one of wt or wb")
+    if compression is None:
+        compression = infer_compression(path)
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Invalid compression {compression}")
+    if threads < 1:
+        raise ValueError("Must use at least one thread")
+    if str(path) == "-":
+        raw: IO[bytes] = open(sys.stdout.fileno(), "wb", closefd=False)
+    else:
+        raw = open(path, "wb")
+    binary: Any
+    if compression == NONE:
+        binary = raw
+    else:
+        level = DEFAULT_LEVELS[compression] if level is None else level
+        if compression == GZIP:
+            binary = ParallelGzipWriter(raw, level=level, threads=threads)
+        elif compression == BGZF:
+            binary = BgzfWriter(raw, level=level, threads=threads)
+        elif compression == GNU_GZIP:
+            binary = GnuGzipWriter(raw, level=level)
+        else:
+            binary = (
+                _require_zstandard()
+                .ZstdCompressor(level=level, threads=threads if threads > 1 else 0)
+                .stream_writer(raw)
+            )
+    if mode == "wb":
+        return binary
+    return io.TextIOWrapper(binary, newline="")
+
+
+def _require_zstandard() -> Any:
+    if zstandard is None:
+        raise RuntimeError(
+            "Reading or writing zstd requires the zstandard package, install it with "
+            "`pip install zstandard`"
+        )
+    return zstandard
+
+
+class _ClosingGzipFile(gzip.GzipFile):
+    """
+    `gzip.GzipFile` does not close a `fileobj` passed to it, this one does.
+    """
+
+    def __init__(self, fileobj: IO[bytes]) -> None:
+        super().__init__(fileobj=fileobj, mode="rb")
+        self._raw = fileobj
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._raw.close()
+
+
+class _BlockCompressingWriter(io.BufferedIOBase):
+    """
+    Buffers writes into fixed size blocks and compresses them on a thread pool, writing
+    the compressed blocks out in order. zlib releases the GIL while compressing, so
+    this scales with the number of threads. At most `2 * threads` blocks are in flight
+    at any time to keep memory bounded. Output only depends on the data and the level,
+    not on the number of threads or on how the writes were split up.
+    """
+
+    block_size = 1 << 20
+
+    def __init__(self, fileobj: IO[bytes], level: int, threads: int = 1) -> None:
+        super().__init__()
+        self._fileobj = fileobj
+        self._level = level
+        self._buffer = bytearray()
+        self._pending: Deque["Future[bytes]"] = deque()
+        self._max_pending = 2 * threads
+        self._executor = ThreadPoolExecutor(threads) if threads > 1 else None
+        self._fileobj.write(self._header())
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[: self.block_size])
+            del self._buffer[: self.block_size]
+            self._submit(block, last=False)
+        return len(data)
+
+    def flush(self) -> None:
+        """
+        Deliberately does not compress a partial block, that would make the output
+        depend on when the caller flushed.
+        """
+        if not self._fileobj.closed:
+            self._fileobj.flush()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            self._submit(bytes(self._buffer), last=True)
+            self._buffer.clear()
+            while self._pending:
+                self._fileobj.write(self._pending.popleft().result())
+            self._fileobj.write(self._trailer())
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+            self._fileobj.close()
+            super().close()
+
+    def _submit(self, block: bytes, last: bool) -> None:
+        args = self._prepare(block, last)
+        if self._executor is None:
+            self._fileobj.write(self._compress(*args))
+            return
+        self._pending.append(self._executor.submit(self._compress, *args))
+        while len(self._pending) > self._max_pending:
+            self._fileobj.write(self._pending.popleft().result())
+
+    def _header(self) -> bytes:
+        return b""
+
+    def _trailer(self) -> bytes:
+        return b""
+
+    def _prepare(self, block: bytes, last: bool) -> Tuple[Any, ...]:
+        """
+        Runs on the calling thread, in order, so it is where any state carried between
+        blocks must be updated. Returns the arguments to `_compress`.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _compress(*args: Any) -> bytes:
+        raise NotImplementedError
+
+
+class ParallelGzipWriter(_BlockCompressingWriter):
+    """
+    Writes a single member gzip stream in the same fashion as `pigz`: each block is
+    deflated independently, primed with the last 32 KiB of the previous block as the
+    dictionary so the compression ratio matches serial gzip, and ends with a sync flush
+    so the compressed blocks can simply be concatenated. Like `gzip -n` the header
+    contains no filename and a zero mtime, so the output is reproducible: the same for
+    a given input and level, whatever the number of threads. It is not byte identical
+    to that of `gzip -n` though, only any gzip reader decompresses it to the same data,
+    since zlib's deflate streams differ from gzip's for all but small inputs, and more
+    so at the block boundaries. Use `GnuGzipWriter` where the bytes must match gzip's.
+    """
+
+    def __init__(self, fileobj: IO[bytes], level: int = 6, threads: int = 1) -> None:
+        self._crc = 0
+        self._size = 0
+        self._dictionary = b""
+        super().__init__(fileobj, level, threads)
+
+    def _header(self) -> bytes:
+        extra_flags = 2 if self._level == 9 else 4 if self._level == 1 else 0
+        return struct.pack("<2sBBIBB", GZIP_MAGIC, 8, 0, 0, extra_flags, GZIP_OS_UNIX)
+
+    def _trailer(self) -> bytes:
+        return struct.pack("<II", self._crc, self._size & 0xFFFFFFFF)
+
+    def _prepare(self, block: bytes, last: bool) -> Tuple[Any, ...]:
+        self._crc = zlib.crc32(block, self._crc)
+        self._size += len(block)
+        dictionary = self._dictionary
+        self._dictionary = (dictionary + block)[-DEFLATE_WINDOW_SIZE:]
+        return block, dictionary, self._level, last
+
+    @staticmethod
+    def _compress(*args: Any) -> bytes:
+        block, dictionary, level, last = args
+        if dictionary:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary)
+        else:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        flush_mode = zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+        return compressor.compress(block) + compressor.flush(flush_mode)
+
+
+class BgzfWriter(_BlockCompressingWriter):
+    """
+    Writes the blocked gzip format used by htslib, readable by `bgzip`, `tabix`, and any
+    gzip reader. Each pool task compresses a batch of BGZF blocks.
+    """
+
+    block_size = 16 * BGZF_BLOCK_SIZE
+
+    def __init__(self, fileobj: IO[bytes], level: int = 6, threads: int = 1) -> None:
+        super().__init__(fileobj, level, threads)
+
+    def _trailer(self) -> bytes:
+        return BGZF_EOF
+
+    def _prepare(self, block: bytes, last: bool) -> Tuple[Any, ...]:
+        return block, self._level
+
+    @staticmethod
+    def _compress(*args: Any) -> bytes:
+        block, level = args
+        blocks: List[bytes] = []
+        view = memoryview(block)
+        for start in range(0, len(block), BGZF_BLOCK_SIZE):
+            blocks.append(make_bgzf_block(view[start : start + BGZF_BLOCK_SIZE], level))
+        return b"".join(blocks)
+
+
+class GnuGzipWriter(io.BufferedIOBase):
+    """
+    Pipes the data through `gzip -n`, for outputs that must be byte for byte what
+    `gzip -nc` makes, e.g. to compare them with the outputs of older pipeline versions.
+    GNU gzip has its own deflate implementation, so no zlib based writer can do that.
+    Single threaded.
+    """
+
+    def __init__(self, fileobj: IO[bytes], level: int = 6) -> None:
+        super().__init__()
+        self._fileobj = fileobj
+        self._process = subprocess.Popen(
+            [GNU_GZIP_PROGRAM, "-nc", f"-{level}"],
+            stdin=subprocess.PIPE,
+            stdout=fileobj,
+        )
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        self._process.stdin.write(data)  # type: ignore
+        return len(data)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            self._process.stdin.close()  # type: ignore
+            returncode = self._process.wait()
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, self._process.args)
+        finally:
+            self._fileobj.close()
+            super().close()
+
+
+def make_bgzf_block(data: Union[bytes, memoryview], level: int = 6) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    # BSIZE is the total block size minus one: 18 byte header + data + 8 byte trailer
+    block_size = len(compressed) + 25
+    header = BGZF_HEADER.pack(GZIP_MAGIC, 8, 4, 0, 0, 0xFF, 6, 66, 67, 2, block_size)
+    trailer = struct.pack("<II", zlib.crc32(data), len(data))
+    return header + compressed + trailer
+
+
+class BgzfReader:
+    """
+    Reads a BGZF file one block at a time so that positions can be reported and sought
+    to as virtual offsets, the compressed offset of the block shifted left 16 bits plus
+    the offset within the uncompressed block, as used by tabix and htslib.
+    """
+
+    def __init__(self, fileobj: IO[bytes]) -> None:
+        self._fileobj = fileobj
+        self._block_offset = 0
+        self._next_block_offset = 0
+        self._block = b""
+        self._within_block = 0
+        self._load_block(0)
+
+    def __enter__(self) -> "BgzfReader":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._fileobj.close()
+
+    def tell(self) -> int:
+        if self._within_block == len(self._block):
+            self._load_block(self._next_block_offset)
+        return self._block_offset << 16 | self._within_block
+
+    def seek(self, virtual_offset: int) -> None:
+        block_offset = virtual_offset >> 16
+        if block_offset != self._block_offset:
+            self._load_block(block_offset)
+        self._within_block = virtual_offset & 0xFFFF
+
+    def readline(self) -> bytes:
+        pieces = []
+        while True:
+            end = self._block.find(b"\n", self._within_block)
+            if end != -1:
+                pieces.append(self._block[self._within_block : end + 1])
+                self._within_block = end + 1
+                break
+            pieces.append(self._block[self._within_block :])
+            self._within_block = len(self._block)
+            if not self._load_block(self._next_block_offset):
+                break
+        return b"".join(pieces)
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(self.readline, b"")
+
+    def _load_block(self, block_offset: int) -> bool:
+        """
+        Returns False at the end of the file. Empty blocks, like the EOF marker, are
+        skipped over.
+        """
+        while True:
+            self._fileobj.seek(block_offset)
+            header = self._fileobj.read(BGZF_HEADER.size)
+            if not header:
+                return False
+            block_size = _parse_bgzf_header(header)
+            if block_size is None:
+                raise ValueError(f"Invalid BGZF block at offset {block_offset}")
+            data = self._fileobj.read(block_size + 1 - BGZF_HEADER.size)
+            self._block = zlib.decompress(data[:-8], -15)
+            self._block_offset = block_offset
+            self._next_block_offset = block_offset + block_size + 1
+            self._within_block = 0
+            if self._block:
+                return True
+            block_offset = self._next_block_offset
+
+
+def _parse_bgzf_header(header: bytes) -> Optional[int]:
+    """
+    Returns the BSIZE field, the total block size minus one, or None if this is not a
+    BGZF block header.
+    """
+    if len(header) < BGZF_HEADER.size:
+        return None
+    magic, method, flags, *_, subfield_1, subfield_2, _, block_size = (
+        BGZF_HEADER.unpack(header)
+    )
+    if (magic, method, flags & 4, subfield_1, subfield_2) != (GZIP_MAGIC, 8, 4, 66, 67):
+        return None
+    return block_size
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "input_filename", help="may be gzip, BGZF, or zstd compressed, or - for stdin"
+    )
+    parser.add_argument(
+        "-o",
+        "--output-filename",
+        required=True,
+        help="may be compressed, see --compression",
+    )
+    add_compression_args(parser)
+    return parser
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import argparse
+import hashlib
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Iterator, List, Optional, Pattern, Sequence, Tuple, Union
+
+from segway_pipeline.compressed_io import open_input
+from segway_pipeline.instrument import add_records, instrumented
+
+PathLike = Union[str, Path]
+
+DEFAULT_ALGORITHM = "md5"
+DEFAULT_CHUNK_SIZE = 1 << 20
+# The shake algorithms need a digest length, so are left out
+ALGORITHMS = sorted(
+    algorithm
+    for algorithm in hashlib.algorithms_guaranteed
+    if not algorithm.startswith("shake")
+)
+
+
+@instrumented("digest")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("Must use at least one job")
+    if args.check is not None:
+        with open(args.check) as f:
+            expected = [parse_checksum_line(line) for line in f if line.strip()]
+        paths = [path for _, path in expected]
+    else:
+        if not args.files:
+            parser.error("Must specify files to digest or --check")
+        paths = args.files
+    add_records(len(paths))
+    digests = digest_files(
+        paths,
+        skip_lines=args.skip_lines,
+        header_regex=args.header_regex,
+        algorithm=args.algorithm,
+        decompress=not args.no_decompress,
+        jobs=args.jobs,
+    )
+    if args.check is None:
+        for path, digest in zip(paths, digests):
+            print(f"{digest}  {path}")
+        return
+    num_failed = 0
+    for (expected_digest, path), digest in zip(expected, digests):
+        if digest == expected_digest:
+            print(f"{path}: OK")
+        else:
+            print(f"{path}: FAILED")
+            num_failed += 1
+    if num_failed:
+        print(
+            f"{num_failed} of {len(paths)} computed digests did NOT match",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+def digest_file(
+    path: PathLike,
+    skip_lines: int = 0,
+    header_regex: Optional[str] = None,
+    algorithm: str = DEFAULT_ALGORITHM,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    decompress: bool = True,
+) -> str:
+    """
+    Returns the hex digest of the decompressed contents of a possibly compressed file
+    after its header, see `iter_content`, or of its raw bytes if not `decompress`. The
+    file is streamed in `chunk_size` chunks, so memory use doesn't depend on the size
+    of the file.
+    """
+    hasher = hashlib.new(algorithm)
+    with open_input(path, "rb") if decompress else open(path, "rb") as file_handle:
+        for chunk in iter_content(file_handle, skip_lines, header_regex, chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def digest_files(
+    paths: Sequence[PathLike],
+    skip_lines: int = 0,
+    header_regex: Optional[str] = None,
+    algorithm: str = DEFAULT_ALGORITHM,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    decompress: bool = True,
+    jobs: int = 1,
+) -> List[str]:
+    """
+    Digests the files with `digest_file` in a pool of `jobs` threads, returning the
+    digests in the same order as `paths`. Both decompression and hashing release the
+    GIL, so the threads run concurrently.
+    """
+    if jobs < 1:
+        raise ValueError("Must use at least one job")
+    if jobs == 1:
+        return [
+            digest_file(
+                path, skip_lines, header_regex, algorithm, chunk_size, decompress
+            )
+            for path in paths
+        ]
+    with ThreadPoolExecutor(jobs) as executor:
+        return list(
+            executor.map(
+                lambda path: digest_file(
+                    path, skip_lines, header_regex, algorithm, chunk_size, decompress
+                ),
+                paths,
+            )
+        )
+
+
+def iter_content(
+    file_handle: IO[bytes],
+    skip_lines: int = 0,
+    header_regex: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """
+    Yields the contents of the file in chunks, leaving out the header: the first
+    `skip_lines` lines, then any lines after those that match `header_regex`, e.g.
+    `track|browser|#`. Lines are only split up until the end of the header, the rest of
+    the file is passed through as it was read.
+    """
+    header_pattern = re.compile(header_regex.encode()) if header_regex else None
+    num_skipped = 0
+    buffer = b""
+    for chunk in iter(lambda: file_handle.read(chunk_size), b""):
+        buffer += chunk
+        position = 0
+        while True:
+            newline = buffer.find(b"\n", position)
+            if newline == -1:
+                break
+            line = buffer[position:newline]
+            if not _is_header(line, num_skipped, skip_lines, header_pattern):
+                yield buffer[position:]
+                yield from iter(lambda: file_handle.read(chunk_size), b"")
+                return
+            num_skipped += 1
+            position = newline + 1
+        buffer = buffer[position:]
+    # Last line without a trailing newline
+    if buffer and not _is_header(buffer, num_skipped, skip_lines, header_pattern):
+        yield buffer
+
+
+def parse_checksum_line(line: str) -> Tuple[str, str]:
+    """
+    Parses a line of `md5sum` style output, a digest and a path separated by two
+    spaces, or a space and a `*` for files digested in binary mode.
+    """
+    digest, path = line.rstrip("\n").split(" ", 1)
+    return digest, path[1:]
+
+
+def _is_header(
+    line: bytes,
+    num_skipped: int,
+    skip_lines: int,
+    header_pattern: Optional[Pattern[bytes]],
+) -> bool:
+    if num_skipped < skip_lines:
+        return True
+    return header_pattern is not None and header_pattern.match(line) is not None
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "files",
+        nargs="*",
+        help="files to digest, may be gzip, BGZF, or zstd compressed, or - for stdin",
+    )
+    parser.add_argument(
+        "-n",
+        "--skip-lines",
+        type=int,
+        default=0,
+        help="number of header lines to leave out of the digest",
+    )
+    parser.add_argument(
+        "--header-regex",
+        help=(
+            "also leave out lines after the skipped ones for as long as they match "
+            "this regex, e.g. 'track|browser|#'"
+        ),
+    )
+    parser.add_argument(
+        "-a",
+        "--algorithm",
+        default=DEFAULT_ALGORITHM,
+        choices=ALGORITHMS,
+    )
+    parser.add_argument(
+        "--no-decompress",
+        action="store_true",
+        help="digest compressed files as they are instead of their contents",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of files to digest concurrently",
+    )
+    parser.add_argument(
+        "-c",
+        "--check",
+        help=(
+            "read digests and paths from this file, as output by this script or "
+            "md5sum, and check them"
+        ),
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
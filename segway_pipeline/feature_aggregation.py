@@ -0,0 +1,633 @@
+import argparse
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import IO, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from segway_pipeline.compressed_io import open_input
+from segway_pipeline.instrument import instrumented
+from segway_pipeline.length_distribution import get_label_sort_key, make_writer
+from segway_pipeline.segmentation import Segmentation, load_input
+
+# Same name, components and layout as the table written by
+# `segtools-aggregation --mode=gene`, which is what the interpretation reads
+FEATURE_AGGREGATION_FILENAME = "feature_aggregation.tab"
+STATIC_FIELDNAMES = ["group", "component", "offset"]
+GROUP = "genes"
+FLANK_5P = "5' flanking: %d bp"
+FLANK_3P = "3' flanking: %d bp"
+INITIAL_EXON = "initial exon (%d bp)"
+INITIAL_INTRON = "initial intron (%d bp)"
+INTERNAL_EXONS = "internal exons (%d bp)"
+INTERNAL_INTRONS = "internal introns (%d bp)"
+TERMINAL_EXON = "terminal exon (%d bp)"
+TERMINAL_INTRON = "terminal intron (%d bp)"
+SPLICE_COMPONENTS = [
+    INITIAL_EXON,
+    INITIAL_INTRON,
+    INTERNAL_EXONS,
+    INTERNAL_INTRONS,
+    TERMINAL_EXON,
+    TERMINAL_INTRON,
+]
+CODING_COMPONENTS = [
+    "initial 5' UTR (%d bp)",
+    "5' UTR introns (%d bp)",
+    "internal 5' UTR (%d bp)",
+    "terminal 5' UTR (%d bp)",
+    "initial CDS (%d bp)",
+    "terminal CDS (%d bp)",
+    "initial 3' UTR (%d bp)",
+    "internal 3' UTR (%d bp)",
+    "3' UTR introns (%d bp)",
+    "terminal 3' UTR (%d bp)",
+]
+EXON_COMPONENTS = [FLANK_5P, *SPLICE_COMPONENTS, FLANK_3P]
+GENE_COMPONENTS = EXON_COMPONENTS + CODING_COMPONENTS
+COMPONENT_INDEXES = {component: i for i, component in enumerate(GENE_COMPONENTS)}
+EXON_FEATURE = "exon"
+CDS_FEATURE = "CDS"
+GENE_FEATURE = "gene"
+INTRON_BINS = 50
+EXON_BINS = 25
+# Bounds the memory used for the pairs of flanks and segments overlapping them
+WINDOWS_PER_CHUNK = 1 << 12
+SEGTOOLS_AGGREGATION = "segtools-aggregation"
+
+Interval = Tuple[int, int]
+GtfRow = Tuple[str, int, int, str, str, Dict[str, str]]
+
+
+class GeneFeatures(NamedTuple):
+    """
+    The parts of the gene models on a chromosome, with the index of their component
+    in `GENE_COMPONENTS`.
+    """
+
+    starts: np.ndarray
+    ends: np.ndarray
+    components: np.ndarray
+    minus: np.ndarray
+
+
+class Transcript:
+    def __init__(self, chrom: str, strand: str) -> None:
+        self.chrom = chrom
+        self.strand = strand
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+        self.exons: List[Interval] = []
+        self.cdss: List[Interval] = []
+        self.error: Optional[str] = None
+
+    def add(self, chrom: str, start: int, end: int, strand: str, feature: str) -> None:
+        if self.start is None or start < self.start:
+            self.start = start
+        if self.end is None or end > self.end:
+            self.end = end
+        if self.error is None and strand != self.strand:
+            self.error = f"Found gene features on more than one strand: {strand}"
+        if self.error is None and chrom != self.chrom:
+            self.error = f"Found gene features on more than one chromosome: {chrom}"
+        if feature == EXON_FEATURE:
+            self.exons.append((start, end))
+        elif feature == CDS_FEATURE:
+            self.cdss.append((start, end))
+
+    def __len__(self) -> int:
+        if self.start is None or self.end is None:
+            return 0
+        return self.end - self.start
+
+
+@instrumented("feature_aggregation")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("Must use at least one job")
+    segmentation = load_input(args.segmentation)
+    with open_input(args.annotation_gtf) as gtf_file_handle:
+        features = read_gene_features(gtf_file_handle)
+    component_bins = get_component_bins(
+        args.flank_bases, args.intron_samples, args.exon_samples
+    )
+    counts, num_features = aggregate(
+        segmentation, features, component_bins, jobs=args.jobs
+    )
+    Path(args.outdir).mkdir(parents=True, exist_ok=True)
+    with open(Path(args.outdir, FEATURE_AGGREGATION_FILENAME), "w", newline="") as f:
+        write_feature_aggregation(
+            segmentation, features, counts, num_features, component_bins, f
+        )
+    if args.plot:
+        plot(args.segmentation, args.annotation_gtf, args.outdir)
+
+
+def read_gene_features(gtf_file_handle: IO[str]) -> Dict[str, GeneFeatures]:
+    """
+    Maps the longest transcript of each gene in the GTF onto the idealized gene model
+    segtools uses, from its exons and CDSs, and returns the parts of the models on
+    each chromosome. The longest transcript is the first one spanning the most bases
+    with any of its features, like segtools. Raises a `ValueError` if a feature is
+    not stranded or the longest transcript of a gene is on more than one strand or
+    chromosome.
+    """
+    genes: Dict[str, Dict[str, Transcript]] = defaultdict(dict)
+    for chrom, start, end, strand, feature, attributes in iter_gtf(gtf_file_handle):
+        if strand not in ("+", "-"):
+            raise ValueError(f"Feature on {chrom} at {start} has no strand")
+        if feature == GENE_FEATURE:
+            continue
+        transcripts = genes[attributes["gene_id"]]
+        transcript_id = attributes["transcript_id"]
+        if transcript_id not in transcripts:
+            transcripts[transcript_id] = Transcript(chrom, strand)
+        transcripts[transcript_id].add(chrom, start, end, strand, feature)
+    parts: Dict[str, List[Tuple[int, int, int, bool]]] = defaultdict(list)
+    for gene_id, transcripts in genes.items():
+        longest = None
+        for transcript in transcripts.values():
+            if longest is None or len(transcript) > len(longest):
+                longest = transcript
+        if longest is None:
+            continue
+        if longest.error is not None:
+            raise ValueError(f"{longest.error} in gene {gene_id}")
+        if not longest.exons:
+            continue
+        minus = longest.strand == "-"
+        for start, end, component in make_gene_model(
+            longest.exons, longest.cdss, minus
+        ):
+            parts[longest.chrom].append((start, end, component, minus))
+    features = {}
+    for chrom, chrom_parts in parts.items():
+        starts, ends, components, minus_strand = zip(*chrom_parts)
+        features[chrom] = GeneFeatures(
+            np.array(starts, dtype=np.int64),
+            np.array(ends, dtype=np.int64),
+            np.array(components, dtype=np.int64),
+            np.array(minus_strand, dtype=bool),
+        )
+    return features
+
+
+def iter_gtf(gtf_file_handle: IO[str]) -> Iterator[GtfRow]:
+    """
+    Yields the chromosome, zero based half open coordinates, strand, feature and
+    attributes of each row, parsed as loosely as segtools does, which drops anything
+    after a `#` on a line.
+    """
+    for line in gtf_file_handle:
+        line = line.split("#", 1)[0].rstrip()
+        if not line:
+            continue
+        words = line.split("\t")
+        if words[0] == "track":
+            continue
+        if len(words) < 9:
+            raise ValueError(f"Expected 9 columns in GTF row: {line}")
+        attributes = {}
+        for attribute in words[8].rstrip("; ").split("; "):
+            key, value = attribute.split(" ", 1)
+            attributes[key] = value.strip('"')
+        if "gene_id" not in attributes:
+            raise ValueError(f"No gene_id in GTF row: {line}")
+        if words[2] == GENE_FEATURE:
+            attributes.setdefault("transcript_id", attributes["gene_id"])
+        if "transcript_id" not in attributes:
+            raise ValueError(f"No transcript_id in GTF row: {line}")
+        yield words[0], int(words[3]) - 1, int(words[4]), words[6], words[2], attributes
+
+
+def make_gene_model(
+    exons: List[Interval], cdss: List[Interval], minus: bool
+) -> List[Tuple[int, int, int]]:
+    """
+    Splits a transcript into the components of the gene model as segtools does: the
+    initial, internal and terminal exons and the introns between them, and if there
+    are CDSs, the UTR exons, trimmed to the CDSs, and introns and the first and last
+    CDS. Returns the start, end and index of the component of each part, in
+    transcription order within each kind of component.
+    """
+    exons = sorted(exons)
+    cdss = sorted(cdss)
+    introns = [
+        (previous_end, start) for (_, previous_end), (start, _) in zip(exons, exons[1:])
+    ]
+    for start, end in introns:
+        if end < start:
+            raise ValueError(f"Exons overlap at {end}-{start}")
+    if minus:
+        exons.reverse()
+        introns.reverse()
+        cdss.reverse()
+    parts = []
+
+    def add(component: str, interval: Interval) -> None:
+        parts.append((interval[0], interval[1], COMPONENT_INDEXES[component]))
+
+    add(INITIAL_EXON, exons[0])
+    if introns:
+        add(INITIAL_INTRON, introns[0])
+    for exon in exons[1:-1]:
+        add(INTERNAL_EXONS, exon)
+    for intron in introns[1:-1]:
+        add(INTERNAL_INTRONS, intron)
+    if introns:
+        add(TERMINAL_INTRON, introns[-1])
+    add(TERMINAL_EXON, exons[-1])
+    if not cdss:
+        return parts
+    first_cds_start, first_cds_end = first_cds = cdss[0]
+    last_cds_start, last_cds_end = last_cds = cdss[-1]
+    utr5_exons: List[Interval] = []
+    utr3_exons: List[Interval] = []
+    for exon_start, exon_end in exons:
+        utr_exons = None
+        if not minus:
+            if exon_start < first_cds_start:
+                exon_end = min(exon_end, first_cds_start)
+                utr_exons = utr5_exons
+            elif exon_end > last_cds_end:
+                exon_start = max(exon_start, last_cds_end)
+                utr_exons = utr3_exons
+        elif exon_end > first_cds_end:
+            exon_start = max(exon_start, first_cds_end)
+            utr_exons = utr5_exons
+        elif exon_start < last_cds_start:
+            exon_end = min(exon_end, last_cds_start)
+            utr_exons = utr3_exons
+        if utr_exons is not None and exon_start < exon_end:
+            utr_exons.append((exon_start, exon_end))
+
+    def upstream(x: Interval, y: Interval) -> bool:
+        return (not minus and x[0] < y[0]) or (minus and x[1] > y[1])
+
+    utr5_introns = [intron for intron in introns if upstream(intron, first_cds)]
+    utr3_introns = [
+        intron
+        for intron in introns
+        if not upstream(intron, first_cds) and upstream(last_cds, intron)
+    ]
+    if utr5_exons:
+        add(CODING_COMPONENTS[0], utr5_exons[0])
+    for intron in utr5_introns:
+        add(CODING_COMPONENTS[1], intron)
+    for exon in utr5_exons[1:-1]:
+        add(CODING_COMPONENTS[2], exon)
+    if utr5_exons:
+        add(CODING_COMPONENTS[3], utr5_exons[-1])
+    add(CODING_COMPONENTS[4], first_cds)
+    add(CODING_COMPONENTS[5], last_cds)
+    if utr3_exons:
+        add(CODING_COMPONENTS[6], utr3_exons[0])
+    for exon in utr3_exons[1:-1]:
+        add(CODING_COMPONENTS[7], exon)
+    for intron in utr3_introns:
+        add(CODING_COMPONENTS[8], intron)
+    if utr3_exons:
+        add(CODING_COMPONENTS[9], utr3_exons[-1])
+    return parts
+
+
+def get_component_bins(
+    flank_bases: int, intron_bins: int = INTRON_BINS, exon_bins: int = EXON_BINS
+) -> List[int]:
+    """
+    The number of bases sampled in each component, in `GENE_COMPONENTS` order: every
+    base of the flanks, and evenly spaced ones in the rest. All of the components
+    that aren't introns are exons or parts of them.
+    """
+    bins = []
+    for component in GENE_COMPONENTS:
+        if component in (FLANK_5P, FLANK_3P):
+            bins.append(flank_bases)
+        elif "intron" in component:
+            bins.append(intron_bins)
+        else:
+            bins.append(exon_bins)
+    return bins
+
+
+def aggregate(
+    segmentation: Segmentation,
+    features: Dict[str, GeneFeatures],
+    component_bins: List[int],
+    jobs: int = 1,
+) -> Tuple[np.ndarray, int]:
+    """
+    Counts the label of the segment at each sampled base of the components of every
+    gene model, by the position of the base relative to the component. Returns the
+    counts, with a row for each bin of each component in `GENE_COMPONENTS` order and
+    a column for each label code, and the number of parts of gene models that had any
+    base labeled. The chromosomes are aggregated in a pool of `jobs` processes.
+    """
+    num_labels = len(segmentation.values["name"])
+    shards = []
+    for chrom, indexes in segmentation.iter_chroms():
+        if chrom not in features:
+            continue
+        shards.append(
+            (
+                segmentation.starts[indexes].astype(np.int64),
+                segmentation.ends[indexes].astype(np.int64),
+                segmentation.codes["name"][indexes].astype(np.int64),
+                features[chrom],
+            )
+        )
+    counts = np.zeros((sum(component_bins), num_labels), dtype=np.int64)
+    num_features = 0
+    if jobs == 1:
+        results: Iterator[Tuple[np.ndarray, int]] = (
+            aggregate_chrom(*shard, component_bins, num_labels) for shard in shards
+        )
+        for chrom_counts, chrom_num_features in results:
+            counts += chrom_counts
+            num_features += chrom_num_features
+        return counts, num_features
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = [
+            executor.submit(aggregate_chrom, *shard, component_bins, num_labels)
+            for shard in shards
+        ]
+        for future in futures:
+            chrom_counts, chrom_num_features = future.result()
+            counts += chrom_counts
+            num_features += chrom_num_features
+    return counts, num_features
+
+
+def aggregate_chrom(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    labels: np.ndarray,
+    features: GeneFeatures,
+    component_bins: List[int],
+    num_labels: int,
+) -> Tuple[np.ndarray, int]:
+    """
+    Aggregates one chromosome, whose segments must be sorted and not overlap. The
+    bases sampled inside the components are looked up in the segments directly. The
+    flanks are counted from the overlaps of each one with the segments instead, as
+    runs of bins added to a difference array of each label.
+    """
+    if np.any(ends[:-1] > starts[1:]):
+        raise ValueError("Segments overlap")
+    bins = np.array(component_bins, dtype=np.int64)
+    row_offsets = np.concatenate([[0], np.cumsum(bins)[:-1]])
+    counts = np.zeros(bins.sum() * num_labels, dtype=np.int64)
+    counted = np.zeros(len(features.starts), dtype=bool)
+
+    # Bases evenly spaced inside each part, with numpy.linspace's arithmetic so they
+    # round to the same ones as segtools, none if the part is shorter than its bins
+    lengths = features.ends - features.starts
+    num_samples = bins[features.components]
+    num_samples[num_samples > lengths] = 0
+    part_indexes = np.repeat(np.arange(len(lengths)), num_samples)
+    sample_indexes = np.arange(num_samples.sum()) - np.repeat(
+        np.cumsum(num_samples) - num_samples, num_samples
+    )
+    steps = lengths[part_indexes] / num_samples[part_indexes]
+    positions = np.round(
+        sample_indexes * steps + features.starts[part_indexes].astype(np.float64)
+    ).astype(np.int64)
+    # The bins run 5' to 3'
+    minus = features.minus[part_indexes]
+    sample_bins = np.where(
+        minus, num_samples[part_indexes] - 1 - sample_indexes, sample_indexes
+    )
+    segment_indexes = np.searchsorted(starts, positions, side="right") - 1
+    labeled = segment_indexes >= 0
+    labeled[labeled] = positions[labeled] < ends[segment_indexes[labeled]]
+    rows = row_offsets[features.components[part_indexes]] + sample_bins
+    counts += np.bincount(
+        rows[labeled] * num_labels + labels[segment_indexes[labeled]],
+        minlength=len(counts),
+    )
+    counted[part_indexes[labeled]] = True
+
+    # The 5' flank of initial exons and the 3' flank of terminal exons, whose bins
+    # also run 5' to 3', so backwards along the genome on the minus strand
+    for flank, exon, five_prime in (
+        (FLANK_5P, INITIAL_EXON, True),
+        (FLANK_3P, TERMINAL_EXON, False),
+    ):
+        width = bins[COMPONENT_INDEXES[flank]]
+        flank_parts = np.flatnonzero(features.components == COMPONENT_INDEXES[exon])
+        if width == 0 or len(flank_parts) == 0:
+            continue
+        flank_minus = features.minus[flank_parts]
+        # The flank is before the part for a plus strand 5' or minus strand 3' flank
+        window_starts = np.where(
+            flank_minus != five_prime,
+            features.starts[flank_parts] - width,
+            features.ends[flank_parts],
+        )
+        flank_counts, hit = count_flanks(
+            starts, ends, labels, window_starts, flank_minus, width, num_labels
+        )
+        start_row = row_offsets[COMPONENT_INDEXES[flank]]
+        counts[
+            start_row * num_labels : (start_row + width) * num_labels
+        ] += flank_counts.ravel()
+        counted[flank_parts[hit]] = True
+    return counts.reshape(-1, num_labels), int(counted.sum())
+
+
+def count_flanks(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    labels: np.ndarray,
+    window_starts: np.ndarray,
+    reverse: np.ndarray,
+    width: int,
+    num_labels: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Counts the labels at each base of windows of `width` bases, the first bin being
+    the base at the window start or, where `reverse`, the last base of the window.
+    Every segment overlapping a window adds one to a run of bins of its label in a
+    difference array, whose cumulative sum is the counts. Returns the counts, with a
+    row per bin and a column per label, and whether each window had any base labeled.
+    """
+    diffs = np.zeros(num_labels * (width + 1), dtype=np.int64)
+    hit = np.zeros(len(window_starts), dtype=bool)
+    for chunk_start in range(0, len(window_starts), WINDOWS_PER_CHUNK):
+        chunk = slice(chunk_start, chunk_start + WINDOWS_PER_CHUNK)
+        window_start = window_starts[chunk]
+        window_end = window_start + width
+        first = np.searchsorted(ends, window_start, side="right")
+        num_overlaps = np.maximum(
+            np.searchsorted(starts, window_end, side="left") - first, 0
+        )
+        windows = np.repeat(np.arange(len(window_start)), num_overlaps)
+        segments = (
+            np.arange(num_overlaps.sum())
+            - np.repeat(np.cumsum(num_overlaps) - num_overlaps, num_overlaps)
+            + first[windows]
+        )
+        overlap_starts = np.maximum(starts[segments], window_start[windows])
+        overlap_ends = np.minimum(ends[segments], window_end[windows])
+        nonempty = overlap_starts < overlap_ends
+        windows = windows[nonempty]
+        overlap_starts = overlap_starts[nonempty]
+        overlap_ends = overlap_ends[nonempty]
+        flipped = reverse[chunk][windows]
+        first_bins = np.where(
+            flipped,
+            window_end[windows] - overlap_ends,
+            overlap_starts - window_start[windows],
+        )
+        last_bins = first_bins + (overlap_ends - overlap_starts)
+        offsets = labels[segments[nonempty]] * (width + 1)
+        diffs += np.bincount(offsets + first_bins, minlength=len(diffs))
+        diffs -= np.bincount(offsets + last_bins, minlength=len(diffs))
+        hit[chunk][windows] = True
+    counts = np.cumsum(diffs.reshape(num_labels, width + 1), axis=1)[:, :width]
+    return counts.T, hit
+
+
+def write_feature_aggregation(
+    segmentation: Segmentation,
+    features: Dict[str, GeneFeatures],
+    counts: np.ndarray,
+    num_features: int,
+    component_bins: List[int],
+    output_file_handle: IO[str],
+) -> None:
+    """
+    Writes the table as segtools does, with a comment line of the number of parts of
+    gene models counted, the number of components of the splicing plot and the number
+    of bases of each label, then the counts of the labels at each offset into each
+    component. The components are named after the mean length of their parts over
+    all the genes, or the number of flanking bases.
+    """
+    label_codes = sorted(
+        range(len(segmentation.values["name"])),
+        key=lambda code: get_label_sort_key(segmentation.values["name"][code]),
+    )
+    label_names = [segmentation.values["name"][code] for code in label_codes]
+    label_bases = np.bincount(
+        segmentation.codes["name"],
+        weights=segmentation.ends.astype(np.int64) - segmentation.starts,
+        minlength=len(label_names),
+    )
+    metadata = {"num_features": num_features, "spacers": len(EXON_COMPONENTS)}
+    for code, label in zip(label_codes, label_names):
+        metadata[label] = int(label_bases[code])
+    output_file_handle.write(
+        "# " + " ".join(f"{key}={value}" for key, value in metadata.items()) + "\n"
+    )
+    writer = make_writer(output_file_handle)
+    writer.writerow(STATIC_FIELDNAMES + label_names)
+    component_names = get_component_names(features, component_bins)
+    row = 0
+    for component, name, num_bins in zip(
+        GENE_COMPONENTS, component_names, component_bins
+    ):
+        offsets = range(-num_bins, 0) if component == FLANK_5P else range(num_bins)
+        for offset in offsets:
+            writer.writerow([GROUP, name, offset, *counts[row, label_codes].tolist()])
+            row += 1
+
+
+def get_component_names(
+    features: Dict[str, GeneFeatures], component_bins: List[int]
+) -> List[str]:
+    """
+    Component names stay unformatted when none of their parts have any bases.
+    """
+    lengths = np.zeros(len(GENE_COMPONENTS), dtype=np.int64)
+    num_parts = np.zeros(len(GENE_COMPONENTS), dtype=np.int64)
+    for chrom_features in features.values():
+        lengths += np.bincount(
+            chrom_features.components,
+            weights=chrom_features.ends - chrom_features.starts,
+            minlength=len(GENE_COMPONENTS),
+        ).astype(np.int64)
+        num_parts += np.bincount(
+            chrom_features.components, minlength=len(GENE_COMPONENTS)
+        )
+    names = []
+    for i, component in enumerate(GENE_COMPONENTS):
+        if component in (FLANK_5P, FLANK_3P):
+            names.append(component % component_bins[i])
+        elif lengths[i] > 0:
+            names.append(component % (lengths[i] / num_parts[i]))
+        else:
+            names.append(component)
+    return names
+
+
+def plot(segmentation: str, annotation_gtf: str, outdir: str) -> None:
+    """
+    Plots the table with segtools, which only reads the table with `--replot`.
+    """
+    subprocess.run(
+        [
+            SEGTOOLS_AGGREGATION,
+            "--replot",
+            "--normalize",
+            "--mode=gene",
+            "-o",
+            outdir,
+            segmentation,
+            annotation_gtf,
+        ],
+        check=True,
+    )
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("segmentation", help="Segway bed or saved segmentation")
+    parser.add_argument("annotation_gtf", help="possibly compressed GTF")
+    parser.add_argument(
+        "-o",
+        "--outdir",
+        required=True,
+        help=f"directory to write {FEATURE_AGGREGATION_FILENAME} to",
+    )
+    parser.add_argument(
+        "-f",
+        "--flank-bases",
+        type=int,
+        default=500,
+        help="number of bases to aggregate off each end of the genes",
+    )
+    parser.add_argument(
+        "-i",
+        "--intron-samples",
+        type=int,
+        default=INTRON_BINS,
+        help="number of evenly spaced bases to sample in each intron",
+    )
+    parser.add_argument(
+        "-e",
+        "--exon-samples",
+        type=int,
+        default=EXON_BINS,
+        help="number of evenly spaced bases to sample in each exon",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes to aggregate the chromosomes in",
+    )
+    parser.add_argument(
+        "--plot",
+        action="store_true",
+        help=f"also plot the table with {SEGTOOLS_AGGREGATION}, after it is written",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
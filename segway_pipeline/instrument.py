@@ -0,0 +1,264 @@
+import cProfile
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from types import FrameType
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar, Union, cast
+
+PathLike = Union[str, Path]
+F = TypeVar("F", bound=Callable[..., Any])
+
+METRICS_DIR_ENV_VAR = "SEGWAY_PIPELINE_METRICS_DIR"
+PROFILE_ENV_VAR = "SEGWAY_PIPELINE_PROFILE"
+CPROFILE = "cprofile"
+SAMPLE = "sample"
+PROFILERS = (CPROFILE, SAMPLE)
+METRICS_SUFFIX = ".json"
+CPROFILE_SUFFIX = ".prof"
+SAMPLE_SUFFIX = ".folded"
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# The runs being measured, innermost last, see `add_records`
+_runs: List["Run"] = []
+
+
+class Run:
+    """
+    A script run being measured by `measure`. `records` is the number of records, e.g.
+    bed rows or archive members, that the script reported handling with `add_records`.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.records = 0
+        self.exit_status = 0
+
+
+class StackSampler(threading.Thread):
+    """
+    A sampling profiler. Every `interval` seconds it records the stacks of all the
+    other threads, which are written out by `write` in the folded format that
+    flamegraph.pl and speedscope read. Unlike cProfile it doesn't slow down the code
+    being profiled, and it sees the time spent in worker threads too.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL) -> None:
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != self.ident:
+                    self.stacks[_format_stack(frame)] += 1
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+    def write(self, path: PathLike) -> None:
+        with open(path, "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+
+def instrumented(name: str) -> Callable[[F], F]:
+    """
+    Decorates a script's `main` to `measure` it under `name` when either
+    `SEGWAY_PIPELINE_METRICS_DIR` or `SEGWAY_PIPELINE_PROFILE` is set in the
+    environment, otherwise `main` runs as is.
+    """
+
+    def decorator(main: F) -> F:
+        @functools.wraps(main)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            metrics_dir = os.environ.get(METRICS_DIR_ENV_VAR) or None
+            profiler = os.environ.get(PROFILE_ENV_VAR) or None
+            if metrics_dir is None and profiler is None:
+                return main(*args, **kwargs)
+            with measure(name, metrics_dir=metrics_dir, profiler=profiler):
+                return main(*args, **kwargs)
+
+        return cast(F, wrapper)
+
+    return decorator
+
+
+@contextmanager
+def measure(
+    name: str,
+    metrics_dir: Optional[PathLike] = None,
+    profiler: Optional[str] = None,
+    sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+) -> Iterator[Run]:
+    """
+    Measures the enclosed code, and if `metrics_dir` is given writes the metrics to
+    `{name}.json` in it, see `get_metrics`, even if the code raises or exits. If
+    `profiler` is `cprofile` the code is also profiled with cProfile, written to
+    `{name}.prof`, or if it is `sample` with `StackSampler`, written to `{name}.folded`,
+    in `metrics_dir` or else the working directory.
+    """
+    if profiler is not None and profiler not in PROFILERS:
+        raise ValueError(
+            f"Unknown profiler {profiler}, must be one of {', '.join(PROFILERS)}"
+        )
+    output_dir = Path(metrics_dir if metrics_dir is not None else ".")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    run = Run(name)
+    start = _snapshot()
+    profile = None
+    sampler = None
+    if profiler == CPROFILE:
+        profile = cProfile.Profile()
+        profile.enable()
+    elif profiler == SAMPLE:
+        sampler = StackSampler(sample_interval)
+        sampler.start()
+    _runs.append(run)
+    try:
+        yield run
+    except SystemExit as e:
+        run.exit_status = _get_exit_status(e.code)
+        raise
+    except BaseException:
+        run.exit_status = 1
+        raise
+    finally:
+        _runs.remove(run)
+        profile_path = None
+        if profile is not None:
+            profile.disable()
+            profile_path = output_dir / f"{name}{CPROFILE_SUFFIX}"
+            profile.dump_stats(str(profile_path))
+        if sampler is not None:
+            sampler.stop()
+            profile_path = output_dir / f"{name}{SAMPLE_SUFFIX}"
+            sampler.write(profile_path)
+        if metrics_dir is not None:
+            metrics = get_metrics(run, start, _snapshot())
+            metrics["profile"] = None if profile_path is None else profile_path.name
+            with open(output_dir / f"{name}{METRICS_SUFFIX}", "w") as f:
+                json.dump(metrics, f, indent=4, sort_keys=True)
+
+
+def add_records(num_records: int) -> None:
+    """
+    Adds to the number of records handled by the run being measured, if any.
+    """
+    if _runs:
+        _runs[-1].records += num_records
+
+
+def get_metrics(run: Run, start: Dict[str, Any], end: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The CPU times of children only include the subprocesses that have been waited for.
+    The peak RSS of children is that of the largest one, not of all of them at once,
+    and like `ru_maxrss` it is kept across `execve`, so it may also be that of a child
+    of whatever launched the script.
+    Bytes read and written are those of this process, not of its children, and count
+    all I/O, including from the page cache. They are missing where there is no
+    `/proc/self/io`.
+    """
+    self_start, children_start = start["rusage"]
+    self_end, children_end = end["rusage"]
+    metrics: Dict[str, Any] = {
+        "name": run.name,
+        "argv": sys.argv,
+        "exit_status": run.exit_status,
+        "wall_seconds": round(end["wall"] - start["wall"], 4),
+        "user_seconds": round(self_end.ru_utime - self_start.ru_utime, 4),
+        "system_seconds": round(self_end.ru_stime - self_start.ru_stime, 4),
+        "children_user_seconds": round(
+            children_end.ru_utime - children_start.ru_utime, 4
+        ),
+        "children_system_seconds": round(
+            children_end.ru_stime - children_start.ru_stime, 4
+        ),
+        "peak_rss_mb": round(get_peak_rss_mb(), 1),
+        "children_peak_rss_mb": round(maxrss_to_mb(children_end.ru_maxrss), 1),
+        "records": run.records,
+        "bytes_read": None,
+        "bytes_written": None,
+    }
+    if start["io"] is not None and end["io"] is not None:
+        metrics["bytes_read"] = end["io"]["rchar"] - start["io"]["rchar"]
+        metrics["bytes_written"] = end["io"]["wchar"] - start["io"]["wchar"]
+    return metrics
+
+
+def get_peak_rss_mb() -> float:
+    """
+    Linux keeps the peak of `ru_maxrss` across `execve`, so a benchmark process would
+    report the memory of the runner that spawned it, read the high water mark of the
+    process's own memory instead where possible.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / (1 << 10)
+    except FileNotFoundError:
+        pass
+    return maxrss_to_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def maxrss_to_mb(maxrss: int) -> float:
+    # Linux reports kilobytes, macOS bytes
+    if sys.platform == "darwin":
+        return maxrss / (1 << 20)
+    return maxrss / (1 << 10)
+
+
+def read_io_counters() -> Optional[Dict[str, int]]:
+    try:
+        with open("/proc/self/io") as f:
+            counters = {}
+            for line in f:
+                key, value = line.split(":")
+                counters[key] = int(value)
+            return counters
+    except OSError:
+        return None
+
+
+def _snapshot() -> Dict[str, Any]:
+    return {
+        "wall": time.perf_counter(),
+        "rusage": (
+            resource.getrusage(resource.RUSAGE_SELF),
+            resource.getrusage(resource.RUSAGE_CHILDREN),
+        ),
+        "io": read_io_counters(),
+    }
+
+
+def _get_exit_status(code: Any) -> int:
+    """
+    Like the interpreter, treats a `SystemExit` without a code as success and one with
+    a message as failure.
+    """
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    return 1
+
+
+def _format_stack(frame: Optional[FrameType]) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(
+            f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+        )
+        frame = frame.f_back
+    return ";".join(reversed(frames))
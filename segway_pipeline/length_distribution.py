@@ -0,0 +1,222 @@
+import argparse
+import csv
+import math
+import shutil
+import subprocess
+import tempfile
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, List, NamedTuple, Tuple, Union
+
+from segway_pipeline.compressed_io import open_input
+from segway_pipeline.instrument import add_records, instrumented
+
+PathLike = Union[str, Path]
+
+# Same names and columns as the tables written by segtools-length-distribution
+LENGTH_DISTRIBUTION_FILENAME = "length_distribution.tab"
+SEGMENT_SIZES_FILENAME = "segment_sizes.tab"
+FIELDNAMES = ["label", "length"]
+FIELDNAMES_SUMMARY = [
+    "label",
+    "num.segs",
+    "mean.len",
+    "median.len",
+    "stdev.len",
+    "num.bp",
+    "frac.bp",
+]
+LABEL_ALL = "all"
+HEADER_PREFIXES = ("track", "browser", "#")
+SEGTOOLS_LENGTH_DISTRIBUTION = "segtools-length-distribution"
+
+
+class LengthStats(NamedTuple):
+    num_segs: int
+    mean: float
+    median: float
+    stdev: float
+    num_bp: int
+
+
+@instrumented("length_distribution")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    Path(args.outdir).mkdir(parents=True, exist_ok=True)
+    with open_input(args.bed) as bed_file_handle, open(
+        Path(args.outdir, LENGTH_DISTRIBUTION_FILENAME), "w", newline=""
+    ) as length_distribution_file_handle:
+        histograms = write_length_distribution(
+            bed_file_handle, length_distribution_file_handle, args.outdir
+        )
+    with open(
+        Path(args.outdir, SEGMENT_SIZES_FILENAME), "w", newline=""
+    ) as segment_sizes_file_handle:
+        write_segment_sizes(histograms, segment_sizes_file_handle)
+    add_records(sum(sum(histogram.values()) for histogram in histograms.values()))
+    if args.plot:
+        plot(args.bed, args.outdir)
+
+
+def write_length_distribution(
+    bed_file_handle: IO[str], output_file_handle: IO[str], tmpdir: PathLike
+) -> Dict[str, Counter]:
+    """
+    Streams the bed once, writing the length of every segment grouped by label in the
+    order the labels first appear, and in the order of the bed within each label, as
+    segtools does for a bed grouped by chromosome and sorted like Segway's. The rows
+    of each label are spilled to a file in `tmpdir` until the end so only the
+    histograms are held in memory. Returns the histogram of the lengths of each label,
+    in the same order.
+    """
+    writer = make_writer(output_file_handle)
+    writer.writerow(FIELDNAMES)
+    histograms: Dict[str, Counter] = {}
+    with tempfile.TemporaryDirectory(dir=tmpdir) as spilldir, ExitStack() as stack:
+        spills: Dict[str, Tuple[IO[str], Any]] = {}
+        for label, length in iter_lengths(bed_file_handle):
+            if label not in spills:
+                spill = stack.enter_context(
+                    open(Path(spilldir, f"{len(spills)}.tab"), "w+", newline="")
+                )
+                spills[label] = (spill, make_writer(spill))
+                histograms[label] = Counter()
+            spills[label][1].writerow([label, length])
+            histograms[label][length] += 1
+        output_file_handle.flush()
+        for spill_file_handle, _ in spills.values():
+            spill_file_handle.seek(0)
+            shutil.copyfileobj(spill_file_handle, output_file_handle)
+    return histograms
+
+
+def iter_lengths(bed_file_handle: IO[str]) -> Iterator[Tuple[str, int]]:
+    """
+    Yields the label, the name column or empty if there is none, and the length of
+    each segment. Raises a `ValueError` for a segment that ends before it starts.
+    """
+    for line in bed_file_handle:
+        if line.startswith(HEADER_PREFIXES) or not line.strip():
+            continue
+        row = line.rstrip("\n").split("\t")
+        start, end = int(row[1]), int(row[2])
+        if end < start:
+            raise ValueError(f"Segment ends before it starts: {line.rstrip()}")
+        yield row[3] if len(row) > 3 else "", end - start
+
+
+def write_segment_sizes(
+    histograms: Dict[str, Counter], output_file_handle: IO[str]
+) -> None:
+    """
+    Writes the summary of all the segments, then of each label ordered numerically
+    where the labels are integers, formatted like segtools.
+    """
+    total: Counter = Counter()
+    for histogram in histograms.values():
+        total.update(histogram)
+    total_bp = summarize(total).num_bp
+    writer = make_writer(output_file_handle)
+    writer.writerow(FIELDNAMES_SUMMARY)
+    writer.writerow(make_size_row(LABEL_ALL, summarize(total), total_bp))
+    for label in sorted(histograms, key=get_label_sort_key):
+        writer.writerow(make_size_row(label, summarize(histograms[label]), total_bp))
+
+
+def summarize(histogram: Counter) -> LengthStats:
+    """
+    Computes the statistics of the lengths counted in the histogram exactly, with the
+    population standard deviation and the median averaging the two middle lengths
+    when there is an even number, like numpy.
+    """
+    num_segs = sum(histogram.values())
+    if num_segs == 0:
+        raise ValueError("No segments to summarize")
+    num_bp = sum(length * count for length, count in histogram.items())
+    sum_squares = sum(length * length * count for length, count in histogram.items())
+    variance = (num_segs * sum_squares - num_bp * num_bp) / (num_segs * num_segs)
+    return LengthStats(
+        num_segs=num_segs,
+        mean=num_bp / num_segs,
+        median=get_median(histogram, num_segs),
+        stdev=math.sqrt(variance),
+        num_bp=num_bp,
+    )
+
+
+def get_median(histogram: Counter, num_segs: int) -> float:
+    # The ranks of the two middle lengths, the same one for an odd number
+    ranks = [(num_segs - 1) // 2, num_segs // 2]
+    middle = []
+    seen = 0
+    for length in sorted(histogram):
+        seen += histogram[length]
+        while ranks and seen > ranks[0]:
+            middle.append(length)
+            ranks.pop(0)
+    return sum(middle) / 2
+
+
+def make_size_row(label: str, stats: LengthStats, total_bp: int) -> List[Any]:
+    return [
+        label,
+        stats.num_segs,
+        f"{stats.mean:.3f}",
+        f"{stats.median:.3f}",
+        f"{stats.stdev:.3f}",
+        stats.num_bp,
+        f"{stats.num_bp / total_bp:.3f}",
+    ]
+
+
+def get_label_sort_key(label: str) -> Tuple[int, Any]:
+    """
+    Segtools sorts integer labels numerically, and fails on a mix of integer and other
+    labels, which here go after the integer ones.
+    """
+    try:
+        return 0, int(label)
+    except ValueError:
+        return 1, label
+
+
+def make_writer(file_handle: IO[str]) -> Any:
+    return csv.writer(file_handle, dialect="excel-tab", lineterminator="\n")
+
+
+def plot(bed: str, outdir: str) -> None:
+    """
+    Plots the tables with segtools, which only reads the tables with `--replot`.
+    """
+    subprocess.run(
+        [SEGTOOLS_LENGTH_DISTRIBUTION, "--replot", "-o", outdir, bed], check=True
+    )
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("bed", help="possibly compressed bed, e.g. segway.bed.gz")
+    parser.add_argument(
+        "-o",
+        "--outdir",
+        required=True,
+        help=(
+            f"directory to write {LENGTH_DISTRIBUTION_FILENAME} and "
+            f"{SEGMENT_SIZES_FILENAME} to"
+        ),
+    )
+    parser.add_argument(
+        "--plot",
+        action="store_true",
+        help=(
+            f"also plot the tables with {SEGTOOLS_LENGTH_DISTRIBUTION}, after they are "
+            "written"
+        ),
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,250 @@
 import argparse
+import re
+import shutil
+import struct
 import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Optional
 
+from segway_pipeline.bed_to_bigbed import parse_chrom_sizes
+from segway_pipeline.cache import Cache, add_cache_args, make_key
+from segway_pipeline.instrument import instrumented
 
+BIGWIG_TO_BEDGRAPH = "bigWigToBedGraph"
+# From bigWigSig in the kent source, files written on either endianness are valid
+BIGWIG_SIGNATURE = 0x888FFC26
+GENOMEDATA_SUFFIX = ".genomedata"
+
+
+@instrumented("make_genomedata")
 def main():
     parser = get_parser()
     args = parser.parse_args()
-    command = make_command(args.files, args.sizes, args.outfile)
-    run_command(command)
+    if args.jobs < 1:
+        parser.error("Must use at least one job")
+    sizes = args.sizes
+    if args.sizes_output is not None:
+        subset_chrom_sizes(args.sizes, args.sizes_output, args.chroms, args.chrom_regex)
+        sizes = args.sizes_output
+    elif args.chroms is not None or args.chrom_regex is not None:
+        parser.error("Must specify --sizes-output to restrict the chromosomes")
+    cache = None
+    key = ""
+    if args.cache_dir is not None:
+        cache = Cache(args.cache_dir, max_size=args.cache_max_size)
+        params = get_cache_params(args.files, args.directory_mode)
+        key = make_key([*args.files, sizes], params, jobs=args.jobs)
+    if args.key_output is not None:
+        with open(args.key_output, "w") as f:
+            f.write(key)
+    if cache is not None and cache.get(key, args.outfile):
+        return
+    if args.directory_mode:
+        with tempfile.TemporaryDirectory(
+            dir=args.tmpdir or Path(args.outfile).resolve().parent
+        ) as tmpdir:
+            build_directory(args.files, sizes, args.outfile, args.jobs, tmpdir)
+    elif args.jobs == 1:
+        run_command(make_command(args.files, sizes, args.outfile))
+    else:
+        with tempfile.TemporaryDirectory(
+            dir=args.tmpdir or Path(args.outfile).resolve().parent
+        ) as tmpdir:
+            track_files = convert_bigwigs(args.files, tmpdir, args.jobs)
+            command = make_command(args.files, sizes, args.outfile, track_files)
+            run_command(command)
+    if cache is not None:
+        cache.put(key, args.outfile, params)
 
 
-def make_command(files: List[str], chrom_sizes: str, outfile: str) -> List[str]:
+def make_command(
+    files: List[str],
+    chrom_sizes: str,
+    outfile: str,
+    track_files: Optional[List[str]] = None,
+    directory_mode: bool = False,
+) -> List[str]:
+    """
+    Tracks are named after `files`, the data for each one is loaded from the
+    corresponding file in `track_files` if given, e.g. a bedGraph converted from it.
+    """
+    if track_files is None:
+        track_files = files
     command = ["genomedata-load", "-s", chrom_sizes, "--sizes"]
-    for file in files:
+    if directory_mode:
+        command.append("--directory-mode")
+    for file, track_file in zip(files, track_files):
         file_basename = Path(file).with_suffix("").name
-        command.extend(["-t", f"{file_basename}={file}"])
+        command.extend(["-t", f"{file_basename}={track_file}"])
     command.append(outfile)
     return command
 
 
-def run_command(command: List[str]):
-    subprocess.run(command)
+def subset_chrom_sizes(
+    chrom_sizes: str,
+    output: str,
+    chroms: Optional[List[str]] = None,
+    chrom_regex: Optional[str] = None,
+) -> List[str]:
+    """
+    Writes the lines of the chrom sizes file for the chromosomes in `chroms`, or the
+    ones that `chrom_regex` fully matches, e.g. `chr([0-9]+|X|Y)` to leave out the alt,
+    random, unplaced and EBV contigs. All of them are kept if neither is given. Returns
+    the kept chromosomes, in their original order. `genomedata-load` skips the data for
+    chromosomes that aren't in the sizes, so loading with the subset builds only those.
+    """
+    pattern = re.compile(chrom_regex) if chrom_regex is not None else None
+    kept = []
+    lines = []
+    with open(chrom_sizes) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            chrom = line.split()[0]
+            if chroms is not None and chrom not in chroms:
+                continue
+            if pattern is not None and not pattern.fullmatch(chrom):
+                continue
+            kept.append(chrom)
+            lines.append(line.rstrip("\n") + "\n")
+    if chroms is not None:
+        missing = [chrom for chrom in chroms if chrom not in kept]
+        if missing:
+            raise ValueError(f"Chromosomes {', '.join(missing)} not in {chrom_sizes}")
+    if pattern is not None and not kept:
+        raise ValueError(f"No chromosomes in {chrom_sizes} match {chrom_regex}")
+    with open(output, "w") as f:
+        f.writelines(lines)
+    return kept
+
+
+def convert_bigwigs(files: List[str], directory: str, jobs: int) -> List[str]:
+    """
+    `genomedata-load` decodes each bigWig with `bigWigToBedGraph` and loads it before
+    moving on to the next track, so the conversion runs on a single core. Here all the
+    bigWigs are converted to bedGraphs in `directory` up front on a pool of `jobs`
+    threads, each running its own `bigWigToBedGraph`. `genomedata-load` then only has to
+    read the bedGraphs, and since it loads bigWigs by piping the same bedGraph text into
+    the same loader the resulting genomedata is identical. Files that aren't bigWigs are
+    passed through. Returns the files to load, in the same order as `files`.
+    """
+    if jobs < 1:
+        raise ValueError("Must use at least one job")
+    track_files = []
+    conversions = []
+    for i, file in enumerate(files):
+        if not is_bigwig(file):
+            track_files.append(file)
+            continue
+        file_basename = Path(file).with_suffix("").name
+        bedgraph = str(Path(directory, f"{i}.{file_basename}.bedGraph"))
+        track_files.append(bedgraph)
+        conversions.append([BIGWIG_TO_BEDGRAPH, file, bedgraph])
+    with ThreadPoolExecutor(jobs) as executor:
+        list(
+            executor.map(
+                lambda command: subprocess.run(command, check=True), conversions
+            )
+        )
+    return track_files
+
+
+def build_directory(
+    files: List[str], chrom_sizes: str, outdir: str, jobs: int, tmpdir: str
+) -> None:
+    """
+    Builds a directory mode genomedata archive, one HDF5 file per chromosome, loading
+    each chromosome in its own `genomedata-load` on a pool of `jobs` threads. Such an
+    archive is just the chromosome files in a directory with no metadata of its own, so
+    the chromosomes can be loaded separately and moved in once done, and the result is
+    the same as loading them all at once with `genomedata-load --directory-mode`.
+    Chromosomes are submitted largest first, so the long ones don't end up starting
+    last and the build takes about as long as the largest chromosome does. Like in
+    `convert_bigwigs` the loading is all done by the subprocesses each thread waits on,
+    so threads run the jobs as concurrently as processes would.
+    """
+    if jobs < 1:
+        raise ValueError("Must use at least one job")
+    for file in files:
+        if not is_bigwig(file):
+            raise ValueError(f"Directory mode requires bigWig tracks, got {file}")
+    with open(chrom_sizes) as chrom_sizes_file_handle:
+        sizes = parse_chrom_sizes(chrom_sizes_file_handle)
+    Path(outdir).mkdir(parents=True, exist_ok=True)
+    chroms = sorted(sizes, key=lambda chrom: sizes[chrom], reverse=True)
+    with ThreadPoolExecutor(jobs) as executor:
+        futures = [
+            executor.submit(load_chromosome, chrom, sizes[chrom], files, outdir, tmpdir)
+            for chrom in chroms
+        ]
+        for future in futures:
+            future.result()
+
+
+def load_chromosome(
+    chrom: str, size: int, files: List[str], outdir: str, tmpdir: str
+) -> None:
+    """
+    Extracts just this chromosome from each bigWig and loads it into a directory mode
+    archive of its own, then moves the chromosome's file into `outdir`. Each track is
+    read from the bigWig's index, so only this chromosome's data is decoded.
+    """
+    with tempfile.TemporaryDirectory(dir=tmpdir) as job_dir:
+        chrom_sizes = Path(job_dir, "chrom.sizes")
+        chrom_sizes.write_text(f"{chrom}\t{size}\n")
+        track_files = []
+        for i, file in enumerate(files):
+            file_basename = Path(file).with_suffix("").name
+            bedgraph = str(Path(job_dir, f"{i}.{file_basename}.bedGraph"))
+            subprocess.run(
+                [BIGWIG_TO_BEDGRAPH, f"-chrom={chrom}", file, bedgraph], check=True
+            )
+            # genomedata-load fails on empty input, which loading the whole genome
+            # doesn't run into. Loading a missing value instead leaves the track empty
+            # the same as it would be in a whole genome build.
+            if not Path(bedgraph).stat().st_size:
+                Path(bedgraph).write_text(f"{chrom}\t0\t1\tnan\n")
+            track_files.append(bedgraph)
+        archive = Path(job_dir, "chrom" + GENOMEDATA_SUFFIX)
+        command = make_command(
+            files, str(chrom_sizes), str(archive), track_files, directory_mode=True
+        )
+        subprocess.run(command, check=True)
+        filename = chrom + GENOMEDATA_SUFFIX
+        shutil.move(str(archive / filename), str(Path(outdir, filename)))
+
+
+def get_cache_params(files: List[str], directory_mode: bool) -> Dict[str, Any]:
+    """
+    The parameters besides the input contents that the genomedata depends on. The track
+    names come from the file names, which aren't part of the cache key otherwise.
+    """
+    return {
+        "script": "make_genomedata",
+        "track_names": [Path(file).with_suffix("").name for file in files],
+        "directory_mode": directory_mode,
+    }
+
+
+def is_bigwig(path: str) -> bool:
+    with open(path, "rb") as f:
+        signature = f.read(4)
+    if len(signature) < 4:
+        return False
+    return BIGWIG_SIGNATURE in (
+        struct.unpack("<I", signature)[0],
+        struct.unpack(">I", signature)[0],
+    )
+
+
+def run_command(command: List[str]) -> subprocess.CompletedProcess:
+    """
+    Raises a `subprocess.CalledProcessError` if the command fails, so that a failed
+    load isn't mistaken for a finished genomedata.
+    """
+    return subprocess.run(command, check=True)
 
 
 def get_parser():
@@ -33,6 +256,61 @@ def get_parser():
     parser.add_argument(
         "-o", "--outfile", help="desired name of output file", required=True
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help=(
+            "number of bigwigs to convert to bedgraphs concurrently before loading, by "
+            "default genomedata-load converts them one at a time itself. With "
+            "--directory-mode, the number of chromosomes to load concurrently"
+        ),
+    )
+    parser.add_argument(
+        "-d",
+        "--directory-mode",
+        action="store_true",
+        help=(
+            "make the output a directory with a genomedata file per chromosome, each "
+            "loaded separately. Requires bigwig files."
+        ),
+    )
+    parser.add_argument(
+        "--tmpdir",
+        help=(
+            "directory for the converted bedgraphs when using more than one job, by "
+            "default the directory of the output file. Needs room for all of them."
+        ),
+    )
+    chroms = parser.add_mutually_exclusive_group()
+    chroms.add_argument(
+        "--chroms",
+        nargs="+",
+        help="only build these chromosomes from the chrom sizes, requires --sizes-output",
+    )
+    chroms.add_argument(
+        "--chrom-regex",
+        help=(
+            "only build the chromosomes this regex fully matches, e.g. "
+            "'chr([0-9]+|X|Y)' for the primary assembly, requires --sizes-output"
+        ),
+    )
+    parser.add_argument(
+        "--sizes-output",
+        help=(
+            "write the chrom sizes of the chromosomes that are built here, for use "
+            "downstream, e.g. with bed_to_bigbed.py"
+        ),
+    )
+    add_cache_args(parser)
+    parser.add_argument(
+        "--key-output",
+        help=(
+            "write the cache key of the genomedata here, for train_segway.py "
+            "--genomedata-key. Empty without --cache-dir"
+        ),
+    )
     return parser
 
 
@@ -3,11 +3,15 @@ import csv
 from pathlib import Path
 from typing import IO, List, Tuple
 
+from segway_pipeline.instrument import add_records, instrumented
 
+
+@instrumented("make_trackname_assay")
 def main() -> None:
     parser = get_parser()
     args = parser.parse_args()
     trackname_assay = make_trackname_assay(args.tracknames, args.assays)
+    add_records(len(trackname_assay))
     with open(args.output_filename, "w", newline="") as f:
         write_trackname_assay(f, trackname_assay)
 
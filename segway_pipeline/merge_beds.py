@@ -0,0 +1,106 @@
+import argparse
+from contextlib import ExitStack
+from pathlib import Path
+from typing import IO, Dict, List, Union
+
+from segway_pipeline.bed_index import HEADER_PREFIXES, build_index, open_indexed
+from segway_pipeline.bed_to_bigbed import parse_chrom_sizes
+from segway_pipeline.compressed_io import add_compression_args, open_output
+from segway_pipeline.instrument import add_records, instrumented
+
+PathLike = Union[str, Path]
+
+
+@instrumented("merge_beds")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    with open(args.chrom_sizes) as chrom_sizes_file_handle:
+        chroms = list(parse_chrom_sizes(chrom_sizes_file_handle))
+    if args.sort_chroms:
+        chroms.sort()
+    with open_output(
+        args.output_filename,
+        "wb",
+        compression=args.compression,
+        threads=args.threads,
+    ) as output_file_handle:
+        num_records = merge_beds(args.beds, chroms, output_file_handle)
+    add_records(num_records)
+
+
+def merge_beds(
+    bed_paths: List[PathLike], chroms: List[str], output_file_handle: IO[bytes]
+) -> int:
+    """
+    Merges beds of disjoint sets of chromosomes, e.g. the outputs of Segway annotate
+    run on shards of the genome, into one with the chromosomes in the order of
+    `chroms`. Each bed must be grouped by chromosome and sorted by start within each
+    one, with the chromosomes in any order, and be uncompressed or BGZF compressed so
+    that the records of each chromosome can be sought to with a `bed_index` index. Only
+    the first bed's header is kept, Segway names each run's track with a random UUID so
+    the headers of the shards differ only by that. Raises a `ValueError` if a
+    chromosome is in more than one bed or not in `chroms`. Returns the number of
+    records written.
+    """
+    indexes = [build_index(bed_path) for bed_path in bed_paths]
+    owners: Dict[str, int] = {}
+    for i, index in enumerate(indexes):
+        for chrom in index["chroms"]:
+            if chrom in owners:
+                raise ValueError(
+                    f"Chromosome {chrom} is in both {bed_paths[owners[chrom]]} and "
+                    f"{bed_paths[i]}"
+                )
+            owners[chrom] = i
+    missing = sorted(set(owners) - set(chroms))
+    if missing:
+        raise ValueError(f"Chromosomes {', '.join(missing)} not in the chrom sizes")
+    num_records = 0
+    with ExitStack() as stack:
+        bed_file_handles = [
+            stack.enter_context(open_indexed(bed_path, index))
+            for bed_path, index in zip(bed_paths, indexes)
+        ]
+        if bed_file_handles:
+            for line in iter(bed_file_handles[0].readline, b""):
+                if not line.startswith(HEADER_PREFIXES):
+                    break
+                output_file_handle.write(line)
+        for chrom in chroms:
+            if chrom not in owners:
+                continue
+            entry = indexes[owners[chrom]]["chroms"][chrom]
+            bed_file_handle = bed_file_handles[owners[chrom]]
+            bed_file_handle.seek(entry["offset"])
+            for _ in range(entry["num_records"]):
+                output_file_handle.write(bed_file_handle.readline())
+            num_records += entry["num_records"]
+    return num_records
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "beds", nargs="+", help="uncompressed or BGZF beds of disjoint chromosomes"
+    )
+    parser.add_argument(
+        "--chrom-sizes",
+        required=True,
+        help="chrom sizes file, the chromosomes are written in its order",
+    )
+    parser.add_argument(
+        "--sort-chroms",
+        action="store_true",
+        help=(
+            "write the chromosomes sorted by name instead, the order in which Segway "
+            "annotates a genomedata"
+        ),
+    )
+    parser.add_argument("-o", "--output-filename", required=True)
+    add_compression_args(parser)
+    return parser
+
+
+if __name__ == "__main__":
+    main()
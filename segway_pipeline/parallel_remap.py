@@ -0,0 +1,188 @@
+import math
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import IO, Any, Deque, Dict, Iterator, List, Optional, Tuple, Union
+
+from segway_pipeline.compressed_io import NONE, open_input, sniff_compression
+from segway_pipeline.vectorized_remap import (
+    DEFAULT_CHUNK_SIZE,
+    ChunkRemapper,
+    CoalescingChunkWriter,
+    flush_chunk_writer,
+    iter_chunks,
+    remap_bed,
+    rewrite_header,
+)
+
+PathLike = Union[str, Path]
+ShardResult = Tuple[bytes, Optional[bytes]]
+
+
+def remap_bed_parallel(
+    bed_path: PathLike,
+    output_file_handle: IO[bytes],
+    mnemonics: Optional[Dict[str, str]] = None,
+    colors: Optional[Dict[str, str]] = None,
+    jobs: int = 1,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    relabeled_file_handle: Optional[IO[bytes]] = None,
+    coalesce: bool = False,
+) -> int:
+    """
+    Parallel version of `vectorized_remap.remap_bed`. The bed is split at newline
+    boundaries into byte ranges of at most about `chunk_size` bytes, and at least `jobs`
+    of them, which are remapped in a pool of `jobs` processes and written out in their
+    original order, so the output is identical to the serial one. At most `2 * jobs`
+    shards are in flight at once to bound memory. With a single job this just runs
+    `remap_bed`.
+
+    Uncompressed beds are read directly by the workers, each seeking to its own byte
+    range. Compressed beds can't be seeked into, so they are decompressed by this
+    process and the shards are sent to the workers instead.
+
+    Coalescing happens in this process as the shards are written out, since runs may
+    span shards. Returns the number of lines that were merged away in the remapped
+    output.
+
+    The first row of the beds is the UCSC track definition line which should not be
+    processed, it is handled here once, not by the workers.
+    """
+    if jobs < 1:
+        raise ValueError("Must use at least one job")
+    if jobs == 1:
+        with open_input(bed_path, "rb") as bed_file_handle:
+            return remap_bed(
+                bed_file_handle,
+                output_file_handle,
+                mnemonics=mnemonics,
+                colors=colors,
+                chunk_size=chunk_size,
+                relabeled_file_handle=relabeled_file_handle,
+                coalesce=coalesce,
+            )
+    tee = relabeled_file_handle is not None
+    output_writer: Any = output_file_handle
+    relabeled_writer: Any = relabeled_file_handle
+    if coalesce:
+        output_writer = CoalescingChunkWriter(output_file_handle)
+        if relabeled_file_handle is not None:
+            relabeled_writer = CoalescingChunkWriter(relabeled_file_handle)
+    with ProcessPoolExecutor(jobs) as executor:
+        if str(bed_path) != "-" and sniff_compression(bed_path) == NONE:
+            with open(bed_path, "rb") as f:
+                header = f.readline()
+            ranges = find_shard_ranges(bed_path, len(header), jobs, chunk_size)
+            futures = (
+                executor.submit(
+                    remap_byte_range, bed_path, start, end, mnemonics, colors, tee
+                )
+                for start, end in ranges
+            )
+            _write_header(header, output_file_handle, relabeled_file_handle)
+            _write_results(futures, jobs, output_writer, relabeled_writer)
+        else:
+            with open_input(bed_path, "rb") as bed_file_handle:
+                _write_header(
+                    bed_file_handle.readline(),
+                    output_file_handle,
+                    relabeled_file_handle,
+                )
+                futures = (
+                    executor.submit(remap_shard, chunk, mnemonics, colors, tee)
+                    for chunk in iter_chunks(bed_file_handle, chunk_size)
+                )
+                _write_results(futures, jobs, output_writer, relabeled_writer)
+    flush_chunk_writer(relabeled_writer)
+    return flush_chunk_writer(output_writer)
+
+
+def find_shard_ranges(
+    bed_path: PathLike, start: int, jobs: int, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> List[Tuple[int, int]]:
+    """
+    Split the bytes of the file from `start` to the end into contiguous ranges that
+    each end just after a newline (or at the end of the file).
+    """
+    size = os.path.getsize(bed_path)
+    if size <= start:
+        return []
+    num_shards = max(jobs, math.ceil((size - start) / chunk_size))
+    shard_size = math.ceil((size - start) / num_shards)
+    boundaries = [start]
+    with open(bed_path, "rb") as f:
+        for target in range(start + shard_size, size, shard_size):
+            if target <= boundaries[-1]:
+                continue
+            f.seek(target - 1)
+            f.readline()
+            boundary = f.tell()
+            if boundary >= size:
+                break
+            boundaries.append(boundary)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def remap_byte_range(
+    bed_path: PathLike,
+    start: int,
+    end: int,
+    mnemonics: Optional[Dict[str, str]],
+    colors: Optional[Dict[str, str]],
+    tee: bool = False,
+) -> ShardResult:
+    with open(bed_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    if not data.endswith(b"\n"):
+        data += b"\n"
+    return remap_shard(data, mnemonics, colors, tee)
+
+
+def remap_shard(
+    data: bytes,
+    mnemonics: Optional[Dict[str, str]],
+    colors: Optional[Dict[str, str]],
+    tee: bool = False,
+) -> ShardResult:
+    """
+    Returns the remapped shard, and the relabeled but not recolored shard if `tee`.
+    """
+    output = ChunkRemapper(mnemonics, colors).remap(data)
+    relabeled = ChunkRemapper(mnemonics).remap(data) if tee else None
+    return output, relabeled
+
+
+def _write_header(
+    header: bytes,
+    output_file_handle: IO[bytes],
+    relabeled_file_handle: Optional[IO[bytes]],
+) -> None:
+    header = rewrite_header(header)
+    output_file_handle.write(header)
+    if relabeled_file_handle is not None:
+        relabeled_file_handle.write(header)
+
+
+def _write_results(
+    futures: Iterator["Future[ShardResult]"],
+    jobs: int,
+    output_file_handle: IO[bytes],
+    relabeled_file_handle: Optional[IO[bytes]],
+) -> None:
+    pending: Deque["Future[ShardResult]"] = deque()
+
+    def write_next() -> None:
+        output, relabeled = pending.popleft().result()
+        output_file_handle.write(output)
+        if relabeled_file_handle is not None and relabeled is not None:
+            relabeled_file_handle.write(relabeled)
+
+    for future in futures:
+        pending.append(future)
+        if len(pending) > 2 * jobs:
+            write_next()
+    while pending:
+        write_next()
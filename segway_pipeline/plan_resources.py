@@ -0,0 +1,197 @@
+import argparse
+import json
+import math
+from typing import Dict, Iterable, NamedTuple, Tuple
+
+from segway_pipeline.bed_to_bigbed import parse_chrom_sizes
+from segway_pipeline.instrument import instrumented
+from segway_pipeline.shard_chroms import shard_chroms
+
+GIB = 1 << 30
+
+# The upper bounds, what segway.wdl used for every run before it was planned
+MAX_CPUS = 96
+MAX_TRAIN_MEMORY_GB = 300
+MAX_ANNOTATE_MEMORY_GB = 400
+MAX_DISK_GB = 1000
+
+# Segway's default --split-sequences, it runs a GMTK job per window of at most this many
+# bases, splitting longer chromosomes
+SPLIT_SEQUENCES = 2000000
+
+# Rough, uncalibrated estimates of the memory of a GMTK job over a single window. No
+# recorded runs were available to fit them to, they should be refit from the metrics
+# outputs of the Segway tasks as runs accumulate.
+JOB_BASE_BYTES = GIB
+BYTES_PER_TRACK_POSITION = 16
+BYTES_PER_LABEL_POSITION = 16
+# Segway itself, besides the GMTK jobs it runs
+SEGWAY_BASE_BYTES = 4 * GIB
+# Genomedata stores a float32 for every base of every track
+GENOMEDATA_BYTES_PER_TRACK_BASE = 4
+# Room for the traindir, identifydir, beds and temporary files on top of the genomedata
+DISK_OVERHEAD_FACTOR = 1.5
+DISK_BASE_GB = 20
+
+
+class ResourcePlan(NamedTuple):
+    train_cpus: int
+    train_memory_gb: int
+    annotate_cpus: int
+    annotate_memory_gb: int
+    disk_gb: int
+
+
+@instrumented("plan_resources")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    with open(args.sizes) as chrom_sizes_file_handle:
+        chrom_sizes = parse_chrom_sizes(chrom_sizes_file_handle)
+    plan = plan_resources(
+        chrom_sizes,
+        num_tracks=args.num_tracks,
+        resolution=args.resolution,
+        minibatch_fraction=args.minibatch_fraction,
+        num_instances=args.num_instances,
+        num_labels=args.num_labels,
+        num_annotate_shards=args.num_annotate_shards,
+        split_sequences=args.split_sequences,
+        max_cpus=args.max_cpus,
+        max_train_memory_gb=args.max_train_memory_gb,
+        max_annotate_memory_gb=args.max_annotate_memory_gb,
+        max_disk_gb=args.max_disk_gb,
+    )
+    with open(args.outfile, "w") as f:
+        json.dump(plan._asdict(), f, indent=4, sort_keys=True)
+
+
+def plan_resources(
+    chrom_sizes: Dict[str, int],
+    num_tracks: int,
+    resolution: int,
+    minibatch_fraction: float,
+    num_instances: int,
+    num_labels: int,
+    num_annotate_shards: int = 1,
+    split_sequences: int = SPLIT_SEQUENCES,
+    max_cpus: int = MAX_CPUS,
+    max_train_memory_gb: int = MAX_TRAIN_MEMORY_GB,
+    max_annotate_memory_gb: int = MAX_ANNOTATE_MEMORY_GB,
+    max_disk_gb: int = MAX_DISK_GB,
+) -> ResourcePlan:
+    """
+    Segway runs a GMTK job per window, one per CPU at a time since the tasks set
+    `SEGWAY_NUM_LOCAL_JOBS` to the number of CPUs. Chromosomes are split into windows of
+    at most `split_sequences` bases, and every job is sized like one over a full window.
+    Each training round runs every instance over a `minibatch_fraction` of the windows,
+    annotation runs over all of them. A CPU is planned for every job up to `max_cpus`,
+    fewer only if the memory bound can't fit that many jobs running at once. When
+    annotation is split into `num_annotate_shards` shards of the chromosomes, see
+    `shard_chroms`, the annotate resources are those of the shard with the most windows.
+    """
+    if not chrom_sizes:
+        raise ValueError("No chromosomes in chrom sizes")
+    if split_sequences < 1:
+        raise ValueError("Windows must be at least one base")
+    window_size = min(split_sequences, max(chrom_sizes.values()))
+    job_bytes = estimate_job_memory(window_size, num_tracks, num_labels, resolution)
+    num_windows = count_windows(chrom_sizes.values(), split_sequences)
+    train_jobs = num_instances * max(1, math.ceil(minibatch_fraction * num_windows))
+    train_cpus, train_memory_gb = fit_jobs(
+        train_jobs, job_bytes, max_cpus, max_train_memory_gb
+    )
+    annotate_jobs = max(
+        count_windows((chrom_sizes[chrom] for chrom in shard), split_sequences)
+        for shard in shard_chroms(chrom_sizes, max(1, num_annotate_shards))
+    )
+    annotate_cpus, annotate_memory_gb = fit_jobs(
+        annotate_jobs, job_bytes, max_cpus, max_annotate_memory_gb
+    )
+    genomedata_bytes = (
+        sum(chrom_sizes.values()) * num_tracks * GENOMEDATA_BYTES_PER_TRACK_BASE
+    )
+    disk_gb = DISK_BASE_GB + math.ceil(genomedata_bytes * DISK_OVERHEAD_FACTOR / GIB)
+    return ResourcePlan(
+        train_cpus=train_cpus,
+        train_memory_gb=train_memory_gb,
+        annotate_cpus=annotate_cpus,
+        annotate_memory_gb=annotate_memory_gb,
+        disk_gb=min(disk_gb, max_disk_gb),
+    )
+
+
+def count_windows(sizes: Iterable[int], split_sequences: int) -> int:
+    """
+    Returns the number of windows Segway splits chromosomes of the given sizes into.
+    """
+    return sum(math.ceil(size / split_sequences) for size in sizes)
+
+
+def estimate_job_memory(
+    window_size: int, num_tracks: int, num_labels: int, resolution: int
+) -> int:
+    """
+    Estimates the bytes used by a GMTK job over a window of `window_size` bases, which
+    grows with the number of positions at the resolution, for the observations of each
+    track and the inference over the labels at each of them.
+    """
+    positions = math.ceil(window_size / resolution)
+    bytes_per_position = (
+        num_tracks * BYTES_PER_TRACK_POSITION + num_labels * BYTES_PER_LABEL_POSITION
+    )
+    return JOB_BASE_BYTES + positions * bytes_per_position
+
+
+def fit_jobs(
+    num_jobs: int, job_bytes: int, max_cpus: int, max_memory_gb: int
+) -> Tuple[int, int]:
+    """
+    Returns the number of CPUs to run `num_jobs` jobs of `job_bytes` each on, and the
+    memory in GB they need, within the bounds. At least one CPU is used, with all of
+    the memory, even if a single job is estimated not to fit.
+    """
+    cpus = min(num_jobs, max_cpus)
+    fitting_jobs = (max_memory_gb * GIB - SEGWAY_BASE_BYTES) // job_bytes
+    cpus = max(1, min(cpus, fitting_jobs))
+    memory_gb = math.ceil((SEGWAY_BASE_BYTES + cpus * job_bytes) / GIB)
+    return cpus, min(memory_gb, max_memory_gb)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", help="path to chrom sizes file", required=True)
+    parser.add_argument("--num-tracks", type=int, required=True)
+    parser.add_argument("--resolution", type=int, required=True)
+    parser.add_argument("--minibatch-fraction", type=float, required=True)
+    parser.add_argument("--num-instances", type=int, required=True)
+    parser.add_argument("--num-labels", type=int, required=True)
+    parser.add_argument(
+        "--num-annotate-shards",
+        type=int,
+        default=1,
+        help="number of shards of the chromosomes to plan annotating each of",
+    )
+    parser.add_argument(
+        "--split-sequences",
+        type=int,
+        default=SPLIT_SEQUENCES,
+        help="maximum window size Segway splits the chromosomes into",
+    )
+    parser.add_argument("--max-cpus", type=int, default=MAX_CPUS)
+    parser.add_argument("--max-train-memory-gb", type=int, default=MAX_TRAIN_MEMORY_GB)
+    parser.add_argument(
+        "--max-annotate-memory-gb", type=int, default=MAX_ANNOTATE_MEMORY_GB
+    )
+    parser.add_argument("--max-disk-gb", type=int, default=MAX_DISK_GB)
+    parser.add_argument(
+        "-o",
+        "--outfile",
+        required=True,
+        help="JSON file to write the planned CPUs, memory and disk to",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
@@ -2,24 +2,80 @@ import argparse
 import csv
 from typing import IO, Dict, List
 
+from segway_pipeline.coalesce import CoalescingWriter, flush_writer, report_merged
+from segway_pipeline.compressed_io import add_compression_args, open_input, open_output
+from segway_pipeline.instrument import instrumented
+from segway_pipeline.parallel_remap import remap_bed_parallel
+from segway_pipeline.segmentation import (
+    SEGMENTATION_SUFFIX,
+    load_input,
+    save_output,
+    uses_segmentation,
+)
+from segway_pipeline.vectorized_remap import (
+    BACKENDS,
+    CSV_BACKEND,
+    DEFAULT_CHUNK_SIZE,
+    NUMPY_BACKEND,
+)
 
+
+@instrumented("relabel")
 def main() -> None:
     parser = get_parser()
     args = parser.parse_args()
-    with open(args.bed) as bed_file_handle, open(
-        args.mnemonics
-    ) as mnemonics_file_handle, open(
-        args.output_filename, "w", newline=""
+    if args.jobs > 1 and args.backend != NUMPY_BACKEND:
+        parser.error("Using more than one job requires the numpy backend")
+    if uses_segmentation(args.bed, args.output_filename):
+        if args.coalesce:
+            parser.error("Coalescing is not supported for segmentations")
+        with open(args.mnemonics) as mnemonics_file_handle:
+            mnemonics = parse_mnemonics(mnemonics_file_handle)
+        save_output(
+            load_input(args.bed).relabel(mnemonics),
+            args.output_filename,
+            compression=args.compression,
+            threads=args.threads,
+        )
+        return
+    binary = args.backend == NUMPY_BACKEND
+    with open(args.mnemonics) as mnemonics_file_handle, open_output(
+        args.output_filename,
+        "wb" if binary else "wt",
+        compression=args.compression,
+        threads=args.threads,
     ) as output_file_handle:
-        relabel(bed_file_handle, mnemonics_file_handle, output_file_handle)
+        if binary:
+            num_merged = remap_bed_parallel(
+                args.bed,
+                output_file_handle,
+                mnemonics=parse_mnemonics(mnemonics_file_handle),
+                jobs=args.jobs,
+                chunk_size=args.chunk_size,
+                coalesce=args.coalesce,
+            )
+        else:
+            with open_input(args.bed) as bed_file_handle:
+                num_merged = relabel(
+                    bed_file_handle,
+                    mnemonics_file_handle,
+                    output_file_handle,
+                    coalesce=args.coalesce,
+                )
+    if args.coalesce:
+        report_merged(num_merged, args.output_filename)
 
 
 def relabel(
     bed_file_handle: IO[str],
     mnemonics_file_handle: IO[str],
     output_file_handle: IO[str],
-) -> None:
+    coalesce: bool = False,
+) -> int:
     """
+    If `coalesce` is set abutting rows that end up with the same label are merged, see
+    `coalesce.CoalescingWriter`. Returns the number of rows that were merged away.
+
     The first row of the beds is the UCSC track definition line which should not be
     processed
     """
@@ -29,9 +85,11 @@ def relabel(
         output_file_handle, delimiter="\t", lineterminator="\n", quotechar="'"
     )
     output_writer.writerow(next(input_reader))
+    row_writer = CoalescingWriter(output_writer) if coalesce else output_writer
     for row in input_reader:
         processed = process_row(row, mnemonics)
-        output_writer.writerow(processed)
+        row_writer.writerow(processed)
+    return flush_writer(row_writer)
 
 
 def parse_mnemonics(mnemonics_file_handle: IO[str]) -> Dict[str, str]:
@@ -52,9 +110,39 @@ def process_row(row: List[str], mnemonics: Dict[str, str]) -> List[str]:
 
 def get_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
-    parser.add_argument("bed")
+    parser.add_argument(
+        "bed",
+        help=(
+            "path to bed, may be gzip, BGZF, or zstd compressed, or - for stdin, or a "
+            "segmentation"
+        ),
+    )
     parser.add_argument("mnemonics")
-    parser.add_argument("-o", "--output-filename", required=True)
+    parser.add_argument(
+        "-o",
+        "--output-filename",
+        required=True,
+        help=f"written as a segmentation if it ends with {SEGMENTATION_SUFFIX}",
+    )
+    add_compression_args(parser)
+    parser.add_argument("--backend", choices=BACKENDS, default=CSV_BACKEND)
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="size in bytes of the chunks read by the numpy backend",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes to remap with, requires the numpy backend",
+    )
+    parser.add_argument(
+        "--coalesce",
+        action="store_true",
+        help="merge abutting segments with the same label and color",
+    )
     return parser
 
 
@@ -0,0 +1,199 @@
+import argparse
+import csv
+from contextlib import ExitStack
+from typing import IO, Any, Dict, List, Optional
+
+from segway_pipeline.coalesce import CoalescingWriter, flush_writer, report_merged
+from segway_pipeline.compressed_io import add_compression_args, open_input, open_output
+from segway_pipeline.instrument import instrumented
+from segway_pipeline.parallel_remap import remap_bed_parallel
+from segway_pipeline.recolor_bed import LABELS_TO_COLORS, Colors, make_color_strings
+from segway_pipeline.relabel import parse_mnemonics
+from segway_pipeline.segmentation import (
+    SEGMENTATION_SUFFIX,
+    load_input,
+    save_output,
+    uses_segmentation,
+)
+from segway_pipeline.vectorized_remap import (
+    BACKENDS,
+    CSV_BACKEND,
+    DEFAULT_CHUNK_SIZE,
+    NUMPY_BACKEND,
+)
+
+
+@instrumented("relabel_recolor")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    if args.jobs > 1 and args.backend != NUMPY_BACKEND:
+        parser.error("Using more than one job requires the numpy backend")
+    if uses_segmentation(args.bed, args.output_filename):
+        if args.coalesce:
+            parser.error("Coalescing is not supported for segmentations")
+        with open(args.mnemonics) as mnemonics_file_handle:
+            mnemonics = parse_mnemonics(mnemonics_file_handle)
+        relabeled = load_input(args.bed).relabel(mnemonics)
+        if args.relabeled_output_filename is not None:
+            save_output(
+                relabeled,
+                args.relabeled_output_filename,
+                compression=args.compression,
+                threads=args.threads,
+            )
+        save_output(
+            relabeled.recolor(make_color_strings(LABELS_TO_COLORS)),
+            args.output_filename,
+            compression=args.compression,
+            threads=args.threads,
+        )
+        return
+    binary = args.backend == NUMPY_BACKEND
+    output_mode = "wb" if binary else "wt"
+    with ExitStack() as stack:
+        mnemonics_file_handle = stack.enter_context(open(args.mnemonics))
+        output_file_handle = stack.enter_context(
+            open_output(
+                args.output_filename,
+                output_mode,
+                compression=args.compression,
+                threads=args.threads,
+            )
+        )
+        relabeled_file_handle = None
+        if args.relabeled_output_filename is not None:
+            relabeled_file_handle = stack.enter_context(
+                open_output(
+                    args.relabeled_output_filename,
+                    output_mode,
+                    compression=args.compression,
+                    threads=args.threads,
+                )
+            )
+        if binary:
+            num_merged = remap_bed_parallel(
+                args.bed,
+                output_file_handle,
+                mnemonics=parse_mnemonics(mnemonics_file_handle),
+                colors=make_color_strings(LABELS_TO_COLORS),
+                jobs=args.jobs,
+                chunk_size=args.chunk_size,
+                relabeled_file_handle=relabeled_file_handle,
+                coalesce=args.coalesce,
+            )
+        else:
+            with open_input(args.bed) as bed_file_handle:
+                num_merged = relabel_recolor(
+                    bed_file_handle,
+                    mnemonics_file_handle,
+                    output_file_handle,
+                    relabeled_file_handle=relabeled_file_handle,
+                    coalesce=args.coalesce,
+                )
+    if args.coalesce:
+        report_merged(num_merged, args.output_filename)
+
+
+def relabel_recolor(
+    bed_file_handle: IO[str],
+    mnemonics_file_handle: IO[str],
+    output_file_handle: IO[str],
+    labels_to_colors: Dict[str, Colors] = LABELS_TO_COLORS,
+    relabeled_file_handle: Optional[IO[str]] = None,
+    coalesce: bool = False,
+) -> int:
+    """
+    Relabels and recolors the Segway bed in a single pass, equivalent to running
+    `relabel.relabel` followed by `recolor_bed.recolor_bed` on its output. If a
+    `relabeled_file_handle` is provided the intermediate relabeled rows are teed to it,
+    which avoids parsing the bed a second time to produce both outputs.
+
+    If `coalesce` is set abutting rows that end up with the same label and color are
+    merged in each output, see `coalesce.CoalescingWriter`. Returns the number of rows
+    that were merged away in the recolored output.
+
+    The first row of the beds is the UCSC track definition line which should not be
+    processed
+    """
+    mnemonics = parse_mnemonics(mnemonics_file_handle)
+    colors = make_color_strings(labels_to_colors)
+    input_reader = csv.reader(bed_file_handle, delimiter="\t", lineterminator="\n")
+    output_writer = csv.writer(
+        output_file_handle, delimiter="\t", lineterminator="\n", quotechar="'"
+    )
+    relabeled_writer: Any = None
+    if relabeled_file_handle is not None:
+        relabeled_writer = csv.writer(
+            relabeled_file_handle, delimiter="\t", lineterminator="\n", quotechar="'"
+        )
+    header = next(input_reader)
+    output_writer.writerow(header)
+    if relabeled_writer is not None:
+        relabeled_writer.writerow(header)
+        if coalesce:
+            relabeled_writer = CoalescingWriter(relabeled_writer)
+    row_writer = CoalescingWriter(output_writer) if coalesce else output_writer
+    for row in input_reader:
+        relabeled = relabel_row(row, mnemonics)
+        if relabeled_writer is not None:
+            relabeled_writer.writerow(relabeled)
+        row_writer.writerow(recolor_row(relabeled, colors))
+    flush_writer(relabeled_writer)
+    return flush_writer(row_writer)
+
+
+def relabel_row(row: List[str], mnemonics: Dict[str, str]) -> List[str]:
+    row[3] = mnemonics[row[3]]
+    return row
+
+
+def recolor_row(row: List[str], colors: Dict[str, str]) -> List[str]:
+    row[-1] = colors[row[3]]
+    return row
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "bed",
+        help=(
+            "path to bed, may be gzip, BGZF, or zstd compressed, or - for stdin, or a "
+            "segmentation"
+        ),
+    )
+    parser.add_argument("mnemonics")
+    parser.add_argument(
+        "-o",
+        "--output-filename",
+        required=True,
+        help=f"written as a segmentation if it ends with {SEGMENTATION_SUFFIX}",
+    )
+    parser.add_argument(
+        "--relabeled-output-filename",
+        help="optionally also write the relabeled but not recolored bed here",
+    )
+    add_compression_args(parser)
+    parser.add_argument("--backend", choices=BACKENDS, default=CSV_BACKEND)
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="size in bytes of the chunks read by the numpy backend",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes to remap with, requires the numpy backend",
+    )
+    parser.add_argument(
+        "--coalesce",
+        action="store_true",
+        help="merge abutting segments with the same label and color",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
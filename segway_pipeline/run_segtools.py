@@ -0,0 +1,292 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Sequence
+
+from segway_pipeline.instrument import add_records, instrumented, maxrss_to_mb
+
+# In the order they are started, the slowest first so the others fit in around them
+SEGTOOLS = (
+    "signal_distribution",
+    "aggregation",
+    "length_distribution",
+    "gmtk_parameters",
+)
+# What the shell reports for a command that can't be found
+COMMAND_NOT_FOUND_STATUS = 127
+# Write the same tables as segtools-length-distribution, segtools-aggregation and
+# segtools-signal-distribution, without holding a base by base map of the segmentation
+# in memory
+LENGTH_DISTRIBUTION_SCRIPT = Path(__file__).with_name("length_distribution.py")
+FEATURE_AGGREGATION_SCRIPT = Path(__file__).with_name("feature_aggregation.py")
+SIGNAL_DISTRIBUTION_SCRIPT = Path(__file__).with_name("signal_distribution.py")
+
+
+class ToolResult(NamedTuple):
+    exit_status: int
+    wall_seconds: float
+    user_seconds: float
+    system_seconds: float
+    peak_rss_mb: float
+
+
+@instrumented("run_segtools")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("Must use at least one job")
+    commands = make_commands(
+        args.segway_output_bed,
+        args.segway_params,
+        args.annotation_gtf,
+        args.genomedata,
+        args.flank_bases,
+        args.jobs,
+        args.signal_distribution_sample_fraction,
+    )
+    start = time.perf_counter()
+    results = run_tools(commands, args.jobs, args.log_dir)
+    wall_seconds = time.perf_counter() - start
+    write_report(
+        commands,
+        results,
+        args.allow_failure,
+        args.jobs,
+        wall_seconds,
+        args.log_dir,
+        args.report,
+    )
+    add_records(len(results))
+    failed = []
+    for name, result in results.items():
+        if result.exit_status == 0:
+            continue
+        print(
+            f"{name} failed with exit status {result.exit_status}, see "
+            f"{get_log_path(args.log_dir, name)}",
+            file=sys.stderr,
+        )
+        if name not in args.allow_failure:
+            failed.append(name)
+    if failed:
+        sys.exit(f"Segtools failed: {', '.join(failed)}")
+
+
+def make_commands(
+    segway_output_bed: str,
+    segway_params: str,
+    annotation_gtf: str,
+    genomedata: str,
+    flank_bases: int,
+    jobs: int = 1,
+    signal_distribution_sample_fraction: float = 1.0,
+) -> Dict[str, List[str]]:
+    """
+    `segway_params` is the params file in the traindir, `params/params.params`.
+    The length distribution, feature aggregation and signal distribution tables are
+    computed natively then plotted by segtools. Signal distribution reads the
+    chromosomes in `jobs` processes, it runs long after the other tools are done, and
+    only reads the given fraction of the segments of each label, all of them by
+    default.
+    """
+    commands = {
+        "signal_distribution": [
+            sys.executable,
+            str(SIGNAL_DISTRIBUTION_SCRIPT),
+            "--plot",
+            "--transformation",
+            "arcsinh",
+            f"--jobs={jobs}",
+            f"--sample-fraction={signal_distribution_sample_fraction}",
+            "-o",
+            "signal_distribution",
+            segway_output_bed,
+            genomedata,
+        ],
+        "aggregation": [
+            sys.executable,
+            str(FEATURE_AGGREGATION_SCRIPT),
+            "--plot",
+            "-o",
+            "feature_aggregation",
+            f"--flank-bases={flank_bases}",
+            segway_output_bed,
+            annotation_gtf,
+        ],
+        "length_distribution": [
+            sys.executable,
+            str(LENGTH_DISTRIBUTION_SCRIPT),
+            "--plot",
+            "-o",
+            "length_distribution",
+            segway_output_bed,
+        ],
+        "gmtk_parameters": [
+            "segtools-gmtk-parameters",
+            "-o",
+            "gmtk_parameters",
+            segway_params,
+        ],
+    }
+    return {name: commands[name] for name in SEGTOOLS}
+
+
+def run_tools(
+    commands: Dict[str, List[str]], jobs: int, log_dir: str
+) -> Dict[str, ToolResult]:
+    """
+    Runs the commands, which must not depend on each other, at most `jobs` at a time
+    in the order given, writing the stdout and stderr of each to `<name>.log` in
+    `log_dir`. All of them are run even if some fail. Returns the results in the same
+    order.
+    """
+    Path(log_dir).mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            name: executor.submit(run_tool, command, get_log_path(log_dir, name))
+            for name, command in commands.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+def run_tool(command: List[str], log_path: Path) -> ToolResult:
+    """
+    Waits for the command with `os.wait4` to get the CPU time and peak RSS of it alone,
+    `RUSAGE_CHILDREN` would mix up all of the commands running at once. A command that
+    can't be run gets the shell's status for a missing command.
+    """
+    start = time.perf_counter()
+    with open(log_path, "wb") as log_file_handle:
+        try:
+            process = subprocess.Popen(
+                command, stdout=log_file_handle, stderr=subprocess.STDOUT
+            )
+        except OSError as e:
+            log_file_handle.write(f"{e}\n".encode())
+            return ToolResult(
+                exit_status=COMMAND_NOT_FOUND_STATUS,
+                wall_seconds=round(time.perf_counter() - start, 4),
+                user_seconds=0.0,
+                system_seconds=0.0,
+                peak_rss_mb=0.0,
+            )
+        _, status, rusage = os.wait4(process.pid, 0)
+    # Already reaped, so the Popen mustn't wait for it again
+    process.returncode = get_exit_status(status)
+    return ToolResult(
+        exit_status=process.returncode,
+        wall_seconds=round(time.perf_counter() - start, 4),
+        user_seconds=round(rusage.ru_utime, 4),
+        system_seconds=round(rusage.ru_stime, 4),
+        peak_rss_mb=round(maxrss_to_mb(rusage.ru_maxrss), 1),
+    )
+
+
+def get_exit_status(status: int) -> int:
+    """
+    Decodes a wait status like `subprocess` does, negative for a signal.
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def get_log_path(log_dir: str, name: str) -> Path:
+    return Path(log_dir, f"{name}.log")
+
+
+def write_report(
+    commands: Dict[str, List[str]],
+    results: Dict[str, ToolResult],
+    allow_failure: Sequence[str],
+    jobs: int,
+    wall_seconds: float,
+    log_dir: str,
+    report: str,
+) -> None:
+    tools = {}
+    for name, result in results.items():
+        tools[name] = {
+            "command": commands[name],
+            "log": str(get_log_path(log_dir, name)),
+            "allow_failure": name in allow_failure,
+            **result._asdict(),
+        }
+    with open(report, "w") as f:
+        json.dump(
+            {
+                "jobs": jobs,
+                "wall_seconds": round(wall_seconds, 4),
+                "tools": tools,
+            },
+            f,
+            indent=4,
+            sort_keys=True,
+        )
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segway-output-bed", required=True)
+    parser.add_argument(
+        "--segway-params",
+        required=True,
+        help="params file from the traindir, params/params.params",
+    )
+    parser.add_argument("--annotation-gtf", required=True)
+    parser.add_argument("--genomedata", required=True)
+    parser.add_argument("--flank-bases", type=int, required=True)
+    parser.add_argument(
+        "--signal-distribution-sample-fraction",
+        type=float,
+        default=1.0,
+        help=(
+            "fraction of the blocks of each label signal distribution reads, seeded "
+            "with $SEGWAY_RAND_SEED"
+        ),
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=len(SEGTOOLS),
+        help=(
+            "number of tools to run at once, by default all of them, and of processes "
+            "signal distribution reads the chromosomes in"
+        ),
+    )
+    parser.add_argument(
+        "--allow-failure",
+        action="append",
+        choices=SEGTOOLS,
+        default=[],
+        help=(
+            "tool that is known to be flaky, its failure is reported but doesn't fail "
+            "the run, can be given more than once"
+        ),
+    )
+    parser.add_argument(
+        "--log-dir",
+        default="segtools_logs",
+        help="directory to write the output of each tool to, as <tool>.log",
+    )
+    parser.add_argument(
+        "-r",
+        "--report",
+        default="segtools_report.json",
+        help=(
+            "JSON file to write the exit status, wall time, CPU time and peak memory of "
+            "each tool to"
+        ),
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+import argparse
+import struct
+import zipfile
+from array import array
+from pathlib import Path
+from typing import IO, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from segway_pipeline.compressed_io import add_compression_args, open_input, open_output
+from segway_pipeline.instrument import add_records, instrumented
+from segway_pipeline.vectorized_remap import rewrite_header
+
+PathLike = Union[str, Path]
+
+FORMAT_VERSION = 1
+ZIP_MAGIC = b"PK\x03\x04"
+ZIP_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+SEGMENTATION_SUFFIX = ".npz"
+
+# Columns of a BED9 row that only take a handful of distinct values, stored as integer
+# codes into a table of those values.
+ENCODED_COLUMNS = {"chrom": 0, "name": 3, "score": 4, "strand": 5, "item_rgb": 8}
+NUM_COLUMNS = 9
+ROWS_PER_CHUNK = 1 << 16
+
+
+class Segmentation:
+    """
+    Columnar, in memory version of a Segway BED9. Coordinates are uint32 arrays, the
+    chromosome, label, score, strand and color columns are integer codes into tables
+    of their distinct values, and the thick start and end are only stored when they
+    differ from the start and end, which they never do in Segway output.
+
+    The arrays are never modified, remapping the labels or colors only builds new
+    tables and shares the arrays with the original.
+    """
+
+    def __init__(
+        self,
+        track_line: str,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        values: Dict[str, List[str]],
+        codes: Dict[str, np.ndarray],
+        thick_starts: Optional[np.ndarray] = None,
+        thick_ends: Optional[np.ndarray] = None,
+    ) -> None:
+        self.track_line = track_line
+        self.starts = starts
+        self.ends = ends
+        self.values = values
+        self.codes = codes
+        self.thick_starts = thick_starts
+        self.thick_ends = thick_ends
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def iter_chroms(self) -> Iterator[Tuple[str, np.ndarray]]:
+        """
+        Yields each chromosome with the indexes of its rows sorted by start, in the
+        order the chromosomes first appear.
+        """
+        chrom_codes = self.codes["chrom"]
+        order = np.lexsort((self.starts, chrom_codes))
+        boundaries = np.flatnonzero(np.diff(chrom_codes[order])) + 1
+        for indexes in np.split(order, boundaries):
+            if len(indexes) == 0:
+                continue
+            yield self.values["chrom"][chrom_codes[indexes[0]]], indexes
+
+    def relabel(self, mnemonics: Dict[str, str]) -> "Segmentation":
+        """
+        Like `relabel.relabel`, a label missing from `mnemonics` raises a `KeyError`.
+        """
+        values = dict(self.values)
+        values["name"] = [mnemonics[label] for label in self.values["name"]]
+        return self._replace(values, self.codes)
+
+    def recolor(self, colors: Dict[str, str]) -> "Segmentation":
+        """
+        The color of a row only depends on its label, so the recolored color codes are
+        just the label codes, with a table of the colors of each label.
+        """
+        values = dict(self.values)
+        values["item_rgb"] = [colors[label] for label in self.values["name"]]
+        codes = dict(self.codes)
+        codes["item_rgb"] = self.codes["name"]
+        return self._replace(values, codes)
+
+    def write_bed(self, output_file_handle: IO[bytes]) -> None:
+        output_file_handle.write(self.track_line.encode() + b"\n")
+        tables = {
+            column: np.array(values, dtype=object)
+            for column, values in self.values.items()
+        }
+        for start in range(0, len(self), ROWS_PER_CHUNK):
+            rows = slice(start, start + ROWS_PER_CHUNK)
+            chroms, names, scores, strands, colors = (
+                tables[column][self.codes[column][rows]].tolist()
+                for column in ENCODED_COLUMNS
+            )
+            starts = self.starts[rows].tolist()
+            ends = self.ends[rows].tolist()
+            thick_starts = (
+                starts
+                if self.thick_starts is None
+                else self.thick_starts[rows].tolist()
+            )
+            thick_ends = (
+                ends if self.thick_ends is None else self.thick_ends[rows].tolist()
+            )
+            output_file_handle.write(
+                "".join(
+                    f"{row[0]}\t{row[1]}\t{row[2]}\t{row[3]}\t{row[4]}\t{row[5]}\t"
+                    f"{row[6]}\t{row[7]}\t{row[8]}\n"
+                    for row in zip(
+                        chroms,
+                        starts,
+                        ends,
+                        names,
+                        scores,
+                        strands,
+                        thick_starts,
+                        thick_ends,
+                        colors,
+                    )
+                ).encode()
+            )
+
+    def save(self, path: PathLike) -> None:
+        """
+        Saved as an uncompressed `.npz` so `load_segmentation` can memory map it.
+        """
+        arrays = {
+            "version": np.array(FORMAT_VERSION),
+            "track_line": np.array(self.track_line),
+            "starts": self.starts,
+            "ends": self.ends,
+        }
+        if self.thick_starts is not None and self.thick_ends is not None:
+            arrays["thick_starts"] = self.thick_starts
+            arrays["thick_ends"] = self.thick_ends
+        for column in ENCODED_COLUMNS:
+            arrays[f"{column}_values"] = np.array(self.values[column], dtype=str)
+            arrays[f"{column}_codes"] = self.codes[column]
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)  # type: ignore
+
+    def _replace(
+        self, values: Dict[str, List[str]], codes: Dict[str, np.ndarray]
+    ) -> "Segmentation":
+        """
+        The remapped output goes through the csv writer in the text code paths, so the
+        track line is rewritten the same way here.
+        """
+        track_line = rewrite_header(self.track_line.encode() + b"\n").decode()
+        return Segmentation(
+            track_line.rstrip("\n"),
+            self.starts,
+            self.ends,
+            values,
+            codes,
+            self.thick_starts,
+            self.thick_ends,
+        )
+
+
+@instrumented("segmentation")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    save_output(
+        load_input(args.input), args.output_filename, args.compression, args.threads
+    )
+
+
+def is_segmentation(path: PathLike) -> bool:
+    if str(path) == "-":
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(ZIP_MAGIC)) == ZIP_MAGIC
+
+
+def uses_segmentation(input_path: PathLike, output_filename: PathLike) -> bool:
+    """
+    Whether a script should go through a `Segmentation` rather than stream text, which
+    is the case when reading or writing one.
+    """
+    return (
+        is_segmentation(input_path)
+        or Path(output_filename).suffix == SEGMENTATION_SUFFIX
+    )
+
+
+def load_input(path: PathLike) -> Segmentation:
+    """
+    Loads either a segmentation or a possibly compressed bed.
+    """
+    if is_segmentation(path):
+        segmentation = load_segmentation(path)
+    else:
+        with open_input(path) as bed_file_handle:
+            segmentation = read_bed(bed_file_handle)
+    add_records(len(segmentation))
+    return segmentation
+
+
+def read_bed(bed_file_handle: IO[str]) -> Segmentation:
+    """
+    Raises a `ValueError` if the bed could not be written back out exactly, i.e. if it
+    is not BED9 or has coordinates that aren't plain integers.
+
+    The first row of the beds is the UCSC track definition line which should not be
+    processed
+    """
+    track_line = bed_file_handle.readline().rstrip("\n")
+    if not track_line:
+        raise ValueError("Bed is empty, expected a track definition line")
+    tables: Dict[str, Dict[str, int]] = {column: {} for column in ENCODED_COLUMNS}
+    codes = {column: array("I") for column in ENCODED_COLUMNS}
+    coordinates = [array("I") for _ in range(4)]
+    starts, ends, thick_starts, thick_ends = coordinates
+    for line in bed_file_handle:
+        row = line.rstrip("\n").split("\t")
+        if len(row) != NUM_COLUMNS:
+            raise ValueError(f"Expected {NUM_COLUMNS} columns but found row {row}")
+        for column, index in ENCODED_COLUMNS.items():
+            table = tables[column]
+            codes[column].append(table.setdefault(row[index], len(table)))
+        for values, field in zip(coordinates, (row[1], row[2], row[6], row[7])):
+            value = int(field)
+            if str(value) != field:
+                raise ValueError(f"Can't store coordinate {field} of row {row} exactly")
+            values.append(value)
+    segmentation = Segmentation(
+        track_line,
+        _to_numpy(starts),
+        _to_numpy(ends),
+        {column: list(table) for column, table in tables.items()},
+        {
+            column: _to_numpy(codes[column], len(tables[column]))
+            for column in ENCODED_COLUMNS
+        },
+    )
+    if thick_starts != starts or thick_ends != ends:
+        segmentation.thick_starts = _to_numpy(thick_starts)
+        segmentation.thick_ends = _to_numpy(thick_ends)
+    return segmentation
+
+
+def load_segmentation(path: PathLike, mmap: bool = True) -> Segmentation:
+    """
+    Loads a segmentation saved with `Segmentation.save`. With `mmap`, the arrays are
+    memory mapped straight out of the `.npz`, which is possible because they are stored
+    uncompressed, so only the pages actually used are ever read.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            name = info.filename[: -len(".npy")]
+            array_ = None
+            if mmap and info.compress_type == zipfile.ZIP_STORED:
+                array_ = _memmap_member(path, f, info)
+            if array_ is None:
+                with archive.open(info) as member:
+                    array_ = np.lib.format.read_array(member)
+            arrays[name] = array_
+    version = int(arrays["version"])
+    if version != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported segmentation format version {version}, expected "
+            f"{FORMAT_VERSION}"
+        )
+    return Segmentation(
+        str(arrays["track_line"]),
+        arrays["starts"],
+        arrays["ends"],
+        {column: arrays[f"{column}_values"].tolist() for column in ENCODED_COLUMNS},
+        {column: arrays[f"{column}_codes"] for column in ENCODED_COLUMNS},
+        arrays.get("thick_starts"),
+        arrays.get("thick_ends"),
+    )
+
+
+def save_output(
+    segmentation: Segmentation,
+    output_filename: PathLike,
+    compression: Optional[str] = None,
+    threads: int = 1,
+) -> None:
+    """
+    Saves the segmentation if the output has the segmentation suffix, otherwise writes
+    it as a possibly compressed bed.
+    """
+    if Path(output_filename).suffix == SEGMENTATION_SUFFIX:
+        segmentation.save(output_filename)
+        return
+    with open_output(
+        output_filename, "wb", compression=compression, threads=threads
+    ) as output_file_handle:
+        segmentation.write_bed(output_file_handle)
+
+
+def _memmap_member(
+    path: PathLike, file_handle: IO[bytes], info: zipfile.ZipInfo
+) -> Optional[np.ndarray]:
+    """
+    Finds the start of the member's data from its local header, which may have a
+    different extra field than the central directory entry, then skips the `.npy`
+    header. Returns None for arrays that can't be memory mapped.
+    """
+    file_handle.seek(info.header_offset)
+    local_header = ZIP_LOCAL_HEADER.unpack(file_handle.read(ZIP_LOCAL_HEADER.size))
+    name_length, extra_length = local_header[-2:]
+    file_handle.seek(name_length + extra_length, 1)
+    version = np.lib.format.read_magic(file_handle)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file_handle)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file_handle)
+    if dtype.hasobject or not shape or 0 in shape:
+        return None
+    return np.memmap(
+        path,
+        dtype=dtype,
+        mode="r",
+        shape=shape,
+        order="F" if fortran_order else "C",
+        offset=file_handle.tell(),
+    )
+
+
+def _to_numpy(values: array, num_codes: Optional[int] = None) -> np.ndarray:
+    """
+    Coordinates are stored as uint32, codes in the smallest type that fits them.
+    """
+    dtype: type = np.uint32
+    if num_codes is not None and num_codes <= 1 << 8:
+        dtype = np.uint8
+    elif num_codes is not None and num_codes <= 1 << 16:
+        dtype = np.uint16
+    return np.frombuffer(values, dtype=np.uint32).astype(dtype)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "input",
+        help=(
+            "bed, may be gzip, BGZF, or zstd compressed, or - for stdin, or a "
+            "segmentation"
+        ),
+    )
+    parser.add_argument(
+        "-o",
+        "--output-filename",
+        required=True,
+        help=f"written as a segmentation if it ends with {SEGMENTATION_SUFFIX}",
+    )
+    add_compression_args(parser)
+    return parser
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+from pathlib import Path
+from typing import Dict, List
+
+from segway_pipeline.bed_to_bigbed import parse_chrom_sizes
+from segway_pipeline.instrument import add_records, instrumented
+
+SHARD_TEMPLATE = "shard_{:04d}.bed"
+
+
+@instrumented("shard_chroms")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    if args.num_shards < 1:
+        parser.error("Must use at least one shard")
+    with open(args.chrom_sizes) as chrom_sizes_file_handle:
+        chrom_sizes = parse_chrom_sizes(chrom_sizes_file_handle)
+    shards = shard_chroms(chrom_sizes, args.num_shards)
+    write_shards(shards, chrom_sizes, args.outdir)
+    add_records(len(chrom_sizes))
+
+
+def shard_chroms(chrom_sizes: Dict[str, int], num_shards: int) -> List[List[str]]:
+    """
+    Splits the chromosomes into at most `num_shards` groups with about the same total
+    size, assigning them largest first to the group with the least so far. Each group
+    keeps the chrom sizes order, and there are no empty groups.
+    """
+    if num_shards < 1:
+        raise ValueError("Must use at least one shard")
+    if not chrom_sizes:
+        raise ValueError("No chromosomes in chrom sizes")
+    num_shards = min(num_shards, len(chrom_sizes))
+    totals = [0] * num_shards
+    assignments = {}
+    for chrom in sorted(
+        chrom_sizes, key=lambda chrom: chrom_sizes[chrom], reverse=True
+    ):
+        shard = totals.index(min(totals))
+        assignments[chrom] = shard
+        totals[shard] += chrom_sizes[chrom]
+    shards: List[List[str]] = [[] for _ in range(num_shards)]
+    for chrom in chrom_sizes:
+        shards[assignments[chrom]].append(chrom)
+    return shards
+
+
+def write_shards(
+    shards: List[List[str]], chrom_sizes: Dict[str, int], outdir: str
+) -> List[Path]:
+    """
+    Writes a bed of the whole of each chromosome in each shard, for Segway's
+    `--include-coords`. Returns the paths, in shard order.
+    """
+    Path(outdir).mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i, shard in enumerate(shards):
+        path = Path(outdir, SHARD_TEMPLATE.format(i))
+        with open(path, "w") as f:
+            for chrom in shard:
+                f.write(f"{chrom}\t0\t{chrom_sizes[chrom]}\n")
+        paths.append(path)
+    return paths
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("chrom_sizes")
+    parser.add_argument("-n", "--num-shards", type=int, required=True)
+    parser.add_argument(
+        "-o",
+        "--outdir",
+        required=True,
+        help=(
+            "directory to write a bed of the chromosomes in each shard to, as "
+            f"{SHARD_TEMPLATE.format(0)} and so on"
+        ),
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,727 @@
+import argparse
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import IO, Any, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from segway_pipeline.instrument import instrumented
+from segway_pipeline.length_distribution import make_writer
+from segway_pipeline.segmentation import Segmentation, load_input
+
+try:
+    from genomedata import Genome  # type: ignore
+except ImportError:  # pragma: no cover
+    Genome = None
+
+# Same name and columns as the table written by `segtools-signal-distribution`, which
+# is what the interpretation reads
+SIGNAL_DISTRIBUTION_FILENAME = "signal_distribution.tab"
+FIELDNAMES = ["label", "trackname", "mean", "sd", "n"]
+# When sampling, the half widths of the confidence intervals of the mean and
+# sd follow
+FIELDNAMES_SAMPLED = FIELDNAMES + ["mean_ci", "sd_ci"]
+# Standard errors in the half width of a 95% confidence interval
+CONFIDENCE_Z = 1.959963984540054
+TRANSFORMATIONS = {"arcsinh": np.arcsinh}
+# Bounds the memory used for the signal of all the tracks read at once
+BASES_PER_CHUNK = 1 << 20
+SEGTOOLS_SIGNAL_DISTRIBUTION = "segtools-signal-distribution"
+# genomedata stores each track of a supercontig in zlib compressed HDF5 chunks of this
+# many bases from its start, so reading any of them decompresses the whole chunk
+GENOMEDATA_CHUNK_BASES = 10000
+MIN_SAMPLED_BLOCKS = 100
+# Sample the same blocks as the rest of the pipeline's runs use the same seed
+SEED_ENV_VAR = "SEGWAY_RAND_SEED"
+DEFAULT_SEED = 0
+
+Chunk = Tuple[int, np.ndarray]
+Shard = Tuple[str, str, np.ndarray, np.ndarray, np.ndarray, int]
+Intervals = Tuple[np.ndarray, np.ndarray]
+
+
+class SignalMoments:
+    """
+    The number of finite values, mean and sum of squared deviations from the mean of
+    the signal of each track over the bases of each label, with a row per label code
+    and a column per track. Moments of disjoint sets of bases merge into the moments
+    of all of them, so each chunk and each chromosome is summarized on its own. The
+    means and sums of squares are long doubles, like the sums segtools keeps.
+    """
+
+    def __init__(self, num_labels: int, num_tracks: int) -> None:
+        shape = (num_labels, num_tracks)
+        self.n = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape, dtype=np.longdouble)
+        self.m2 = np.zeros(shape, dtype=np.longdouble)
+
+    @staticmethod
+    def concatenate(moments: List["SignalMoments"], num_tracks: int) -> "SignalMoments":
+        """
+        Stacks the rows of the moments.
+        """
+        stacked = SignalMoments(0, num_tracks)
+        for name in ("n", "mean", "m2"):
+            setattr(
+                stacked,
+                name,
+                np.concatenate(
+                    [getattr(stacked, name)] + [getattr(m, name) for m in moments]
+                ),
+            )
+        return stacked
+
+    def add(self, base_labels: np.ndarray, data: np.ndarray) -> None:
+        """
+        Adds the finite values of `data`, with a row per base and a column per track,
+        to the labels in `base_labels`, which are negative for unlabeled bases. The
+        moments of the chunk are computed in two passes over it, then merged into the
+        rows of the labels in it only, as there can be a row per segment.
+        """
+        num_labels, num_tracks = self.n.shape
+        labeled = base_labels >= 0
+        rows = np.flatnonzero(np.bincount(base_labels[labeled], minlength=num_labels))
+        chunk_codes = np.zeros(num_labels, dtype=np.int64)
+        chunk_codes[rows] = np.arange(len(rows))
+        chunk = SignalMoments(len(rows), num_tracks)
+        for track in range(num_tracks):
+            values = data[:, track]
+            kept = labeled & np.isfinite(values)
+            codes = chunk_codes[base_labels[kept]]
+            values = values[kept].astype(np.float64)
+            n = np.bincount(codes, minlength=len(rows))
+            sums = np.bincount(codes, weights=values, minlength=len(rows))
+            mean = sums / np.maximum(n, 1)
+            chunk.n[:, track] = n
+            chunk.mean[:, track] = mean
+            chunk.m2[:, track] = np.bincount(
+                codes, weights=np.square(values - mean[codes]), minlength=len(rows)
+            )
+        self.merge(chunk, rows)
+
+    def merge(self, other: "SignalMoments", rows: Optional[np.ndarray] = None) -> None:
+        """
+        Chan et al.'s pairwise update of the mean and sum of squares, of the given rows
+        only if any.
+        """
+        if rows is None:
+            rows = np.arange(len(self.n))
+        n = self.n[rows] + other.n
+        weight = np.divide(
+            other.n.astype(np.longdouble),
+            n,
+            out=np.zeros(n.shape, dtype=np.longdouble),
+            where=n > 0,
+        )
+        delta = other.mean - self.mean[rows]
+        self.m2[rows] += other.m2 + np.square(delta) * self.n[rows] * weight
+        self.mean[rows] += delta * weight
+        self.n[rows] = n
+
+    def get_means(self) -> np.ndarray:
+        """
+        NaN where there are no values, as segtools divides by zero.
+        """
+        return np.where(self.n > 0, self.mean, np.nan).astype(np.longdouble)
+
+    def get_sds(self) -> np.ndarray:
+        """
+        The sample standard deviation, NaN where there are fewer than two values.
+        """
+        variances = np.divide(
+            self.m2,
+            self.n - 1,
+            out=np.full(self.n.shape, np.nan, dtype=np.longdouble),
+            where=self.n > 1,
+        )
+        return np.sqrt(variances)
+
+
+class Summary(NamedTuple):
+    tracknames: List[str]
+    moments: SignalMoments
+    # The standard errors of the means and sds, only when sampling
+    mean_errors: Optional[np.ndarray] = None
+    sd_errors: Optional[np.ndarray] = None
+
+
+class BlockSample(NamedTuple):
+    # The starts, ends and sampled cluster index of the pieces of the segments in the
+    # sampled blocks of each chromosome, the indexes counting from 0 on each
+    cluster_pieces: List[Tuple[str, np.ndarray, np.ndarray, np.ndarray]]
+    # The label of each sampled cluster, in the order of the chromosomes
+    cluster_labels: np.ndarray
+    # The number of clusters of each label that were sampled from
+    num_clusters: np.ndarray
+
+
+@instrumented("signal_distribution")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("Must use at least one job")
+    if not 0 < args.sample_fraction <= 1:
+        parser.error("Sample fraction must be greater than 0 and at most 1")
+    segmentation = load_input(args.segmentation)
+    summary = summarize(
+        segmentation,
+        args.genomedata,
+        args.transformation,
+        jobs=args.jobs,
+        sample_fraction=args.sample_fraction,
+        min_sampled_blocks=args.min_sampled_blocks,
+        seed=args.seed,
+    )
+    Path(args.outdir).mkdir(parents=True, exist_ok=True)
+    with open(Path(args.outdir, SIGNAL_DISTRIBUTION_FILENAME), "w", newline="") as f:
+        write_signal_distribution(segmentation.values["name"], summary, f)
+    if args.plot:
+        plot(args.segmentation, args.genomedata, args.outdir)
+
+
+def summarize(
+    segmentation: Segmentation,
+    genomedata: str,
+    transformation: Optional[str] = None,
+    jobs: int = 1,
+    sample_fraction: float = 1.0,
+    min_sampled_blocks: int = MIN_SAMPLED_BLOCKS,
+    seed: int = DEFAULT_SEED,
+    bases_per_chunk: int = BASES_PER_CHUNK,
+    block_bases: int = GENOMEDATA_CHUNK_BASES,
+) -> Summary:
+    """
+    Summarizes the signal of every continuous track of the genomedata over the bases
+    of each label, after the transformation if any. Only the chromosomes in both the
+    segmentation and the genomedata are read, like segtools, in a pool of `jobs`
+    processes that each open the genomedata themselves. The track names and moments
+    are in the order of the columns of the genomedata.
+
+    With a sample fraction below 1 only the bases in a sample of blocks of each
+    supercontig are read, see `sample_blocks`, and the summary has the standard errors
+    of the estimates.
+    """
+    if Genome is None:
+        raise RuntimeError(
+            "Reading the signal requires the genomedata package, install it with "
+            "`pip install genomedata`"
+        )
+    num_labels = len(segmentation.values["name"])
+    with Genome(genomedata) as genome:
+        tracknames = list(genome.tracknames_continuous)
+        chrom_indexes = [
+            (chrom, indexes)
+            for chrom, indexes in segmentation.iter_chroms()
+            if chrom in genome
+        ]
+        supercontigs = [
+            get_supercontig_intervals(genome[chrom]) for chrom, _ in chrom_indexes
+        ]
+    label_codes = segmentation.codes["name"].astype(np.int64)
+    if sample_fraction >= 1:
+        shards = [
+            (
+                genomedata,
+                chrom,
+                segmentation.starts[indexes].astype(np.int64),
+                segmentation.ends[indexes].astype(np.int64),
+                label_codes[indexes],
+                num_labels,
+            )
+            for chrom, indexes in chrom_indexes
+        ]
+        moments = SignalMoments(num_labels, len(tracknames))
+        for chrom_moments in summarize_shards(
+            shards, len(tracknames), transformation, jobs, bases_per_chunk
+        ):
+            moments.merge(chrom_moments)
+        return Summary(tracknames, moments)
+
+    sample = sample_blocks(
+        [
+            (
+                chrom,
+                segmentation.starts[indexes].astype(np.int64),
+                segmentation.ends[indexes].astype(np.int64),
+                label_codes[indexes],
+            )
+            for chrom, indexes in chrom_indexes
+        ],
+        supercontigs,
+        num_labels,
+        sample_fraction,
+        min_sampled_blocks,
+        seed,
+        block_bases,
+    )
+    shards = [
+        (genomedata, chrom, starts, ends, clusters, int(clusters.max()) + 1)
+        for chrom, starts, ends, clusters in sample.cluster_pieces
+        if len(clusters)
+    ]
+    cluster_moments = SignalMoments.concatenate(
+        list(
+            summarize_shards(
+                shards, len(tracknames), transformation, jobs, bases_per_chunk
+            )
+        ),
+        len(tracknames),
+    )
+    return Summary(
+        tracknames,
+        *estimate(cluster_moments, sample.cluster_labels, sample.num_clusters),
+    )
+
+
+def get_supercontig_intervals(chromosome: Any) -> Intervals:
+    """
+    The starts and ends of the supercontigs with signal of the chromosome, in order.
+    """
+    bounds = [
+        (supercontig.start, supercontig.end)
+        for supercontig, _ in chromosome.itercontinuous()
+    ]
+    starts = np.array([start for start, _ in bounds], dtype=np.int64)
+    ends = np.array([end for _, end in bounds], dtype=np.int64)
+    return starts, ends
+
+
+def sample_blocks(
+    chroms: List[Tuple[str, np.ndarray, np.ndarray, np.ndarray]],
+    supercontigs: List[Intervals],
+    num_labels: int,
+    sample_fraction: float,
+    min_sampled_blocks: int = MIN_SAMPLED_BLOCKS,
+    seed: int = DEFAULT_SEED,
+    block_bases: int = GENOMEDATA_CHUNK_BASES,
+) -> BlockSample:
+    """
+    Samples blocks of the genome rather than segments, since the signal is read a
+    whole HDF5 chunk at a time: at a tenth of segments a thousand or so bases long,
+    nearly every chunk still holds one of them. Each supercontig is tiled with blocks
+    of `block_bases` from its start, the chunks genomedata stores the signal in, and
+    the bases of a label in a block are a cluster. `chroms` has the chromosome name and
+    the sorted starts, ends and label codes of its segments, and `supercontigs` the
+    intervals of the supercontigs of each one.
+
+    Each label gets a simple random sample without replacement of the blocks it has
+    bases in, `sample_fraction` of them rounded up but at least `min_sampled_blocks`,
+    so that the rare labels still have enough clusters to estimate the error from. The
+    blocks are ranked by a random key shared by all the labels, each of which keeps
+    its first ones, so the samples of the labels mostly coincide and only a bit over
+    `sample_fraction` of the blocks are read. Bases of a label in a block sampled for
+    other labels only are left out, as they aren't part of that label's sample.
+    """
+    pieces = []
+    num_blocks = 0
+    for (chrom, starts, ends, labels), (
+        supercontig_starts,
+        supercontig_ends,
+    ) in zip(chroms, supercontigs):
+        block_starts, block_ends = tile_intervals(
+            supercontig_starts, supercontig_ends, block_bases
+        )
+        segments, blocks, piece_starts, piece_ends = split_intervals(
+            starts, ends, block_starts, block_ends
+        )
+        pieces.append(
+            (chrom, piece_starts, piece_ends, labels[segments], blocks + num_blocks)
+        )
+        num_blocks += len(block_starts)
+    block_keys = np.random.default_rng(seed).random(num_blocks)
+    piece_clusters = np.concatenate(
+        [blocks * num_labels + labels for _, _, _, labels, blocks in pieces]
+        + [np.array([], dtype=np.int64)]
+    )
+    clusters, piece_clusters = np.unique(piece_clusters, return_inverse=True)
+    cluster_labels = clusters % num_labels
+    cluster_keys = block_keys[clusters // num_labels]
+    num_clusters = np.bincount(cluster_labels, minlength=num_labels)
+    sample_sizes = np.minimum(
+        np.maximum(np.ceil(num_clusters * sample_fraction), min_sampled_blocks),
+        num_clusters,
+    ).astype(np.int64)
+    order = np.lexsort((cluster_keys, cluster_labels))
+    label_offsets = np.cumsum(num_clusters) - num_clusters
+    ranks = np.empty(len(clusters), dtype=np.int64)
+    ranks[order] = np.arange(len(clusters)) - label_offsets[cluster_labels[order]]
+    sampled = ranks < sample_sizes[cluster_labels]
+    sampled_indexes = np.cumsum(sampled) - 1
+    cluster_pieces = []
+    offset = 0
+    for chrom, piece_starts, piece_ends, _, _ in pieces:
+        chrom_clusters = piece_clusters[offset : offset + len(piece_starts)]
+        offset += len(piece_starts)
+        kept = sampled[chrom_clusters]
+        chrom_sampled = sampled_indexes[chrom_clusters[kept]]
+        # Clusters are ordered by block, so a chromosome's are all after the last one's
+        first = chrom_sampled.min() if len(chrom_sampled) else 0
+        cluster_pieces.append(
+            (chrom, piece_starts[kept], piece_ends[kept], chrom_sampled - first)
+        )
+    return BlockSample(cluster_pieces, cluster_labels[sampled], num_clusters)
+
+
+def tile_intervals(starts: np.ndarray, ends: np.ndarray, size: int) -> Intervals:
+    """
+    Splits each interval into consecutive tiles of `size` from its start, the last of
+    which may be shorter.
+    """
+    counts = -(-(ends - starts) // size)
+    intervals = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.arange(len(intervals)) - np.repeat(np.cumsum(counts) - counts, counts)
+    tile_starts = starts[intervals] + offsets * size
+    return tile_starts, np.minimum(tile_starts + size, ends[intervals])
+
+
+def split_intervals(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    block_starts: np.ndarray,
+    block_ends: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Splits sorted, disjoint intervals at the bounds of the sorted, disjoint blocks,
+    leaving out the parts outside of all the blocks. Returns the interval and block
+    that each piece is from and the pieces' starts and ends, in order.
+    """
+    first = np.searchsorted(block_ends, starts, side="right")
+    last = np.searchsorted(block_starts, ends, side="left")
+    counts = np.maximum(last - first, 0)
+    intervals = np.repeat(np.arange(len(starts)), counts)
+    blocks = (
+        np.arange(len(intervals))
+        - np.repeat(np.cumsum(counts) - counts, counts)
+        + np.repeat(first, counts)
+    )
+    piece_starts = np.maximum(starts[intervals], block_starts[blocks])
+    piece_ends = np.minimum(ends[intervals], block_ends[blocks])
+    return intervals, blocks, piece_starts, piece_ends
+
+
+def summarize_shards(
+    shards: List[Shard],
+    num_tracks: int,
+    transformation: Optional[str],
+    jobs: int,
+    bases_per_chunk: int,
+) -> Iterator[SignalMoments]:
+    """
+    Yields the moments of each shard in order, summarized in a pool of `jobs`
+    processes.
+    """
+    if jobs == 1:
+        for shard in shards:
+            yield summarize_chrom(*shard, num_tracks, transformation, bases_per_chunk)
+        return
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = [
+            executor.submit(
+                summarize_chrom, *shard, num_tracks, transformation, bases_per_chunk
+            )
+            for shard in shards
+        ]
+        for future in futures:
+            yield future.result()
+
+
+def summarize_chrom(
+    genomedata: str,
+    chrom: str,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    groups: np.ndarray,
+    num_groups: int,
+    num_tracks: int,
+    transformation: Optional[str] = None,
+    bases_per_chunk: int = BASES_PER_CHUNK,
+) -> SignalMoments:
+    """
+    Summarizes the bases of the segments of one chromosome by group, the label codes
+    or the sampled cluster of each piece of a segment when sampling. The segments
+    must be sorted and not overlap. Only the bases of the segments are read, a chunk
+    at a time.
+    """
+    if np.any(ends[:-1] > starts[1:]):
+        raise ValueError(f"Segments overlap on {chrom}")
+    read_starts, read_ends = get_read_intervals(starts, ends)
+    with Genome(genomedata) as genome:
+        chunks = iter_chunks(genome[chrom], read_starts, read_ends, bases_per_chunk)
+        return summarize_chunks(
+            chunks, starts, ends, groups, num_groups, num_tracks, transformation
+        )
+
+
+def get_read_intervals(starts: np.ndarray, ends: np.ndarray) -> Intervals:
+    """
+    Joins abutting segments, which are read together.
+    """
+    breaks = np.flatnonzero(starts[1:] > ends[:-1]) + 1
+    read_starts = starts[np.concatenate([[0], breaks])]
+    read_ends = ends[np.concatenate([breaks - 1, [len(ends) - 1]])]
+    return read_starts, read_ends
+
+
+def iter_chunks(
+    chromosome: Any, starts: np.ndarray, ends: np.ndarray, bases_per_chunk: int
+) -> Iterator[Chunk]:
+    """
+    Yields the start and the signal of each chunk of the sorted, disjoint intervals
+    of the chromosome, chunks never spanning supercontigs. There is no signal outside
+    of the supercontigs.
+    """
+    for supercontig, continuous in chromosome.itercontinuous():
+        first = np.searchsorted(ends, supercontig.start, side="right")
+        last = np.searchsorted(starts, supercontig.end, side="left")
+        for start, end in zip(starts[first:last].tolist(), ends[first:last].tolist()):
+            start = max(start, supercontig.start)
+            end = min(end, supercontig.end)
+            for chunk_start in range(start, end, bases_per_chunk):
+                chunk_end = min(chunk_start + bases_per_chunk, end)
+                yield chunk_start, continuous[
+                    supercontig.project(chunk_start) : supercontig.project(chunk_end)
+                ]
+
+
+def summarize_chunks(
+    chunks: Iterable[Chunk],
+    starts: np.ndarray,
+    ends: np.ndarray,
+    groups: np.ndarray,
+    num_groups: int,
+    num_tracks: int,
+    transformation: Optional[str] = None,
+) -> SignalMoments:
+    moments = SignalMoments(num_groups, num_tracks)
+    for chunk_start, data in chunks:
+        base_groups = get_base_labels(
+            starts, ends, groups, chunk_start, chunk_start + len(data)
+        )
+        if transformation is not None:
+            data = TRANSFORMATIONS[transformation](data)
+        moments.add(base_groups, data)
+    return moments
+
+
+def estimate(
+    cluster_moments: SignalMoments, cluster_labels: np.ndarray, num_clusters: np.ndarray
+) -> Tuple[SignalMoments, np.ndarray, np.ndarray]:
+    """
+    Estimates the moments of each label from those of a sample of clusters of its
+    bases, and the standard errors of the means and sds. `num_clusters` is the number
+    of clusters of each label the sample was drawn from.
+
+    The signal of nearby bases is far more alike than that of distant ones, so the
+    errors are those of ratio estimators over the sampled clusters, with the finite
+    population correction: the variance of the mean is (1 - f) s^2 / (k m^2), where k
+    of the clusters are sampled, m is the mean number of values per sampled cluster
+    and s^2 the sample variance of the residuals of the clusters' sums, the sum of
+    their deviations from the mean. The variance's residuals are likewise the sums of
+    the squared deviations less the variance, and the error of the sd is half that of
+    the variance over the sd. Both are NaN for labels with fewer than two sampled
+    clusters, and 0 if all of them are sampled.
+    """
+    num_labels = len(num_clusters)
+    moments = SignalMoments(num_labels, cluster_moments.n.shape[1])
+    moments.n = sum_by_label(cluster_moments.n, cluster_labels, num_labels)
+    nonempty = moments.n > 0
+    sums = sum_by_label(
+        cluster_moments.n * cluster_moments.mean, cluster_labels, num_labels
+    )
+    moments.mean[nonempty] = sums[nonempty] / moments.n[nonempty]
+    deviations = cluster_moments.mean - moments.mean[cluster_labels]
+    moments.m2 = sum_by_label(
+        cluster_moments.m2 + cluster_moments.n * np.square(deviations),
+        cluster_labels,
+        num_labels,
+    )
+    variances = np.zeros(moments.n.shape, dtype=np.longdouble)
+    variances[nonempty] = moments.m2[nonempty] / moments.n[nonempty]
+    mean_residuals = cluster_moments.n * deviations
+    variance_residuals = (
+        cluster_moments.m2
+        + cluster_moments.n * np.square(deviations)
+        - cluster_moments.n * variances[cluster_labels]
+    )
+    num_sampled = np.bincount(cluster_labels, minlength=num_labels)
+    population_corrections = 1 - num_sampled / np.maximum(num_clusters, 1)
+    enough = (num_sampled > 1)[:, np.newaxis] & nonempty
+    label_indexes = np.nonzero(enough)[0]
+    scales = np.full(moments.n.shape, np.nan, dtype=np.longdouble)
+    scales[enough] = (
+        population_corrections[label_indexes]
+        * num_sampled[label_indexes]
+        / (num_sampled[label_indexes] - 1)
+        / np.square(moments.n[enough].astype(np.longdouble))
+    )
+    mean_errors = np.sqrt(
+        scales * sum_by_label(np.square(mean_residuals), cluster_labels, num_labels)
+    )
+    variance_errors = np.sqrt(
+        scales * sum_by_label(np.square(variance_residuals), cluster_labels, num_labels)
+    )
+    sds = moments.get_sds()
+    sd_errors = np.divide(
+        variance_errors,
+        2 * sds,
+        out=np.full(sds.shape, np.nan, dtype=np.longdouble),
+        where=sds > 0,
+    )
+    return moments, mean_errors, sd_errors
+
+
+def sum_by_label(values: np.ndarray, labels: np.ndarray, num_labels: int) -> np.ndarray:
+    sums = np.zeros((num_labels, values.shape[1]), dtype=values.dtype)
+    np.add.at(sums, labels, values)
+    return sums
+
+
+def get_base_labels(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    labels: np.ndarray,
+    chunk_start: int,
+    chunk_end: int,
+) -> np.ndarray:
+    """
+    The label code of each base between `chunk_start` and `chunk_end`, -1 where no
+    segment covers it, from sorted segments that don't overlap. The chunk alternates
+    between runs of unlabeled bases and the segments overlapping it, clipped to it.
+    """
+    first = np.searchsorted(ends, chunk_start, side="right")
+    last = np.searchsorted(starts, chunk_end, side="left")
+    num_segments = max(int(last) - int(first), 0)
+    bounds = np.empty(2 * num_segments + 2, dtype=np.int64)
+    bounds[0] = chunk_start
+    bounds[1:-1:2] = np.maximum(starts[first:last], chunk_start)
+    bounds[2:-1:2] = np.minimum(ends[first:last], chunk_end)
+    bounds[-1] = chunk_end
+    runs = np.full(2 * num_segments + 1, -1, dtype=np.int64)
+    runs[1::2] = labels[first:last]
+    return np.repeat(runs, np.diff(bounds))
+
+
+def write_signal_distribution(
+    label_names: List[str], summary: Summary, output_file_handle: IO[str]
+) -> None:
+    """
+    Writes the table as segtools does, a row per label in the order the labels first
+    appear in the segmentation, then per track in the order of the genomedata, with
+    the long doubles written out in full. When sampling, the half widths of the 95%
+    confidence intervals of the mean and sd follow.
+    """
+    moments = summary.moments
+    means = moments.get_means()
+    sds = moments.get_sds()
+    margins = None
+    if summary.mean_errors is not None and summary.sd_errors is not None:
+        margins = (
+            CONFIDENCE_Z * summary.mean_errors,
+            CONFIDENCE_Z * summary.sd_errors,
+        )
+    writer = make_writer(output_file_handle)
+    writer.writerow(FIELDNAMES if margins is None else FIELDNAMES_SAMPLED)
+    for code, label in enumerate(label_names):
+        for track, trackname in enumerate(summary.tracknames):
+            row = [
+                label,
+                trackname,
+                str(means[code, track]),
+                str(sds[code, track]),
+                int(moments.n[code, track]),
+            ]
+            if margins is not None:
+                row.extend(str(margin[code, track]) for margin in margins)
+            writer.writerow(row)
+
+
+def plot(segmentation: str, genomedata: str, outdir: str) -> bool:
+    """
+    Plots the table with segtools, which only reads the table with `--replot`. The
+    plotting is known to fail spuriously under Python 3, see
+    https://github.com/hoffmangroup/segtools/issues/58, so a failure only warns since
+    the table has already been written. Returns whether the plot succeeded.
+    """
+    try:
+        subprocess.run(
+            [
+                SEGTOOLS_SIGNAL_DISTRIBUTION,
+                "--replot",
+                "-o",
+                outdir,
+                segmentation,
+                genomedata,
+            ],
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(
+            f"Plotting the signal distribution failed, the table is unaffected: {e}",
+            file=sys.stderr,
+        )
+        return False
+    return True
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("segmentation", help="Segway bed or saved segmentation")
+    parser.add_argument("genomedata", help="genomedata archive the signal is read from")
+    parser.add_argument(
+        "-o",
+        "--outdir",
+        required=True,
+        help=f"directory to write {SIGNAL_DISTRIBUTION_FILENAME} to",
+    )
+    parser.add_argument(
+        "-t",
+        "--transformation",
+        choices=sorted(TRANSFORMATIONS),
+        help="transformation applied to the signal before it is summarized",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes to summarize the chromosomes in",
+    )
+    parser.add_argument(
+        "--sample-fraction",
+        type=float,
+        default=1.0,
+        help=(
+            "fraction of the blocks of the genome each label has bases in to read the "
+            "signal of, the table then has the confidence intervals of the estimates, "
+            "by default all of them are read"
+        ),
+    )
+    parser.add_argument(
+        "--min-sampled-blocks",
+        type=int,
+        default=MIN_SAMPLED_BLOCKS,
+        help="number of blocks of each label to sample at least, if it has as many",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=int(os.environ.get(SEED_ENV_VAR, DEFAULT_SEED)),
+        help=f"seed of the sample of blocks, by default ${SEED_ENV_VAR} if set",
+    )
+    parser.add_argument(
+        "--plot",
+        action="store_true",
+        help=(
+            f"also plot the table with {SEGTOOLS_SIGNAL_DISTRIBUTION}, after it is "
+            "written"
+        ),
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
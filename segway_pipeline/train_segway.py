@@ -0,0 +1,139 @@
+import argparse
+import os
+import subprocess
+import tarfile
+from pathlib import Path
+from typing import Any, Dict, List, Mapping
+
+from segway_pipeline.archive import write_archive
+from segway_pipeline.cache import Cache, add_cache_args, make_key
+from segway_pipeline.compressed_io import add_compression_args, open_output
+from segway_pipeline.instrument import instrumented
+
+# Environment variables that change the trained model
+SEGWAY_ENV_VARS = ("SEGWAY_RAND_SEED",)
+
+
+@instrumented("train_segway")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    cache = None
+    if args.cache_dir is not None:
+        cache = Cache(args.cache_dir, max_size=args.cache_max_size)
+        params = get_cache_params(args, os.environ)
+        if args.genomedata_key:
+            # The genomedata key already hashes the bigwigs and chrom sizes it was
+            # built from, so the genomedata itself needn't be hashed again
+            params["genomedata_key"] = args.genomedata_key
+            key = make_key([], params)
+        else:
+            key = make_key([args.genomedata], params, jobs=args.threads)
+        if cache.get(key, args.output_filename):
+            extract_traindir(args.output_filename)
+            return
+    Path(args.traindir).mkdir(exist_ok=True)
+    subprocess.run(make_command(args), check=True)
+    with open_output(
+        args.output_filename,
+        "wb",
+        compression=args.compression,
+        threads=args.threads,
+    ) as output_file_handle:
+        write_archive(output_file_handle, [args.traindir])
+    if cache is not None:
+        cache.put(key, args.output_filename, params)
+
+
+def make_command(args: argparse.Namespace) -> List[str]:
+    command = [
+        "segway",
+        "train",
+        "--num-labels",
+        str(args.num_labels),
+        "--resolution",
+        str(args.resolution),
+        "--minibatch-fraction",
+        str(args.minibatch_fraction),
+        "--num-instances",
+        str(args.num_instances),
+    ]
+    if args.prior_strength is not None:
+        command.extend(["--prior_strength", str(args.prior_strength)])
+    command.extend(
+        [
+            "--segtransition-weight-scale",
+            str(args.segtransition_weight_scale),
+            "--max-train-rounds",
+            str(args.max_train_rounds),
+            args.genomedata,
+            args.traindir,
+        ]
+    )
+    return command
+
+
+def get_cache_params(
+    args: argparse.Namespace, environ: Mapping[str, str]
+) -> Dict[str, Any]:
+    """
+    Everything besides the genomedata that the traindir depends on, the training
+    hyperparameters and the random seed.
+    """
+    params: Dict[str, Any] = {
+        "script": "train_segway",
+        "traindir": args.traindir,
+        "num_labels": args.num_labels,
+        "resolution": args.resolution,
+        "minibatch_fraction": args.minibatch_fraction,
+        "num_instances": args.num_instances,
+        "prior_strength": args.prior_strength,
+        "segtransition_weight_scale": args.segtransition_weight_scale,
+        "max_train_rounds": args.max_train_rounds,
+    }
+    for name in SEGWAY_ENV_VARS:
+        params[name] = environ.get(name)
+    return params
+
+
+def extract_traindir(archive_path: str) -> None:
+    """
+    Downstream tasks also use files from the traindir itself, so a cached traindir is
+    extracted as well. The members are named by the traindir path, which is part of the
+    cache key, so they go back where they would have been trained.
+    """
+    with tarfile.open(archive_path) as archive:
+        archive.extractall()
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("genomedata")
+    parser.add_argument("traindir", help="directory for segway to train in")
+    parser.add_argument(
+        "-o",
+        "--output-filename",
+        required=True,
+        help="archive of the traindir, may be compressed, see --compression",
+    )
+    parser.add_argument("--num-labels", type=int, required=True)
+    parser.add_argument("--resolution", type=int, required=True)
+    parser.add_argument("--minibatch-fraction", type=float, required=True)
+    parser.add_argument("--num-instances", type=int, required=True)
+    parser.add_argument("--prior-strength", type=float)
+    parser.add_argument("--segtransition-weight-scale", type=float, required=True)
+    parser.add_argument("--max-train-rounds", type=int, required=True)
+    add_compression_args(parser)
+    add_cache_args(parser)
+    parser.add_argument(
+        "--genomedata-key",
+        help=(
+            "cache key of the genomedata, from make_genomedata.py --key-output, to key "
+            "the traindir on instead of the contents of the genomedata. Ignored if empty"
+        ),
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import fnmatch
+import hashlib
+import sys
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import IO, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from segway_pipeline.instrument import instrumented
+
+PathLike = Union[str, Path]
+
+TRAINDIR = "traindir"
+CHUNK_SIZE = 1 << 20
+# The shell scripts in `cmdline` contain Cromwell file paths. The files in `output`
+# seem to have the same contents, but the filenames aren't the same.
+IGNORED_DIRS = ("cmdline", "output")
+# The run scripts and job logs in `log` are nondeterministic, but these can still be
+# compared, the likelihoods for each parallel training run.
+LOG_WHITELIST = ("jt_info.txt", "likelihood.*.tab")
+# The 1-based lines to leave out of the files in a directory, the files in
+# `triangulation` contain a timestamp at line 17.
+SKIPPED_LINES: Dict[str, Tuple[int, ...]] = {"triangulation": (17,)}
+
+
+class TraindirDiff(NamedTuple):
+    """
+    The relative paths of the compared members that are only in the first archive, only
+    in the second, and in both but with different contents.
+    """
+
+    only_in_first: List[str]
+    only_in_second: List[str]
+    different: List[str]
+
+    @property
+    def matches(self) -> bool:
+        return not (self.only_in_first or self.only_in_second or self.different)
+
+
+@instrumented("traindir_diff")
+def main() -> None:
+    parser = get_parser()
+    args = parser.parse_args()
+    diff = diff_traindirs(args.traindir1, args.traindir2)
+    for label, paths in (
+        (f"Only in {args.traindir1}", diff.only_in_first),
+        (f"Only in {args.traindir2}", diff.only_in_second),
+        ("Differ", diff.different),
+    ):
+        for path in paths:
+            print(f"{label}: {path}")
+    if not diff.matches:
+        sys.exit(1)
+
+
+def diff_traindirs(traindir1: PathLike, traindir2: PathLike) -> TraindirDiff:
+    """
+    Compares two traindir archives without extracting them. Both are read as streams
+    at the same time in separate threads, hashing each member that isn't ignored chunk
+    by chunk, so memory use doesn't depend on the size of the archives or members.
+    """
+    with ThreadPoolExecutor(2) as executor:
+        digests1, digests2 = executor.map(digest_archive, (traindir1, traindir2))
+    return TraindirDiff(
+        only_in_first=sorted(set(digests1) - set(digests2)),
+        only_in_second=sorted(set(digests2) - set(digests1)),
+        different=sorted(
+            path
+            for path in set(digests1) & set(digests2)
+            if digests1[path] != digests2[path]
+        ),
+    )
+
+
+def digest_archive(path: PathLike) -> Dict[str, str]:
+    """
+    Returns the md5 of each member of the possibly compressed tar that is compared, by
+    its path relative to the archive's traindir.
+    """
+    digests = {}
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            relative_path = get_relative_path(member.name)
+            if is_ignored(relative_path):
+                continue
+            member_file = archive.extractfile(member)
+            if member_file is None:  # pragma: no cover
+                continue
+            skipped_lines = get_skipped_lines(relative_path)
+            digests[relative_path] = digest_member(member_file, skipped_lines)
+    return digests
+
+
+def digest_member(
+    file_handle: IO[bytes], skipped_lines: Optional[Tuple[int, ...]] = None
+) -> str:
+    """
+    Members with lines to skip are hashed line by line, the rest chunk by chunk.
+    """
+    hasher = hashlib.md5()
+    if skipped_lines:
+        for line_number, line in enumerate(file_handle, start=1):
+            if line_number not in skipped_lines:
+                hasher.update(line)
+    else:
+        for chunk in iter(lambda: file_handle.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def get_relative_path(name: str) -> str:
+    """
+    Members are keyed by their path from the traindir down, since the archives may not
+    have been made from the same parent directory.
+    """
+    parts = PurePosixPath(name).parts
+    if TRAINDIR in parts:
+        parts = parts[parts.index(TRAINDIR) :]
+    return str(PurePosixPath(*parts))
+
+
+def is_ignored(relative_path: str) -> bool:
+    path = PurePosixPath(relative_path)
+    if any(directory in path.parts[:-1] for directory in IGNORED_DIRS):
+        return True
+    if "log" in path.parts[:-1]:
+        return not any(
+            fnmatch.fnmatchcase(path.name, pattern) for pattern in LOG_WHITELIST
+        )
+    return False
+
+
+def get_skipped_lines(relative_path: str) -> Optional[Tuple[int, ...]]:
+    for directory, line_numbers in SKIPPED_LINES.items():
+        if directory in PurePosixPath(relative_path).parts[:-1]:
+            return line_numbers
+    return None
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("traindir1", help="traindir archive, may be gzip compressed")
+    parser.add_argument("traindir2", help="traindir archive, may be gzip compressed")
+    return parser
+
+
+if __name__ == "__main__":
+    main()
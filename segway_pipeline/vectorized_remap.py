@@ -0,0 +1,343 @@
+import csv
+import io
+from typing import IO, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from segway_pipeline.coalesce import CHROM, END, MERGE_KEY_COLUMNS, START, THICK_END
+
+CSV_BACKEND = "csv"
+NUMPY_BACKEND = "numpy"
+BACKENDS = (CSV_BACKEND, NUMPY_BACKEND)
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+NEWLINE = ord("\n")
+TAB = ord("\t")
+
+# Index of the name column, i.e. the Segway label, in a BED9 row
+LABEL_COLUMN = 3
+
+# Coalescing needs the thick end and all of the merge key columns
+MIN_COALESCE_COLUMNS = max(THICK_END, *MERGE_KEY_COLUMNS) + 1
+
+
+class ChunkRemapper:
+    """
+    Rewrites the label and color columns of blocks of complete bed lines with NumPy array
+    operations instead of per-row Python. Each distinct label is assigned an integer
+    code the first time it is seen, the replacement label and color bytes for each code
+    are stored in code indexed tables, and the output for a block is assembled with a
+    single gather over the input bytes and the replacement table.
+
+    If `mnemonics` is None labels are left as is, if `colors` is None the color column
+    is left as is. `colors` is keyed by the relabeled label. Like the csv path, a label
+    missing from either mapping raises a `KeyError`.
+    """
+
+    def __init__(
+        self,
+        mnemonics: Optional[Dict[str, str]] = None,
+        colors: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self._mnemonics = mnemonics
+        self._colors = colors
+        self._codes: Dict[bytes, int] = {}
+        self._replacements: List[Tuple[bytes, bytes]] = []
+        self._table = np.empty(0, dtype=np.uint8)
+        self._label_offsets = np.empty(0, dtype=np.int64)
+        self._label_lengths = np.empty(0, dtype=np.int64)
+        self._color_offsets = np.empty(0, dtype=np.int64)
+        self._color_lengths = np.empty(0, dtype=np.int64)
+
+    def remap(self, chunk: bytes) -> bytes:
+        """
+        `chunk` must consist of complete, newline terminated lines.
+        """
+        if not chunk:
+            return b""
+        buffer = np.frombuffer(chunk, dtype=np.uint8)
+        line_ends = np.flatnonzero(buffer == NEWLINE)
+        tabs = np.flatnonzero(buffer == TAB)
+        line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+        first_tabs = np.searchsorted(tabs, line_starts)
+        num_tabs = np.diff(np.append(first_tabs, len(tabs)))
+        if (num_tabs <= LABEL_COLUMN).any():
+            raise ValueError(
+                f"Found bed line with fewer than {LABEL_COLUMN + 2} columns in chunk"
+            )
+        label_starts = tabs[first_tabs + LABEL_COLUMN - 1] + 1
+        label_ends = tabs[first_tabs + LABEL_COLUMN]
+        color_starts = tabs[first_tabs + num_tabs - 1] + 1
+        codes = self._encode(buffer, label_starts, label_ends)
+        # The table is appended after the chunk so every output piece is a slice of one
+        # source array.
+        source = np.concatenate((buffer, self._table))
+        table_offset = len(buffer)
+        if self._mnemonics is None:
+            new_label_starts = label_starts
+            new_label_lengths = label_ends - label_starts
+        else:
+            new_label_starts = np.take(self._label_offsets, codes) + table_offset
+            new_label_lengths = np.take(self._label_lengths, codes)
+        if self._colors is None:
+            new_color_starts = color_starts
+            new_color_lengths = line_ends - color_starts
+        else:
+            new_color_starts = np.take(self._color_offsets, codes) + table_offset
+            new_color_lengths = np.take(self._color_lengths, codes)
+        starts = np.stack(
+            (line_starts, new_label_starts, label_ends, new_color_starts, line_ends),
+            axis=1,
+        )
+        lengths = np.stack(
+            (
+                label_starts - line_starts,
+                new_label_lengths,
+                color_starts - label_ends,
+                new_color_lengths,
+                np.ones_like(line_ends),
+            ),
+            axis=1,
+        )
+        return gather(source, starts.ravel(), lengths.ravel()).tobytes()
+
+    def _encode(
+        self, buffer: np.ndarray, starts: np.ndarray, ends: np.ndarray
+    ) -> np.ndarray:
+        """
+        Map each label to its integer code. The labels are packed with `pack_fields` so
+        the distinct labels in the chunk can be found with `np.unique`, only those go
+        through a Python dict.
+        """
+        labels = pack_fields(buffer, starts, ends)
+        unique_labels, inverse = np.unique(labels, return_inverse=True)
+        unique_codes = np.array(
+            [self._get_code(label) for label in unique_labels.tolist()], dtype=np.int64
+        )
+        return unique_codes[inverse.ravel()]
+
+    def _get_code(self, label: bytes) -> int:
+        code = self._codes.get(label)
+        if code is not None:
+            return code
+        new_label = label.decode()
+        if self._mnemonics is not None:
+            new_label = self._mnemonics[new_label]
+        color = b""
+        if self._colors is not None:
+            color = self._colors[new_label].encode()
+        code = len(self._replacements)
+        self._codes[label] = code
+        self._replacements.append((new_label.encode(), color))
+        self._build_table()
+        return code
+
+    def _build_table(self) -> None:
+        pieces = [piece for replacement in self._replacements for piece in replacement]
+        lengths = np.array([len(piece) for piece in pieces], dtype=np.int64)
+        offsets = np.cumsum(lengths) - lengths
+        self._table = np.frombuffer(b"".join(pieces), dtype=np.uint8)
+        self._label_offsets, self._color_offsets = offsets[0::2], offsets[1::2]
+        self._label_lengths, self._color_lengths = lengths[0::2], lengths[1::2]
+
+
+class CoalescingChunkWriter:
+    """
+    Byte level counterpart of `coalesce.CoalescingWriter` for the numpy backend, which
+    merges the same runs of abutting rows a block of complete bed lines at a time, see
+    `coalesce_chunk`. The last run of each block is held back, since it may continue
+    into the next one.
+
+    Call `flush` after the last block to write out the final run.
+    """
+
+    def __init__(self, file_handle: IO[bytes]) -> None:
+        self._file_handle = file_handle
+        self._pending = b""
+        self.num_merged = 0
+
+    def write(self, chunk: bytes) -> None:
+        data = self._pending + chunk
+        if not data:
+            return
+        merged, self._pending, num_merged = coalesce_chunk(data)
+        self._file_handle.write(merged)
+        self.num_merged += num_merged
+
+    def flush(self) -> None:
+        self._file_handle.write(self._pending)
+        self._pending = b""
+
+
+def coalesce_chunk(chunk: bytes) -> Tuple[bytes, bytes, int]:
+    """
+    Merges the runs of abutting lines that `coalesce.can_merge` would merge in a block
+    of complete, newline terminated bed lines, by comparing the packed columns of each
+    line with those of the line before it. Each run is assembled with a single gather,
+    from its first line with the end and thick end of its last line. Returns the merged
+    lines but the last, the last merged line and the number of lines merged away.
+    """
+    buffer = np.frombuffer(chunk, dtype=np.uint8)
+    line_ends = np.flatnonzero(buffer == NEWLINE)
+    line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+    # The leading -1 stands in for the newline before the first line, so that column i
+    # of each line always runs from after separator first + i - 1 to separator first + i
+    separators = np.concatenate(
+        ([-1], np.flatnonzero((buffer == TAB) | (buffer == NEWLINE)))
+    )
+    first = np.searchsorted(separators, line_starts)
+    num_columns = np.diff(np.append(first, len(separators)))
+    if (num_columns < MIN_COALESCE_COLUMNS).any():
+        raise ValueError(
+            f"Found bed line with fewer than {MIN_COALESCE_COLUMNS} columns in chunk"
+        )
+
+    def bounds(column: int) -> Tuple[np.ndarray, np.ndarray]:
+        return separators[first + column - 1] + 1, separators[first + column]
+
+    def values(column: int) -> np.ndarray:
+        return pack_fields(buffer, *bounds(column))
+
+    mergeable = values(START)[1:] == values(END)[:-1]
+    for column in (CHROM, *MERGE_KEY_COLUMNS):
+        column_values = values(column)
+        mergeable &= column_values[1:] == column_values[:-1]
+    run_firsts = np.flatnonzero(np.concatenate(([True], ~mergeable)))
+    run_lasts = np.append(run_firsts[1:], len(line_starts)) - 1
+    end_starts, end_ends = bounds(END)
+    thick_end_starts, thick_end_ends = bounds(THICK_END)
+    starts = np.stack(
+        (
+            line_starts[run_firsts],
+            end_starts[run_lasts],
+            end_ends[run_firsts],
+            thick_end_starts[run_lasts],
+            thick_end_ends[run_firsts],
+        ),
+        axis=1,
+    )
+    lengths = np.stack(
+        (
+            end_starts[run_firsts] - line_starts[run_firsts],
+            end_ends[run_lasts] - end_starts[run_lasts],
+            thick_end_starts[run_firsts] - end_ends[run_firsts],
+            thick_end_ends[run_lasts] - thick_end_starts[run_lasts],
+            line_ends[run_firsts] + 1 - thick_end_ends[run_firsts],
+        ),
+        axis=1,
+    )
+    merged = gather(buffer, starts.ravel(), lengths.ravel()).tobytes()
+    last = len(merged) - int(lengths[-1].sum())
+    return merged[:last], merged[last:], len(line_starts) - len(run_firsts)
+
+
+def flush_chunk_writer(writer: Any) -> int:
+    """
+    Flushes the writer if it is coalescing, and returns the number of lines it merged.
+    """
+    if isinstance(writer, CoalescingChunkWriter):
+        writer.flush()
+        return writer.num_merged
+    return 0
+
+
+def pack_fields(buffer: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    Packs the fields `buffer[start:end]` into a fixed width bytes array, padded with
+    nulls, so they can be compared and deduplicated with array operations.
+    """
+    lengths = ends - starts
+    width = max(int(lengths.max()), 1)
+    positions = starts[:, np.newaxis] + np.arange(width)
+    mask = np.arange(width) < lengths[:, np.newaxis]
+    padded = np.where(mask, buffer[np.minimum(positions, len(buffer) - 1)], 0)
+    return np.ascontiguousarray(padded, dtype=np.uint8).view(f"S{width}").ravel()
+
+
+def gather(source: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Concatenate the slices `source[start:start + length]` without a Python loop.
+    """
+    output_offsets = np.cumsum(lengths) - lengths
+    indices = np.arange(int(lengths.sum())) - np.repeat(
+        output_offsets - starts, lengths
+    )
+    return source[indices]
+
+
+def remap_bed(
+    input_file_handle: IO[bytes],
+    output_file_handle: IO[bytes],
+    mnemonics: Optional[Dict[str, str]] = None,
+    colors: Optional[Dict[str, str]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    relabeled_file_handle: Optional[IO[bytes]] = None,
+    coalesce: bool = False,
+) -> int:
+    """
+    Reads the bed in `chunk_size` byte chunks, so memory use is bounded by a small
+    multiple of the chunk size, and remaps each chunk with a `ChunkRemapper`. Produces
+    the same bytes as `relabel.relabel` and `recolor_bed.recolor_bed` for beds without
+    quoted fields. If `relabeled_file_handle` is given, the relabeled but not recolored
+    lines are written to it as well.
+
+    If `coalesce` is set each output is coalesced like with the csv backend, see
+    `CoalescingChunkWriter`. Returns the number of lines that were merged away in the
+    remapped output.
+
+    The first row of the beds is the UCSC track definition line which should not be
+    processed
+    """
+    remapper = ChunkRemapper(mnemonics, colors)
+    relabeler = ChunkRemapper(mnemonics) if relabeled_file_handle is not None else None
+    header = rewrite_header(input_file_handle.readline())
+    output_file_handle.write(header)
+    if relabeled_file_handle is not None:
+        relabeled_file_handle.write(header)
+    output_writer: Any = output_file_handle
+    relabeled_writer: Any = relabeled_file_handle
+    if coalesce:
+        output_writer = CoalescingChunkWriter(output_file_handle)
+        if relabeled_file_handle is not None:
+            relabeled_writer = CoalescingChunkWriter(relabeled_file_handle)
+    for chunk in iter_chunks(input_file_handle, chunk_size):
+        output_writer.write(remapper.remap(chunk))
+        if relabeler is not None and relabeled_writer is not None:
+            relabeled_writer.write(relabeler.remap(chunk))
+    flush_chunk_writer(relabeled_writer)
+    return flush_chunk_writer(output_writer)
+
+
+def iter_chunks(file_handle: IO[bytes], chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Yield chunks of complete lines of roughly `chunk_size` bytes. A missing newline at
+    the end of the file is added, as the csv writer would.
+    """
+    remainder = b""
+    while True:
+        data = file_handle.read(chunk_size)
+        if not data:
+            break
+        data = remainder + data
+        last_newline = data.rfind(b"\n")
+        if last_newline == -1:
+            remainder = data
+            continue
+        remainder = data[last_newline + 1 :]
+        yield data[: last_newline + 1]
+    if remainder:
+        yield remainder + b"\n"
+
+
+def rewrite_header(line: bytes) -> bytes:
+    """
+    Round trip the track line through the csv module so it comes out exactly as it does
+    from the csv backend.
+    """
+    if not line:
+        raise ValueError("Bed is empty, expected a track definition line")
+    output = io.StringIO(newline="")
+    writer = csv.writer(output, delimiter="\t", lineterminator="\n", quotechar="'")
+    writer.writerow(next(csv.reader([line.decode()], delimiter="\t")))
+    return output.getvalue().encode()
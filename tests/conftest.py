@@ -1,13 +1,16 @@
-import gzip
-import hashlib
-import shutil
+import csv
+import math
 import subprocess
 from pathlib import Path
-from typing import Union
 
+import bbi
 import pytest
 from diff_pdf_visually import pdfdiff
 
+from segway_pipeline.compressed_io import open_input
+from segway_pipeline.digest import digest_file
+from segway_pipeline.traindir_diff import diff_traindirs
+
 
 @pytest.fixture
 def test_data_dir():
@@ -32,39 +35,17 @@ def genomedatas_match():
 
 
 @pytest.fixture
-def traindirs_match(skip_n_lines_md5):
+def traindirs_match():
     """
-    Within the traindir, the generated shell scripts in the `cmdline` will be
-    nondeterministic, since they contain Cromwell file paths. Within `log`, similar
-    nondeterminism occurs with the run scripts there and the job logs, however
-    jt_info.txt, likelihood.0.tab, and likelihood.1.tab can still be compared (for 2
-    parallel training runs). File in the `output` folder seem to have the same contents,
-    but the filenames aren't the same so you can't reliably compare them. The files in
-    the `triangulation` folder contain a timestamp at line 17, so need to skip that line
-    when comparing.
+    Compares the traindir archives without extracting them, ignoring the files that
+    are nondeterministic, see `traindir_diff` for the rules.
     """
 
-    def _traindirs_match(traindir1: Path, traindir2: Path, workflow_dir: Path) -> bool:
-        traindir1_extracted = workflow_dir / "traindir1"
-        traindir2_extracted = workflow_dir / "traindir2"
-        shutil.unpack_archive(traindir1, extract_dir=traindir1_extracted)
-        shutil.unpack_archive(traindir2, extract_dir=traindir2_extracted)
-        f2_paths = [i for i in traindir2_extracted.glob("**/*") if i.is_file()]
-        for f1 in traindir1_extracted.glob("**/*"):
-            if not f1.is_file():
-                continue
-            if any(key in f1.parts for key in ("cmdline", "output", "triangulation")):
-                continue
-            if "log" in f1.parts:
-                if not f1.match("*.tab") or not f1.match("jt_info.txt"):
-                    continue
-            shared_root_index = f1.parts.index("traindir")
-            f2 = [
-                i
-                for i in f2_paths
-                if i.parts[shared_root_index:] == f1.parts[shared_root_index:]
-            ][0]
-            assert md5sum(f1) == md5sum(f2)
+    def _traindirs_match(traindir1: Path, traindir2: Path) -> bool:
+        diff = diff_traindirs(traindir1, traindir2)
+        assert not diff.only_in_first
+        assert not diff.only_in_second
+        assert not diff.different
         return True
 
     return _traindirs_match
@@ -82,22 +63,95 @@ def pdfs_match():
     return _pdfs_match
 
 
+@pytest.fixture
+def signal_distribution_matches_segment_sizes():
+    """
+    There is no segtools table of the test genomedata to compare the signal
+    distribution to, so checks it against the segment sizes of the same segmentation
+    instead: every label has a row per track, a count of at most the bases of the
+    label, a finite mean where there are values and a finite sd where there are two.
+    """
+
+    def _signal_distribution_matches_segment_sizes(
+        table: Path, segment_sizes: Path
+    ) -> bool:
+        rows = _read_signal_distribution(table)
+        with open_input(segment_sizes) as f:
+            label_bases = {
+                row["label"]: int(row["num.bp"])
+                for row in csv.DictReader(f, delimiter="\t")
+                if row["label"] != "all"
+            }
+        assert {label for label, _ in rows} == label_bases.keys()
+        tracknames = {trackname for _, trackname in rows}
+        assert len(rows) == len(label_bases) * len(tracknames)
+        for (label, trackname), row in rows.items():
+            n = int(row["n"])
+            assert 0 < n <= label_bases[label], (label, trackname, n)
+            assert math.isfinite(float(row["mean"])), (label, trackname)
+            sd = float(row["sd"])
+            assert n < 2 or (math.isfinite(sd) and sd >= 0), (label, trackname, sd)
+        return True
+
+    return _signal_distribution_matches_segment_sizes
+
+
+def _read_signal_distribution(table: Path):
+    with open_input(table) as f:
+        return {
+            (row["label"], row["trackname"]): row
+            for row in csv.DictReader(f, delimiter="\t")
+        }
+
+
+@pytest.fixture
+def bigbed_matches_bed():
+    """
+    Reads the bigBed back with pybbi, which wraps UCSC's own bigBed reader, and compares
+    its chromosome sizes, records and total summary to those of the bed. Requires the
+    bed records to not overlap.
+    """
+
+    def _bigbed_matches_bed(bigbed: Path, bed: Path, chrom_sizes: Path) -> bool:
+        with open(chrom_sizes) as f:
+            expected_chrom_sizes = dict(
+                (chrom, int(size)) for chrom, size in csv.reader(f, delimiter="\t")
+            )
+        with open_input(bed) as f:
+            expected_records = [
+                (row[0], int(row[1]), int(row[2]), *row[3:])
+                for row in csv.reader(f, delimiter="\t")
+                if not row[0].startswith("track")
+            ]
+        with bbi.open(str(bigbed)) as f:
+            assert f.chromsizes == dict(sorted(expected_chrom_sizes.items()))
+            records = [
+                record
+                for chrom in dict.fromkeys(record[0] for record in expected_records)
+                for record in f.fetch_intervals(
+                    chrom, 0, expected_chrom_sizes[chrom], iterator=True
+                )
+            ]
+            assert records == expected_records
+            bases = sum(end - start for _, start, end, *_ in expected_records)
+            assert f.info["summary"]["basesCovered"] == bases
+            assert f.info["summary"]["sum"] == bases
+        return True
+
+    return _bigbed_matches_bed
+
+
 @pytest.fixture
 def skip_n_lines_md5():
     """
     Text files can sometimes contain nondeterministic data in the headers. This fixture
     returns a function that will compare the md5sums of a file after n lines have been
-    skipped. Will decompress gzipped files if need be.
+    skipped. Will decompress gzipped files if need be. The file is streamed, so this
+    works for whole genome outputs too.
     """
 
     def _skip_n_lines_md5(file_path: Path, n_lines: int) -> str:
-        try:
-            with gzip.open(str(file_path), "rt") as f:
-                lines = "".join(f.readlines()[n_lines:])
-        except OSError:
-            with open(str(file_path)) as f:
-                lines = "".join(f.readlines()[n_lines:])
-        return md5sum(lines)
+        return digest_file(file_path, skip_lines=n_lines)
 
     return _skip_n_lines_md5
 
@@ -110,17 +164,8 @@ def skip_n_lines_and_compare(skip_n_lines_md5):
     return _skip_n_lines_and_compare
 
 
-def md5sum(file: Union[str, Path]) -> str:
+def md5sum(file: Path) -> str:
     """
-    Compute the md5sum of a string, a text file, or a binary file.
+    Compute the md5sum of a text or binary file, compressed files aren't decompressed.
     """
-    if isinstance(file, str):
-        return hashlib.md5(file.encode()).hexdigest()
-    try:
-        with open(file) as f:
-            data = f.read()
-            return hashlib.md5(data.encode()).hexdigest()
-    except UnicodeDecodeError:
-        with open(file, "rb") as g:
-            binary_data = g.read()
-            return hashlib.md5(binary_data).hexdigest()
+    return digest_file(file, decompress=False)
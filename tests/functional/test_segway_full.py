@@ -7,7 +7,7 @@ import pytest
 def test_segway_train_traindirs_match(test_data_dir, workflow_dir, traindirs_match):
     actual_traindir_path = workflow_dir / Path("test-output/traindir.tar.gz")
     expected_traindir_path = test_data_dir / Path("segway_full_traindir.tar.gz")
-    assert traindirs_match(actual_traindir_path, expected_traindir_path, workflow_dir)
+    assert traindirs_match(actual_traindir_path, expected_traindir_path)
 
 
 @pytest.mark.workflow("test_segway_full")
@@ -46,6 +46,20 @@ def test_segway_full_recolored_bed_files_match(
     assert md5sum == "03c5b47a4dd6988a60f2418770a5e51f"
 
 
+@pytest.mark.workflow("test_segway_full")
+def test_segway_full_recolored_bigbed_matches_bed(
+    test_data_dir, workflow_dir, bigbed_matches_bed
+):
+    """
+    The recolored bed is checked above, the bigBed must hold the same records.
+    """
+    assert bigbed_matches_bed(
+        workflow_dir / Path("test-output/recolored.bb"),
+        workflow_dir / Path("test-output/recolored.bed.gz"),
+        test_data_dir / Path("GRCh38_EBV_chr19.chrom.sizes.tsv"),
+    )
+
+
 @pytest.mark.workflow("test_segway_full")
 def test_segway_full_length_distribution_pdfs_match(
     workflow_dir, test_data_dir, pdfs_match
@@ -97,3 +111,16 @@ def test_segway_full_feature_aggregation_translation_pdfs_match(
     )
     expected = test_data_dir / Path("segway_full_feature_aggregation.translation.pdf")
     assert pdfs_match(result, expected)
+
+
+@pytest.mark.workflow("test_segway_full")
+def test_segway_full_signal_distribution_matches_segment_sizes(
+    workflow_dir, signal_distribution_matches_segment_sizes
+):
+    result = workflow_dir / Path(
+        "test-output/signal_distribution/signal_distribution.tab"
+    )
+    segment_sizes = workflow_dir / Path(
+        "test-output/glob-a287da44f32bf6a3fc6d7c51c52ddafa/segment_sizes.tab"
+    )
+    assert signal_distribution_matches_segment_sizes(result, segment_sizes)
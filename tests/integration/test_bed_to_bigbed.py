@@ -0,0 +1,14 @@
+from pathlib import Path
+
+import pytest
+
+
+@pytest.mark.workflow("test_bed_to_bigbed")
+def test_bed_to_bigbed_bigbed_matches_bed(
+    test_data_dir, workflow_dir, bigbed_matches_bed
+):
+    assert bigbed_matches_bed(
+        workflow_dir / Path("test-output/segway.bb"),
+        test_data_dir / Path("segway.bed.gz"),
+        test_data_dir / Path("GRCh38_EBV_chr19.chrom.sizes.tsv"),
+    )
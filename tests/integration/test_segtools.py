@@ -52,3 +52,16 @@ def test_segtools_feature_aggregation_translation_pdfs_match(
     )
     expected = test_data_dir / Path("feature_aggregation.translation.pdf")
     assert pdfs_match(result, expected)
+
+
+@pytest.mark.workflow("test_segtools")
+def test_segtools_signal_distribution_matches_segment_sizes(
+    workflow_dir, signal_distribution_matches_segment_sizes
+):
+    result = workflow_dir / Path(
+        "test-output/signal_distribution/signal_distribution.tab"
+    )
+    segment_sizes = workflow_dir / Path(
+        "test-output/glob-a287da44f32bf6a3fc6d7c51c52ddafa/segment_sizes.tab"
+    )
+    assert signal_distribution_matches_segment_sizes(result, segment_sizes)
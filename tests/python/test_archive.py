@@ -0,0 +1,168 @@
+import gzip
+import io
+import os
+import shutil
+import subprocess
+import tarfile
+
+import pytest
+
+from segway_pipeline.archive import (
+    DEFAULT_MTIME,
+    RECORD_SIZE,
+    list_members,
+    main,
+    make_pax_records,
+    write_archive,
+)
+
+LONG_NAME = "a" * 120
+REGEX = "traindir/(params/params.params|triangulation)($|/.*)"
+
+
+@pytest.fixture
+def traindir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(f"traindir/{LONG_NAME}/deep")
+    os.makedirs("traindir/params")
+    os.makedirs("traindir/triangulation")
+    os.makedirs("traindir/log")
+    with open(f"traindir/{LONG_NAME}/deep/f.txt", "w") as f:
+        f.write("deep\n")
+    with open("traindir/params/params.params", "w") as f:
+        f.write("params\n")
+    with open("traindir/params/input.master", "w") as f:
+        f.write("master\n")
+    with open("traindir/triangulation/segway.str.trifile", "wb") as f:
+        f.write(os.urandom(1000))
+    with open("traindir/log/ünicode.txt", "w") as f:
+        f.write("u\n")
+    with open("traindir/" + "b" * 91, "w") as f:
+        f.write("exactly 100 bytes\n")
+    os.link("traindir/params/params.params", "traindir/params/zz_hard")
+    os.symlink("../params/params.params", "traindir/log/link")
+    os.symlink("/" + LONG_NAME, "traindir/log/long_link")
+    os.chmod("traindir/params/input.master", 0o600)
+    return "traindir"
+
+
+def gnu_tar(paths, find_args=()):
+    listing = subprocess.run(
+        ["find", *paths, *find_args, "-print0"], check=True, stdout=subprocess.PIPE
+    ).stdout
+    members = b"\0".join(sorted(listing.split(b"\0")[:-1])) + b"\0"
+    return subprocess.run(
+        [
+            "tar",
+            "--owner=0",
+            "--group=0",
+            "--numeric-owner",
+            "--mtime=2019-01-01 00:00Z",
+            "--pax-option=exthdr.name=%d/PaxHeaders/%f,delete=atime,delete=ctime",
+            "--no-recursion",
+            "--null",
+            "-T",
+            "-",
+            "-c",
+        ],
+        input=members,
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+
+
+@pytest.mark.skipif(
+    shutil.which("tar") is None or shutil.which("find") is None,
+    reason="needs GNU tar and find",
+)
+@pytest.mark.parametrize(
+    "member_regex,find_args",
+    [(None, ()), (REGEX, ("-regextype", "egrep", "-regex", REGEX))],
+)
+def test_write_archive_matches_gnu_tar(traindir, member_regex, find_args):
+    version = subprocess.run(["tar", "--version"], stdout=subprocess.PIPE).stdout
+    if b"GNU tar" not in version:
+        pytest.skip("needs GNU tar")
+    output = io.BytesIO()
+    write_archive(output, [traindir], member_regex)
+    assert output.getvalue() == gnu_tar([traindir], find_args)
+
+
+def test_write_archive(traindir):
+    output = io.BytesIO()
+    members = write_archive(output, [traindir])
+    assert len(output.getvalue()) % RECORD_SIZE == 0
+    output.seek(0)
+    with tarfile.open(fileobj=output) as archive:
+        infos = archive.getmembers()
+        assert [info.name for info in infos] == members
+        assert all(info.mtime == DEFAULT_MTIME for info in infos)
+        assert all(info.uid == 0 and info.gid == 0 for info in infos)
+        info = archive.getmember(f"traindir/{LONG_NAME}/deep/f.txt")
+        assert archive.extractfile(info).read() == b"deep\n"
+        hard_link = archive.getmember("traindir/params/zz_hard")
+        assert hard_link.islnk()
+        assert hard_link.linkname == "traindir/params/params.params"
+        assert archive.getmember("traindir/log/long_link").linkname == "/" + LONG_NAME
+        assert archive.getmember("traindir/log/ünicode.txt").isfile()
+        assert archive.getmember("traindir/params/input.master").mode == 0o600
+
+
+def test_write_archive_is_deterministic(traindir):
+    first = io.BytesIO()
+    write_archive(first, [traindir])
+    os.utime("traindir/params/params.params", (0, 0))
+    second = io.BytesIO()
+    write_archive(second, [traindir])
+    assert first.getvalue() == second.getvalue()
+
+
+def test_write_archive_unsupported_file_type_raises(traindir):
+    os.mkfifo("traindir/fifo")
+    with pytest.raises(ValueError):
+        write_archive(io.BytesIO(), [traindir])
+
+
+def test_list_members(traindir):
+    assert list_members([traindir], REGEX) == [
+        "traindir/params/params.params",
+        "traindir/triangulation",
+        "traindir/triangulation/segway.str.trifile",
+    ]
+
+
+@pytest.mark.parametrize(
+    "records,expected",
+    [
+        ([("path", b"foo")], b"12 path=foo\n"),
+        ([("path", b"a" * 90)], b"99 path=" + b"a" * 90 + b"\n"),
+        ([("path", b"a" * 91)], b"101 path=" + b"a" * 91 + b"\n"),
+        (
+            [("linkpath", b"foo"), ("size", b"1")],
+            b"16 linkpath=foo\n9 size=1\n",
+        ),
+    ],
+)
+def test_make_pax_records(records, expected):
+    assert make_pax_records(records) == expected
+
+
+def test_main(traindir, mocker):
+    mocker.patch(
+        "sys.argv",
+        [
+            "prog",
+            "--threads",
+            "2",
+            "--member-regex",
+            REGEX,
+            "-o",
+            "out.tar.gz",
+            "traindir",
+        ],
+    )
+    main()
+    expected = io.BytesIO()
+    write_archive(expected, [traindir], REGEX)
+    with gzip.open("out.tar.gz") as f:
+        assert f.read() == expected.getvalue()
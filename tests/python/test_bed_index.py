@@ -0,0 +1,117 @@
+import json
+from contextlib import suppress as does_not_raise
+
+import pytest
+
+from segway_pipeline.bed_index import (
+    build_index,
+    load_index,
+    open_indexed,
+    parse_region,
+    query,
+)
+from segway_pipeline.compressed_io import open_output
+
+ROWS = [
+    ("chr2", 0, 500),
+    ("chr2", 500, 2500),
+    ("chr2", 2500, 2600),
+    ("chr2", 5000, 5100),
+    ("chr1", 100, 200),
+    ("chr1", 150, 1200),
+]
+BED_DATA = "track name=foo\n" + "".join(
+    f"{chrom}\t{start}\t{end}\tfoo\t0\t.\t{start}\t{end}\t1,2,3\n"
+    for chrom, start, end in ROWS
+)
+
+
+@pytest.fixture(params=[None, "bgzf"])
+def bed_path(request, tmp_path):
+    path = tmp_path / "in.bed"
+    with open_output(path, compression=request.param) as f:
+        f.write(BED_DATA)
+    return path
+
+
+def test_build_index(bed_path):
+    index = build_index(bed_path, bin_size=1000)
+    assert list(index["chroms"]) == ["chr2", "chr1"]
+    chr2 = index["chroms"]["chr2"]
+    assert chr2["num_records"] == 4
+    # Bins 3 and 4 are empty and point at the next record, the one in bin 5
+    assert len(chr2["bins"]) == 6
+    assert chr2["bins"][0] == chr2["offset"]
+    assert chr2["bins"][3] == chr2["bins"][4] == chr2["bins"][5]
+    assert len(index["chroms"]["chr1"]["bins"]) == 2
+
+
+@pytest.mark.parametrize(
+    "chrom,start,end,expected",
+    [
+        ("chr2", None, None, ROWS[:4]),
+        ("chr2", 2000, 2550, ROWS[1:3]),
+        ("chr2", 3000, 4000, []),
+        ("chr2", 3000, 5001, ROWS[3:4]),
+        ("chr2", 9000, 10000, []),
+        ("chr1", 1100, 1101, ROWS[5:]),
+        ("chr3", 0, 10, []),
+    ],
+)
+def test_query(bed_path, chrom, start, end, expected):
+    index = build_index(bed_path, bin_size=1000)
+    with open_indexed(bed_path, index) as bed_file_handle:
+        lines = list(query(bed_file_handle, index, chrom, start, end))
+    assert [tuple(line.decode().split("\t")[:3]) for line in lines] == [
+        (c, str(s), str(e)) for c, s, e in expected
+    ]
+
+
+def test_build_index_gzip_raises(tmp_path):
+    path = tmp_path / "in.bed.gz"
+    with open_output(path) as f:
+        f.write(BED_DATA)
+    with pytest.raises(ValueError, match="bgzf"):
+        build_index(path)
+
+
+@pytest.mark.parametrize(
+    "data,match",
+    [
+        ("chr1\t10\t20\nchr1\t5\t20\n", "out of order"),
+        ("chr1\t10\t20\nchr2\t5\t20\nchr1\t30\t40\n", "more than once"),
+        ("chr1\t10\n", "fewer than 3 columns"),
+    ],
+)
+def test_build_index_unsorted_raises(tmp_path, data, match):
+    path = tmp_path / "in.bed"
+    path.write_text(data)
+    with pytest.raises(ValueError, match=match):
+        build_index(path)
+
+
+def test_load_index_stale_raises(tmp_path):
+    bed_path = tmp_path / "in.bed"
+    bed_path.write_text(BED_DATA)
+    index_path = tmp_path / "in.bed.index.json"
+    index_path.write_text(json.dumps(build_index(bed_path)))
+    assert load_index(index_path, bed_path)["chroms"]
+    bed_path.write_text(BED_DATA + BED_DATA.splitlines(keepends=True)[-1])
+    with pytest.raises(ValueError, match="out of date"):
+        load_index(index_path, bed_path)
+
+
+@pytest.mark.parametrize(
+    "region,expected,condition",
+    [
+        ("chr1", ("chr1", None, None), does_not_raise()),
+        ("chr1:1-100", ("chr1", 0, 100), does_not_raise()),
+        ("chr1:1,001-2,000", ("chr1", 1000, 2000), does_not_raise()),
+        ("chr1:0-100", None, pytest.raises(ValueError)),
+        ("chr1:100-1", None, pytest.raises(ValueError)),
+        ("chr1:100", None, pytest.raises(ValueError)),
+    ],
+)
+def test_parse_region(region, expected, condition):
+    with condition:
+        assert parse_region(region) == expected
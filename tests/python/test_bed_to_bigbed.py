@@ -0,0 +1,292 @@
+import gzip
+import io
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from segway_pipeline.bed_to_bigbed import (
+    BIGBED_MAGIC,
+    BPT_MAGIC,
+    BRANCH_ITEM,
+    CIR_TREE_HEADER,
+    CIR_TREE_MAGIC,
+    HEADER,
+    LEAF_ITEM,
+    NODE_HEADER,
+    ZOOM_HEADER,
+    ZOOM_RECORD,
+    bed_to_bigbed,
+    compute_coverage,
+    parse_chrom_sizes,
+    summarize,
+)
+
+BED = (
+    "track name=foo itemRgb=on\n"
+    "chr2\t0\t100\t1\t1000\t.\t0\t100\t1,2,3\n"
+    "chr2\t100\t250\t2\t1000\t.\t100\t250\t4,5,6\n"
+    "chr10\t50\t60\t1\t1000\t.\t50\t60\t1,2,3\n"
+    "chr10\t55\t70\t3\t1000\t.\t55\t70\t7,8,9\n"
+)
+CHROM_SIZES = {"chr2": 1000, "chr10": 500, "chr1": 2000}
+
+
+def read_blocks(data, index_offset):
+    """
+    Walk the R-tree at `index_offset` and return the decompressed blocks it indexes.
+    """
+    header = CIR_TREE_HEADER.unpack_from(data, index_offset)
+    assert header[0] == CIR_TREE_MAGIC
+
+    def walk(offset):
+        is_leaf, count = NODE_HEADER.unpack_from(data, offset)
+        offset += NODE_HEADER.size
+        for i in range(count):
+            if is_leaf:
+                *_, block_offset, size = LEAF_ITEM.unpack_from(
+                    data, offset + i * LEAF_ITEM.size
+                )
+                yield zlib.decompress(data[block_offset : block_offset + size])
+            else:
+                *_, child = BRANCH_ITEM.unpack_from(data, offset + i * BRANCH_ITEM.size)
+                yield from walk(child)
+
+    return list(walk(index_offset + CIR_TREE_HEADER.size))
+
+
+def read_chrom_tree(data, offset):
+    magic, _, key_size, _, item_count = struct.unpack_from("<IIIIQ", data, offset)
+    assert magic == BPT_MAGIC
+    chroms = {}
+
+    def walk(offset):
+        is_leaf, count = NODE_HEADER.unpack_from(data, offset)
+        offset += NODE_HEADER.size
+        for _ in range(count):
+            key = data[offset : offset + key_size].rstrip(b"\0").decode()
+            offset += key_size
+            if is_leaf:
+                chroms[key] = struct.unpack_from("<II", data, offset)
+            else:
+                walk(struct.unpack_from("<Q", data, offset)[0])
+            offset += 8
+
+    walk(offset + 32)
+    assert len(chroms) == item_count
+    return chroms
+
+
+def read_records(data, chrom_tree_offset, index_offset):
+    names = {
+        chrom_id: chrom
+        for chrom, (chrom_id, _) in read_chrom_tree(data, chrom_tree_offset).items()
+    }
+    records = []
+    for block in read_blocks(data, index_offset):
+        offset = 0
+        while offset < len(block):
+            chrom_id, start, end = struct.unpack_from("<III", block, offset)
+            rest_end = block.index(b"\0", offset + 12)
+            rest = block[offset + 12 : rest_end].decode()
+            records.append(f"{names[chrom_id]}\t{start}\t{end}\t{rest}")
+            offset = rest_end + 1
+    return records
+
+
+def write_bigbed(bed, chrom_sizes=CHROM_SIZES, **kwargs):
+    output = io.BytesIO()
+    num_records = bed_to_bigbed(io.StringIO(bed), chrom_sizes, output, **kwargs)
+    return num_records, output.getvalue()
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{}, {"threads": 3}, {"block_size": 2, "items_per_slot": 1}],
+)
+def test_bed_to_bigbed(kwargs):
+    num_records, data = write_bigbed(BED, **kwargs)
+    assert num_records == 4
+    header = HEADER.unpack_from(data)
+    assert header[:2] == (BIGBED_MAGIC, 4)
+    zoom_levels, chrom_tree_offset, data_offset, index_offset = header[2:6]
+    assert header[6:8] == (9, 9)
+    assert data.endswith(struct.pack("<I", BIGBED_MAGIC))
+    assert read_chrom_tree(data, chrom_tree_offset) == {
+        "chr1": (0, 2000),
+        "chr10": (1, 500),
+        "chr2": (2, 1000),
+    }
+    assert struct.unpack_from("<Q", data, data_offset) == (4,)
+    # The index is sorted by chromosome id, so chr10 comes first
+    lines = BED.splitlines()
+    assert read_records(data, chrom_tree_offset, index_offset) == lines[3:] + lines[1:3]
+    autosql_offset = header[8]
+    assert data[autosql_offset:].startswith(b"table bed")
+    total_summary = struct.unpack_from("<Qdddd", data, header[9])
+    assert total_summary == (270, 1, 2, 275, 285)
+    assert zoom_levels > 0
+    for level in range(zoom_levels):
+        _, _, zoom_data_offset, zoom_index_offset = ZOOM_HEADER.unpack_from(
+            data, HEADER.size + level * ZOOM_HEADER.size
+        )
+        blocks = read_blocks(data, zoom_index_offset)
+        records = [
+            ZOOM_RECORD.unpack_from(block, offset)
+            for block in blocks
+            for offset in range(0, len(block), ZOOM_RECORD.size)
+        ]
+        assert struct.unpack_from("<I", data, zoom_data_offset) == (len(records),)
+        assert sum(record[3] for record in records) == 270
+        assert sum(record[6] for record in records) == 275
+
+
+def test_bed_to_bigbed_is_deterministic():
+    bed = gzip.open("tests/data/segway.bed.gz", "rt").read()
+    with open("tests/data/GRCh38_EBV_chr19.chrom.sizes.tsv") as f:
+        chrom_sizes = parse_chrom_sizes(f)
+    _, serial = write_bigbed(bed, chrom_sizes)
+    _, threaded = write_bigbed(bed, chrom_sizes, threads=4)
+    assert serial == threaded
+    header = HEADER.unpack_from(serial)
+    records = read_records(serial, header[3], header[5])
+    assert records == bed.splitlines()[1:]
+
+
+def make_overlapping_bed(rng, chrom_sizes, num_records):
+    """
+    A bed of records of random lengths at random sorted starts, which overlap, over
+    the chromosomes in the order given rather than sorted.
+    """
+    lines = ["track name=foo"]
+    for chrom, size in chrom_sizes.items():
+        starts = np.sort(rng.integers(0, size - 500, size=num_records))
+        for start in starts.tolist():
+            end = start + int(rng.integers(1, 500))
+            label = int(rng.integers(0, 5))
+            lines.append(
+                f"{chrom}\t{start}\t{end}\t{label}\t1000\t.\t{start}\t{end}\t1,2,3"
+            )
+    return "\n".join(lines) + "\n"
+
+
+def test_bed_to_bigbed_reads_with_ucsc_library(tmp_path):
+    """
+    pybbi reads the bigBed with UCSC's own library, which checks the format
+    independently of the writer. It must return the records of the bed, and the
+    summaries it reads from each zoom level must be those of the coverage of the
+    records. The bins are two zoom records wide, so the library picks that zoom level,
+    and start on zoom record bounds, so it doesn't interpolate.
+    """
+    bbi = pytest.importorskip("bbi")
+    chrom_sizes = {"chr2": 100000, "chr10": 200000}
+    bed = make_overlapping_bed(np.random.default_rng(0), chrom_sizes, 3000)
+    bigbed_path = tmp_path / "foo.bb"
+    with open(bigbed_path, "wb") as f:
+        bed_to_bigbed(io.StringIO(bed), chrom_sizes, f, threads=2)
+    expected_records = [
+        (chrom, int(start), int(end), *rest)
+        for chrom, start, end, *rest in (
+            line.split("\t") for line in bed.splitlines()[1:]
+        )
+    ]
+    depths = {chrom: np.zeros(size) for chrom, size in chrom_sizes.items()}
+    for chrom, start, end, *_ in expected_records:
+        depths[chrom][start:end] += 1
+    with bbi.open(str(bigbed_path)) as bigbed:
+        assert bigbed.chromsizes == dict(sorted(chrom_sizes.items()))
+        records = [
+            record
+            for chrom, size in chrom_sizes.items()
+            for record in bigbed.fetch_intervals(chrom, 0, size, iterator=True)
+        ]
+        assert records == expected_records
+        assert len(bigbed.zooms) > 1
+        for reduction in bigbed.zooms:
+            bin_size = 2 * reduction
+            for chrom, size in chrom_sizes.items():
+                num_bins = size // bin_size
+                if num_bins == 0:
+                    continue
+                end = num_bins * bin_size
+                coverage = depths[chrom][:end].reshape(num_bins, bin_size)
+                covered = coverage > 0
+                expected = {
+                    "cov": covered.mean(axis=1),
+                    "sum": coverage.sum(axis=1),
+                    "max": coverage.max(axis=1),
+                    "min": np.where(covered, coverage, np.inf).min(axis=1),
+                }
+                expected["min"][~covered.any(axis=1)] = 0
+                for summary, values in expected.items():
+                    assert np.allclose(
+                        bigbed.fetch(chrom, 0, end, bins=num_bins, summary=summary),
+                        values,
+                        rtol=1e-12,
+                        atol=0,
+                    ), (reduction, chrom, summary)
+
+
+def test_bed_to_bigbed_empty():
+    num_records, data = write_bigbed("track name=foo\n")
+    assert num_records == 0
+    header = HEADER.unpack_from(data)
+    assert header[2] == 0
+    assert read_blocks(data, header[5]) == []
+
+
+@pytest.mark.parametrize(
+    "bed,match",
+    [
+        ("chr3\t0\t10\n", "not in the chrom sizes"),
+        ("chr2\t0\t1001\n", "Invalid coordinates"),
+        ("chr2\t10\t5\n", "Invalid coordinates"),
+        ("chr2\t10\t20\nchr2\t5\t20\n", "out of order"),
+        ("chr2\t0\t10\nchr1\t0\t10\nchr2\t20\t30\n", "more than once"),
+        ("chr2\t0\t10\tfoo\nchr2\t10\t20\n", "Expected 4 columns"),
+        ("chr2\t0\n", "must have between 3 and 12"),
+    ],
+)
+def test_bed_to_bigbed_raises(bed, match):
+    with pytest.raises(ValueError, match=match):
+        write_bigbed(bed)
+
+
+def test_compute_coverage():
+    chroms, starts, ends, depths = compute_coverage(
+        np.array([1, 1, 1, 0]),
+        np.array([0, 5, 20, 3]),
+        np.array([10, 15, 30, 4]),
+    )
+    assert chroms.tolist() == [0, 1, 1, 1, 1]
+    assert starts.tolist() == [3, 0, 5, 10, 20]
+    assert ends.tolist() == [4, 5, 10, 15, 30]
+    assert depths.tolist() == [1, 1, 2, 1, 1]
+
+
+def test_summarize():
+    coverage = (
+        np.array([0, 0, 1]),
+        np.array([5, 10, 0]),
+        np.array([10, 25, 3]),
+        np.array([2, 1, 1]),
+    )
+    chroms, starts, ends, valid_counts, mins, maxes, sums, sums_of_squares = summarize(
+        coverage, 10
+    )
+    assert chroms.tolist() == [0, 0, 0, 1]
+    assert starts.tolist() == [5, 10, 20, 0]
+    assert ends.tolist() == [10, 20, 25, 3]
+    assert valid_counts.tolist() == [5, 10, 5, 3]
+    assert mins.tolist() == [2, 1, 1, 1]
+    assert maxes.tolist() == [2, 1, 1, 1]
+    assert sums.tolist() == [10, 10, 5, 3]
+    assert sums_of_squares.tolist() == [20, 10, 5, 3]
+
+
+def test_parse_chrom_sizes():
+    assert parse_chrom_sizes(io.StringIO("chr1\t10\n\nchr2\t20\n")) == {
+        "chr1": 10,
+        "chr2": 20,
+    }
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from benchmarks.generate_data import (
+    generate_data,
+    make_mnemonics,
+    make_reference_epigenome,
+)
+from benchmarks.run_benchmarks import LocalClient, find_regressions, run_one
+from scripts.make_input_jsons_from_portal import get_portal_files
+from segway_pipeline.recolor_bed import LABELS_TO_COLORS
+
+CHROM_SIZES = {"chr1": 100000, "chr2": 50000}
+
+
+def test_generate_data_is_deterministic(tmp_path):
+    first = generate_data(tmp_path / "first", CHROM_SIZES, num_datasets=10, seed=1)
+    second = generate_data(tmp_path / "second", CHROM_SIZES, num_datasets=10, seed=1)
+    for name, path in first.items():
+        assert path.read_bytes() == second[name].read_bytes()
+    other = generate_data(tmp_path / "other", CHROM_SIZES, num_datasets=10, seed=2)
+    assert other["bed"].read_bytes() != first["bed"].read_bytes()
+
+
+def test_generate_data_bed_tiles_chromosomes(tmp_path):
+    paths = generate_data(tmp_path, CHROM_SIZES, scale=0.5, num_labels=4)
+    lines = paths["bed"].read_text().splitlines()
+    assert lines[0].startswith("track ")
+    rows = [line.split("\t") for line in lines[1:]]
+    assert all(len(row) == 9 for row in rows)
+    for chrom, size in CHROM_SIZES.items():
+        chrom_rows = [row for row in rows if row[0] == chrom]
+        assert chrom_rows[0][1] == "0"
+        assert chrom_rows[-1][2] == str(size // 2)
+        for previous, row in zip(chrom_rows, chrom_rows[1:]):
+            assert previous[2] == row[1]
+            assert previous[3] != row[3]
+    relabeled = paths["relabeled_bed"].read_text().splitlines()[1:]
+    assert {line.split("\t")[3] for line in relabeled} <= set(LABELS_TO_COLORS)
+
+
+def test_make_mnemonics():
+    mnemonics = make_mnemonics(12)
+    assert len(mnemonics) == 12
+    assert set(mnemonics.values()) == set(LABELS_TO_COLORS)
+
+
+def test_make_reference_epigenome_one_file_per_dataset():
+    reference_epigenome, quality_metrics = make_reference_epigenome(50)
+    portal_files = get_portal_files(
+        reference_epigenome, "GRCh38", LocalClient(quality_metrics)
+    )
+    num_used = sum(
+        dataset["assay_title"] not in ("WGBS", "Control ChIP-seq")
+        for dataset in reference_epigenome["related_datasets"]
+    )
+    assert len(portal_files) == len(set(portal_files)) == num_used
+
+
+@pytest.mark.parametrize(
+    "name", ["recolor_bed_mmap", "get_portal_files", "signal_distribution_sample"]
+)
+def test_run_one(tmp_path, name):
+    paths = generate_data(tmp_path, CHROM_SIZES, num_datasets=5)
+    result = run_one(name, paths)
+    assert result["seconds"] > 0
+    assert result["peak_rss_mb"] > 0
+    assert result["records"] > 0
+    assert not (tmp_path / f"{name}.out").exists()
+    json.dumps(result)
+
+
+def test_find_regressions():
+    baseline = {
+        "relabel": {"seconds": 10.0, "peak_rss_mb": 50.0},
+        "recolor_bed": {"seconds": 10.0, "peak_rss_mb": 50.0},
+    }
+    results = {
+        "relabel": {"seconds": 12.0, "peak_rss_mb": 70.0},
+        "recolor_bed": {"seconds": 13.0, "peak_rss_mb": 40.0},
+        "get_portal_files": {"seconds": 100.0, "peak_rss_mb": 100.0},
+    }
+    regressions = find_regressions(results, baseline, threshold=0.25)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("relabel peak_rss_mb")
+    assert regressions[1].startswith("recolor_bed seconds")
@@ -0,0 +1,165 @@
+import os
+
+import pytest
+
+from segway_pipeline.cache import Cache, format_size, main, make_key, parse_size
+
+PARAMS = {"resolution": 100}
+
+
+@pytest.fixture
+def output_dir(tmp_path):
+    output_dir = tmp_path / "files.genomedata"
+    (output_dir / "sub").mkdir(parents=True)
+    (output_dir / "chr1.genomedata").write_bytes(b"chr1")
+    (output_dir / "sub" / "chr2.genomedata").write_bytes(b"chr22")
+    return output_dir
+
+
+def make_entry(cache, tmp_path, key, size, last_used):
+    path = tmp_path / f"{key}.out"
+    path.write_bytes(b"x" * size)
+    cache.put(key, path, {"key": key})
+    os.utime(cache.directory / "objects" / key / "entry.json", (last_used, last_used))
+
+
+def test_cache_get_put_file(tmp_path):
+    cache = Cache(tmp_path / "cache")
+    source = tmp_path / "in.txt"
+    source.write_text("foo")
+    destination = tmp_path / "out.txt"
+    assert not cache.get("abc", destination)
+    cache.put("abc", source, PARAMS)
+    source.write_text("changed")
+    assert cache.get("abc", destination)
+    assert destination.read_text() == "foo"
+    (entry,) = cache.entries()
+    assert entry.key == "abc"
+    assert entry.name == "in.txt"
+    assert entry.size == 3
+    assert entry.params == PARAMS
+    assert not os.listdir(tmp_path / "cache" / "tmp")
+
+
+def test_cache_get_put_dir(tmp_path, output_dir):
+    cache = Cache(tmp_path / "cache")
+    cache.put("abc", output_dir)
+    destination = tmp_path / "out.genomedata"
+    destination.mkdir()
+    (destination / "stale").write_text("stale")
+    assert cache.get("abc", destination)
+    assert sorted(str(p.relative_to(destination)) for p in destination.rglob("*")) == [
+        "chr1.genomedata",
+        "sub",
+        "sub/chr2.genomedata",
+    ]
+    assert cache.entries()[0].size == 9
+
+
+def test_cache_put_existing_key_is_kept(tmp_path):
+    cache = Cache(tmp_path / "cache")
+    source = tmp_path / "in.txt"
+    source.write_text("foo")
+    cache.put("abc", source)
+    source.write_text("bar")
+    cache.put("abc", source)
+    destination = tmp_path / "out.txt"
+    cache.get("abc", destination)
+    assert destination.read_text() == "foo"
+
+
+def test_cache_invalid_key_raises(tmp_path):
+    with pytest.raises(ValueError):
+        Cache(tmp_path).get("../abc", tmp_path / "out")
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = Cache(tmp_path / "cache", max_size=250)
+    make_entry(cache, tmp_path, "a", 100, 1000)
+    make_entry(cache, tmp_path, "b", 100, 3000)
+    cache.get("a", tmp_path / "out")
+    make_entry(cache, tmp_path, "c", 100, 4000)
+    assert [entry.key for entry in cache.entries()] == ["c", "a"]
+
+
+def test_cache_prune(tmp_path):
+    cache = Cache(tmp_path / "cache")
+    for key, last_used in (("a", 1000), ("b", 2000), ("c", 3000)):
+        make_entry(cache, tmp_path, key, 100, last_used)
+    assert cache.prune() == []
+    removed = cache.prune(max_size=150)
+    assert [entry.key for entry in removed] == ["a", "b"]
+    make_entry(cache, tmp_path, "d", 100, 10 ** 10)
+    removed = cache.prune(max_age=60)
+    assert [entry.key for entry in removed] == ["c"]
+    assert [entry.key for entry in cache.entries()] == ["d"]
+    assert cache.remove("d")
+    assert not cache.remove("d")
+
+
+def test_make_key(tmp_path, output_dir):
+    first = tmp_path / "a.bw"
+    first.write_bytes(b"a")
+    second = tmp_path / "b.bw"
+    second.write_bytes(b"b")
+    key = make_key([first, second, output_dir], PARAMS)
+    assert len(key) == 64
+    assert make_key([first, second, output_dir], PARAMS, jobs=2) == key
+    assert make_key([second, first, output_dir], PARAMS) != key
+    assert make_key([first, second, output_dir], {"resolution": 200}) != key
+    moved = tmp_path / "moved"
+    output_dir.rename(moved)
+    assert make_key([first, second, moved], PARAMS) == key
+    (moved / "sub" / "chr2.genomedata").rename(moved / "chr2.genomedata")
+    assert make_key([first, second, moved], PARAMS) != key
+
+
+@pytest.mark.parametrize(
+    "size,expected",
+    [
+        ("100", 100),
+        ("2K", 2048),
+        ("1.5g", 3 << 29),
+        ("3TB", 3 << 40),
+        ("1 MiB", 1 << 20),
+    ],
+)
+def test_parse_size(size, expected):
+    assert parse_size(size) == expected
+
+
+def test_parse_size_invalid_raises():
+    with pytest.raises(ValueError):
+        parse_size("10X")
+
+
+@pytest.mark.parametrize(
+    "size,expected",
+    [(100, "100"), (2048, "2.0K"), (3 << 29, "1.5G"), (5 << 50, "5120.0T")],
+)
+def test_format_size(size, expected):
+    assert format_size(size) == expected
+
+
+def test_main(tmp_path, mocker, capsys):
+    cache = Cache(tmp_path / "cache")
+    make_entry(cache, tmp_path, "abc", 100, 1000)
+    make_entry(cache, tmp_path, "abd", 100, 2000)
+    mocker.patch("sys.argv", ["prog", str(cache.directory), "list"])
+    main()
+    out = capsys.readouterr().out.splitlines()
+    assert [line.split("\t")[0] for line in out[:2]] == ["abc", "abd"]
+    assert out[2] == "2 entries, 200 total"
+    mocker.patch("sys.argv", ["prog", str(cache.directory), "remove", "ab"])
+    with pytest.raises(SystemExit):
+        main()
+    mocker.patch("sys.argv", ["prog", str(cache.directory), "remove", "abd"])
+    main()
+    assert capsys.readouterr().out == "Removed abd abd.out\n"
+    mocker.patch("sys.argv", ["prog", str(cache.directory), "prune"])
+    with pytest.raises(SystemExit):
+        main()
+    mocker.patch("sys.argv", ["prog", str(cache.directory), "prune", "--max-size", "0"])
+    main()
+    assert capsys.readouterr().out == "Removed abc abc.out\n"
+    assert cache.entries() == []
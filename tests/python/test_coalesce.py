@@ -0,0 +1,77 @@
+import csv
+from io import StringIO
+
+import pytest
+
+from segway_pipeline.coalesce import CoalescingWriter, can_merge, flush_writer
+from segway_pipeline.relabel import relabel
+
+
+def make_row(chrom, start, end, name, color="255,0,0"):
+    return [chrom, str(start), str(end), name, "1000", ".", str(start), str(end), color]
+
+
+@pytest.mark.parametrize(
+    "previous,row,expected",
+    [
+        (make_row("chr1", 0, 10, "foo"), make_row("chr1", 10, 20, "foo"), True),
+        (make_row("chr1", 0, 10, "foo"), make_row("chr2", 10, 20, "foo"), False),
+        (make_row("chr1", 0, 10, "foo"), make_row("chr1", 11, 20, "foo"), False),
+        (make_row("chr1", 0, 10, "foo"), make_row("chr1", 10, 20, "bar"), False),
+        (
+            make_row("chr1", 0, 10, "foo"),
+            make_row("chr1", 10, 20, "foo", color="0,0,0"),
+            False,
+        ),
+    ],
+)
+def test_can_merge(previous, row, expected):
+    assert can_merge(previous, row) is expected
+
+
+def test_coalescing_writer():
+    output = StringIO()
+    writer = CoalescingWriter(csv.writer(output, delimiter="\t", lineterminator="\n"))
+    row = make_row("chr1", 0, 10, "foo")
+    writer.writerow(row)
+    # Mutating a row after writing it must not affect the pending run
+    row[3] = "qux"
+    for data in [
+        ("chr1", 10, 20, "foo"),
+        ("chr1", 20, 35, "foo"),
+        ("chr1", 35, 40, "bar"),
+        ("chr2", 40, 50, "bar"),
+    ]:
+        writer.writerow(make_row(*data))
+    assert flush_writer(writer) == 2
+    assert output.getvalue() == (
+        "chr1\t0\t35\tfoo\t1000\t.\t0\t35\t255,0,0\n"
+        "chr1\t35\t40\tbar\t1000\t.\t35\t40\t255,0,0\n"
+        "chr2\t40\t50\tbar\t1000\t.\t40\t50\t255,0,0\n"
+    )
+
+
+def test_flush_writer_not_coalescing():
+    assert flush_writer(csv.writer(StringIO())) == 0
+
+
+def test_relabel_coalesce():
+    bed_data = (
+        "track name=segway\n"
+        "chr19\t0\t100\t0\t1000\t.\t0\t100\t1,1,1\n"
+        "chr19\t100\t200\t1\t1000\t.\t100\t200\t1,1,1\n"
+        "chr19\t200\t300\t2\t1000\t.\t200\t300\t1,1,1\n"
+    )
+    output_file_handle = StringIO("w", newline="")
+    result = relabel(
+        StringIO(bed_data),
+        StringIO("old\tnew\n0\tfoo\n1\tfoo\n2\tbar\n"),
+        output_file_handle,
+        coalesce=True,
+    )
+    assert result == 1
+    assert output_file_handle.getvalue() == (
+        "track name=segway\n"
+        "chr19\t0\t200\tfoo\t1000\t.\t0\t200\t1,1,1\n"
+        "chr19\t200\t300\tbar\t1000\t.\t200\t300\t1,1,1\n"
+    )
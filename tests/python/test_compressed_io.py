@@ -0,0 +1,211 @@
+import gzip
+import struct
+import subprocess
+from contextlib import suppress as does_not_raise
+
+import pytest
+
+from segway_pipeline.compressed_io import (
+    BGZF_EOF,
+    BgzfReader,
+    BgzfWriter,
+    GnuGzipWriter,
+    ParallelGzipWriter,
+    detect_compression,
+    infer_compression,
+    is_bgzf,
+    main,
+    make_bgzf_block,
+    open_input,
+    open_output,
+    recompress,
+)
+
+DATA = "".join(
+    f"chr19\t{i * 100}\t{(i + 1) * 100}\t{i % 7}\t1000\t.\t{i * 100}\t{(i + 1) * 100}\t"
+    "102,102,102\n"
+    for i in range(5000)
+)
+
+
+@pytest.mark.parametrize(
+    "path,expected",
+    [
+        ("foo.bed", "none"),
+        ("foo.bed.gz", "gzip"),
+        ("foo.bed.bgz", "bgzf"),
+        ("foo.bed.zst", "zstd"),
+    ],
+)
+def test_infer_compression(path, expected):
+    assert infer_compression(path) == expected
+
+
+@pytest.mark.parametrize(
+    "magic,expected",
+    [
+        (b"trac", "none"),
+        (b"\x1f\x8b\x08\x04", "gzip"),
+        (b"\x28\xb5\x2f\xfd", "zstd"),
+        (b"", "none"),
+    ],
+)
+def test_detect_compression(magic, expected):
+    assert detect_compression(magic) == expected
+
+
+@pytest.mark.parametrize(
+    "filename,compression",
+    [
+        ("out.bed", None),
+        ("out.bed.gz", None),
+        ("out.bed.bgz", None),
+        ("out.bed", "gzip"),
+        ("out.bed", "bgzf"),
+    ],
+)
+@pytest.mark.parametrize("threads", [1, 3])
+def test_open_output_round_trip(tmp_path, filename, compression, threads):
+    path = tmp_path / filename
+    with open_output(path, compression=compression, threads=threads) as f:
+        f.write(DATA)
+    with open_input(path) as f:
+        assert f.read() == DATA
+
+
+def test_open_output_zstd_round_trip(tmp_path):
+    pytest.importorskip("zstandard")
+    path = tmp_path / "out.bed.zst"
+    with open_output(path, threads=2) as f:
+        f.write(DATA)
+    assert path.read_bytes().startswith(b"\x28\xb5\x2f\xfd")
+    with open_input(path) as f:
+        assert f.read() == DATA
+
+
+@pytest.mark.parametrize(
+    "kwargs,condition",
+    [
+        ({"mode": "wt"}, does_not_raise()),
+        ({"mode": "w"}, pytest.raises(ValueError)),
+        ({"compression": "bzip2"}, pytest.raises(ValueError)),
+        ({"threads": 0}, pytest.raises(ValueError)),
+    ],
+)
+def test_open_output_invalid_args(tmp_path, kwargs, condition):
+    with condition:
+        open_output(tmp_path / "out.bed", **kwargs).close()
+
+
+def test_parallel_gzip_writer_is_deterministic(tmp_path, mocker):
+    """
+    Use a tiny block size so the data spans many blocks.
+    """
+    mocker.patch.object(ParallelGzipWriter, "block_size", 4096)
+    outputs = []
+    for threads in (1, 4):
+        path = tmp_path / f"{threads}.gz"
+        with ParallelGzipWriter(open(path, "wb"), threads=threads) as f:
+            for i in range(0, len(DATA), 1000):
+                f.write(DATA[i : i + 1000].encode())
+        outputs.append(path.read_bytes())
+    assert outputs[0] == outputs[1]
+    assert gzip.decompress(outputs[0]).decode() == DATA
+    # No filename or mtime in the header, single member with a Unix OS byte like gzip -n
+    assert outputs[0][:10] == b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\x03"
+
+
+def test_gnu_gzip_writer_matches_gzip(tmp_path):
+    path = tmp_path / "out.bed.gz"
+    with open_output(path, compression="gnu-gzip") as f:
+        f.write(DATA)
+    expected = subprocess.run(
+        ["gzip", "-nc"], input=DATA.encode(), capture_output=True, check=True
+    ).stdout
+    assert path.read_bytes() == expected
+
+
+def test_gnu_gzip_writer_recompresses_archive_identically(tmp_path):
+    """
+    The training params archive was made with `gzip -nc`, like the WDL tasks did.
+    """
+    path = tmp_path / "training_params.tar.gz"
+    recompress("tests/data/training_params.tar.gz", path, compression="gnu-gzip")
+    with open("tests/data/training_params.tar.gz", "rb") as f:
+        assert path.read_bytes() == f.read()
+
+
+def test_gnu_gzip_writer_failure_raises(tmp_path, mocker):
+    mocker.patch("segway_pipeline.compressed_io.GNU_GZIP_PROGRAM", "false")
+    f = GnuGzipWriter(open(tmp_path / "out.gz", "wb"))
+    with pytest.raises(subprocess.CalledProcessError):
+        f.close()
+
+
+def test_bgzf_writer(tmp_path):
+    path = tmp_path / "out.bgz"
+    data = DATA.encode()
+    with BgzfWriter(open(path, "wb"), threads=2) as f:
+        f.write(data)
+    compressed = path.read_bytes()
+    assert compressed.endswith(BGZF_EOF)
+    assert gzip.decompress(compressed) == data
+    offset = 0
+    num_blocks = 0
+    while offset < len(compressed):
+        assert compressed[offset + 12 : offset + 16] == b"BC\x02\x00"
+        (block_size,) = struct.unpack("<H", compressed[offset + 16 : offset + 18])
+        offset += block_size + 1
+        num_blocks += 1
+    assert offset == len(compressed)
+    assert num_blocks > 2
+
+
+def test_make_bgzf_block():
+    block = make_bgzf_block(b"foo")
+    (block_size,) = struct.unpack("<H", block[16:18])
+    assert block_size == len(block) - 1
+    assert gzip.decompress(block) == b"foo"
+
+
+def test_bgzf_reader(tmp_path, mocker):
+    """
+    Use a tiny block size so lines span blocks.
+    """
+    mocker.patch("segway_pipeline.compressed_io.BGZF_BLOCK_SIZE", 100)
+    path = tmp_path / "out.bgz"
+    with BgzfWriter(open(path, "wb")) as f:
+        f.write(DATA.encode())
+    assert is_bgzf(path)
+    lines = DATA.encode().splitlines(keepends=True)
+    offsets = []
+    with BgzfReader(open(path, "rb")) as f:
+        for line in lines:
+            offsets.append(f.tell())
+            assert f.readline() == line
+        assert f.readline() == b""
+        for i in (4000, 2, 4999, 0):
+            f.seek(offsets[i])
+            assert f.readline() == lines[i]
+    assert len({offset >> 16 for offset in offsets}) > 100
+
+
+def test_is_bgzf(tmp_path):
+    path = tmp_path / "out.gz"
+    path.write_bytes(gzip.compress(b"foo"))
+    assert not is_bgzf(path)
+
+
+@pytest.mark.parametrize("input_compression", ["none", "gzip", "bgzf"])
+def test_main(tmp_path, mocker, input_compression):
+    input_path = tmp_path / "in"
+    with open_output(input_path, compression=input_compression) as f:
+        f.write(DATA)
+    output_path = tmp_path / "out.bed.gz"
+    mocker.patch(
+        "sys.argv",
+        ["prog", "--threads", "2", "-o", str(output_path), str(input_path)],
+    )
+    main()
+    assert not is_bgzf(output_path)
+    assert gzip.decompress(output_path.read_bytes()).decode() == DATA
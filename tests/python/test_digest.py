@@ -0,0 +1,108 @@
+import gzip
+import hashlib
+from io import BytesIO
+
+import pytest
+
+from segway_pipeline.compressed_io import open_output
+from segway_pipeline.digest import (
+    digest_file,
+    digest_files,
+    iter_content,
+    main,
+    parse_checksum_line,
+)
+
+DATA = "track name=foo\n#comment\nchr1\t0\t10\nchr1\t10\t20\n"
+
+
+def md5(data):
+    return hashlib.md5(data.encode()).hexdigest()
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip", "bgzf", "zstd"])
+def test_digest_file(tmp_path, compression):
+    path = tmp_path / "in.bed"
+    with open_output(path, compression=compression) as f:
+        f.write(DATA)
+    assert digest_file(path) == md5(DATA)
+    assert digest_file(path, skip_lines=1) == md5(DATA.split("\n", 1)[1])
+
+
+def test_digest_file_no_decompress(tmp_path):
+    path = tmp_path / "in.bed.gz"
+    path.write_bytes(gzip.compress(DATA.encode()))
+    assert digest_file(path, decompress=False) == hashlib.md5(
+        path.read_bytes()
+    ).hexdigest()
+
+
+def test_digest_file_matches_reading_whole_file():
+    path = "tests/data/segway.bed.gz"
+    with gzip.open(path, "rt") as f:
+        expected = md5("".join(f.readlines()[1:]))
+    assert digest_file(path, skip_lines=1) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 16, 1 << 20])
+@pytest.mark.parametrize(
+    "data,skip_lines,header_regex,expected",
+    [
+        (DATA, 0, None, DATA),
+        (DATA, 2, None, DATA.split("\n", 2)[2]),
+        (DATA, 0, "track|#", DATA.split("\n", 2)[2]),
+        (DATA, 1, "track", DATA.split("\n", 1)[1]),
+        (DATA, 10, None, ""),
+        ("track\nchr1", 1, None, "chr1"),
+        ("track\nchr1", 0, "track|chr", ""),
+        ("", 1, None, ""),
+    ],
+)
+def test_iter_content(chunk_size, data, skip_lines, header_regex, expected):
+    chunks = iter_content(
+        BytesIO(data.encode()), skip_lines, header_regex, chunk_size=chunk_size
+    )
+    assert b"".join(chunks).decode() == expected
+
+
+def test_digest_files(tmp_path):
+    paths = []
+    for i in range(5):
+        path = tmp_path / f"{i}.txt"
+        path.write_text(f"header {i}\n{DATA * i}")
+        paths.append(path)
+    expected = [md5(DATA * i) for i in range(5)]
+    assert digest_files(paths, skip_lines=1) == expected
+    assert digest_files(paths, skip_lines=1, jobs=3) == expected
+
+
+def test_digest_files_invalid_jobs_raises():
+    with pytest.raises(ValueError):
+        digest_files([], jobs=0)
+
+
+@pytest.mark.parametrize(
+    "line,expected",
+    [("abc  foo bar.txt\n", ("abc", "foo bar.txt")), ("abc *foo", ("abc", "foo"))],
+)
+def test_parse_checksum_line(line, expected):
+    assert parse_checksum_line(line) == expected
+
+
+def test_main_check(tmp_path, mocker, capsys):
+    path = tmp_path / "in.bed"
+    path.write_text(DATA)
+    mocker.patch("sys.argv", ["prog", "-n", "1", str(path)])
+    main()
+    checksums = capsys.readouterr().out
+    assert checksums == f"{md5(DATA.split(chr(10), 1)[1])}  {path}\n"
+    checksum_path = tmp_path / "checksums.md5"
+    checksum_path.write_text(checksums)
+    mocker.patch("sys.argv", ["prog", "-n", "1", "--check", str(checksum_path)])
+    main()
+    assert capsys.readouterr().out == f"{path}: OK\n"
+    path.write_text(DATA + DATA)
+    with pytest.raises(SystemExit) as e:
+        main()
+    assert e.value.code == 1
+    assert capsys.readouterr().out == f"{path}: FAILED\n"
@@ -0,0 +1,373 @@
+import io
+import random
+
+import numpy as np
+import pytest
+
+from segway_pipeline.feature_aggregation import (
+    COMPONENT_INDEXES,
+    FLANK_3P,
+    FLANK_5P,
+    GENE_COMPONENTS,
+    INITIAL_EXON,
+    TERMINAL_EXON,
+    aggregate,
+    count_flanks,
+    get_component_bins,
+    iter_gtf,
+    main,
+    make_gene_model,
+    read_gene_features,
+)
+from segway_pipeline.segmentation import read_bed
+
+TRACK_LINE = "track name=segway.abc\n"
+
+
+def make_bed(segments):
+    return TRACK_LINE + "".join(
+        f"{chrom}\t{start}\t{end}\t{label}\t1000\t.\t{start}\t{end}\t1,2,3\n"
+        for chrom, start, end, label in segments
+    )
+
+
+def make_gtf_row(chrom, feature, start, end, strand, gene_id, transcript_id):
+    """
+    Takes zero based half open coordinates.
+    """
+    return (
+        f"{chrom}\ttest\t{feature}\t{start + 1}\t{end}\t.\t{strand}\t.\t"
+        f'gene_id "{gene_id}"; transcript_id "{transcript_id}";\n'
+    )
+
+
+def segtools_aggregate(segmentation, features, component_bins):
+    """
+    Port of segtools' calc_aggregation and calc_feature_windows in gene mode, which
+    looks every window of every part up in a map of the label at each base.
+    """
+    num_labels = len(segmentation.values["name"])
+    counts = [np.zeros((bins, num_labels), dtype=np.int64) for bins in component_bins]
+    counted = 0
+    chrom_codes = segmentation.codes["chrom"]
+    for code, chrom in enumerate(segmentation.values["chrom"]):
+        if chrom not in features:
+            continue
+        rows = np.flatnonzero(chrom_codes == code)
+        rows = rows[np.argsort(segmentation.starts[rows], kind="stable")]
+        map_start = int(segmentation.starts[rows[0]])
+        map_end = int(segmentation.ends[rows[-1]])
+        segment_map = np.full(map_end - map_start, -1)
+        for row in rows:
+            segment_map[
+                segmentation.starts[row]
+                - map_start : segmentation.ends[row]
+                - map_start
+            ] = segmentation.codes["name"][row]
+        chrom_features = features[chrom]
+        for start, end, component, minus in zip(*chrom_features):
+            num_5p = (
+                component_bins[0] if component == COMPONENT_INDEXES[INITIAL_EXON] else 0
+            )
+            num_3p = (
+                component_bins[7]
+                if component == COMPONENT_INDEXES[TERMINAL_EXON]
+                else 0
+            )
+            num_internal = component_bins[component]
+            if num_internal > end - start:
+                num_internal = 0
+            internal = np.round(
+                np.linspace(start, end, num_internal, endpoint=False)
+            ).astype(int)
+            if minus:
+                bins_5p = np.arange(end, end + num_5p)[::-1]
+                internal = internal[::-1]
+                bins_3p = np.arange(start - num_3p, start)[::-1]
+            else:
+                bins_5p = np.arange(start - num_5p, start)
+                bins_3p = np.arange(end, end + num_3p)
+            feature_counted = False
+            for window_component, window in (
+                (COMPONENT_INDEXES[FLANK_5P], bins_5p),
+                (component, internal),
+                (COMPONENT_INDEXES[FLANK_3P], bins_3p),
+            ):
+                keep = (window >= map_start) & (window < map_end)
+                indexes = np.arange(len(window))[keep]
+                labels = segment_map[window[keep] - map_start]
+                indexes = indexes[labels != -1]
+                labels = labels[labels != -1]
+                np.add.at(counts[window_component], (indexes, labels), 1)
+                if len(labels) > 0 and not feature_counted:
+                    counted += 1
+                    feature_counted = True
+    return np.concatenate(counts), counted
+
+
+def make_random_inputs(rng):
+    segments = []
+    for chrom, size in (("chr1", 200000), ("chr2", 120000), ("chr3", 50000)):
+        position = rng.randrange(0, 2000)
+        while position < size:
+            end = position + rng.randrange(1, 40) * 100
+            segments.append((chrom, position, end, str(rng.randrange(0, 6))))
+            position = end + rng.choice([0, 0, 0, 500])
+    rng.shuffle(segments)
+    gtf = ["#!genome-build test\n"]
+    for gene in range(80):
+        chrom = rng.choice(["chr1", "chr2", "chrM"])
+        strand = rng.choice("+-")
+        gtf.append(make_gtf_row(chrom, "gene", 0, 1, strand, f"g{gene}", ""))
+        for transcript in range(rng.randrange(1, 3)):
+            transcript_id = f"g{gene}.{transcript}"
+            position = rng.randrange(0, 190000)
+            exons = []
+            for _ in range(rng.randrange(1, 6)):
+                length = rng.randrange(1, 400)
+                exons.append((position, position + length))
+                position += length + rng.randrange(0, 3000)
+            for exon in exons:
+                gtf.append(
+                    make_gtf_row(
+                        chrom, "exon", *exon, strand, f"g{gene}", transcript_id
+                    )
+                )
+            if rng.random() < 0.7:
+                cds_start = rng.randrange(exons[0][0], exons[0][1])
+                cds_end = rng.randrange(exons[-1][0], exons[-1][1]) + 1
+                if cds_start < cds_end:
+                    for exon_start, exon_end in exons:
+                        start, end = max(exon_start, cds_start), min(exon_end, cds_end)
+                        if start < end:
+                            gtf.append(
+                                make_gtf_row(
+                                    chrom,
+                                    "CDS",
+                                    start,
+                                    end,
+                                    strand,
+                                    f"g{gene}",
+                                    transcript_id,
+                                )
+                            )
+    return read_bed(io.StringIO(make_bed(segments))), "".join(gtf)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_aggregate_matches_segtools(seed):
+    rng = random.Random(seed)
+    segmentation, gtf = make_random_inputs(rng)
+    features = read_gene_features(io.StringIO(gtf))
+    component_bins = get_component_bins(rng.choice([0, 1, 700, 3000]), 13, 7)
+    expected_counts, expected_num_features = segtools_aggregate(
+        segmentation, features, component_bins
+    )
+    assert expected_counts.sum() > 0
+    counts, num_features = aggregate(segmentation, features, component_bins)
+    np.testing.assert_array_equal(counts, expected_counts)
+    assert num_features == expected_num_features
+
+
+def test_aggregate_parallel():
+    segmentation, gtf = make_random_inputs(random.Random(5))
+    features = read_gene_features(io.StringIO(gtf))
+    component_bins = get_component_bins(1000)
+    serial = aggregate(segmentation, features, component_bins)
+    parallel = aggregate(segmentation, features, component_bins, jobs=2)
+    np.testing.assert_array_equal(parallel[0], serial[0])
+    assert parallel[1] == serial[1]
+
+
+def test_aggregate_overlapping_segments_raises():
+    segmentation = read_bed(
+        io.StringIO(make_bed([("chr1", 0, 100, "0"), ("chr1", 50, 150, "1")]))
+    )
+    features = read_gene_features(
+        io.StringIO(make_gtf_row("chr1", "exon", 10, 20, "+", "g", "t"))
+    )
+    with pytest.raises(ValueError):
+        aggregate(segmentation, features, get_component_bins(10))
+
+
+def test_count_flanks():
+    starts = np.array([0, 10, 30])
+    ends = np.array([10, 25, 40])
+    labels = np.array([1, 0, 1])
+    counts, hit = count_flanks(
+        starts,
+        ends,
+        labels,
+        np.array([5, 5, 50]),
+        np.array([False, True, False]),
+        8,
+        2,
+    )
+    # Bases 5 to 12, then 12 down to 5, the last window is past the segments
+    assert counts.tolist() == [[1, 1]] * 3 + [[0, 2]] * 2 + [[1, 1]] * 3
+    assert hit.tolist() == [True, True, False]
+
+
+def test_make_gene_model_plus():
+    exons = [(300, 400), (0, 100), (150, 200)]
+    cdss = [(50, 100), (150, 200), (300, 320)]
+    parts = make_gene_model(exons, cdss, minus=False)
+    assert [(start, end, GENE_COMPONENTS[i]) for start, end, i in parts] == [
+        (0, 100, "initial exon (%d bp)"),
+        (100, 150, "initial intron (%d bp)"),
+        (150, 200, "internal exons (%d bp)"),
+        (200, 300, "terminal intron (%d bp)"),
+        (300, 400, "terminal exon (%d bp)"),
+        (0, 50, "initial 5' UTR (%d bp)"),
+        (0, 50, "terminal 5' UTR (%d bp)"),
+        (50, 100, "initial CDS (%d bp)"),
+        (300, 320, "terminal CDS (%d bp)"),
+        (320, 400, "initial 3' UTR (%d bp)"),
+        (320, 400, "terminal 3' UTR (%d bp)"),
+    ]
+
+
+def test_make_gene_model_minus():
+    exons = [(0, 100), (150, 200), (300, 400), (500, 600)]
+    cdss = [(150, 200), (300, 350)]
+    parts = make_gene_model(exons, cdss, minus=True)
+    assert [(start, end, GENE_COMPONENTS[i]) for start, end, i in parts] == [
+        (500, 600, "initial exon (%d bp)"),
+        (400, 500, "initial intron (%d bp)"),
+        (300, 400, "internal exons (%d bp)"),
+        (150, 200, "internal exons (%d bp)"),
+        (200, 300, "internal introns (%d bp)"),
+        (100, 150, "terminal intron (%d bp)"),
+        (0, 100, "terminal exon (%d bp)"),
+        (500, 600, "initial 5' UTR (%d bp)"),
+        (400, 500, "5' UTR introns (%d bp)"),
+        (350, 400, "terminal 5' UTR (%d bp)"),
+        (300, 350, "initial CDS (%d bp)"),
+        (150, 200, "terminal CDS (%d bp)"),
+        (0, 100, "initial 3' UTR (%d bp)"),
+        (100, 150, "3' UTR introns (%d bp)"),
+        (0, 100, "terminal 3' UTR (%d bp)"),
+    ]
+
+
+def test_make_gene_model_overlapping_exons_raises():
+    with pytest.raises(ValueError):
+        make_gene_model([(0, 100), (50, 200)], [], minus=False)
+
+
+def test_iter_gtf():
+    gtf = (
+        "#!genome-build test\n"
+        "\n"
+        'chr1\tsrc\tgene\t11\t20\t.\t+\t.\tgene_id "g1"; # comment\n'
+        'chr1\tsrc\texon\t11\t20\t.\t+\t.\tgene_id "g1"; transcript_id "t1";\n'
+    )
+    assert list(iter_gtf(io.StringIO(gtf))) == [
+        ("chr1", 10, 20, "+", "gene", {"gene_id": "g1", "transcript_id": "g1"}),
+        ("chr1", 10, 20, "+", "exon", {"gene_id": "g1", "transcript_id": "t1"}),
+    ]
+
+
+def test_iter_gtf_no_transcript_id_raises():
+    with pytest.raises(ValueError):
+        list(iter_gtf(io.StringIO('chr1\ts\texon\t1\t2\t.\t+\t.\tgene_id "g1";\n')))
+
+
+def test_read_gene_features_longest_transcript():
+    gtf = "".join(
+        [
+            make_gtf_row("chr1", "exon", 100, 200, "+", "g1", "short"),
+            make_gtf_row("chr1", "exon", 0, 50, "-", "g1", "long"),
+            make_gtf_row("chr1", "transcript", 0, 300, "-", "g1", "long"),
+            make_gtf_row("chr1", "exon", 250, 300, "-", "g1", "long"),
+            make_gtf_row("chr1", "start_codon", 0, 3, "+", "g2", "no_exons"),
+        ]
+    )
+    features = read_gene_features(io.StringIO(gtf))
+    assert list(features) == ["chr1"]
+    chrom_features = features["chr1"]
+    # Both introns of a transcript with two exons are the same one
+    assert chrom_features.starts.tolist() == [250, 50, 50, 0]
+    assert chrom_features.ends.tolist() == [300, 250, 250, 50]
+    assert chrom_features.minus.tolist() == [True] * 4
+
+
+@pytest.mark.parametrize(
+    "gtf",
+    [
+        make_gtf_row("chr1", "exon", 0, 50, ".", "g1", "t1"),
+        make_gtf_row("chr1", "exon", 0, 50, "+", "g1", "t1")
+        + make_gtf_row("chr2", "exon", 100, 150, "+", "g1", "t1"),
+    ],
+)
+def test_read_gene_features_invalid_raises(gtf):
+    with pytest.raises(ValueError):
+        read_gene_features(io.StringIO(gtf))
+
+
+def test_main(tmp_path, mocker):
+    bed = tmp_path / "segway.bed"
+    bed.write_text(
+        make_bed(
+            [
+                ("chr1", 0, 1000, "1"),
+                ("chr1", 1000, 1500, "0"),
+                ("chr1", 1500, 3000, "10"),
+                ("chr2", 0, 100, "0"),
+            ]
+        )
+    )
+    gtf = tmp_path / "genes.gtf"
+    gtf.write_text(
+        make_gtf_row("chr1", "exon", 1000, 1100, "+", "g1", "t1")
+        + make_gtf_row("chr1", "exon", 1400, 1600, "+", "g1", "t1")
+        + make_gtf_row("chr1", "CDS", 1050, 1100, "+", "g1", "t1")
+        + make_gtf_row("chr1", "CDS", 1400, 1500, "+", "g1", "t1")
+    )
+    outdir = tmp_path / "feature_aggregation"
+    mock_run = mocker.patch("subprocess.run")
+    testargs = [
+        "prog",
+        "-o",
+        str(outdir),
+        "--flank-bases",
+        "3",
+        "--intron-samples",
+        "2",
+        "--exon-samples",
+        "2",
+        "--plot",
+        str(bed),
+        str(gtf),
+    ]
+    mocker.patch("sys.argv", testargs)
+    main()
+    lines = (outdir / "feature_aggregation.tab").read_text().splitlines()
+    assert lines[0] == "# num_features=10 spacers=8 0=600 1=1000 10=1500"
+    assert lines[1] == "group\tcomponent\toffset\t0\t1\t10"
+    assert lines[2:10] == [
+        "genes\t5' flanking: 3 bp\t-3\t0\t1\t0",
+        "genes\t5' flanking: 3 bp\t-2\t0\t1\t0",
+        "genes\t5' flanking: 3 bp\t-1\t0\t1\t0",
+        "genes\tinitial exon (100 bp)\t0\t1\t0\t0",
+        "genes\tinitial exon (100 bp)\t1\t1\t0\t0",
+        "genes\tinitial intron (300 bp)\t0\t1\t0\t0",
+        "genes\tinitial intron (300 bp)\t1\t1\t0\t0",
+        "genes\tinternal exons (%d bp)\t0\t0\t0\t0",
+    ]
+    assert "genes\t3' flanking: 3 bp\t2\t0\t0\t1" in lines
+    assert "genes\tinitial 5' UTR (50 bp)\t1\t1\t0\t0" in lines
+    assert len(lines) == 2 + 2 * 3 + 2 * (len(GENE_COMPONENTS) - 2)
+    mock_run.assert_called_once_with(
+        [
+            "segtools-aggregation",
+            "--replot",
+            "--normalize",
+            "--mode=gene",
+            "-o",
+            str(outdir),
+            str(bed),
+            str(gtf),
+        ],
+        check=True,
+    )
@@ -0,0 +1,158 @@
+import json
+import pstats
+import subprocess
+import sys
+import time
+
+import pytest
+
+from segway_pipeline.instrument import (
+    METRICS_DIR_ENV_VAR,
+    PROFILE_ENV_VAR,
+    StackSampler,
+    add_records,
+    instrumented,
+    measure,
+)
+from segway_pipeline.make_trackname_assay import main as make_trackname_assay_main
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def read_metrics(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def test_measure(tmp_path):
+    with measure("foo", metrics_dir=tmp_path) as run:
+        add_records(3)
+        add_records(4)
+        (tmp_path / "out.txt").write_bytes(b"x" * 1000)
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+    assert run.records == 7
+    metrics = read_metrics(tmp_path / "foo.json")
+    assert metrics["name"] == "foo"
+    assert metrics["exit_status"] == 0
+    assert metrics["records"] == 7
+    assert metrics["wall_seconds"] > 0
+    assert metrics["peak_rss_mb"] > 0
+    assert metrics["children_peak_rss_mb"] > 0
+    assert metrics["children_user_seconds"] + metrics["children_system_seconds"] > 0
+    assert metrics["profile"] is None
+    if metrics["bytes_written"] is not None:
+        assert metrics["bytes_written"] >= 1000
+
+
+def test_measure_records_outside_run_are_ignored(tmp_path):
+    add_records(5)
+    with measure("foo", metrics_dir=tmp_path):
+        pass
+    assert read_metrics(tmp_path / "foo.json")["records"] == 0
+
+
+@pytest.mark.parametrize(
+    "exception,exit_status",
+    [
+        (SystemExit(2), 2),
+        (SystemExit(None), 0),
+        (SystemExit("usage"), 1),
+        (ValueError("bad"), 1),
+    ],
+)
+def test_measure_exit_status(tmp_path, exception, exit_status):
+    with pytest.raises(type(exception)):
+        with measure("foo", metrics_dir=tmp_path):
+            raise exception
+    assert read_metrics(tmp_path / "foo.json")["exit_status"] == exit_status
+
+
+def test_measure_cprofile(tmp_path):
+    with measure("foo", metrics_dir=tmp_path, profiler="cprofile"):
+        busy(0.01)
+    assert read_metrics(tmp_path / "foo.json")["profile"] == "foo.prof"
+    stats = pstats.Stats(str(tmp_path / "foo.prof"))
+    assert any(function[2] == "busy" for function in stats.stats)
+
+
+def test_measure_sample(tmp_path):
+    with measure("foo", metrics_dir=tmp_path, profiler="sample", sample_interval=0.001):
+        busy(0.1)
+    assert read_metrics(tmp_path / "foo.json")["profile"] == "foo.folded"
+    lines = (tmp_path / "foo.folded").read_text().splitlines()
+    assert any("busy (test_instrument.py" in line for line in lines)
+    assert all(int(line.rsplit(" ", 1)[1]) > 0 for line in lines)
+
+
+def test_measure_unknown_profiler_raises(tmp_path):
+    with pytest.raises(ValueError):
+        with measure("foo", metrics_dir=tmp_path, profiler="perf"):
+            pass
+
+
+def test_stack_sampler_sees_other_threads(tmp_path):
+    sampler = StackSampler(interval=0.001)
+    sampler.start()
+    busy(0.05)
+    sampler.stop()
+    assert sampler.stacks
+    assert not any("StackSampler" in stack for stack in sampler.stacks)
+    sampler.write(tmp_path / "out.folded")
+    assert (tmp_path / "out.folded").read_text().count("\n") == len(sampler.stacks)
+
+
+def test_instrumented_disabled(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv(METRICS_DIR_ENV_VAR, raising=False)
+    monkeypatch.delenv(PROFILE_ENV_VAR, raising=False)
+
+    @instrumented("foo")
+    def main():
+        return 1
+
+    assert main() == 1
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_instrumented_profile_without_metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv(METRICS_DIR_ENV_VAR, raising=False)
+    monkeypatch.setenv(PROFILE_ENV_VAR, "cprofile")
+
+    @instrumented("foo")
+    def main():
+        pass
+
+    main()
+    assert [path.name for path in tmp_path.iterdir()] == ["foo.prof"]
+
+
+def test_instrumented_main(tmp_path, monkeypatch, mocker):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv(METRICS_DIR_ENV_VAR, "metrics")
+    monkeypatch.delenv(PROFILE_ENV_VAR, raising=False)
+    argv = [
+        "prog",
+        "--tracknames",
+        "foo.bigWig",
+        "bar.bigWig",
+        "--assays",
+        "DNase-seq",
+        "H3K27ac",
+        "--output-filename",
+        "trackname_assay.txt",
+    ]
+    mocker.patch("sys.argv", argv)
+    make_trackname_assay_main()
+    metrics = read_metrics(tmp_path / "metrics" / "make_trackname_assay.json")
+    assert metrics["records"] == 2
+    assert metrics["argv"] == argv
+    mocker.patch("sys.argv", ["prog"])
+    with pytest.raises(SystemExit):
+        make_trackname_assay_main()
+    metrics = read_metrics(tmp_path / "metrics" / "make_trackname_assay.json")
+    assert metrics["exit_status"] == 2
@@ -0,0 +1,153 @@
+import gzip
+import io
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from segway_pipeline.length_distribution import (
+    get_label_sort_key,
+    get_median,
+    main,
+    summarize,
+    write_length_distribution,
+    write_segment_sizes,
+)
+
+BED = (
+    "track name=segway.abc\n"
+    "chr1\t0\t100\t2\t1000\t.\t0\t100\t1,2,3\n"
+    "chr1\t100\t300\t0\t1000\t.\t100\t300\t1,2,3\n"
+    "chr1\t300\t400\t2\t1000\t.\t300\t400\t1,2,3\n"
+    "chr2\t0\t50\t10\t1000\t.\t0\t50\t1,2,3\n"
+    "chr2\t50\t350\t0\t1000\t.\t50\t350\t1,2,3\n"
+)
+LENGTH_DISTRIBUTION = "label\tlength\n2\t100\n2\t100\n0\t200\n0\t300\n10\t50\n"
+SEGMENT_SIZES = (
+    "label\tnum.segs\tmean.len\tmedian.len\tstdev.len\tnum.bp\tfrac.bp\n"
+    "all\t5\t150.000\t100.000\t89.443\t750\t1.000\n"
+    "0\t2\t250.000\t250.000\t50.000\t500\t0.667\n"
+    "2\t2\t100.000\t100.000\t0.000\t200\t0.267\n"
+    "10\t1\t50.000\t50.000\t0.000\t50\t0.067\n"
+)
+
+
+def make_size_row(label, lengths, total_bp):
+    """
+    How segtools formats the summary of an array of lengths.
+    """
+    return "\t".join(
+        [
+            label,
+            str(len(lengths)),
+            "%.3f" % lengths.mean(),
+            "%.3f" % np.median(lengths),
+            "%.3f" % lengths.std(),
+            str(lengths.sum()),
+            "%.3f" % (lengths.sum() / total_bp),
+        ]
+    )
+
+
+def test_write_length_distribution(tmp_path):
+    output = io.StringIO()
+    histograms = write_length_distribution(io.StringIO(BED), output, tmp_path)
+    assert output.getvalue() == LENGTH_DISTRIBUTION
+    assert histograms == {
+        "2": Counter({100: 2}),
+        "0": Counter({200: 1, 300: 1}),
+        "10": Counter({50: 1}),
+    }
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_write_segment_sizes(tmp_path):
+    histograms = write_length_distribution(io.StringIO(BED), io.StringIO(), tmp_path)
+    output = io.StringIO()
+    write_segment_sizes(histograms, output)
+    assert output.getvalue() == SEGMENT_SIZES
+
+
+def test_write_segment_sizes_matches_numpy():
+    rng = random.Random(0)
+    lengths = {
+        label: np.array(
+            [rng.randrange(1, 50) * 200 for _ in range(rng.randrange(1, 500))]
+        )
+        for label in ("3", "1", "12", "0")
+    }
+    output = io.StringIO()
+    write_segment_sizes(
+        {label: Counter(values.tolist()) for label, values in lengths.items()}, output
+    )
+    all_lengths = np.concatenate(list(lengths.values()))
+    total_bp = all_lengths.sum()
+    expected = [make_size_row("all", all_lengths, total_bp)] + [
+        make_size_row(label, lengths[label], total_bp)
+        for label in ("0", "1", "3", "12")
+    ]
+    assert output.getvalue().splitlines()[1:] == expected
+
+
+@pytest.mark.parametrize(
+    "lengths", [[5], [1, 2], [3, 1, 2], [7, 7, 1, 9], [4, 4, 4, 10, 10, 10]]
+)
+def test_get_median(lengths):
+    assert get_median(Counter(lengths), len(lengths)) == np.median(lengths)
+
+
+def test_summarize_empty_raises():
+    with pytest.raises(ValueError):
+        summarize(Counter())
+
+
+def test_write_length_distribution_end_before_start_raises(tmp_path):
+    with pytest.raises(ValueError):
+        write_length_distribution(
+            io.StringIO("chr1\t10\t5\t0\n"), io.StringIO(), tmp_path
+        )
+
+
+def test_get_label_sort_key():
+    labels = ["10", "quiescent", "2", "enhancer", "0"]
+    assert sorted(labels, key=get_label_sort_key) == [
+        "0",
+        "2",
+        "10",
+        "enhancer",
+        "quiescent",
+    ]
+
+
+@pytest.mark.parametrize("plot", [False, True])
+def test_main(tmp_path, mocker, plot):
+    bed = tmp_path / "segway.bed.gz"
+    with gzip.open(bed, "wt") as f:
+        f.write(BED)
+    outdir = tmp_path / "length_distribution"
+    mock_run = mocker.patch("subprocess.run")
+    testargs = ["prog", "-o", str(outdir), str(bed)]
+    if plot:
+        testargs.append("--plot")
+    mocker.patch("sys.argv", testargs)
+    main()
+    assert (outdir / "length_distribution.tab").read_text() == LENGTH_DISTRIBUTION
+    assert (outdir / "segment_sizes.tab").read_text() == SEGMENT_SIZES
+    assert sorted(path.name for path in outdir.iterdir()) == [
+        "length_distribution.tab",
+        "segment_sizes.tab",
+    ]
+    if plot:
+        mock_run.assert_called_once_with(
+            [
+                "segtools-length-distribution",
+                "--replot",
+                "-o",
+                str(outdir),
+                str(bed),
+            ],
+            check=True,
+        )
+    else:
+        mock_run.assert_not_called()
@@ -1,10 +1,36 @@
+import struct
 import subprocess
 from contextlib import suppress as does_not_raise
 from typing import List
 
 import pytest
 
-from segway_pipeline.make_genomedata import get_parser, main, make_command
+from segway_pipeline.cache import Cache
+from segway_pipeline.make_genomedata import (
+    BIGWIG_SIGNATURE,
+    build_directory,
+    convert_bigwigs,
+    get_parser,
+    is_bigwig,
+    load_chromosome,
+    main,
+    make_command,
+    subset_chrom_sizes,
+)
+
+CHROM_SIZES = (
+    "chr1\t248956422\n"
+    "chr10\t133797422\n"
+    "\n"
+    "chr1_KI270706v1_random\t175055\n"
+    "chrX\t156040895\n"
+    "chrEBV\t171823"
+)
+
+
+def write_bigwig(path, byte_order="<"):
+    path.write_bytes(struct.pack(f"{byte_order}I", BIGWIG_SIGNATURE) + b"data")
+    return str(path)
 
 
 def test_make_command():
@@ -25,6 +51,135 @@ def test_make_command():
     ]
 
 
+def test_make_command_track_files():
+    result = make_command(["f1.bigwig"], "chrom.sizes", "my.gd", ["0.f1.bedGraph"])
+    assert result == [
+        "genomedata-load",
+        "-s",
+        "chrom.sizes",
+        "--sizes",
+        "-t",
+        "f1=0.f1.bedGraph",
+        "my.gd",
+    ]
+
+
+def test_make_command_directory_mode():
+    result = make_command(["f1.bigwig"], "chrom.sizes", "my.gd", directory_mode=True)
+    assert result == [
+        "genomedata-load",
+        "-s",
+        "chrom.sizes",
+        "--sizes",
+        "--directory-mode",
+        "-t",
+        "f1=f1.bigwig",
+        "my.gd",
+    ]
+
+
+@pytest.mark.parametrize(
+    "data,expected",
+    [
+        (struct.pack("<I", BIGWIG_SIGNATURE), True),
+        (struct.pack(">I", BIGWIG_SIGNATURE), True),
+        (b"chr1\t0\t10\t1.0\n", False),
+        (b"", False),
+    ],
+)
+def test_is_bigwig(tmp_path, data, expected):
+    path = tmp_path / "f"
+    path.write_bytes(data)
+    assert is_bigwig(str(path)) == expected
+
+
+def test_convert_bigwigs(tmp_path, mocker):
+    mocker.patch("subprocess.run")
+    bedgraph = tmp_path / "c.bedGraph"
+    bedgraph.write_text("chr1\t0\t10\t1.0\n")
+    files = [
+        write_bigwig(tmp_path / "a.bigWig"),
+        write_bigwig(tmp_path / "b.bw", byte_order=">"),
+        str(bedgraph),
+    ]
+    result = convert_bigwigs(files, "tmp", jobs=2)
+    assert result == ["tmp/0.a.bedGraph", "tmp/1.b.bedGraph", str(bedgraph)]
+    assert sorted(call[0][0] for call in subprocess.run.call_args_list) == [
+        ["bigWigToBedGraph", files[0], "tmp/0.a.bedGraph"],
+        ["bigWigToBedGraph", files[1], "tmp/1.b.bedGraph"],
+    ]
+
+
+def test_convert_bigwigs_failure_raises(tmp_path, mocker):
+    mocker.patch(
+        "subprocess.run",
+        side_effect=subprocess.CalledProcessError(1, "bigWigToBedGraph"),
+    )
+    with pytest.raises(subprocess.CalledProcessError):
+        convert_bigwigs([write_bigwig(tmp_path / "a.bw")], str(tmp_path), jobs=2)
+
+
+def test_build_directory_schedules_largest_chromosome_first(tmp_path, mocker):
+    load_chromosome = mocker.patch("segway_pipeline.make_genomedata.load_chromosome")
+    sizes = tmp_path / "chrom.sizes"
+    sizes.write_text("chr1\t200\nchr10\t50\nchr2\t300\nchrEBV\t10\n")
+    files = [write_bigwig(tmp_path / "a.bw")]
+    outdir = tmp_path / "out.genomedata"
+    build_directory(files, str(sizes), str(outdir), jobs=1, tmpdir=str(tmp_path))
+    assert outdir.is_dir()
+    assert [call[0][:2] for call in load_chromosome.call_args_list] == [
+        ("chr2", 300),
+        ("chr1", 200),
+        ("chr10", 50),
+        ("chrEBV", 10),
+    ]
+
+
+def test_build_directory_requires_bigwigs(tmp_path):
+    bedgraph = tmp_path / "a.bedGraph"
+    bedgraph.write_text("chr1\t0\t10\t1.0\n")
+    with pytest.raises(ValueError):
+        build_directory([str(bedgraph)], "sizes", str(tmp_path), 1, str(tmp_path))
+
+
+def test_load_chromosome(tmp_path, mocker):
+    """
+    The fake `bigWigToBedGraph` only has data for the first track, the empty bedGraph
+    for the second is filled in with a missing value.
+    """
+    commands = []
+
+    def run(command, check):
+        commands.append(command)
+        if command[0] == "bigWigToBedGraph":
+            data = "chr2\t0\t10\t1.0\n" if command[2].endswith("a.bw") else ""
+            with open(command[3], "w") as f:
+                f.write(data)
+            assert check
+        else:
+            archive = tmp_path / command[-1]
+            archive.mkdir()
+            (archive / "chr2.genomedata").write_text("gd")
+            with open(command[2]) as f:
+                assert f.read() == "chr2\t300\n"
+            track_files = [arg.split("=")[1] for arg in command[6:-1:2]]
+            with open(track_files[1]) as f:
+                assert f.read() == "chr2\t0\t1\tnan\n"
+
+    mocker.patch("subprocess.run", side_effect=run)
+    files = [write_bigwig(tmp_path / "a.bw"), write_bigwig(tmp_path / "b.bw")]
+    outdir = tmp_path / "out"
+    outdir.mkdir()
+    load_chromosome("chr2", 300, files, str(outdir), str(tmp_path))
+    assert [command[:3] for command in commands[:2]] == [
+        ["bigWigToBedGraph", "-chrom=chr2", files[0]],
+        ["bigWigToBedGraph", "-chrom=chr2", files[1]],
+    ]
+    assert commands[2][4] == "--directory-mode"
+    assert (outdir / "chr2.genomedata").read_text() == "gd"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.bw", "b.bw", "out"]
+
+
 @pytest.mark.parametrize(
     "args,condition",
     [
@@ -32,6 +187,14 @@ def test_make_command():
         (["--sizes", "ch.sizes", "-o", "outfile"], pytest.raises(SystemExit)),
         (["--files", "b.bw", "-o", "outfile"], pytest.raises(SystemExit)),
         (["--sizes", "ch.sizes", "--files", "b.bw"], pytest.raises(SystemExit)),
+        (
+            ["--sizes", "ch.sizes", "--files", "b.bw", "-o", "outfile", "-j", "4"],
+            does_not_raise(),
+        ),
+        (
+            ["--sizes", "ch.sizes", "--files", "b.bw", "-o", "outfile", "-d"],
+            does_not_raise(),
+        ),
     ],
 )
 def test_get_parser(args: List[str], condition):
@@ -60,3 +223,154 @@ def test_main(mocker):
             "out.file",
         ],
     )
+
+
+def test_main_jobs(tmp_path, mocker):
+    mocker.patch("subprocess.run")
+    bigwig = write_bigwig(tmp_path / "ref.bw")
+    outfile = str(tmp_path / "out.file")
+    testargs = [
+        "prog",
+        "-j",
+        "2",
+        "--files",
+        bigwig,
+        "--sizes",
+        "c.sizes",
+        "-o",
+        outfile,
+    ]
+    mocker.patch("sys.argv", testargs)
+    main()
+    conversion, load = subprocess.run.call_args_list
+    bedgraph = conversion[0][0][2]
+    assert conversion[0][0] == ["bigWigToBedGraph", bigwig, bedgraph]
+    assert bedgraph.startswith(str(tmp_path))
+    assert load[0][0] == [
+        "genomedata-load",
+        "-s",
+        "c.sizes",
+        "--sizes",
+        "-t",
+        f"ref={bedgraph}",
+        outfile,
+    ]
+
+
+def test_main_cache(tmp_path, mocker):
+    def run(command, check=False):
+        with open(command[-1], "w") as f:
+            f.write("genomedata")
+        return subprocess.CompletedProcess(command, 0)
+
+    mocker.patch("subprocess.run", side_effect=run)
+    bigwig = write_bigwig(tmp_path / "ref.bw")
+    sizes = tmp_path / "c.sizes"
+    sizes.write_text("chr1\t100\n")
+    outfile = tmp_path / "out.genomedata"
+    testargs = ["prog", "--files", bigwig, "--sizes", str(sizes), "-o", str(outfile)]
+    mocker.patch("sys.argv", [*testargs, "--cache-dir", str(tmp_path / "cache")])
+    main()
+    outfile.unlink()
+    main()
+    assert subprocess.run.call_count == 1
+    assert outfile.read_text() == "genomedata"
+    renamed = write_bigwig(tmp_path / "other.bw")
+    testargs[2] = renamed
+    mocker.patch("sys.argv", [*testargs, "--cache-dir", str(tmp_path / "cache")])
+    main()
+    assert subprocess.run.call_count == 2
+
+
+def test_main_key_output(tmp_path, mocker):
+    def run(command, check=False):
+        with open(command[-1], "w") as f:
+            f.write("genomedata")
+        return subprocess.CompletedProcess(command, 0)
+
+    mocker.patch("subprocess.run", side_effect=run)
+    bigwig = write_bigwig(tmp_path / "ref.bw")
+    sizes = tmp_path / "c.sizes"
+    sizes.write_text("chr1\t100\n")
+    key_output = tmp_path / "key.txt"
+    testargs = [
+        "prog",
+        "--files",
+        bigwig,
+        "--sizes",
+        str(sizes),
+        "-o",
+        str(tmp_path / "out.genomedata"),
+        "--key-output",
+        str(key_output),
+    ]
+    mocker.patch("sys.argv", testargs)
+    main()
+    assert key_output.read_text() == ""
+    mocker.patch("sys.argv", [*testargs, "--cache-dir", str(tmp_path / "cache")])
+    main()
+    (entry,) = Cache(tmp_path / "cache").entries()
+    assert key_output.read_text() == entry.key
+
+
+@pytest.mark.parametrize(
+    "chroms,chrom_regex,expected",
+    [
+        (None, None, ["chr1", "chr10", "chr1_KI270706v1_random", "chrX", "chrEBV"]),
+        (["chrX", "chr1"], None, ["chr1", "chrX"]),
+        (None, "chr([0-9]+|X|Y)", ["chr1", "chr10", "chrX"]),
+    ],
+)
+def test_subset_chrom_sizes(tmp_path, chroms, chrom_regex, expected):
+    sizes = tmp_path / "chrom.sizes"
+    sizes.write_text(CHROM_SIZES)
+    output = tmp_path / "subset.sizes"
+    assert subset_chrom_sizes(str(sizes), str(output), chroms, chrom_regex) == expected
+    assert [line.split("\t")[0] for line in output.read_text().splitlines()] == expected
+
+
+@pytest.mark.parametrize(
+    "chroms,chrom_regex", [(["chr2", "chr1"], None), (None, "chr2[0-9]")]
+)
+def test_subset_chrom_sizes_missing_raises(tmp_path, chroms, chrom_regex):
+    sizes = tmp_path / "chrom.sizes"
+    sizes.write_text(CHROM_SIZES)
+    with pytest.raises(ValueError):
+        subset_chrom_sizes(str(sizes), str(tmp_path / "out"), chroms, chrom_regex)
+
+
+def test_main_chrom_regex(tmp_path, mocker):
+    mocker.patch("subprocess.run")
+    sizes = tmp_path / "chrom.sizes"
+    sizes.write_text(CHROM_SIZES)
+    output = str(tmp_path / "subset.sizes")
+    testargs = ["prog", "--files", "ref.bw", "--sizes", str(sizes), "-o", "out.file"]
+    mocker.patch("sys.argv", [*testargs, "--chrom-regex", "chr1"])
+    with pytest.raises(SystemExit):
+        main()
+    mocker.patch(
+        "sys.argv", [*testargs, "--chrom-regex", "chr1", "--sizes-output", output]
+    )
+    main()
+    assert subprocess.run.call_args[0][0][2] == output
+    with open(output) as f:
+        assert f.read() == "chr1\t248956422\n"
+
+
+def test_main_load_failure_raises(tmp_path, mocker):
+    """
+    A failed load must fail the task, not leave a partial genomedata in the cache.
+    """
+    mocker.patch(
+        "subprocess.run",
+        side_effect=subprocess.CalledProcessError(1, "genomedata-load"),
+    )
+    bigwig = write_bigwig(tmp_path / "ref.bw")
+    sizes = tmp_path / "c.sizes"
+    sizes.write_text("chr1\t100\n")
+    cache_dir = tmp_path / "cache"
+    testargs = ["prog", "--files", bigwig, "--sizes", str(sizes), "-o", "out.file"]
+    mocker.patch("sys.argv", [*testargs, "--cache-dir", str(cache_dir)])
+    with pytest.raises(subprocess.CalledProcessError):
+        main()
+    assert Cache(cache_dir).entries() == []
@@ -0,0 +1,104 @@
+import gzip
+import io
+
+import pytest
+
+from segway_pipeline.compressed_io import open_output
+from segway_pipeline.merge_beds import main, merge_beds
+
+CHROM_SIZES = "chr1\t10000\nchr2\t8000\nchr10\t6000\nchrX\t4000\n"
+
+
+def make_rows(chrom, num_rows):
+    return "".join(
+        f"{chrom}\t{i * 100}\t{(i + 1) * 100}\t{i % 3}\t0\t.\t{i * 100}\t{(i + 1) * 100}"
+        "\t1,2,3\n"
+        for i in range(num_rows)
+    )
+
+
+ROWS = {chrom: make_rows(chrom, n) for chrom, n in (("chr1", 3), ("chr2", 2))}
+ROWS.update({chrom: make_rows(chrom, n) for chrom, n in (("chr10", 4), ("chrX", 1))})
+
+
+def write_bed(path, chroms, header="track name=segway.abc\n", compression="bgzf"):
+    with open_output(path, compression=compression) as f:
+        f.write(header + "".join(ROWS[chrom] for chrom in chroms))
+    return str(path)
+
+
+@pytest.mark.parametrize("compression", [None, "bgzf"])
+def test_merge_beds(tmp_path, compression):
+    beds = [
+        write_bed(tmp_path / "0.bed", ["chrX", "chr1"], compression=compression),
+        write_bed(
+            tmp_path / "1.bed",
+            ["chr2", "chr10"],
+            header="track name=segway.def\n",
+            compression=compression,
+        ),
+    ]
+    output = io.BytesIO()
+    num_records = merge_beds(beds, ["chr1", "chr10", "chr2", "chrX"], output)
+    assert num_records == 10
+    assert output.getvalue().decode() == (
+        "track name=segway.abc\n"
+        + ROWS["chr1"]
+        + ROWS["chr10"]
+        + ROWS["chr2"]
+        + ROWS["chrX"]
+    )
+
+
+def test_merge_beds_no_header_skips_missing_chroms(tmp_path):
+    beds = [write_bed(tmp_path / "0.bed", ["chr2"], header="")]
+    output = io.BytesIO()
+    assert merge_beds(beds, ["chr1", "chr2", "chrX"], output) == 2
+    assert output.getvalue().decode() == ROWS["chr2"]
+
+
+def test_merge_beds_overlapping_shards_raises(tmp_path):
+    beds = [
+        write_bed(tmp_path / "0.bed", ["chr1", "chr2"]),
+        write_bed(tmp_path / "1.bed", ["chr2"]),
+    ]
+    with pytest.raises(ValueError, match="chr2"):
+        merge_beds(beds, ["chr1", "chr2"], io.BytesIO())
+
+
+def test_merge_beds_unknown_chrom_raises(tmp_path):
+    beds = [write_bed(tmp_path / "0.bed", ["chr1", "chrX"])]
+    with pytest.raises(ValueError, match="chrX"):
+        merge_beds(beds, ["chr1"], io.BytesIO())
+
+
+def test_merge_beds_gzip_raises(tmp_path):
+    beds = [write_bed(tmp_path / "0.bed.gz", ["chr1"], compression="gzip")]
+    with pytest.raises(ValueError):
+        merge_beds(beds, ["chr1"], io.BytesIO())
+
+
+@pytest.mark.parametrize(
+    "extra_args,order",
+    [
+        ([], ["chr1", "chr2", "chr10", "chrX"]),
+        (["--sort-chroms"], ["chr1", "chr10", "chr2", "chrX"]),
+    ],
+)
+def test_main(tmp_path, mocker, extra_args, order):
+    sizes = tmp_path / "chrom.sizes"
+    sizes.write_text(CHROM_SIZES)
+    beds = [
+        write_bed(tmp_path / "0.bed.gz", ["chr1", "chrX"]),
+        write_bed(tmp_path / "1.bed.gz", ["chr2", "chr10"]),
+    ]
+    output = tmp_path / "segway.bed.gz"
+    mocker.patch(
+        "sys.argv",
+        ["prog", "--chrom-sizes", str(sizes), "-o", str(output), *extra_args, *beds],
+    )
+    main()
+    with gzip.open(output, "rt") as f:
+        assert f.read() == "track name=segway.abc\n" + "".join(
+            ROWS[chrom] for chrom in order
+        )
@@ -0,0 +1,124 @@
+import gzip
+from io import BytesIO
+
+import pytest
+
+from segway_pipeline.parallel_remap import (
+    find_shard_ranges,
+    remap_bed_parallel,
+    remap_shard,
+)
+from segway_pipeline.vectorized_remap import remap_bed
+
+HEADER = 'track description="foo" itemRgb=on name=segway\n'
+ROWS = "".join(
+    f"chr19\t{i * 100}\t{(i + 1) * 100}\t{i % 3}\t1000\t.\t{i * 100}\t{(i + 1) * 100}\t"
+    "102,102,102\n"
+    for i in range(200)
+)
+MNEMONICS = {"0": "foo", "1": "bar", "2": "baz"}
+COLORS = {"foo": "255,0,0", "bar": "255,195,77", "baz": "0,128,0"}
+
+
+@pytest.fixture
+def bed_path(tmp_path):
+    path = tmp_path / "in.bed"
+    path.write_text(HEADER + ROWS)
+    return path
+
+
+def test_find_shard_ranges(bed_path):
+    data = bed_path.read_bytes()
+    result = find_shard_ranges(bed_path, len(HEADER), jobs=4, chunk_size=1000)
+    assert result[0][0] == len(HEADER)
+    assert result[-1][1] == len(data)
+    assert len(result) >= 4
+    for (_, end), (start, _) in zip(result[:-1], result[1:]):
+        assert end == start
+        assert data[end - 1 : end] == b"\n"
+
+
+def test_find_shard_ranges_header_only(tmp_path):
+    path = tmp_path / "in.bed"
+    path.write_text(HEADER)
+    assert find_shard_ranges(path, len(HEADER), jobs=2) == []
+
+
+def test_remap_shard():
+    output, relabeled = remap_shard(
+        b"chr19\t0\t100\t0\t1000\t.\t0\t100\t1,1,1\n", MNEMONICS, COLORS, tee=True
+    )
+    assert output == b"chr19\t0\t100\tfoo\t1000\t.\t0\t100\t255,0,0\n"
+    assert relabeled == b"chr19\t0\t100\tfoo\t1000\t.\t0\t100\t1,1,1\n"
+
+
+@pytest.mark.parametrize("compress", [False, True])
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_remap_bed_parallel_matches_serial(tmp_path, bed_path, compress, jobs):
+    if compress:
+        path = tmp_path / "in.bed.gz"
+        path.write_bytes(gzip.compress(bed_path.read_bytes()))
+    else:
+        path = bed_path
+    expected = BytesIO()
+    expected_relabeled = BytesIO()
+    remap_bed(
+        BytesIO((HEADER + ROWS).encode()),
+        expected,
+        mnemonics=MNEMONICS,
+        colors=COLORS,
+        relabeled_file_handle=expected_relabeled,
+    )
+    output = BytesIO()
+    relabeled = BytesIO()
+    remap_bed_parallel(
+        path,
+        output,
+        mnemonics=MNEMONICS,
+        colors=COLORS,
+        jobs=jobs,
+        chunk_size=500,
+        relabeled_file_handle=relabeled,
+    )
+    assert output.getvalue() == expected.getvalue()
+    assert relabeled.getvalue() == expected_relabeled.getvalue()
+    assert output.getvalue().count(b"track") == 1
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_remap_bed_parallel_coalesce_matches_serial(tmp_path, bed_path, compress):
+    if compress:
+        path = tmp_path / "in.bed.gz"
+        path.write_bytes(gzip.compress(bed_path.read_bytes()))
+    else:
+        path = bed_path
+    # Runs of two labels out of every three, so plenty of them span the shards
+    mnemonics = {"0": "foo", "1": "foo", "2": "baz"}
+    expected = BytesIO()
+    expected_num_merged = remap_bed(
+        BytesIO((HEADER + ROWS).encode()),
+        expected,
+        mnemonics=mnemonics,
+        colors=COLORS,
+        coalesce=True,
+    )
+    output = BytesIO()
+    relabeled = BytesIO()
+    num_merged = remap_bed_parallel(
+        path,
+        output,
+        mnemonics=mnemonics,
+        colors=COLORS,
+        jobs=3,
+        chunk_size=500,
+        relabeled_file_handle=relabeled,
+        coalesce=True,
+    )
+    assert output.getvalue() == expected.getvalue()
+    assert num_merged == expected_num_merged == 67
+    assert relabeled.getvalue().count(b"\n") == 1 + 200 - 67
+
+
+def test_remap_bed_parallel_invalid_jobs_raises(bed_path):
+    with pytest.raises(ValueError):
+        remap_bed_parallel(bed_path, BytesIO(), jobs=0)
@@ -0,0 +1,183 @@
+import json
+
+import pytest
+
+from segway_pipeline.plan_resources import (
+    GIB,
+    MAX_ANNOTATE_MEMORY_GB,
+    MAX_CPUS,
+    MAX_DISK_GB,
+    MAX_TRAIN_MEMORY_GB,
+    ResourcePlan,
+    count_windows,
+    estimate_job_memory,
+    fit_jobs,
+    main,
+    plan_resources,
+)
+
+GENOME = {f"chr{i}": 250000000 - i * 8000000 for i in range(1, 23)}
+GENOME.update({"chrX": 156040895, "chrY": 57227415})
+
+
+def test_plan_resources_small():
+    plan = plan_resources(
+        {"chr19": 58617616},
+        num_tracks=3,
+        resolution=100,
+        minibatch_fraction=0.01,
+        num_instances=10,
+        num_labels=13,
+    )
+    # chr19 is split into 30 windows, a CPU for each when annotating
+    assert plan == ResourcePlan(
+        train_cpus=10,
+        train_memory_gb=15,
+        annotate_cpus=30,
+        annotate_memory_gb=35,
+        disk_gb=21,
+    )
+
+
+def test_plan_resources_genome_uses_all_cpus():
+    plan = plan_resources(
+        GENOME,
+        num_tracks=40,
+        resolution=100,
+        minibatch_fraction=0.01,
+        num_instances=10,
+        num_labels=22,
+    )
+    assert plan.train_cpus == MAX_CPUS
+    assert plan.annotate_cpus == MAX_CPUS
+
+
+def test_plan_resources_split_sequences():
+    kwargs = dict(
+        num_tracks=3,
+        resolution=100,
+        minibatch_fraction=1,
+        num_instances=1,
+        num_labels=13,
+    )
+    plan = plan_resources({"chr19": 58617616}, split_sequences=10000000, **kwargs)
+    assert plan.annotate_cpus == 6
+    assert plan.train_cpus == 6
+
+
+def test_plan_resources_invalid_split_sequences_raises():
+    with pytest.raises(ValueError):
+        plan_resources({"chr1": 1000}, 1, 100, 0.01, 10, 12, split_sequences=0)
+
+
+def test_plan_resources_within_bounds():
+    plan = plan_resources(
+        GENOME,
+        num_tracks=100,
+        resolution=1,
+        minibatch_fraction=1,
+        num_instances=100,
+        num_labels=30,
+    )
+    # The memory bounds can't fit a job per CPU at base resolution with this many tracks
+    assert 1 <= plan.train_cpus < MAX_CPUS
+    assert 1 <= plan.annotate_cpus < MAX_CPUS
+    assert plan.train_memory_gb <= MAX_TRAIN_MEMORY_GB
+    assert plan.annotate_memory_gb <= MAX_ANNOTATE_MEMORY_GB
+    assert plan.disk_gb == MAX_DISK_GB
+
+
+def test_plan_resources_grows_with_inputs():
+    kwargs = dict(resolution=100, minibatch_fraction=0.01, num_instances=10)
+    small = plan_resources(GENOME, num_tracks=5, num_labels=14, **kwargs)
+    large = plan_resources(GENOME, num_tracks=40, num_labels=22, **kwargs)
+    assert large.train_memory_gb > small.train_memory_gb
+    assert large.annotate_memory_gb > small.annotate_memory_gb
+    assert large.disk_gb > small.disk_gb
+
+
+def test_plan_resources_empty_chrom_sizes_raises():
+    with pytest.raises(ValueError):
+        plan_resources({}, 1, 100, 0.01, 10, 12)
+
+
+@pytest.mark.parametrize(
+    "sizes,expected", [([1], 1), ([10, 11], 3), ([10, 20, 21], 6), ([], 0)]
+)
+def test_count_windows(sizes, expected):
+    assert count_windows(sizes, 10) == expected
+
+
+def test_estimate_job_memory():
+    assert estimate_job_memory(1000, 2, 3, 100) == GIB + 10 * (2 + 3) * 16
+
+
+@pytest.mark.parametrize(
+    "num_jobs,job_bytes,expected",
+    [
+        (10, GIB, (10, 14)),
+        (200, GIB, (96, 100)),
+        # Only 65 jobs of 3 GiB fit in 200 GB besides segway itself
+        (200, 3 * GIB, (65, 199)),
+        (10, 300 * GIB, (1, 200)),
+    ],
+)
+def test_fit_jobs(num_jobs, job_bytes, expected):
+    assert fit_jobs(num_jobs, job_bytes, 96, 200) == expected
+
+
+def test_main(tmp_path, mocker):
+    sizes = tmp_path / "chrom.sizes"
+    sizes.write_text("chr19\t58617616\n\n")
+    outfile = tmp_path / "resources.json"
+    testargs = [
+        "prog",
+        "--sizes",
+        str(sizes),
+        "--num-tracks",
+        "3",
+        "--resolution",
+        "100",
+        "--minibatch-fraction",
+        "0.01",
+        "--num-instances",
+        "10",
+        "--num-labels",
+        "13",
+        "--max-cpus",
+        "4",
+        "-o",
+        str(outfile),
+    ]
+    mocker.patch("sys.argv", testargs)
+    main()
+    with open(outfile) as f:
+        resources = json.load(f)
+    assert resources == {
+        "annotate_cpus": 4,
+        "annotate_memory_gb": 9,
+        "disk_gb": 21,
+        "train_cpus": 4,
+        "train_memory_gb": 9,
+    }
+
+
+def test_plan_resources_annotate_shards():
+    kwargs = dict(
+        num_tracks=40,
+        resolution=100,
+        minibatch_fraction=0.01,
+        num_instances=10,
+        num_labels=22,
+        max_cpus=2000,
+        max_annotate_memory_gb=4000,
+    )
+    whole = plan_resources(GENOME, **kwargs)
+    sharded = plan_resources(GENOME, num_annotate_shards=8, **kwargs)
+    assert whole.annotate_cpus == count_windows(GENOME.values(), 2000000)
+    # The shard with the most windows
+    assert sharded.annotate_cpus == 243
+    assert sharded.annotate_memory_gb < whole.annotate_memory_gb
+    assert sharded._replace(annotate_cpus=0, annotate_memory_gb=0) == whole._replace(
+        annotate_cpus=0, annotate_memory_gb=0
+    )
@@ -1,8 +1,25 @@
-from io import StringIO
+import gzip
+from io import BytesIO, StringIO
 
 import pytest
 
-from segway_pipeline.recolor_bed import Colors, Rgb, process_row, recolor_bed
+from segway_pipeline.recolor_bed import (
+    Colors,
+    Rgb,
+    main,
+    make_color_bytes,
+    make_color_strings,
+    process_row,
+    recolor_bed,
+    recolor_bed_mmap,
+)
+
+BED_DATA = (
+    'track autoScale=off description="foo" itemRgb=on name=segway viewLimits=0:1 '
+    "visibility=dense\n"
+    "chr19\t0\t90800\tfoo\t1000\t.\t0\t90800\t102,102,102\n"
+    "chr19\t90800\t91100\tbar\t1000\t.\t90800\t91100\t217,95,2\n"
+)
 
 
 @pytest.mark.parametrize("args", [(256, 0, 0), (23, -1, 9)])
@@ -37,6 +54,49 @@ def test_recolor_bed():
     )
 
 
+def test_make_color_strings():
+    result = make_color_strings({"foo": Colors.RED, "bar": Colors.ORANGE})
+    assert result == {"foo": "255,0,0", "bar": "255,195,77"}
+
+
+def test_make_color_bytes():
+    result = make_color_bytes({"foo": Colors.RED})
+    assert result == {b"foo": b"255,0,0"}
+
+
+@pytest.mark.parametrize("trailing_newline", [True, False])
+def test_recolor_bed_mmap_matches_recolor_bed(tmp_path, trailing_newline):
+    labels_to_colors = {"foo": Colors.RED, "bar": Colors.ORANGE}
+    bed_data = BED_DATA if trailing_newline else BED_DATA.rstrip("\n")
+    bed_path = tmp_path / "in.bed"
+    bed_path.write_text(bed_data)
+    expected = StringIO("w", newline="")
+    recolor_bed(StringIO(bed_data), expected, labels_to_colors=labels_to_colors)
+    output_file_handle = BytesIO()
+    recolor_bed_mmap(
+        bed_path, output_file_handle, labels_to_colors=labels_to_colors, batch_size=1
+    )
+    assert output_file_handle.getvalue() == expected.getvalue().encode()
+
+
+def test_recolor_bed_mmap_unknown_label_raises(tmp_path):
+    bed_path = tmp_path / "in.bed"
+    bed_path.write_text(BED_DATA)
+    with pytest.raises(KeyError, match="bar"):
+        recolor_bed_mmap(bed_path, BytesIO(), labels_to_colors={"foo": Colors.RED})
+
+
+def test_main_mmap_backend_compressed_input_raises(tmp_path, mocker):
+    bed_path = tmp_path / "in.bed.gz"
+    bed_path.write_bytes(gzip.compress(BED_DATA.encode()))
+    mocker.patch(
+        "sys.argv",
+        ["prog", "--backend", "mmap", "-o", str(tmp_path / "out.bed"), str(bed_path)],
+    )
+    with pytest.raises(SystemExit):
+        main()
+
+
 def test_process_row():
     labels_to_colors = {"foo": Colors.RED}
     row = ["chr19", "0", "90800", "foo", "1000", ".", "0", "90800", "102,102,102"]
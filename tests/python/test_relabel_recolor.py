@@ -0,0 +1,119 @@
+from contextlib import suppress as does_not_raise
+from io import StringIO
+from typing import List
+
+import pytest
+
+from segway_pipeline.recolor_bed import Colors, recolor_bed
+from segway_pipeline.relabel import relabel
+from segway_pipeline.relabel_recolor import (
+    get_parser,
+    recolor_row,
+    relabel_recolor,
+    relabel_row,
+)
+
+BED_DATA = (
+    'track autoScale=off description="foo" itemRgb=on name=segway viewLimits=0:1 '
+    "visibility=dense\n"
+    "chr19\t0\t90800\t0\t1000\t.\t0\t90800\t102,102,102\n"
+    "chr19\t90800\t91100\t1\t1000\t.\t90800\t91100\t217,95,2\n"
+)
+
+
+@pytest.fixture
+def mnemonics():
+    return "old\tnew\n0\tfoo\n1\tbar\n"
+
+
+@pytest.fixture
+def labels_to_colors():
+    return {"foo": Colors.RED, "bar": Colors.ORANGE}
+
+
+def test_relabel_recolor(mnemonics, labels_to_colors):
+    output_file_handle = StringIO("w", newline="")
+    relabel_recolor(
+        StringIO(initial_value=BED_DATA),
+        StringIO(initial_value=mnemonics),
+        output_file_handle,
+        labels_to_colors=labels_to_colors,
+    )
+    assert output_file_handle.getvalue() == (
+        'track autoScale=off description="foo" itemRgb=on name=segway viewLimits=0:1 '
+        "visibility=dense\n"
+        "chr19\t0\t90800\tfoo\t1000\t.\t0\t90800\t255,0,0\n"
+        "chr19\t90800\t91100\tbar\t1000\t.\t90800\t91100\t255,195,77\n"
+    )
+
+
+def test_relabel_recolor_matches_separate_passes(mnemonics, labels_to_colors):
+    relabeled = StringIO("w", newline="")
+    relabel(
+        StringIO(initial_value=BED_DATA), StringIO(initial_value=mnemonics), relabeled
+    )
+    expected = StringIO("w", newline="")
+    recolor_bed(
+        StringIO(initial_value=relabeled.getvalue()),
+        expected,
+        labels_to_colors=labels_to_colors,
+    )
+    output_file_handle = StringIO("w", newline="")
+    relabeled_file_handle = StringIO("w", newline="")
+    relabel_recolor(
+        StringIO(initial_value=BED_DATA),
+        StringIO(initial_value=mnemonics),
+        output_file_handle,
+        labels_to_colors=labels_to_colors,
+        relabeled_file_handle=relabeled_file_handle,
+    )
+    assert output_file_handle.getvalue() == expected.getvalue()
+    assert relabeled_file_handle.getvalue() == relabeled.getvalue()
+
+
+def test_relabel_recolor_unknown_label_raises(labels_to_colors):
+    with pytest.raises(KeyError):
+        relabel_recolor(
+            StringIO(initial_value=BED_DATA),
+            StringIO(initial_value="old\tnew\n0\tfoo\n1\tqux\n"),
+            StringIO("w", newline=""),
+            labels_to_colors=labels_to_colors,
+        )
+
+
+def test_relabel_row():
+    row = ["chr19", "0", "90800", "0", "1000", ".", "0", "90800", "102,102,102"]
+    result = relabel_row(row, {"0": "foo"})
+    assert result[3] == "foo"
+
+
+def test_recolor_row():
+    row = ["chr19", "0", "90800", "foo", "1000", ".", "0", "90800", "102,102,102"]
+    result = recolor_row(row, {"foo": "255,0,0"})
+    assert result[-1] == "255,0,0"
+
+
+@pytest.mark.parametrize(
+    "args,condition",
+    [
+        (["in.bed", "mnemonics.txt", "-o", "out.bed"], does_not_raise()),
+        (["-", "mnemonics.txt", "-o", "out.bed"], does_not_raise()),
+        (
+            [
+                "in.bed",
+                "mnemonics.txt",
+                "-o",
+                "out.bed",
+                "--relabeled-output-filename",
+                "relabeled.bed",
+            ],
+            does_not_raise(),
+        ),
+        (["in.bed", "-o", "out.bed"], pytest.raises(SystemExit)),
+        (["in.bed", "mnemonics.txt"], pytest.raises(SystemExit)),
+    ],
+)
+def test_get_parser(args: List[str], condition):
+    parser = get_parser()
+    with condition:
+        parser.parse_args(args)
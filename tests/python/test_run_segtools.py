@@ -0,0 +1,189 @@
+import json
+import sys
+
+import pytest
+
+from segway_pipeline.run_segtools import (
+    COMMAND_NOT_FOUND_STATUS,
+    FEATURE_AGGREGATION_SCRIPT,
+    LENGTH_DISTRIBUTION_SCRIPT,
+    SEGTOOLS,
+    SIGNAL_DISTRIBUTION_SCRIPT,
+    get_exit_status,
+    main,
+    make_commands,
+    run_tool,
+    run_tools,
+)
+
+
+def python_command(code):
+    return [sys.executable, "-c", code]
+
+
+def test_make_commands():
+    commands = make_commands("seg.bed.gz", "params.params", "anno.gtf", "gd", 500)
+    assert tuple(commands) == SEGTOOLS
+    assert commands["aggregation"] == [
+        sys.executable,
+        str(FEATURE_AGGREGATION_SCRIPT),
+        "--plot",
+        "-o",
+        "feature_aggregation",
+        "--flank-bases=500",
+        "seg.bed.gz",
+        "anno.gtf",
+    ]
+    assert commands["gmtk_parameters"][-1] == "params.params"
+    assert commands["length_distribution"][:3] == [
+        sys.executable,
+        str(LENGTH_DISTRIBUTION_SCRIPT),
+        "--plot",
+    ]
+    assert LENGTH_DISTRIBUTION_SCRIPT.is_file()
+    assert FEATURE_AGGREGATION_SCRIPT.is_file()
+    assert SIGNAL_DISTRIBUTION_SCRIPT.is_file()
+    assert commands["signal_distribution"] == [
+        sys.executable,
+        str(SIGNAL_DISTRIBUTION_SCRIPT),
+        "--plot",
+        "--transformation",
+        "arcsinh",
+        "--jobs=1",
+        "--sample-fraction=1.0",
+        "-o",
+        "signal_distribution",
+        "seg.bed.gz",
+        "gd",
+    ]
+
+
+def test_make_commands_jobs():
+    commands = make_commands("seg.bed.gz", "p", "a.gtf", "gd", 1, 4, 0.1)
+    assert "--jobs=4" in commands["signal_distribution"]
+    assert "--sample-fraction=0.1" in commands["signal_distribution"]
+    assert not any(arg.startswith("--jobs") for arg in commands["aggregation"])
+
+
+def test_run_tool(tmp_path):
+    log = tmp_path / "tool.log"
+    result = run_tool(
+        python_command("import sys; print('out'); sys.exit('err')"),
+        log,
+    )
+    assert result.exit_status == 1
+    assert result.wall_seconds > 0
+    assert result.peak_rss_mb > 0
+    assert log.read_text().splitlines() == ["out", "err"]
+
+
+def test_run_tool_killed(tmp_path):
+    result = run_tool(
+        python_command("import os, signal; os.kill(os.getpid(), signal.SIGKILL)"),
+        tmp_path / "tool.log",
+    )
+    assert result.exit_status == -9
+
+
+def test_run_tool_missing_command(tmp_path):
+    log = tmp_path / "tool.log"
+    result = run_tool([str(tmp_path / "missing")], log)
+    assert result.exit_status == COMMAND_NOT_FOUND_STATUS
+    assert "missing" in log.read_text()
+
+
+@pytest.mark.parametrize("status,expected", [(0, 0), (3 << 8, 3), (15, -15)])
+def test_get_exit_status(status, expected):
+    assert get_exit_status(status) == expected
+
+
+def test_run_tools_concurrently(tmp_path):
+    """
+    The first tool only succeeds if the second one runs while it waits.
+    """
+    flag = tmp_path / "flag"
+    commands = {
+        "waiter": python_command(
+            "import os, sys, time\n"
+            "deadline = time.time() + 30\n"
+            f"while not os.path.exists({str(flag)!r}):\n"
+            "    if time.time() > deadline:\n"
+            "        sys.exit(1)\n"
+            "    time.sleep(0.01)\n"
+        ),
+        "writer": python_command(f"open({str(flag)!r}, 'w').close()"),
+        "failer": python_command("raise SystemExit(2)"),
+    }
+    results = run_tools(commands, 2, str(tmp_path / "logs"))
+    assert list(results) == ["waiter", "writer", "failer"]
+    assert [result.exit_status for result in results.values()] == [0, 0, 2]
+    assert sorted(path.name for path in (tmp_path / "logs").iterdir()) == [
+        "failer.log",
+        "waiter.log",
+        "writer.log",
+    ]
+
+
+def run_main(tmp_path, mocker, statuses, extra_args):
+    mocker.patch(
+        "segway_pipeline.run_segtools.make_commands",
+        return_value={
+            name: python_command(f"raise SystemExit({statuses.get(name, 0)})")
+            for name in SEGTOOLS
+        },
+    )
+    report = tmp_path / "report.json"
+    testargs = [
+        "prog",
+        "--segway-output-bed",
+        "seg.bed.gz",
+        "--segway-params",
+        "params.params",
+        "--annotation-gtf",
+        "anno.gtf",
+        "--genomedata",
+        "gd",
+        "--flank-bases",
+        "500",
+        "--log-dir",
+        str(tmp_path / "logs"),
+        "-r",
+        str(report),
+        *extra_args,
+    ]
+    mocker.patch("sys.argv", testargs)
+    main()
+    with open(report) as f:
+        return json.load(f)
+
+
+def test_main_allowed_failure(tmp_path, mocker):
+    report = run_main(
+        tmp_path,
+        mocker,
+        {"signal_distribution": 1},
+        ["--allow-failure", "signal_distribution", "-j", "2"],
+    )
+    assert report["jobs"] == 2
+    assert list(report["tools"]) == sorted(SEGTOOLS)
+    signal_distribution = report["tools"]["signal_distribution"]
+    assert signal_distribution["exit_status"] == 1
+    assert signal_distribution["allow_failure"]
+    assert signal_distribution["log"] == str(tmp_path / "logs/signal_distribution.log")
+    assert report["tools"]["aggregation"]["exit_status"] == 0
+    assert not report["tools"]["aggregation"]["allow_failure"]
+
+
+def test_main_failure_raises(tmp_path, mocker, capsys):
+    with pytest.raises(SystemExit, match="aggregation"):
+        run_main(
+            tmp_path,
+            mocker,
+            {"signal_distribution": 1, "aggregation": 3},
+            ["--allow-failure", "signal_distribution"],
+        )
+    with open(tmp_path / "report.json") as f:
+        report = json.load(f)
+    assert report["tools"]["aggregation"]["exit_status"] == 3
+    assert report["tools"]["length_distribution"]["exit_status"] == 0
+    assert "signal_distribution failed with exit status 1" in capsys.readouterr().err
@@ -0,0 +1,138 @@
+import gzip
+from io import BytesIO, StringIO
+
+import numpy as np
+import pytest
+
+from segway_pipeline.recolor_bed import LABELS_TO_COLORS, make_color_strings
+from segway_pipeline.relabel_recolor import main, relabel_recolor
+from segway_pipeline.segmentation import (
+    is_segmentation,
+    load_input,
+    load_segmentation,
+    read_bed,
+    save_output,
+    uses_segmentation,
+)
+
+BED_DATA = (
+    'track autoScale=off description="foo" itemRgb=on name=segway viewLimits=0:1 '
+    "visibility=dense\n"
+    "chr19\t0\t90800\t0\t1000\t.\t0\t90800\t102,102,102\n"
+    "chr19\t90800\t91100\t1\t1000\t.\t90800\t91100\t217,95,2\n"
+    "chr2\t0\t100\t0\t1000\t.\t0\t100\t102,102,102\n"
+)
+MNEMONICS = "old\tnew\n0\tQuiescent\n1\tPromoter\n"
+
+
+def to_bed(segmentation):
+    output = BytesIO()
+    segmentation.write_bed(output)
+    return output.getvalue().decode()
+
+
+def test_read_bed():
+    segmentation = read_bed(StringIO(BED_DATA))
+    assert len(segmentation) == 3
+    assert segmentation.starts.dtype == np.uint32
+    assert segmentation.starts.tolist() == [0, 90800, 0]
+    assert segmentation.values["chrom"] == ["chr19", "chr2"]
+    assert segmentation.codes["chrom"].tolist() == [0, 0, 1]
+    assert segmentation.codes["name"].dtype == np.uint8
+    assert segmentation.thick_starts is None
+    assert to_bed(segmentation) == BED_DATA
+
+
+def test_read_bed_keeps_thick_coordinates():
+    bed = BED_DATA.replace("\t90800\t91100\t217", "\t90900\t91000\t217")
+    segmentation = read_bed(StringIO(bed))
+    assert segmentation.thick_starts.tolist() == [0, 90900, 0]
+    assert to_bed(segmentation) == bed
+
+
+@pytest.mark.parametrize(
+    "bed,match",
+    [
+        ("", "empty"),
+        ("track\nchr19\t0\t10\n", "Expected 9 columns"),
+        ("track\nchr19\t00\t10\t0\t0\t.\t0\t10\t0,0,0\n", "exactly"),
+    ],
+)
+def test_read_bed_raises(bed, match):
+    with pytest.raises(ValueError, match=match):
+        read_bed(StringIO(bed))
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load_round_trip(tmp_path, mmap):
+    path = tmp_path / "segway.npz"
+    bed = gzip.open("tests/data/segway.bed.gz", "rt").read()
+    read_bed(StringIO(bed)).save(path)
+    assert is_segmentation(path)
+    segmentation = load_segmentation(path, mmap=mmap)
+    assert isinstance(segmentation.starts, np.memmap) == mmap
+    assert to_bed(segmentation) == bed
+
+
+def test_load_input_and_save_output(tmp_path):
+    bed_path = tmp_path / "in.bed.gz"
+    bed_path.write_bytes(gzip.compress(BED_DATA.encode()))
+    assert not is_segmentation(bed_path)
+    segmentation_path = tmp_path / "out.npz"
+    save_output(load_input(bed_path), segmentation_path)
+    bed_output_path = tmp_path / "out.bed.gz"
+    save_output(load_input(segmentation_path), bed_output_path)
+    assert gzip.decompress(bed_output_path.read_bytes()).decode() == BED_DATA
+
+
+def test_uses_segmentation(tmp_path):
+    bed_path = tmp_path / "in.bed"
+    bed_path.write_text(BED_DATA)
+    assert not uses_segmentation(bed_path, "out.bed.gz")
+    assert uses_segmentation(bed_path, "out.npz")
+    assert not uses_segmentation("-", "out.bed")
+
+
+def test_relabel_recolor_matches_text():
+    """
+    Recoloring reuses the label codes as the color codes rather than copying them.
+    """
+    segmentation = read_bed(StringIO(BED_DATA))
+    relabeled = segmentation.relabel({"0": "Quiescent", "1": "Promoter"})
+    recolored = relabeled.recolor(make_color_strings(LABELS_TO_COLORS))
+    assert recolored.starts is segmentation.starts
+    assert recolored.codes["item_rgb"] is segmentation.codes["name"]
+    relabeled_output = StringIO(newline="")
+    output = StringIO(newline="")
+    relabel_recolor(
+        StringIO(BED_DATA),
+        StringIO(MNEMONICS),
+        output,
+        relabeled_file_handle=relabeled_output,
+    )
+    assert to_bed(relabeled) == relabeled_output.getvalue()
+    assert to_bed(recolored) == output.getvalue()
+
+
+def test_relabel_unknown_label_raises():
+    with pytest.raises(KeyError):
+        read_bed(StringIO(BED_DATA)).relabel({"0": "Quiescent"})
+
+
+def test_relabel_recolor_main_segmentation(tmp_path, mocker):
+    bed_path = tmp_path / "in.bed"
+    bed_path.write_text(BED_DATA)
+    segmentation_path = tmp_path / "in.npz"
+    read_bed(StringIO(BED_DATA)).save(segmentation_path)
+    mnemonics_path = tmp_path / "mnemonics.txt"
+    mnemonics_path.write_text(MNEMONICS)
+    outputs = []
+    for input_path in (bed_path, segmentation_path):
+        output_path = tmp_path / f"{input_path.name}.out.bed"
+        mocker.patch(
+            "sys.argv",
+            ["prog", "-o", str(output_path), str(input_path), str(mnemonics_path)],
+        )
+        main()
+        outputs.append(output_path.read_text())
+    assert outputs[0] == outputs[1]
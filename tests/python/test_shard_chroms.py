@@ -0,0 +1,49 @@
+import pytest
+
+from segway_pipeline.shard_chroms import main, shard_chroms
+
+CHROM_SIZES = {
+    "chr1": 250,
+    "chr2": 240,
+    "chr10": 130,
+    "chr11": 135,
+    "chr21": 45,
+    "chrX": 155,
+    "chrEBV": 1,
+}
+
+
+def test_shard_chroms():
+    shards = shard_chroms(CHROM_SIZES, 3)
+    assert shards == [["chr1", "chr21"], ["chr2", "chr10"], ["chr11", "chrX", "chrEBV"]]
+    totals = [sum(CHROM_SIZES[chrom] for chrom in shard) for shard in shards]
+    assert totals == [295, 370, 291]
+
+
+def test_shard_chroms_more_shards_than_chroms():
+    shards = shard_chroms({"chr1": 10, "chr2": 5}, 4)
+    assert shards == [["chr1"], ["chr2"]]
+
+
+def test_shard_chroms_single_shard_keeps_order():
+    assert shard_chroms(CHROM_SIZES, 1) == [list(CHROM_SIZES)]
+
+
+@pytest.mark.parametrize("chrom_sizes,num_shards", [({}, 2), (CHROM_SIZES, 0)])
+def test_shard_chroms_invalid_raises(chrom_sizes, num_shards):
+    with pytest.raises(ValueError):
+        shard_chroms(chrom_sizes, num_shards)
+
+
+def test_main(tmp_path, mocker):
+    sizes = tmp_path / "chrom.sizes"
+    sizes.write_text("chr1\t100\nchr2\t90\n\nchr3\t20\n")
+    outdir = tmp_path / "shards"
+    mocker.patch("sys.argv", ["prog", "-n", "2", "-o", str(outdir), str(sizes)])
+    main()
+    assert sorted(path.name for path in outdir.iterdir()) == [
+        "shard_0000.bed",
+        "shard_0001.bed",
+    ]
+    assert (outdir / "shard_0000.bed").read_text() == "chr1\t0\t100\n"
+    assert (outdir / "shard_0001.bed").read_text() == "chr2\t0\t90\nchr3\t0\t20\n"
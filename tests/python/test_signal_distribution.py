@@ -0,0 +1,474 @@
+import io
+import random
+import subprocess
+
+import numpy as np
+import pytest
+
+from segway_pipeline.segmentation import read_bed
+from segway_pipeline.signal_distribution import (
+    CONFIDENCE_Z,
+    SignalMoments,
+    Summary,
+    estimate,
+    get_base_labels,
+    iter_chunks,
+    main,
+    sample_blocks,
+    split_intervals,
+    summarize,
+    summarize_chrom,
+    summarize_chunks,
+    tile_intervals,
+    write_signal_distribution,
+)
+
+BED = (
+    "track name=segway.abc\n"
+    "chr1\t0\t4\t1\t1000\t.\t0\t4\t1,2,3\n"
+    "chr1\t6\t10\t0\t1000\t.\t6\t10\t1,2,3\n"
+    "chr2\t0\t3\t0\t1000\t.\t0\t3\t1,2,3\n"
+    "chr3\t0\t10\t1\t1000\t.\t0\t10\t1,2,3\n"
+)
+TRACKNAMES = ["h3k4me3", "dnase"]
+NAN = np.nan
+# chr1 has a supercontig from 2 to 8 and one from 9 to 12, chr3 isn't in the
+# genomedata
+SIGNAL = {
+    "chr1": [
+        (2, np.array([[1, 2], [3, NAN], [5, 6], [7, 8], [NAN, 10], [11, 12]])),
+        (9, np.array([[13, 14], [15, 16], [17, 18]])),
+    ],
+    "chr2": [(0, np.array([[0, 1], [2, 1], [4, 1]]))],
+}
+SIGNAL_DISTRIBUTION = (
+    "label\ttrackname\tmean\tsd\tn\n"
+    "1\th3k4me3\t2.0\t1.4142135623730950488\t2\n"
+    "1\tdnase\t2.0\tnan\t1\n"
+    "0\th3k4me3\t6.0\t5.7008771254956898955\t5\n"
+    "0\tdnase\t6.5\t6.1562975886485539517\t6\n"
+)
+
+
+class FakeSupercontig:
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+    def project(self, pos):
+        return pos - self.start
+
+
+class FakeChromosome:
+    def __init__(self, supercontigs):
+        self.supercontigs = supercontigs
+
+    def itercontinuous(self):
+        for start, continuous in self.supercontigs:
+            yield FakeSupercontig(start, start + len(continuous)), continuous
+
+
+class FakeGenome:
+    """
+    Just what is read from a genomedata archive, with the signal in `SIGNAL`.
+    """
+
+    tracknames_continuous = TRACKNAMES
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def __contains__(self, chrom):
+        return chrom in SIGNAL
+
+    def __getitem__(self, chrom):
+        return FakeChromosome(SIGNAL[chrom])
+
+
+def segtools_moments(starts, ends, labels, data, num_labels, transformation):
+    """
+    How segtools computes the mean and sd, from long double sums of the values of each
+    segment and of their squares, which are float32 like the signal.
+    """
+    shape = (num_labels, data.shape[1])
+    sums = np.zeros(shape, dtype=np.longdouble)
+    sums2 = np.zeros(shape, dtype=np.longdouble)
+    counts = np.zeros(shape, dtype=int)
+    for start, end, label in zip(starts, ends, labels):
+        for track in range(data.shape[1]):
+            values = data[start:end, track]
+            values = values[np.isfinite(values)]
+            if transformation:
+                values = np.arcsinh(values)
+            sums[label, track] += values.sum(dtype=np.longdouble)
+            sums2[label, track] += np.square(values).sum(dtype=np.longdouble)
+            counts[label, track] += len(values)
+    means = sums / counts
+    sds = np.sqrt((sums2 - np.square(sums) / counts) / (counts - 1))
+    return means, sds, counts
+
+
+def test_get_base_labels():
+    starts = np.array([2, 5, 9])
+    ends = np.array([4, 8, 12])
+    labels = np.array([3, 0, 1])
+    assert get_base_labels(starts, ends, labels, 0, 13).tolist() == [
+        -1,
+        -1,
+        3,
+        3,
+        -1,
+        0,
+        0,
+        0,
+        -1,
+        1,
+        1,
+        1,
+        -1,
+    ]
+    assert get_base_labels(starts, ends, labels, 3, 6).tolist() == [3, -1, 0]
+    assert get_base_labels(starts, ends, labels, 12, 15).tolist() == [-1, -1, -1]
+
+
+def test_get_base_labels_matches_searchsorted():
+    rng = np.random.default_rng(0)
+    bounds = np.sort(rng.choice(100000, size=2000, replace=False))
+    starts, ends = bounds[0::2], bounds[1::2]
+    labels = rng.integers(0, 5, size=len(starts))
+    positions = np.arange(40000, 60000)
+    indexes = np.searchsorted(starts, positions, side="right") - 1
+    covered = (indexes >= 0) & (positions < ends[indexes])
+    expected = np.where(covered, labels[indexes], -1)
+    assert np.array_equal(get_base_labels(starts, ends, labels, 40000, 60000), expected)
+
+
+def test_signal_moments_merge():
+    rng = np.random.default_rng(1)
+    values = rng.normal(1e6, 2.0, size=10000)
+    labels = rng.integers(0, 3, size=len(values))
+    moments = SignalMoments(3, 1)
+    for chunk in np.array_split(np.arange(len(values)), 7):
+        moments.add(labels[chunk], values[chunk, np.newaxis])
+    for label in range(3):
+        label_values = values[labels == label]
+        assert moments.n[label, 0] == len(label_values)
+        assert np.isclose(moments.get_means()[label, 0], label_values.mean())
+        assert np.isclose(
+            moments.get_sds()[label, 0], label_values.std(ddof=1), rtol=1e-9
+        )
+
+
+def test_signal_moments_empty():
+    moments = SignalMoments(2, 1)
+    moments.add(np.array([0, -1]), np.array([[1.0], [2.0]]))
+    assert moments.n.tolist() == [[1], [0]]
+    assert np.isnan(moments.get_sds()).all()
+    assert moments.get_means()[0, 0] == 1
+    assert np.isnan(moments.get_means()[1, 0])
+
+
+@pytest.mark.parametrize("transformation", [None, "arcsinh"])
+@pytest.mark.parametrize("chunk_bases", [1, 7, 1000, 100000])
+def test_summarize_chunks_matches_segtools(transformation, chunk_bases):
+    rng = random.Random(2)
+    starts, ends, labels = [], [], []
+    position = 0
+    while position < 20000:
+        position += rng.choice([0, 0, rng.randrange(1, 50)])
+        end = position + rng.randrange(1, 300)
+        starts.append(position)
+        ends.append(end)
+        labels.append(rng.randrange(4))
+        position = end
+    num_bases = ends[-1] + 10
+    data = np.random.default_rng(3).lognormal(size=(num_bases, 3)).astype(np.float32)
+    data[np.random.default_rng(4).random(data.shape) < 0.1] = np.nan
+    data[5, 1] = np.inf
+    chunks = (
+        (chunk_start, data[chunk_start : chunk_start + chunk_bases])
+        for chunk_start in range(0, num_bases, chunk_bases)
+    )
+    moments = summarize_chunks(
+        chunks,
+        np.array(starts),
+        np.array(ends),
+        np.array(labels),
+        4,
+        3,
+        transformation,
+    )
+    means, sds, counts = segtools_moments(starts, ends, labels, data, 4, transformation)
+    assert np.array_equal(moments.n, counts)
+    assert np.allclose(moments.get_means(), means, rtol=1e-15, atol=0)
+    # Rounding the squares to float32 costs segtools' sds their last digits, the
+    # exact sds square the values in float64
+    transformed = data if transformation is None else np.arcsinh(data)
+    _, exact_sds, _ = segtools_moments(
+        starts, ends, labels, transformed.astype(np.float64), 4, None
+    )
+    assert np.allclose(moments.get_sds(), exact_sds, rtol=1e-14, atol=0)
+    assert np.allclose(sds, exact_sds, rtol=1e-8, atol=0)
+
+
+def test_summarize_chrom_overlap_raises():
+    with pytest.raises(ValueError, match="chr1"):
+        summarize_chrom(
+            "gd", "chr1", np.array([0, 5]), np.array([10, 20]), np.array([0, 1]), 2, 1
+        )
+
+
+def test_iter_chunks():
+    chunks = iter_chunks(
+        FakeChromosome(SIGNAL["chr1"]), np.array([0, 7]), np.array([4, 11]), 2
+    )
+    assert [(start, data[:, 0].tolist()) for start, data in chunks] == [
+        (2, [1, 3]),
+        (7, [11]),
+        (9, [13, 15]),
+    ]
+
+
+def test_summarize(mocker):
+    mocker.patch("segway_pipeline.signal_distribution.Genome", FakeGenome)
+    segmentation = read_bed(io.StringIO(BED))
+    summary = summarize(segmentation, "gd", bases_per_chunk=4)
+    assert summary.tracknames == TRACKNAMES
+    assert summary.moments.n.tolist() == [[2, 1], [5, 6]]
+    assert summary.moments.get_means().tolist() == [[2, 2], [6, 6.5]]
+    assert summary.mean_errors is None
+
+
+def test_summarize_sampled_all_blocks(mocker):
+    """
+    With every block sampled the estimates are exact, and so have no error.
+    """
+    mocker.patch("segway_pipeline.signal_distribution.Genome", FakeGenome)
+    segmentation = read_bed(io.StringIO(BED))
+    exact = summarize(segmentation, "gd")
+    summary = summarize(
+        segmentation, "gd", sample_fraction=0.5, min_sampled_blocks=4, block_bases=2
+    )
+    assert np.array_equal(summary.moments.n, exact.moments.n)
+    assert np.allclose(summary.moments.get_means(), exact.moments.get_means())
+    assert np.allclose(
+        summary.moments.get_sds(), exact.moments.get_sds(), equal_nan=True
+    )
+    # Label 1 only has bases in one block of the supercontigs
+    assert np.isnan(summary.mean_errors[0]).all()
+    assert summary.mean_errors[1].tolist() == [0, 0]
+    assert summary.sd_errors[1].tolist() == [0, 0]
+
+
+def test_tile_intervals():
+    starts, ends = tile_intervals(np.array([0, 25]), np.array([20, 30]), 8)
+    assert starts.tolist() == [0, 8, 16, 25]
+    assert ends.tolist() == [8, 16, 20, 30]
+
+
+def test_split_intervals():
+    intervals, blocks, starts, ends = split_intervals(
+        np.array([0, 5, 12, 30]),
+        np.array([5, 12, 14, 40]),
+        np.array([2, 10, 20]),
+        np.array([10, 13, 30]),
+    )
+    assert intervals.tolist() == [0, 1, 1, 2]
+    assert blocks.tolist() == [0, 0, 1, 1]
+    assert starts.tolist() == [2, 5, 10, 12]
+    assert ends.tolist() == [5, 10, 12, 13]
+
+
+def test_sample_blocks():
+    # Labels 0 and 1 alternate in every block of 10 bases, except for the first 3
+    # blocks where label 2 replaces label 0, and label 3 has none
+    starts = np.arange(0, 10000, 5)
+    ends = starts + 5
+    labels = np.tile([0, 1], 1000)
+    labels[[0, 2, 4]] = 2
+    chroms = [("chr1", starts, ends, labels)]
+    supercontigs = [(np.array([0]), np.array([10000]))]
+    sample = sample_blocks(chroms, supercontigs, 4, 0.1, 20, seed=1, block_bases=10)
+    assert sample.num_clusters.tolist() == [997, 1000, 3, 0]
+    assert np.bincount(sample.cluster_labels, minlength=4).tolist() == [100, 100, 3, 0]
+    [(chrom, piece_starts, piece_ends, clusters)] = sample.cluster_pieces
+    assert chrom == "chr1"
+    assert np.all(piece_starts // 10 == (piece_ends - 1) // 10)
+    assert np.array_equal(np.unique(clusters), np.arange(203))
+    # The labels share a sample of about a tenth of the blocks
+    assert 100 <= len(np.unique(piece_starts // 10)) <= 103
+    same = sample_blocks(chroms, supercontigs, 4, 0.1, 20, seed=1, block_bases=10)
+    assert np.array_equal(same.cluster_pieces[0][1], piece_starts)
+    other = sample_blocks(chroms, supercontigs, 4, 0.1, 20, seed=2, block_bases=10)
+    assert not np.array_equal(other.cluster_pieces[0][1], piece_starts)
+
+
+def make_clustered_signal(rng, num_segments):
+    """
+    Segments of two labels whose signal is around a mean of their own.
+    """
+    lengths = rng.integers(5, 200, size=num_segments)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    labels = rng.integers(0, 2, size=num_segments)
+    segment_means = rng.normal(labels * 2.0, 1.0)
+    data = np.repeat(segment_means, lengths)[:, np.newaxis] + rng.normal(
+        0, 0.5, size=(ends[-1], 1)
+    )
+    return starts, ends, labels, data
+
+
+def test_estimate_confidence_intervals_cover():
+    """
+    About 95% of the confidence intervals of samples contain the exact values.
+    """
+    rng = np.random.default_rng(5)
+    starts, ends, labels, data = make_clustered_signal(rng, 2000)
+    exact = summarize_chunks([(0, data)], starts, ends, labels, 2, 1)
+    chroms = [("chr1", starts, ends, labels)]
+    supercontigs = [(np.array([0]), np.array([len(data)]))]
+    mean_covered = sd_covered = num_samples = 0
+    for seed in range(200):
+        sample = sample_blocks(chroms, supercontigs, 2, 0.1, 0, seed, block_bases=500)
+        [(_, piece_starts, piece_ends, clusters)] = sample.cluster_pieces
+        cluster_moments = summarize_chunks(
+            [(0, data)],
+            piece_starts,
+            piece_ends,
+            clusters,
+            len(sample.cluster_labels),
+            1,
+        )
+        moments, mean_errors, sd_errors = estimate(
+            cluster_moments, sample.cluster_labels, sample.num_clusters
+        )
+        mean_covered += np.sum(
+            np.abs(moments.get_means() - exact.get_means())
+            <= CONFIDENCE_Z * mean_errors
+        )
+        sd_covered += np.sum(
+            np.abs(moments.get_sds() - exact.get_sds()) <= CONFIDENCE_Z * sd_errors
+        )
+        num_samples += 2
+    assert 0.9 < mean_covered / num_samples < 0.99
+    assert 0.9 < sd_covered / num_samples < 0.99
+
+
+def test_estimate_matches_merge():
+    rng = np.random.default_rng(6)
+    starts, ends, labels, data = make_clustered_signal(rng, 300)
+    exact = summarize_chunks([(0, data)], starts, ends, labels, 2, 1)
+    segment_moments = summarize_chunks(
+        [(0, data)], starts, ends, np.arange(len(starts)), len(starts), 1
+    )
+    moments, mean_errors, sd_errors = estimate(
+        segment_moments, labels, np.bincount(labels)
+    )
+    assert np.array_equal(moments.n, exact.n)
+    assert np.allclose(moments.get_means(), exact.get_means(), rtol=1e-12)
+    assert np.allclose(moments.get_sds(), exact.get_sds(), rtol=1e-12)
+    assert mean_errors.tolist() == [[0], [0]]
+
+
+def test_write_signal_distribution(mocker):
+    mocker.patch("segway_pipeline.signal_distribution.Genome", FakeGenome)
+    segmentation = read_bed(io.StringIO(BED))
+    output = io.StringIO()
+    write_signal_distribution(
+        segmentation.values["name"], summarize(segmentation, "gd"), output
+    )
+    assert output.getvalue() == SIGNAL_DISTRIBUTION
+
+
+def test_write_signal_distribution_sampled():
+    moments = SignalMoments(1, 1)
+    moments.add(np.array([0, 0, 0]), np.array([[1.0], [2.0], [3.0]]))
+    output = io.StringIO()
+    write_signal_distribution(
+        ["0"],
+        Summary(["dnase"], moments, np.array([[0.5]]), np.array([[0.25]])),
+        output,
+    )
+    assert output.getvalue().splitlines() == [
+        "label\ttrackname\tmean\tsd\tn\tmean_ci\tsd_ci",
+        f"0\tdnase\t2.0\t1.0\t3\t{0.5 * CONFIDENCE_Z}\t{0.25 * CONFIDENCE_Z}",
+    ]
+
+
+@pytest.mark.parametrize("plot", [False, True])
+def test_main(tmp_path, mocker, plot):
+    mocker.patch("segway_pipeline.signal_distribution.Genome", FakeGenome)
+    bed = tmp_path / "segway.bed"
+    bed.write_text(BED)
+    outdir = tmp_path / "signal_distribution"
+    mock_run = mocker.patch("subprocess.run")
+    testargs = ["prog", "-o", str(outdir), str(bed), "gd"]
+    if plot:
+        testargs.append("--plot")
+    mocker.patch("sys.argv", testargs)
+    main()
+    assert (outdir / "signal_distribution.tab").read_text() == SIGNAL_DISTRIBUTION
+    if plot:
+        mock_run.assert_called_once_with(
+            [
+                "segtools-signal-distribution",
+                "--replot",
+                "-o",
+                str(outdir),
+                str(bed),
+                "gd",
+            ],
+            check=True,
+        )
+    else:
+        mock_run.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        subprocess.CalledProcessError(1, "segtools-signal-distribution"),
+        FileNotFoundError("segtools-signal-distribution"),
+    ],
+)
+def test_main_plot_failure_keeps_table(tmp_path, mocker, capsys, error):
+    mocker.patch("segway_pipeline.signal_distribution.Genome", FakeGenome)
+    bed = tmp_path / "segway.bed"
+    bed.write_text(BED)
+    outdir = tmp_path / "signal_distribution"
+    mocker.patch("subprocess.run", side_effect=error)
+    mocker.patch("sys.argv", ["prog", "--plot", "-o", str(outdir), str(bed), "gd"])
+    main()
+    assert (outdir / "signal_distribution.tab").read_text() == SIGNAL_DISTRIBUTION
+    assert "Plotting the signal distribution failed" in capsys.readouterr().err
+
+
+def test_main_sampled(tmp_path, mocker):
+    mocker.patch("segway_pipeline.signal_distribution.Genome", FakeGenome)
+    bed = tmp_path / "segway.bed"
+    bed.write_text(BED)
+    outdir = tmp_path / "signal_distribution"
+    mocker.patch(
+        "sys.argv",
+        ["prog", "-o", str(outdir), "--sample-fraction", "0.5", str(bed), "gd"],
+    )
+    main()
+    lines = (outdir / "signal_distribution.tab").read_text().splitlines()
+    assert lines[0] == "label\ttrackname\tmean\tsd\tn\tmean_ci\tsd_ci"
+    assert len(lines) == 5
+
+
+@pytest.mark.parametrize("sample_fraction", ["0", "1.5"])
+def test_main_bad_sample_fraction(mocker, sample_fraction):
+    mocker.patch(
+        "sys.argv",
+        ["prog", "-o", "out", "--sample-fraction", sample_fraction, "b", "g"],
+    )
+    with pytest.raises(SystemExit):
+        main()
@@ -0,0 +1,121 @@
+import subprocess
+import tarfile
+
+import pytest
+
+from segway_pipeline.train_segway import get_cache_params, get_parser, main
+
+ARGS = [
+    "--num-labels",
+    "10",
+    "--resolution",
+    "100",
+    "--minibatch-fraction",
+    "0.01",
+    "--num-instances",
+    "3",
+    "--segtransition-weight-scale",
+    "5",
+    "--max-train-rounds",
+    "25",
+]
+
+
+def fake_segway_train(command, check):
+    with open(f"{command[-1]}/params.params", "w") as f:
+        f.write("params")
+
+
+@pytest.fixture
+def genomedata(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "files.genomedata"
+    path.write_text("genomedata")
+    return str(path)
+
+
+def test_main(genomedata, mocker):
+    mocker.patch("subprocess.run", side_effect=fake_segway_train)
+    mocker.patch(
+        "sys.argv",
+        [
+            "prog",
+            *ARGS,
+            "--prior-strength",
+            "1",
+            "-o",
+            "out.tar",
+            genomedata,
+            "traindir",
+        ],
+    )
+    main()
+    assert subprocess.run.call_args[0][0] == [
+        "segway",
+        "train",
+        "--num-labels",
+        "10",
+        "--resolution",
+        "100",
+        "--minibatch-fraction",
+        "0.01",
+        "--num-instances",
+        "3",
+        "--prior_strength",
+        "1.0",
+        "--segtransition-weight-scale",
+        "5.0",
+        "--max-train-rounds",
+        "25",
+        genomedata,
+        "traindir",
+    ]
+    with tarfile.open("out.tar") as archive:
+        assert archive.getnames() == ["traindir", "traindir/params.params"]
+
+
+def test_main_cache(genomedata, tmp_path, mocker):
+    """
+    The second run with the same inputs reuses the first run's traindir, a different
+    seed trains again.
+    """
+    mocker.patch("subprocess.run", side_effect=fake_segway_train)
+    mocker.patch.dict("os.environ", {"SEGWAY_RAND_SEED": "1"})
+    args = ["prog", *ARGS, "--cache-dir", "cache", "-o", "out.tar.gz"]
+    mocker.patch("sys.argv", [*args, genomedata, "traindir"])
+    main()
+    first = (tmp_path / "out.tar.gz").read_bytes()
+    (tmp_path / "out.tar.gz").unlink()
+    (tmp_path / "traindir" / "params.params").unlink()
+    main()
+    assert subprocess.run.call_count == 1
+    assert (tmp_path / "out.tar.gz").read_bytes() == first
+    assert (tmp_path / "traindir" / "params.params").read_text() == "params"
+    mocker.patch.dict("os.environ", {"SEGWAY_RAND_SEED": "2"})
+    main()
+    assert subprocess.run.call_count == 2
+
+
+def test_main_cache_genomedata_key(genomedata, tmp_path, mocker):
+    """
+    With the genomedata key the traindir is keyed on it, not on the genomedata contents.
+    """
+    mocker.patch("subprocess.run", side_effect=fake_segway_train)
+    args = ["prog", *ARGS, "--cache-dir", "cache", "-o", "out.tar.gz"]
+    mocker.patch("sys.argv", [*args, "--genomedata-key", "abc", genomedata, "traindir"])
+    main()
+    (tmp_path / "files.genomedata").write_text("rebuilt genomedata")
+    main()
+    assert subprocess.run.call_count == 1
+    mocker.patch("sys.argv", [*args, "--genomedata-key", "def", genomedata, "traindir"])
+    main()
+    assert subprocess.run.call_count == 2
+
+
+def test_get_cache_params():
+    args = get_parser().parse_args([*ARGS, "-o", "out.tar.gz", "gd", "traindir"])
+    params = get_cache_params(args, {"SEGWAY_RAND_SEED": "112344321", "HOME": "/"})
+    assert params["SEGWAY_RAND_SEED"] == "112344321"
+    assert "HOME" not in params
+    assert params["num_labels"] == 10
+    assert params["prior_strength"] is None
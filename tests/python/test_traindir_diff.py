@@ -0,0 +1,109 @@
+import io
+import tarfile
+
+import pytest
+
+from segway_pipeline.traindir_diff import (
+    diff_traindirs,
+    get_relative_path,
+    is_ignored,
+    main,
+)
+
+TRIANGULATION = "".join(f"line {i}\n" for i in range(1, 17))
+MEMBERS = {
+    "traindir/params/params.params": "params",
+    "traindir/cmdline/0/emt0.sh": "cd /cromwell-executions/1",
+    "traindir/output/o/foo.1.out": "foo",
+    "traindir/log/jt_info.txt": "info",
+    "traindir/log/likelihood.0.tab": "0.5",
+    "traindir/log/run.sh": "run 1",
+    "traindir/triangulation/segway.str.trifile": (
+        TRIANGULATION + "% Created: Wednesday May 06 2020\nend\n"
+    ),
+}
+
+
+def make_archive(path, members, prefix=""):
+    with tarfile.open(path, "w:gz") as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(prefix + name)
+            info.size = len(data.encode())
+            archive.addfile(info, io.BytesIO(data.encode()))
+    return path
+
+
+def test_diff_traindirs_ignores_nondeterministic_files(tmp_path):
+    members = dict(MEMBERS)
+    members["traindir/cmdline/0/emt0.sh"] = "cd /cromwell-executions/2"
+    members["traindir/output/o/foo.2.out"] = members.pop("traindir/output/o/foo.1.out")
+    members["traindir/log/run.sh"] = "run 2"
+    members["traindir/triangulation/segway.str.trifile"] = (
+        TRIANGULATION + "% Created: Thursday May 07 2020\nend\n"
+    )
+    diff = diff_traindirs(
+        make_archive(tmp_path / "1.tar.gz", MEMBERS),
+        make_archive(tmp_path / "2.tar.gz", members, prefix="foo/"),
+    )
+    assert diff.matches
+
+
+def test_diff_traindirs_reports_differences(tmp_path):
+    members = dict(MEMBERS)
+    members["traindir/params/params.params"] = "other params"
+    members["traindir/log/likelihood.1.tab"] = "0.6"
+    del members["traindir/log/jt_info.txt"]
+    members["traindir/triangulation/segway.str.trifile"] = "changed\n" + TRIANGULATION
+    diff = diff_traindirs(
+        make_archive(tmp_path / "1.tar.gz", MEMBERS),
+        make_archive(tmp_path / "2.tar.gz", members),
+    )
+    assert not diff.matches
+    assert diff.only_in_first == ["traindir/log/jt_info.txt"]
+    assert diff.only_in_second == ["traindir/log/likelihood.1.tab"]
+    assert diff.different == [
+        "traindir/params/params.params",
+        "traindir/triangulation/segway.str.trifile",
+    ]
+
+
+@pytest.mark.parametrize(
+    "name,expected",
+    [
+        ("traindir/params/params.params", "traindir/params/params.params"),
+        ("./traindir/log/run.sh", "traindir/log/run.sh"),
+        ("cromwell/glob/traindir/window.bed", "traindir/window.bed"),
+        ("other/window.bed", "other/window.bed"),
+    ],
+)
+def test_get_relative_path(name, expected):
+    assert get_relative_path(name) == expected
+
+
+@pytest.mark.parametrize(
+    "relative_path,expected",
+    [
+        ("traindir/params/params.params", False),
+        ("traindir/cmdline/0/emt0.sh", True),
+        ("traindir/output/o/foo.out", True),
+        ("traindir/log/jt_info.txt", False),
+        ("traindir/log/likelihood.12.tab", False),
+        ("traindir/log/jobs.0.tab", True),
+        ("traindir/log/segway.sh", True),
+        ("traindir/likelihood/likelihood.0.ll", False),
+    ],
+)
+def test_is_ignored(relative_path, expected):
+    assert is_ignored(relative_path) == expected
+
+
+def test_main(tmp_path, mocker, capsys):
+    first = make_archive(tmp_path / "1.tar.gz", MEMBERS)
+    mocker.patch("sys.argv", ["prog", str(first), "tests/data/traindir.tar.gz"])
+    with pytest.raises(SystemExit) as e:
+        main()
+    assert e.value.code == 1
+    assert "Differ: traindir/params/params.params\n" in capsys.readouterr().out
+    mocker.patch("sys.argv", ["prog", str(first), str(first)])
+    main()
+    assert capsys.readouterr().out == ""
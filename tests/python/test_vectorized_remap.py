@@ -0,0 +1,187 @@
+from io import BytesIO, StringIO
+
+import numpy as np
+import pytest
+
+from segway_pipeline.recolor_bed import LABELS_TO_COLORS, make_color_strings
+from segway_pipeline.relabel import relabel
+from segway_pipeline.relabel_recolor import relabel_recolor
+from segway_pipeline.vectorized_remap import (
+    ChunkRemapper,
+    CoalescingChunkWriter,
+    coalesce_chunk,
+    gather,
+    iter_chunks,
+    remap_bed,
+    rewrite_header,
+)
+
+HEADER = (
+    'track autoScale=off description="foo" itemRgb=on name=segway viewLimits=0:1 '
+    "visibility=dense\n"
+)
+ROWS = (
+    "chr19\t0\t90800\t0\t1000\t.\t0\t90800\t102,102,102\n"
+    "chr19\t90800\t91100\t1\t1000\t.\t90800\t91100\t217,95,2\n"
+    "chr19\t91100\t245800\t10\t1000\t.\t91100\t245800\t102,102,102\n"
+)
+MNEMONICS = {"0": "foo", "1": "bar", "10": "quux"}
+COLORS = {"foo": "255,0,0", "bar": "255,195,77", "quux": "0,128,0"}
+
+
+def test_chunk_remapper_relabel():
+    remapper = ChunkRemapper(mnemonics=MNEMONICS)
+    result = remapper.remap(ROWS.encode())
+    assert result == (
+        b"chr19\t0\t90800\tfoo\t1000\t.\t0\t90800\t102,102,102\n"
+        b"chr19\t90800\t91100\tbar\t1000\t.\t90800\t91100\t217,95,2\n"
+        b"chr19\t91100\t245800\tquux\t1000\t.\t91100\t245800\t102,102,102\n"
+    )
+
+
+def test_chunk_remapper_recolor():
+    remapper = ChunkRemapper(colors={"0": "1,2,3", "1": "4,5,6", "10": "7,8,9"})
+    result = remapper.remap(ROWS.encode())
+    assert result == (
+        b"chr19\t0\t90800\t0\t1000\t.\t0\t90800\t1,2,3\n"
+        b"chr19\t90800\t91100\t1\t1000\t.\t90800\t91100\t4,5,6\n"
+        b"chr19\t91100\t245800\t10\t1000\t.\t91100\t245800\t7,8,9\n"
+    )
+
+
+def test_chunk_remapper_relabel_and_recolor_across_chunks():
+    remapper = ChunkRemapper(mnemonics=MNEMONICS, colors=COLORS)
+    lines = ROWS.encode().splitlines(keepends=True)
+    result = remapper.remap(lines[0]) + remapper.remap(b"".join(lines[1:]))
+    assert result == (
+        b"chr19\t0\t90800\tfoo\t1000\t.\t0\t90800\t255,0,0\n"
+        b"chr19\t90800\t91100\tbar\t1000\t.\t90800\t91100\t255,195,77\n"
+        b"chr19\t91100\t245800\tquux\t1000\t.\t91100\t245800\t0,128,0\n"
+    )
+
+
+def test_chunk_remapper_unknown_label_raises():
+    remapper = ChunkRemapper(mnemonics={"0": "foo"})
+    with pytest.raises(KeyError):
+        remapper.remap(ROWS.encode())
+
+
+def test_chunk_remapper_too_few_columns_raises():
+    remapper = ChunkRemapper(mnemonics=MNEMONICS)
+    with pytest.raises(ValueError):
+        remapper.remap(b"chr19\t0\t90800\n")
+
+
+def test_coalesce_chunk():
+    merged, last, num_merged = coalesce_chunk(
+        b"chr1\t0\t10\tfoo\t1000\t.\t0\t10\t1,1,1\n"
+        b"chr1\t10\t20\tfoo\t1000\t.\t10\t20\t1,1,1\n"
+        b"chr1\t20\t30\tfoo\t1000\t.\t20\t30\t2,2,2\n"
+        b"chr1\t31\t40\tfoo\t1000\t.\t31\t40\t2,2,2\n"
+        b"chr2\t40\t50\tfoo\t1000\t.\t40\t50\t2,2,2\n"
+        b"chr2\t50\t100\tfoo\t1000\t.\t50\t100\t2,2,2\n"
+    )
+    assert merged == (
+        b"chr1\t0\t20\tfoo\t1000\t.\t0\t20\t1,1,1\n"
+        b"chr1\t20\t30\tfoo\t1000\t.\t20\t30\t2,2,2\n"
+        b"chr1\t31\t40\tfoo\t1000\t.\t31\t40\t2,2,2\n"
+    )
+    assert last == b"chr2\t40\t100\tfoo\t1000\t.\t40\t100\t2,2,2\n"
+    assert num_merged == 2
+
+
+def test_coalesce_chunk_too_few_columns_raises():
+    with pytest.raises(ValueError):
+        coalesce_chunk(b"chr19\t0\t90800\tfoo\n")
+
+
+def test_coalescing_chunk_writer_across_chunks():
+    output = BytesIO()
+    writer = CoalescingChunkWriter(output)
+    rows = [
+        f"chr1\t{i}\t{i + 1}\tfoo\t1000\t.\t{i}\t{i + 1}\t1,1,1\n".encode()
+        for i in range(5)
+    ]
+    for row in rows:
+        writer.write(row)
+    writer.write(b"")
+    assert output.getvalue() == b""
+    writer.flush()
+    assert output.getvalue() == b"chr1\t0\t5\tfoo\t1000\t.\t0\t5\t1,1,1\n"
+    assert writer.num_merged == 4
+
+
+def test_gather():
+    source = np.frombuffer(b"abcdefgh", dtype=np.uint8)
+    result = gather(source, np.array([6, 0, 3]), np.array([2, 1, 0]))
+    assert result.tobytes() == b"gha"
+
+
+def test_iter_chunks_adds_missing_newline():
+    data = BytesIO(b"a\tb\nc\td\ne\tf")
+    result = list(iter_chunks(data, chunk_size=3))
+    assert b"".join(result) == b"a\tb\nc\td\ne\tf\n"
+    assert all(chunk.endswith(b"\n") for chunk in result)
+
+
+def test_rewrite_header():
+    assert rewrite_header(HEADER.encode()) == HEADER.encode()
+
+
+def test_rewrite_header_empty_raises():
+    with pytest.raises(ValueError):
+        rewrite_header(b"")
+
+
+@pytest.mark.parametrize("chunk_size", [1, 50, 1024])
+def test_remap_bed_matches_csv_backend(chunk_size):
+    mnemonics_data = "old\tnew\n" + "".join(f"{k}\t{v}\n" for k, v in MNEMONICS.items())
+    expected = StringIO("w", newline="")
+    relabel(StringIO(HEADER + ROWS), StringIO(mnemonics_data), expected)
+    output = BytesIO()
+    relabeled = BytesIO()
+    remap_bed(
+        BytesIO((HEADER + ROWS).encode()),
+        output,
+        mnemonics=MNEMONICS,
+        colors=COLORS,
+        chunk_size=chunk_size,
+        relabeled_file_handle=relabeled,
+    )
+    assert relabeled.getvalue() == expected.getvalue().encode()
+    assert output.getvalue().startswith(HEADER.encode())
+    assert output.getvalue().count(b"255,195,77") == 1
+
+
+@pytest.mark.parametrize("chunk_size", [1, 50, 1024])
+def test_remap_bed_coalesce_matches_csv_backend(chunk_size):
+    rows = ROWS + (
+        "chr19\t245800\t245900\t1\t1000\t.\t245800\t245900\t217,95,2\n"
+        "chr19\t245900\t246000\t0\t1000\t.\t245900\t246000\t102,102,102\n"
+        "chr20\t246000\t246100\t0\t1000\t.\t246000\t246100\t102,102,102\n"
+    )
+    mnemonics = {"0": "Enhancer", "1": "Enhancer", "10": "Bivalent"}
+    mnemonics_data = "old\tnew\n" + "".join(f"{k}\t{v}\n" for k, v in mnemonics.items())
+    expected = StringIO("w", newline="")
+    expected_relabeled = StringIO("w", newline="")
+    expected_num_merged = relabel_recolor(
+        StringIO(HEADER + rows),
+        StringIO(mnemonics_data),
+        expected,
+        relabeled_file_handle=expected_relabeled,
+        coalesce=True,
+    )
+    output = BytesIO()
+    relabeled = BytesIO()
+    num_merged = remap_bed(
+        BytesIO((HEADER + rows).encode()),
+        output,
+        mnemonics=mnemonics,
+        colors=make_color_strings(LABELS_TO_COLORS),
+        chunk_size=chunk_size,
+        relabeled_file_handle=relabeled,
+        coalesce=True,
+    )
+    assert relabeled.getvalue() == expected_relabeled.getvalue().encode()
+    assert output.getvalue() == expected.getvalue().encode()
+    assert num_merged == expected_num_merged == 2